@@ -0,0 +1,223 @@
+import glob
+import os
+import sqlite3
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import database
+from app.dependencies import encode_cursor
+from app.main import app
+
+# tests/db runs in-process against a scratch SQLite database built from
+# tools/init.sql + tools/migrations, no running API needed.
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TOOLS_DIR = next(
+    path for path in (os.path.join(ROOT, "tools"), os.path.join(ROOT, "v2", "tools")) if os.path.isdir(path)
+)
+
+# statements that are transaction control, not queries
+CONTROL_PREFIXES = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA")
+
+
+def build_database(path: str):
+    conn = sqlite3.connect(path)
+    database.register_sqlite_functions(conn)
+    with open(os.path.join(TOOLS_DIR, "init.sql"), "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    for migration in sorted(glob.glob(os.path.join(TOOLS_DIR, "migrations", "*.sql"))):
+        with open(migration, "r", encoding="utf-8") as f:
+            conn.executescript(f.read())
+    conn.commit()
+    conn.close()
+
+
+class QueryRecorder:
+    # Records every statement the API sends to the database while recording is on
+    def __init__(self):
+        self.recording = False
+        self.statements: list[tuple[str, tuple]] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.recording:
+            return
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        self.statements.append((statement, tuple(parameters or ())))
+
+    def start(self):
+        self.statements = []
+        self.recording = True
+
+    def stop(self):
+        self.recording = False
+
+    @property
+    def queries(self) -> list[tuple[str, tuple]]:
+        return [(s, p) for s, p in self.statements if not s.lstrip().upper().startswith(CONTROL_PREFIXES)]
+
+
+@pytest.fixture(scope="session")
+def db_path(tmp_path_factory) -> str:
+    path = str(tmp_path_factory.mktemp("db") / "mobypark.db")
+    build_database(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def recorder(db_path: str) -> QueryRecorder:
+    write_engine, read_engine = database.create_engines(f"sqlite+aiosqlite:///{db_path}", "production")
+    database.AsyncSessionLocal.configure(bind=write_engine)
+    database.ReadSessionLocal.configure(bind=read_engine)
+
+    recorder = QueryRecorder()
+    for engine in (write_engine, read_engine):
+        event.listen(engine.sync_engine, "before_cursor_execute", recorder)
+    return recorder
+
+
+@pytest.fixture(scope="session")
+def client(recorder: QueryRecorder):
+    with TestClient(app) as client:
+        yield client
+
+
+def run_in_app(client: TestClient, fn):
+    # await fn(db) on the app's event loop with a writer session, then commit
+    async def call():
+        async with database.AsyncSessionLocal() as db:
+            result = await fn(db)
+            await db.commit()
+            return result
+    return client.portal.call(call)
+
+
+def register_and_login(client: TestClient, role: str = "user") -> dict:
+    username = f"{role}_{uuid.uuid4().hex[:8]}"
+    payload = {
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "strongpassword123",
+        "name": "Test User",
+        "phone": "+1234567890",
+        "birth_year": 1990,
+        "role": role,
+    }
+    client.post("/v2/register", json=payload).raise_for_status()
+    response = client.post("/v2/login", json={"username": username, "password": "strongpassword123"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client: TestClient) -> dict:
+    return register_and_login(client, "admin")
+
+
+@pytest.fixture(scope="session")
+def user_headers(client: TestClient) -> dict:
+    return register_and_login(client, "user")
+
+
+@pytest.fixture(scope="session")
+def parking_lot_id(client: TestClient, admin_headers: dict) -> int:
+    payload = {
+        "name": "Test Parking",
+        "location": "Downtown",
+        "address": "Stationsplein 1",
+        "capacity": 150,
+        "reserved": 20,
+        "tariff": 2.5,
+        "daytariff": 20.0,
+        "latitude": 52.37,
+        "longitude": 4.89,
+    }
+    response = client.post("/v2/parking-lots", headers=admin_headers, json=payload)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def create_vehicle(client: TestClient, headers: dict) -> int:
+    plate = f"TST-{uuid.uuid4().hex[:6].upper()}"
+    response = client.post("/v2/vehicles", headers=headers, json={"license_plate": plate, "brand": "Toyota"})
+    response.raise_for_status()
+    return response.json()["vehicle_id"]
+
+
+def exercise_api(client: TestClient, admin: dict, user: dict, lid: int):
+    # Calls every router endpoint once (happy flow), so the recorder sees every query the API issues
+    def ok(response):
+        assert response.status_code < 400, (response.request.method, response.request.url, response.text)
+        return response.json()
+
+    ok(client.get("/v2/profile", headers=user))
+    ok(client.put("/v2/profile", headers=user, json={"name": "Updated"}))
+
+    vid = create_vehicle(client, user)
+    vehicle_plate = next(v["license_plate"] for v in ok(client.get("/v2/vehicles", headers=user))["items"] if v["vehicle_id"] == vid)
+    ok(client.get(f"/v2/vehicles?after={encode_cursor(0)}&total=estimate", headers=user))
+    ok(client.put(f"/v2/vehicles/{vid}", headers=user, json={"color": "Blue"}))
+    profile = ok(client.get("/v2/profile", headers=user))
+    ok(client.get(f"/v2/vehicles/{profile['id']}", headers=admin))
+
+    ok(client.get("/v2/parking-lots", headers=user))
+    ok(client.get(f"/v2/parking-lots?after={encode_cursor(0)}&total=estimate", headers=user))
+    ok(client.get(f"/v2/parking-lots/{lid}"))
+    ok(client.put(f"/v2/parking-lots/{lid}", headers=admin, json={"tariff": 3.0}))
+
+    session = ok(client.post(f"/v2/parking-lots/{lid}/sessions/start", headers=user, json={"vehicle_id": vid}))
+    ok(client.get(f"/v2/parking-lots/{lid}/sessions", headers=user))
+    ok(client.get(f"/v2/parking-lots/{lid}/sessions", headers=admin))
+    ok(client.get(f"/v2/parking-lots/{lid}/sessions?after={encode_cursor(0)}&total=estimate", headers=admin))
+    ok(client.get(f"/v2/parking-lots/{lid}/sessions?after={encode_cursor(0)}&total=estimate", headers=user))
+    ok(client.get(f"/v2/parking-lots/{lid}/sessions/{session['id']}", headers=user))
+    ok(client.get(f"/v2/parking-lots/{lid}/sessions/{session['id']}", headers=admin))
+    ok(client.post(f"/v2/parking-lots/{lid}/sessions/{session['id']}/stop", headers=user))
+    ok(client.get(f"/v2/parking-lots/{lid}/stats?bucket=hour", headers=admin))
+    ok(client.post(f"/v2/parking-lots/{lid}/gate/entry", headers=admin, json={"license_plate": "walk-01"}))
+    ok(client.post(f"/v2/parking-lots/{lid}/gate/exit", headers=admin, json={"license_plate": "WALK 01"}))
+    ok(client.post("/v2/gate/events", headers=admin, json={"events": [
+        {"lot_id": lid, "kind": "entry", "license_plate": "walk-02"},
+        {"lot_id": lid, "kind": "entry", "license_plate": vehicle_plate},
+        {"lot_id": lid, "kind": "exit", "license_plate": "walk-02"},
+        {"lot_id": lid, "kind": "exit", "license_plate": vehicle_plate},
+    ]}))
+    ok(client.get(f"/v2/parking-lots/{lid}/availability", headers=user))
+    ok(client.get("/v2/parking-lots/nearby?lat=51.92&lon=4.48&radius=5000", headers=user))
+    ok(client.get("/v2/parking-lots/search?q=parkin", headers=user))
+    ok(client.get("/v2/metrics", headers=admin))
+    # 999999 is not in the counters: database fallback
+    ok(client.get(f"/v2/parking-lots/availability?ids={lid}&ids=999999", headers=user))
+
+    payment = ok(client.post("/v2/payments", headers=user, json={"sessions_id": session["id"], "method": "ideal"}))
+    ok(client.put(f"/v2/payments/{payment['id']}", headers=user))
+    ok(client.get("/v2/payments", headers=user))
+    ok(client.get(f"/v2/payments?after={encode_cursor(0)}&total=estimate", headers=user))
+    ok(client.get(f"/v2/payments/{profile['id']}", headers=admin))
+
+    ok(client.get("/v2/billing", headers=user))
+    ok(client.get("/v2/billing/monthly", headers=user))
+    ok(client.get(f"/v2/billing/{profile['id']}", headers=admin))
+
+    reservation = ok(client.post("/v2/reservations", headers=user, json={
+        "vehicles_id": vid,
+        "parking_lots_id": lid,
+        "start_time": "2030-01-01T10:00:00Z",
+        "end_time": "2030-01-01T12:00:00Z",
+    }))
+    ok(client.get("/v2/reservations", headers=user))
+    ok(client.get(f"/v2/reservations?after={encode_cursor(0)}&total=estimate", headers=user))
+    ok(client.get(f"/v2/reservations/{reservation['id']}", headers=user))
+    ok(client.put(f"/v2/reservations/{reservation['id']}", headers=user, json={"cost": 5.0}))
+    ok(client.delete(f"/v2/reservations/{reservation['id']}", headers=admin))
+
+    second = ok(client.post(f"/v2/parking-lots/{lid}/sessions/start", headers=user, json={"vehicle_id": vid}))
+    ok(client.delete(f"/v2/parking-lots/{lid}/sessions/{second['id']}", headers=admin))
+    ok(client.delete(f"/v2/vehicles/{create_vehicle(client, user)}", headers=user))
+
+
+@pytest.fixture
+def api_walk(client: TestClient, admin_headers: dict, user_headers: dict, parking_lot_id: int):
+    return lambda: exercise_api(client, admin_headers, user_headers, parking_lot_id)
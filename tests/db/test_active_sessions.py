@@ -0,0 +1,96 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import TOOLS_DIR, build_database, create_vehicle
+from test_gates import create_lot
+
+from app import database
+
+
+def start(client, headers, lot_id: int, vehicle_id: int):
+    return client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=headers, json={"vehicle_id": vehicle_id})
+
+
+def occupied(client, headers, lot_id: int) -> int:
+    return client.get(f"/v2/parking-lots/{lot_id}/availability", headers=headers).json()["occupied"]
+
+
+def test_second_open_session_is_refused(client, admin_headers, user_headers, recorder) -> None:
+    one, two = create_lot(client, admin_headers), create_lot(client, admin_headers)
+    vehicle_id = create_vehicle(client, user_headers)
+
+    recorder.start()
+    first = start(client, user_headers, one, vehicle_id)
+    recorder.stop()
+    assert first.status_code == 201
+    # the index does the check, not a lookup of open sessions
+    assert not [s for s, _ in recorder.queries if "end_date IS NULL" in s]
+
+    for lot_id in (one, two):
+        again = start(client, user_headers, lot_id, vehicle_id)
+        assert again.status_code == 409 and again.json()["detail"] == "Vehicle already has an active session"
+    assert occupied(client, user_headers, one) == 1 and occupied(client, user_headers, two) == 0
+
+    client.post(f"/v2/parking-lots/{one}/sessions/{first.json()['id']}/stop", headers=user_headers).raise_for_status()
+    assert start(client, user_headers, two, vehicle_id).status_code == 201
+
+
+def test_concurrent_starts(client, admin_headers, user_headers) -> None:
+    lot_id = create_lot(client, admin_headers)
+    vehicle_id = create_vehicle(client, user_headers)
+    with ThreadPoolExecutor(8) as pool:
+        statuses = sorted(pool.map(lambda _: start(client, user_headers, lot_id, vehicle_id).status_code, range(8)))
+    assert statuses == [201] + [409] * 7
+    assert occupied(client, user_headers, lot_id) == 1
+
+
+def test_gates_respect_the_open_session_elsewhere(client, admin_headers, user_headers, db_path) -> None:
+    one, two = create_lot(client, admin_headers), create_lot(client, admin_headers)
+    vehicle_id = create_vehicle(client, user_headers)
+    conn = sqlite3.connect(db_path)
+    plate = conn.execute("SELECT license_plate FROM vehicles WHERE vehicle_id = ?", (vehicle_id,)).fetchone()[0]
+    conn.close()
+    assert start(client, user_headers, one, vehicle_id).status_code == 201
+
+    entry = client.post(f"/v2/parking-lots/{two}/gate/entry", headers=admin_headers, json={"license_plate": plate})
+    assert entry.status_code == 409
+
+    results = client.post("/v2/gate/events", headers=admin_headers, json={"events": [
+        {"lot_id": two, "kind": "entry", "license_plate": plate},
+        {"lot_id": two, "kind": "entry", "license_plate": "vrij-01"},
+        {"lot_id": one, "kind": "exit", "license_plate": plate},
+    ]}).json()["results"]
+    assert [(r["outcome"], r["status"]) for r in results] == [("rejected", 409), ("created", 201), ("stopped", 200)]
+
+    # after the exit the car can go in elsewhere, also within one batch
+    results = client.post("/v2/gate/events", headers=admin_headers, json={"events": [
+        {"lot_id": two, "kind": "entry", "license_plate": plate},
+        {"lot_id": two, "kind": "exit", "license_plate": plate},
+        {"lot_id": two, "kind": "entry", "license_plate": plate, "at": "2099-01-01T00:00:00Z"},
+    ]}).json()["results"]
+    assert [r["outcome"] for r in results] == ["created", "stopped", "created"]
+    assert occupied(client, user_headers, two) == 2
+
+
+def test_migration_cancels_older_duplicates(tmp_path) -> None:
+    # a database from before migration 010 with two open sessions of the same vehicle
+    path = str(tmp_path / "old.db")
+    build_database(path)
+    conn = sqlite3.connect(path)
+    database.register_sqlite_functions(conn)
+    conn.execute("DROP INDEX idx_sessions_open_vehicle")
+    conn.execute("INSERT INTO users (username, email, password_hash, name, birth_year) VALUES ('dup', 'd@x', 'x', 'd', 1990)")
+    conn.execute("INSERT INTO vehicles (vehicle_id, user_id, license_plate) VALUES (1, 1, 'DUP-01')")
+    conn.execute("INSERT INTO parking_lots (id, name, location, address, capacity, reserved, tariff, daytariff) VALUES (1, 'x', 'x', 'x', 5, 0, 2, 10)")
+    conn.executemany(
+        "INSERT INTO sessions (parking_lots_id, vehicle_id, license_plate, start_date, status) VALUES (1, ?, 'DUP-01', ?, 'ACTIVE')",
+        [(1, "2025-01-01 10:00:00"), (1, "2025-01-02 10:00:00"), (None, "2025-01-01 10:00:00"), (None, "2025-01-01 10:00:00")],
+    )
+    with open(os.path.join(TOOLS_DIR, "migrations", "010_one_open_session_per_vehicle.sql"), "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+
+    rows = conn.execute("SELECT vehicle_id, end_date IS NULL, status FROM sessions ORDER BY id").fetchall()
+    conn.close()
+    # the newest stays open, sessions without a vehicle are not affected
+    assert rows == [(1, 0, "CANCELLED"), (1, 1, "ACTIVE"), (None, 1, "ACTIVE"), (None, 1, "ACTIVE")]
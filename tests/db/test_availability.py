@@ -0,0 +1,98 @@
+import sqlite3
+
+from conftest import create_vehicle
+
+from app import database
+from app.occupancy import occupancy
+
+
+def create_lot(client, admin_headers, capacity: int = 3, reserved: int = 1) -> int:
+    payload = {
+        "name": "Availability Parking",
+        "location": "Centrum",
+        "address": "Blaak 1",
+        "capacity": capacity,
+        "reserved": reserved,
+        "tariff": 2.0,
+        "daytariff": 15.0,
+        "latitude": 51.92,
+        "longitude": 4.48,
+    }
+    response = client.post("/v2/parking-lots", headers=admin_headers, json=payload)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def availability(client, headers, lot_id: int) -> dict:
+    response = client.get(f"/v2/parking-lots/{lot_id}/availability", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_sessions_move_the_counter(client, admin_headers, user_headers, recorder) -> None:
+    lot_id = create_lot(client, admin_headers)
+    assert availability(client, user_headers, lot_id) == {"lot_id": lot_id, "capacity": 3, "reserved": 1, "occupied": 0, "available": 2}
+
+    vehicle_id = create_vehicle(client, user_headers)
+    session = client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=user_headers, json={"vehicle_id": vehicle_id}).json()
+    assert availability(client, user_headers, lot_id)["occupied"] == 1
+
+    # served from memory, no query at all
+    recorder.start()
+    assert availability(client, user_headers, lot_id)["available"] == 1
+    recorder.stop()
+    assert [s for s, _ in recorder.queries if "sessions" in s] == []
+
+    client.post(f"/v2/parking-lots/{lot_id}/sessions/{session['id']}/stop", headers=user_headers).raise_for_status()
+    assert availability(client, user_headers, lot_id)["occupied"] == 0
+
+    # failed start (unknown vehicle) leaves the counter alone
+    response = client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=user_headers, json={"vehicle_id": 999999})
+    assert response.status_code == 404
+    assert availability(client, user_headers, lot_id)["occupied"] == 0
+
+
+def test_deleting_an_open_session(client, admin_headers, user_headers) -> None:
+    lot_id = create_lot(client, admin_headers)
+    vehicle_id = create_vehicle(client, user_headers)
+    session = client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=user_headers, json={"vehicle_id": vehicle_id}).json()
+    assert availability(client, user_headers, lot_id)["occupied"] == 1
+
+    client.delete(f"/v2/parking-lots/{lot_id}/sessions/{session['id']}", headers=admin_headers).raise_for_status()
+    assert availability(client, user_headers, lot_id)["occupied"] == 0
+
+
+def test_reconcile_picks_up_other_writers(client, admin_headers, user_headers, db_path) -> None:
+    lot_id = create_lot(client, admin_headers, capacity=10, reserved=0)
+
+    # sessions started by another worker / process
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO sessions (parking_lots_id, license_plate, start_date, status) VALUES (?, ?, '2025-01-01T10:00:00Z', 'ACTIVE')",
+        [(lot_id, f"OTHER-{i}") for i in range(4)],
+    )
+    conn.commit()
+    conn.close()
+    assert availability(client, user_headers, lot_id)["occupied"] == 0
+
+    client.portal.call(occupancy.reconcile, database.ReadSessionLocal)
+    assert availability(client, user_headers, lot_id) == {"lot_id": lot_id, "capacity": 10, "reserved": 0, "occupied": 4, "available": 6}
+
+
+def test_bulk_availability(client, admin_headers, user_headers) -> None:
+    first = create_lot(client, admin_headers, capacity=5, reserved=0)
+    second = create_lot(client, admin_headers, capacity=8, reserved=2)
+    occupancy.drop_lot(second)  # not known to this worker: comes from the database
+
+    response = client.get("/v2/parking-lots/availability", headers=user_headers, params={"ids": [second, first, 999999, first]})
+    assert response.status_code == 200, response.text
+    assert [(a["lot_id"], a["available"]) for a in response.json()] == [(second, 6), (first, 5)]
+
+    everything = client.get("/v2/parking-lots/availability", headers=user_headers).json()
+    assert first in [a["lot_id"] for a in everything]
+
+    assert client.get("/v2/parking-lots/availability", params={"ids": [first]}).status_code in (401, 403)
+    assert client.get("/v2/parking-lots/999999/availability", headers=user_headers).status_code == 404
+    # the single-lot endpoint asks for a token like the bulk one
+    assert client.get(f"/v2/parking-lots/{first}/availability").status_code in (401, 403)
+    assert client.get("/v2/parking-lots/availability", headers=user_headers, params={"ids": list(range(501))}).status_code == 400
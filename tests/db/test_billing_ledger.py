@@ -0,0 +1,93 @@
+import sqlite3
+
+from app import ledger
+from conftest import create_vehicle, register_and_login, run_in_app
+from test_gates import create_lot
+
+
+def assert_ledger_consistent(client) -> None:
+    assert run_in_app(client, ledger.diff_ledger) == []
+    assert run_in_app(client, ledger.diff_months) == []
+
+
+def test_writes_keep_ledger_consistent(client, admin_headers, parking_lot_id) -> None:
+    headers = register_and_login(client)
+    user_id = client.get("/v2/profile", headers=headers).json()["id"]
+    vid = create_vehicle(client, headers)
+    lot = f"/v2/parking-lots/{parking_lot_id}/sessions"
+
+    sessions = []
+    for _ in range(3):
+        sid = client.post(f"{lot}/start", headers=headers, json={"vehicle_id": vid}).json()["id"]
+        assert_ledger_consistent(client)
+        assert client.post(f"{lot}/{sid}/stop", headers=headers).status_code == 200
+        assert_ledger_consistent(client)
+        sessions.append(sid)
+
+    # barrier camera: same ledger path, by plate
+    plate = next(v["license_plate"] for v in client.get("/v2/vehicles", headers=headers).json()["items"] if v["vehicle_id"] == vid)
+    assert client.post(f"/v2/parking-lots/{parking_lot_id}/gate/entry", headers=admin_headers, json={"license_plate": plate}).status_code == 201
+    assert client.post(f"/v2/parking-lots/{parking_lot_id}/gate/exit", headers=admin_headers, json={"license_plate": plate.lower()}).status_code == 200
+    assert_ledger_consistent(client)
+
+    pid = client.post("/v2/payments", headers=headers, json={"sessions_id": sessions[0], "method": "ideal"}).json()["id"]
+    assert_ledger_consistent(client)
+    assert client.put(f"/v2/payments/{pid}", headers=headers).status_code == 200
+    assert_ledger_consistent(client)
+
+    summary = client.get("/v2/billing", headers=headers).json()
+    assert summary["sessions"] == 4
+    assert client.get(f"/v2/billing/{user_id}", headers=admin_headers).json() == summary
+
+    assert client.put(f"/v2/vehicles/{vid}", headers=headers, json={"license_plate": "NEW-01-PL"}).status_code == 200
+    assert_ledger_consistent(client)
+
+    assert client.delete(f"{lot}/{sessions[1]}", headers=admin_headers).status_code == 200
+    assert_ledger_consistent(client)
+    assert client.get("/v2/billing", headers=headers).json()["sessions"] == 3
+
+    assert client.delete(f"/v2/vehicles/{vid}", headers=headers).status_code == 200
+    assert_ledger_consistent(client)
+    assert client.get("/v2/billing", headers=headers).json()["sessions"] == 0
+
+
+def test_checker_finds_and_rebuild_fixes_drift(client, db_path) -> None:
+    headers = register_and_login(client)
+    user_id = client.get("/v2/profile", headers=headers).json()["id"]
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO billing_ledger (user_id, sessions, amount, paid, paid_completed) VALUES (?, 5, 12.5, 0, 0)", (user_id,))
+    conn.commit()
+    conn.close()
+
+    diffs = run_in_app(client, ledger.diff_ledger)
+    assert [d[0] for d in diffs] == [user_id]
+    assert diffs[0][1] == (5, 12.5, 0.0, 0.0)
+
+    run_in_app(client, ledger.rebuild_ledger)
+    assert_ledger_consistent(client)
+    assert client.get("/v2/billing", headers=headers).json()["sessions"] == 0
+
+
+def test_lot_delete_drops_its_sessions_from_billing(client, admin_headers, db_path) -> None:
+    headers = register_and_login(client)
+    vid = create_vehicle(client, headers)
+    lot_id = create_lot(client, admin_headers)
+    sid = client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=headers, json={"vehicle_id": vid}).json()["id"]
+    assert client.post(f"/v2/parking-lots/{lot_id}/sessions/{sid}/stop", headers=headers).status_code == 200
+    assert client.get("/v2/billing", headers=headers).json()["sessions"] == 1
+    # a past month, so it is read from the rollup
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE sessions SET start_date = '2024-03-04 10:00:00', end_date = '2024-03-04 12:00:00' WHERE id = ?", (sid,))
+    conn.commit()
+    conn.close()
+    run_in_app(client, ledger.rebuild_ledger)
+    run_in_app(client, ledger.rebuild_months)
+    assert_ledger_consistent(client)
+    assert [m["month"] for m in client.get("/v2/billing/monthly", headers=headers).json()] == ["2024-03"]
+
+    # foreign_keys=ON deletes the lot's sessions with it
+    assert client.delete(f"/v2/parking-lots/{lot_id}", headers=admin_headers).status_code == 200
+    assert_ledger_consistent(client)
+    assert client.get("/v2/billing", headers=headers).json()["sessions"] == 0
+    assert client.get("/v2/billing/monthly", headers=headers).json() == []
@@ -0,0 +1,150 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import ledger
+from app.dependencies import calculate_price, tr_hash
+from conftest import create_vehicle, register_and_login, run_in_app
+from test_settlement import settle
+
+
+class Lot:
+    def __init__(self, tariff, daytariff):
+        self.tariff = tariff
+        self.daytariff = daytariff
+
+
+def seed_sessions(db_path: str, lot_id: int, vehicle_id: int, plate: str, user_id: int, count: int):
+    # even sessions are paid by sessions_id, every third odd one only by transaction hash,
+    # the last one is still open
+    conn = sqlite3.connect(db_path)
+    for i in range(count):
+        closed = i < count - 1
+        start = f"2024-02-{i % 28 + 1:02d} 08:00:00"
+        if not closed:
+            start = (datetime.now(timezone.utc) - timedelta(minutes=10)).strftime("%Y-%m-%d %H:%M:%S.%f")
+        cur = conn.execute(
+            "INSERT INTO sessions (parking_lots_id, vehicle_id, license_plate, start_date, end_date, status, calculated_amount) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                lot_id, vehicle_id, plate, start,
+                f"2024-02-{i % 28 + 1:02d} {9 + i % 10:02d}:30:00" if closed else None,
+                "COMPLETED" if closed else "ACTIVE",
+                round(1.1 * (i % 7), 2) if closed else 0,
+            ),
+        )
+        sid = cur.lastrowid
+        if i % 2 == 0:
+            conn.execute(
+                "INSERT INTO payments (amount, sessions_id, initiator_users_id) VALUES (?, ?, ?)",
+                (1.25 * (i % 5 + 1), sid, user_id),
+            )
+        elif i % 3 == 0:
+            conn.execute(
+                "INSERT INTO payments (amount, sessions_id, initiator_users_id, hash) VALUES (?, 0, ?, ?)",
+                (2.5, user_id, tr_hash(sid, plate)),
+            )
+    conn.commit()
+    conn.close()
+
+
+def reference_summary(db_path: str, user_id: int) -> dict:
+    # per-session computation: stored price of closed sessions, calculate_price until now for open
+    # ones, payments on sessions_id else the md5 transaction hash for every session
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT s.id, s.start_date, s.end_date, s.calculated_amount, l.tariff, l.daytariff, v.license_plate "
+        "FROM sessions s JOIN vehicles v ON s.vehicle_id = v.vehicle_id JOIN parking_lots l ON s.parking_lots_id = l.id "
+        "WHERE v.user_id = ?",
+        (user_id,),
+    ).fetchall()
+    amount = paid = 0.0
+    for sid, start, end, calculated, tariff, daytariff, plate in rows:
+        if end is None:
+            amount += calculate_price(Lot(tariff, daytariff), datetime.fromisoformat(start))[0]
+        else:
+            amount += calculated
+        by_session = conn.execute("SELECT COALESCE(SUM(amount), 0) FROM payments WHERE sessions_id = ?", (sid,)).fetchone()[0]
+        if not by_session:
+            by_session = conn.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM payments WHERE hash = ?", (tr_hash(sid, plate),)
+            ).fetchone()[0]
+        paid += round(float(by_session), 2)
+    conn.close()
+    amount, paid = round(amount, 2), round(paid, 2)
+    return {
+        "amount": amount,
+        "payed": paid,
+        "payed_completed": 0.0,
+        "amount_still_to_pay": round(amount - paid, 2),
+        "sessions": len(rows),
+        "average": round(amount / len(rows), 2) if rows else 0.0,
+    }
+
+
+@pytest.fixture
+def billed_user(client, db_path, parking_lot_id):
+    def make(session_count: int):
+        headers = register_and_login(client)
+        user_id = client.get("/v2/profile", headers=headers).json()["id"]
+        vid = create_vehicle(client, headers)
+        plate = next(v for v in client.get("/v2/vehicles", headers=headers).json()["items"] if v["vehicle_id"] == vid)["license_plate"]
+        seed_sessions(db_path, parking_lot_id, vid, plate, user_id, session_count)
+        settle(client)
+        run_in_app(client, ledger.rebuild_ledger)
+        run_in_app(client, ledger.rebuild_months)
+        return headers, user_id
+    return make
+
+
+def billing_query_count(client, recorder, url: str, headers: dict) -> int:
+    client.get(url, headers=headers)  # warm the principal cache
+    recorder.start()
+    response = client.get(url, headers=headers)
+    recorder.stop()
+    assert response.status_code == 200
+    return len(recorder.queries)
+
+
+def test_billing_query_count_is_constant(client, recorder, admin_headers, billed_user) -> None:
+    small_headers, small_id = billed_user(2)
+    large_headers, large_id = billed_user(60)
+
+    # ledger row + open sessions
+    assert billing_query_count(client, recorder, "/v2/billing", small_headers) == 2
+    assert billing_query_count(client, recorder, "/v2/billing", large_headers) == 2
+    assert billing_query_count(client, recorder, f"/v2/billing/{small_id}", admin_headers) == \
+        billing_query_count(client, recorder, f"/v2/billing/{large_id}", admin_headers)
+
+
+def test_billing_matches_per_session_computation(client, db_path, billed_user) -> None:
+    headers, user_id = billed_user(40)
+    summary = client.get("/v2/billing", headers=headers).json()
+    assert summary == reference_summary(db_path, user_id)
+    assert summary["payed"] > 0
+
+
+def reference_monthly(db_path: str, user_id: int) -> list:
+    # the old endpoint: group every session of the user by start month
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT strftime('%Y-%m', s.start_date) AS month, COUNT(s.id), SUM(s.calculated_amount) FROM sessions s "
+        "JOIN vehicles v ON s.vehicle_id = v.vehicle_id WHERE v.user_id = ? GROUP BY month ORDER BY month",
+        (user_id,),
+    ).fetchall()
+    conn.close()
+    return [{"month": m, "sessions": n, "total_cost": round(c or 0, 2)} for m, n, c in rows]
+
+
+def test_monthly_reads_rollup(client, recorder, db_path, billed_user) -> None:
+    small_headers, _ = billed_user(2)
+    large_headers, large_id = billed_user(60)
+
+    # rollup + live current month
+    assert billing_query_count(client, recorder, "/v2/billing/monthly", small_headers) == 2
+    assert billing_query_count(client, recorder, "/v2/billing/monthly", large_headers) == 2
+
+    monthly = client.get("/v2/billing/monthly", headers=large_headers).json()
+    assert monthly == reference_monthly(db_path, large_id)
+    assert len(monthly) == 2  # February 2024 from the rollup, the open session live
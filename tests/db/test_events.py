@@ -0,0 +1,56 @@
+from conftest import create_vehicle
+
+from app.events import broadcaster
+
+
+def create_lot(client, admin_headers) -> int:
+    payload = {
+        "name": "Events Parking",
+        "location": "Centrum",
+        "address": "Meent 1",
+        "capacity": 4,
+        "tariff": 2.0,
+        "daytariff": 15.0,
+        "latitude": 51.92,
+        "longitude": 4.48,
+    }
+    response = client.post("/v2/parking-lots", headers=admin_headers, json=payload)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def drain(client, sub) -> str:
+    return "".join(client.portal.call(sub.next, 0))
+
+
+def test_session_events_reach_subscribers(client, admin_headers, user_headers, recorder) -> None:
+    lot_id = create_lot(client, admin_headers)
+    subs = [client.portal.call(broadcaster.subscribe, [lot_id]) for _ in range(200)]
+    try:
+        assert all('"occupied":0' in drain(client, sub) for sub in subs)
+
+        vehicle_id = create_vehicle(client, user_headers)
+        recorder.start()
+        session = client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=user_headers, json={"vehicle_id": vehicle_id}).json()
+        recorder.stop()
+        started = len(recorder.queries)
+        client.post(f"/v2/parking-lots/{lot_id}/sessions/{session['id']}/stop", headers=user_headers).raise_for_status()
+
+        for sub in subs:
+            frames = drain(client, sub)
+            assert frames.index("event: session_started") < frames.index("event: session_stopped")
+            assert f'"session_id":{session["id"]}' in frames
+            # start en stop samengevoegd tot de laatste stand
+            assert frames.count("event: occupancy") == 1 and '"occupied":0' in frames
+        # the queries of a start don't depend on the number of subscribers
+        assert started < 20
+    finally:
+        for sub in subs:
+            broadcaster.unsubscribe(sub)
+
+
+def test_event_stream_routes(client, user_headers) -> None:
+    assert client.get("/v2/parking-lots/999999/events", headers=user_headers).status_code == 404
+    assert client.get("/v2/parking-lots/events").status_code in (401, 403)
+    assert client.get("/v2/parking-lots/1/events").status_code in (401, 403)
+    assert client.get("/v2/parking-lots/events", headers=user_headers, params={"ids": list(range(501))}).status_code == 400
@@ -0,0 +1,91 @@
+import sqlite3
+
+from conftest import create_vehicle
+
+PLATES = ["AB-123-C", "ab 123 c", " Ab-12 3c", "X-9\t9"]
+
+
+def create_lot(client, admin_headers, capacity: int = 10) -> int:
+    payload = {
+        "name": "Gate Parking",
+        "location": "Centrum",
+        "address": "Slagboom 1",
+        "capacity": capacity,
+        "tariff": 2.0,
+        "daytariff": 15.0,
+        "latitude": 51.92,
+        "longitude": 4.48,
+    }
+    response = client.post("/v2/parking-lots", headers=admin_headers, json=payload)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def test_plate_norm_matches_licenceplate_clean(db_path) -> None:
+    from app.dependencies import licenceplate_clean
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("INSERT INTO users (username, email, password_hash, name, birth_year) VALUES ('gate-norm', 'g@x', 'x', 'g', 1990)")
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'gate-norm'").fetchone()[0]
+        for plate in PLATES:
+            conn.execute("DELETE FROM vehicles WHERE license_plate = ?", (plate,))
+            conn.execute("INSERT INTO vehicles (user_id, license_plate) VALUES (?, ?)", (user_id, plate))
+            stored = conn.execute("SELECT plate_norm FROM vehicles WHERE license_plate = ?", (plate,)).fetchone()[0]
+            assert stored == licenceplate_clean(plate)
+        # plate changed: recomputed
+        conn.execute("UPDATE vehicles SET license_plate = 'zz-00-zz' WHERE license_plate = ?", (PLATES[3],))
+        assert conn.execute("SELECT plate_norm FROM vehicles WHERE license_plate = 'zz-00-zz'").fetchone()[0] == "ZZ00ZZ"
+    finally:
+        # nothing is kept
+        conn.rollback()
+        conn.close()
+
+
+def test_gate_entry_and_exit(client, admin_headers, user_headers, recorder, db_path) -> None:
+    lot_id = create_lot(client, admin_headers)
+    vehicle_id = create_vehicle(client, user_headers)
+    conn = sqlite3.connect(db_path)
+    plate = conn.execute("SELECT license_plate FROM vehicles WHERE vehicle_id = ?", (vehicle_id,)).fetchone()[0]
+    conn.close()
+    # as the camera reads it
+    read = " " + plate.lower().replace("-", " ") + " "
+
+    entered = client.post(f"/v2/parking-lots/{lot_id}/gate/entry", headers=admin_headers, json={"license_plate": read})
+    assert entered.status_code == 201, entered.text
+    session = entered.json()
+    assert session["vehicle_id"] == vehicle_id and session["license_plate"] == plate and session["status"] == "ACTIVE"
+    assert client.get(f"/v2/parking-lots/{lot_id}/availability", headers=user_headers).json()["occupied"] == 1
+
+    # second read of the same car: same session, counter unchanged
+    again = client.post(f"/v2/parking-lots/{lot_id}/gate/entry", headers=admin_headers, json={"license_plate": plate})
+    assert again.status_code == 200 and again.json()["id"] == session["id"]
+    assert client.get(f"/v2/parking-lots/{lot_id}/availability", headers=user_headers).json()["occupied"] == 1
+
+    recorder.start()
+    left = client.post(f"/v2/parking-lots/{lot_id}/gate/exit", headers=admin_headers, json={"license_plate": read})
+    recorder.stop()
+    assert left.status_code == 200, left.text
+    assert left.json()["id"] == session["id"] and left.json()["status"] == "COMPLETED"
+    assert client.get(f"/v2/parking-lots/{lot_id}/availability", headers=user_headers).json()["occupied"] == 0
+    lookups = [s for s, _ in recorder.queries if "plate_norm = " in s]
+    assert len(lookups) == 1
+
+    assert client.post(f"/v2/parking-lots/{lot_id}/gate/exit", headers=admin_headers, json={"license_plate": plate}).status_code == 404
+
+
+def test_gate_unknown_plate_and_full_lot(client, admin_headers, user_headers) -> None:
+    lot_id = create_lot(client, admin_headers, capacity=1)
+    first = client.post(f"/v2/parking-lots/{lot_id}/gate/entry", headers=admin_headers, json={"license_plate": "gast-01"})
+    assert first.status_code == 201
+    assert first.json()["vehicle_id"] is None and first.json()["license_plate"] == "GAST01"
+
+    full = client.post(f"/v2/parking-lots/{lot_id}/gate/entry", headers=admin_headers, json={"license_plate": "gast-02"})
+    assert full.status_code == 409
+
+    assert client.post(f"/v2/parking-lots/{lot_id}/gate/exit", headers=admin_headers, json={"license_plate": "GAST 01"}).status_code == 200
+    assert client.post(f"/v2/parking-lots/{lot_id}/gate/entry", headers=admin_headers, json={"license_plate": "gast-02"}).status_code == 201
+
+    assert client.post(f"/v2/parking-lots/{lot_id}/gate/entry", headers=user_headers, json={"license_plate": "x"}).status_code == 403
+    assert client.post(f"/v2/parking-lots/{lot_id}/gate/entry", headers=admin_headers, json={"license_plate": " - "}).status_code == 400
+    assert client.post("/v2/parking-lots/999999/gate/entry", headers=admin_headers, json={"license_plate": "gast-03"}).status_code == 404
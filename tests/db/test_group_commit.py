@@ -0,0 +1,107 @@
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app import database, write_queue
+from app.write_queue import GroupCommitWriter, run_write
+from conftest import create_vehicle
+
+# GROUP_COMMIT_WINDOW_MS > 0: long enough for the units of one gather() to share a batch
+WINDOW_SECONDS = 0.05
+
+
+@pytest.fixture
+def probe(db_path: str) -> str:
+    # scratch tables; the child's foreign key is only checked at COMMIT
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS group_commit_parent (id INTEGER PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS group_commit_probe (
+            name TEXT PRIMARY KEY,
+            parent_id INTEGER REFERENCES group_commit_parent(id) DEFERRABLE INITIALLY DEFERRED
+        );
+        DELETE FROM group_commit_probe;
+        """
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+@pytest.fixture
+def writer(client, monkeypatch):
+    # run_write() goes through this writer for the duration of a test
+    writer = GroupCommitWriter(database.AsyncSessionLocal, WINDOW_SECONDS, 8)
+
+    async def start():
+        writer.start()
+
+    async def stop():
+        writer._task.cancel()
+
+    client.portal.call(start)
+    monkeypatch.setattr(write_queue, "group_writer", writer)
+    yield writer
+    client.portal.call(stop)
+
+
+def names(db_path: str) -> list[str]:
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute("SELECT name FROM group_commit_probe ORDER BY name")]
+    finally:
+        conn.close()
+
+
+def insert(name: str, parent_id=None, fail: bool = False):
+    async def unit(db):
+        await db.execute(text("INSERT INTO group_commit_probe (name, parent_id) VALUES (:name, :parent_id)"), {"name": name, "parent_id": parent_id})
+        if fail:
+            raise ValueError(name)
+        return id(db)
+    return unit
+
+
+def gather(client, *units):
+    async def call():
+        return await asyncio.gather(*(run_write(None, unit) for unit in units), return_exceptions=True)
+    return client.portal.call(call)
+
+
+def test_callers_share_one_batch(client, writer, probe) -> None:
+    outcomes = gather(client, insert("a"), insert("b"), insert("c"))
+    # one session, one COMMIT
+    assert len(set(outcomes)) == 1 and not any(isinstance(o, Exception) for o in outcomes)
+    assert (writer.batches, writer.units) == (1, 3)
+    assert names(probe) == ["a", "b", "c"]
+
+
+def test_failing_unit_is_rolled_back_alone(client, writer, probe) -> None:
+    outcomes = gather(client, insert("a"), insert("b", fail=True), insert("c"))
+    assert isinstance(outcomes[1], ValueError)
+    assert not isinstance(outcomes[0], Exception) and not isinstance(outcomes[2], Exception)
+    assert writer.batches == 1
+    # b's SAVEPOINT was rolled back, a and c committed
+    assert names(probe) == ["a", "c"]
+
+
+def test_failed_commit_reaches_every_caller(client, writer, probe) -> None:
+    # the orphan row passes its SAVEPOINT, the deferred foreign key fails the COMMIT
+    outcomes = gather(client, insert("a"), insert("orphan", parent_id=999999), insert("c"))
+    assert all(isinstance(o, IntegrityError) for o in outcomes), outcomes
+    assert names(probe) == []
+
+    # the writer keeps running after a failed batch
+    assert gather(client, insert("d"))[0] is not None
+    assert names(probe) == ["d"]
+
+
+def test_endpoint_writes_use_the_writer(client, writer, user_headers) -> None:
+    vehicle_id = create_vehicle(client, user_headers)
+    response = client.put(f"/v2/vehicles/{vehicle_id}", headers=user_headers, json={"color": "Blue"})
+    assert response.status_code == 200 and response.json()["color"] == "Blue"
+    assert (writer.batches, writer.units) == (1, 1)
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import sqlite3
+import uuid
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app import database
+from app.idempotency import IdempotencyStore, fingerprint
+from app.main import app
+from app.write_queue import run_write
+from conftest import create_vehicle, register_and_login
+from test_gates import create_lot
+
+
+def count(db_path: str, sql: str, *parameters) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql, parameters).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def encode(result) -> tuple[int, bytes]:
+    return 201, json.dumps(result).encode()
+
+
+def worker() -> IdempotencyStore:
+    # one worker's store, on the shared test database
+    return IdempotencyStore(database.ReadSessionLocal, database.AsyncSessionLocal, ttl_seconds=60)
+
+
+def request(store: IdempotencyStore, key, body: bytes = b"r", result=None, release: asyncio.Event = None, error=None):
+    # store.run() with a write unit that returns `result` (or raises `error`) once `release` is set
+    calls = []
+
+    async def unit(db):
+        calls.append(1)
+        if release is not None:
+            await release.wait()
+        if error is not None:
+            raise error
+        return result
+
+    async def call(claim):
+        async with database.AsyncSessionLocal() as db:
+            return await run_write(db, claim(unit))
+
+    async def run():
+        return await store.run(key, fingerprint(body.decode()), encode, call)
+
+    return run, calls
+
+
+@pytest.fixture
+def key() -> tuple[int, str]:
+    return (1, str(uuid.uuid4()))
+
+
+def test_replay_returns_stored_response(client, key) -> None:
+    store = worker()
+    first, calls = request(store, key, result={"id": 1})
+    assert client.portal.call(first) == (201, b'{"id": 1}', {"id": 1})
+    assert client.portal.call(first) == (201, b'{"id": 1}', None)
+    # another worker replays it too
+    assert client.portal.call(request(worker(), key)[0])[:2] == (201, b'{"id": 1}')
+    # keys are per user
+    assert client.portal.call(request(store, (2, key[1]), result={"id": 2})[0])[2] == {"id": 2}
+    assert len(calls) == 1
+
+
+def test_concurrent_duplicates_wait_for_the_first(client, key) -> None:
+    store = worker()
+
+    async def three():
+        release = asyncio.Event()
+        run, calls = request(store, key, result={"id": 7}, release=release)
+        tasks = [asyncio.create_task(run()) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert store.stats()["pending"] == 1
+        release.set()
+        return await asyncio.gather(*tasks), calls
+
+    results, calls = client.portal.call(three)
+    assert len(calls) == 1
+    assert [r[:2] for r in results] == [(201, b'{"id": 7}')] * 3
+    assert sum(r[2] is None for r in results) == 2
+    assert store.stats()["waited"] >= 2 and store.stats()["pending"] == 0
+
+
+def test_worker_that_missed_the_key_replays(client, key) -> None:
+    # a second worker looked before the first committed: its claim fails, its write is rolled back
+    first, second = worker(), worker()
+    client.portal.call(request(first, key, result={"id": 3})[0])
+
+    async def missed(key):
+        second._lookup = lookup
+        return None
+
+    lookup = second._lookup
+    second._lookup = missed
+    run, calls = request(second, key, result={"id": 4})
+    assert client.portal.call(run) == (201, b'{"id": 3}', None)
+    assert calls == [] and second.stats()["taken"] == 1
+
+
+def test_errors_are_not_stored(client, key) -> None:
+    store = worker()
+
+    async def fail_twice():
+        release = asyncio.Event()
+        run, _ = request(store, key, release=release, error=HTTPException(status_code=404, detail="Session not found"))
+        tasks = [asyncio.create_task(run()) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert [e.status_code for e in client.portal.call(fail_twice)] == [404, 404]
+    # the key is free again: a later retry runs
+    assert client.portal.call(request(store, key, result={"id": 5})[0])[2] == {"id": 5}
+
+
+def test_key_reused_for_other_request(client, key) -> None:
+    store = worker()
+    client.portal.call(request(store, key, b"a", result={})[0])
+    with pytest.raises(HTTPException) as raised:
+        client.portal.call(request(store, key, b"b", result={})[0])
+    assert raised.value.status_code == 422
+
+
+def test_expired_keys(client, key, db_path) -> None:
+    store = worker()
+    client.portal.call(request(store, key, result={"id": 6})[0])
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE idempotency_keys SET created_at = created_at - 61 WHERE user_id = ? AND key = ?", key)
+    conn.commit()
+    conn.close()
+
+    # expired: the key runs again (taking the row over), the sweep leaves the new one
+    assert client.portal.call(request(store, key, b"other", result={"id": 7})[0])[2] == {"id": 7}
+    client.portal.call(store.sweep)
+    assert count(db_path, "SELECT COUNT(*) FROM idempotency_keys WHERE user_id = ? AND key = ?", *key) == 1
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE idempotency_keys SET created_at = created_at - 61 WHERE user_id = ? AND key = ?", key)
+    conn.commit()
+    conn.close()
+    assert client.portal.call(store.sweep) >= 1
+    assert count(db_path, "SELECT COUNT(*) FROM idempotency_keys WHERE user_id = ? AND key = ?", *key) == 0
+
+
+def test_payment_retry_returns_first_response(client, admin_headers, db_path, recorder) -> None:
+    headers = register_and_login(client)
+    lot_id = create_lot(client, admin_headers)
+    vehicle_id = create_vehicle(client, headers)
+    session_id = client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=headers, json={"vehicle_id": vehicle_id}).json()["id"]
+    body = {"sessions_id": session_id, "method": "ideal"}
+    keyed = {**headers, "Idempotency-Key": str(uuid.uuid4())}
+
+    first = client.post("/v2/payments", headers=keyed, json=body)
+    assert first.status_code == 201 and "Idempotent-Replayed" not in first.headers
+    recorder.start()
+    again = client.post("/v2/payments", headers=keyed, json=body)
+    recorder.stop()
+    assert again.status_code == 201 and again.headers["Idempotent-Replayed"] == "true"
+    assert again.json() == first.json()
+    # the replay doesn't touch payments or sessions
+    assert not [s for s, _ in recorder.queries if "payments" in s or "sessions" in s]
+    assert count(db_path, "SELECT COUNT(*) FROM payments WHERE sessions_id = ?", session_id) == 1
+
+    # same key, other request
+    other = client.post("/v2/payments", headers=keyed, json={**body, "method": "creditcard"})
+    assert other.status_code == 422
+    # the key is per user
+    assert client.post("/v2/payments", headers={**register_and_login(client), "Idempotency-Key": keyed["Idempotency-Key"]}, json=body).status_code == 201
+    # without the header every request is a new payment
+    assert client.post("/v2/payments", headers=headers, json=body).status_code == 201
+    assert count(db_path, "SELECT COUNT(*) FROM payments WHERE sessions_id = ?", session_id) == 3
+
+
+def test_errors_are_not_replayed(client) -> None:
+    headers = {**register_and_login(client), "Idempotency-Key": str(uuid.uuid4())}
+    assert client.post("/v2/payments", headers=headers, json={"sessions_id": 999999, "method": "ideal"}).status_code == 404
+    assert client.post("/v2/payments", headers=headers, json={"sessions_id": 999999, "method": "ideal"}).status_code == 404
+    assert client.post("/v2/payments", headers={**headers, "Idempotency-Key": ""}, json={"sessions_id": 1, "method": "ideal"}).status_code == 400
+
+
+def test_concurrent_session_starts_wait_for_the_first(client, admin_headers, db_path) -> None:
+    headers = {**register_and_login(client), "Idempotency-Key": str(uuid.uuid4())}
+    lot_id = create_lot(client, admin_headers)
+    vehicle_id = create_vehicle(client, headers)
+    url = f"/v2/parking-lots/{lot_id}/sessions/start"
+
+    async def start_three():
+        # on the app's event loop, so the three requests are in flight together
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver") as http:
+            return await asyncio.gather(*(http.post(url, headers=headers, json={"vehicle_id": vehicle_id}) for _ in range(3)))
+
+    responses = client.portal.call(start_three)
+    assert [r.status_code for r in responses] == [201, 201, 201]
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert sum(r.headers.get("Idempotent-Replayed") == "true" for r in responses) == 2
+    assert count(db_path, "SELECT COUNT(*) FROM sessions WHERE vehicle_id = ?", vehicle_id) == 1
+
+    # a plain retry after the response: the same session, not a 409
+    again = client.post(url, headers=headers, json={"vehicle_id": vehicle_id})
+    assert again.status_code == 201 and again.json() == responses[0].json()
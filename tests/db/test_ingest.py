@@ -0,0 +1,152 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from conftest import create_vehicle, register_and_login
+from test_billing_ledger import assert_ledger_consistent
+from test_gates import create_lot
+
+URL = "/v2/gate/events"
+
+
+def ingest(client, headers, events) -> list[dict]:
+    response = client.post(URL, headers=headers, json={"events": events})
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [r["index"] for r in results] == list(range(len(events)))
+    return results
+
+
+def occupied(client, headers, lot_id: int) -> int:
+    return client.get(f"/v2/parking-lots/{lot_id}/availability", headers=headers).json()["occupied"]
+
+
+def ingest_stats(client, headers) -> dict:
+    return client.get("/v2/metrics", headers=headers).json()["ingest"]
+
+
+def test_bulk_entries_and_exits(client, admin_headers) -> None:
+    one, two = create_lot(client, admin_headers), create_lot(client, admin_headers)
+
+    before = ingest_stats(client, admin_headers)
+    first = results = ingest(client, admin_headers, [
+        {"lot_id": one, "kind": "entry", "license_plate": "bulk-01"},
+        {"lot_id": one, "kind": "entry", "license_plate": "BULK 01"},  # tweede lezing
+        {"lot_id": two, "kind": "entry", "license_plate": "bulk-01"},
+        {"lot_id": one, "kind": "entry", "license_plate": "bulk-02"},
+        {"lot_id": one, "kind": "exit", "license_plate": "bulk-03"},
+        {"lot_id": one, "kind": "entry", "license_plate": " - "},
+        {"lot_id": 999999, "kind": "entry", "license_plate": "bulk-04"},
+    ])
+    assert [r["outcome"] for r in results] == ["created", "duplicate", "created", "created", "rejected", "rejected", "rejected"]
+    assert results[1]["session_id"] == results[0]["session_id"]
+    assert [r["status"] for r in results[4:]] == [404, 400, 404]
+    assert occupied(client, admin_headers, one) == 2 and occupied(client, admin_headers, two) == 1
+    # one write transaction per lot
+    after = ingest_stats(client, admin_headers)
+    assert after["transactions"] - before["transactions"] == 3
+    assert after["duplicates"] - before["duplicates"] == 1 and after["invalid"] - before["invalid"] == 1
+
+    # in camera order, not in request order
+    results = ingest(client, admin_headers, [
+        {"lot_id": one, "kind": "exit", "license_plate": "bulk-05", "at": "2030-01-01T10:30:00"},
+        {"lot_id": one, "kind": "entry", "license_plate": "bulk-05", "at": "2030-01-01T10:00:00"},
+        {"lot_id": one, "kind": "exit", "license_plate": "bulk-02"},
+    ])
+    assert [r["outcome"] for r in results] == ["stopped", "created", "stopped"]
+    assert results[0]["session_id"] == results[1]["session_id"]
+    session = client.get(f"/v2/parking-lots/{one}/sessions/{results[0]['session_id']}", headers=admin_headers).json()
+    assert session["duration_minutes"] == 30 and session["status"] == "COMPLETED"
+    assert occupied(client, admin_headers, one) == 1
+
+    # an entry already done through the bulk endpoint is a repeated read for the single gate endpoint
+    again = client.post(f"/v2/parking-lots/{one}/gate/entry", headers=admin_headers, json={"license_plate": "bulk-01"})
+    assert again.status_code == 200 and again.json()["id"] == first[0]["session_id"]
+
+    assert ingest_stats(client, admin_headers)["events_per_second"] > 0
+
+
+def test_ledger_follows_bulk_exits(client, admin_headers, db_path) -> None:
+    lot_id = create_lot(client, admin_headers)
+    user_headers = register_and_login(client)
+    conn = sqlite3.connect(db_path)
+    plates = [
+        conn.execute("SELECT license_plate FROM vehicles WHERE vehicle_id = ?", (create_vehicle(client, user_headers),)).fetchone()[0]
+        for _ in range(2)
+    ]
+    conn.close()
+
+    # first car in and out in one batch, the second one stays until the next batch
+    results = ingest(client, admin_headers, [
+        {"lot_id": lot_id, "kind": "entry", "license_plate": plates[0], "at": "2025-03-01T08:00:00Z"},
+        {"lot_id": lot_id, "kind": "entry", "license_plate": plates[1], "at": "2025-03-01T08:05:00Z"},
+        {"lot_id": lot_id, "kind": "exit", "license_plate": plates[0], "at": "2025-03-01T10:00:00Z"},
+    ])
+    assert [r["outcome"] for r in results] == ["created", "created", "stopped"]
+    assert_ledger_consistent(client)
+    # the open one is priced live
+    assert client.get("/v2/billing", headers=user_headers).json()["sessions"] == 2
+
+    results = ingest(client, admin_headers, [
+        {"lot_id": lot_id, "kind": "exit", "license_plate": plates[1].lower(), "at": "2025-03-01T11:05:00Z"},
+    ])
+    assert results[0]["outcome"] == "stopped"
+    assert_ledger_consistent(client)
+    assert client.get("/v2/billing", headers=user_headers).json()["sessions"] == 2
+
+
+def test_full_lot_within_one_batch(client, admin_headers) -> None:
+    lot_id = create_lot(client, admin_headers, capacity=2)
+    results = ingest(client, admin_headers, [
+        {"lot_id": lot_id, "kind": "entry", "license_plate": f"vol-0{i}"} for i in range(3)
+    ])
+    assert [r["outcome"] for r in results] == ["created", "created", "rejected"]
+    assert results[2]["status"] == 409
+    assert occupied(client, admin_headers, lot_id) == 2
+
+    # exit and a new car in the same batch: the place is free again
+    results = ingest(client, admin_headers, [
+        {"lot_id": lot_id, "kind": "exit", "license_plate": "vol-00"},
+        {"lot_id": lot_id, "kind": "entry", "license_plate": "vol-02"},
+    ])
+    assert [r["outcome"] for r in results] == ["stopped", "created"]
+    assert occupied(client, admin_headers, lot_id) == 2
+
+
+def test_validation(client, admin_headers, user_headers) -> None:
+    event = {"lot_id": 1, "kind": "entry", "license_plate": "x-1"}
+    assert client.post(URL, headers=user_headers, json={"events": [event]}).status_code == 403
+    assert client.post(URL, headers=admin_headers, json={"events": []}).status_code == 422
+    assert client.post(URL, headers=admin_headers, json={"events": [{**event, "kind": "park"}]}).status_code == 422
+    assert client.post(URL, headers=admin_headers, json={"events": [event] * 1001}).status_code == 400
+
+
+def test_backdated_reads_rewind_lot_stats(client, admin_headers) -> None:
+    lot_id = create_lot(client, admin_headers)
+    day = (datetime.now(timezone.utc) - timedelta(days=2)).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+    def at(hours: float) -> str:
+        return (day + timedelta(hours=hours)).isoformat()
+
+    def hourly() -> list[tuple]:
+        response = client.get(
+            f"/v2/parking-lots/{lot_id}/stats",
+            headers=admin_headers,
+            params={"bucket": "hour", "from": day.isoformat() + "Z", "to": (day + timedelta(days=1)).isoformat() + "Z"},
+        )
+        assert response.status_code == 200, response.text
+        return [(b["sessions"], b["peak_occupancy"]) for b in response.json()["buckets"]]
+
+    ingest(client, admin_headers, [
+        {"lot_id": lot_id, "kind": "entry", "license_plate": "late-01", "at": at(8)},
+        {"lot_id": lot_id, "kind": "exit", "license_plate": "late-01", "at": at(9.5)},
+    ])
+    # the day is materialized now
+    assert hourly()[9:11] == [(1, 1), (0, 0)]
+
+    # a camera that was offline sends its reads of that day afterwards
+    results = ingest(client, admin_headers, [
+        {"lot_id": lot_id, "kind": "entry", "license_plate": "late-02", "at": at(10)},
+        {"lot_id": lot_id, "kind": "exit", "license_plate": "late-02", "at": at(10.75)},
+    ])
+    assert [r["outcome"] for r in results] == ["created", "stopped"]
+    assert hourly()[9:11] == [(1, 1), (1, 1)]
@@ -0,0 +1,90 @@
+import sqlite3
+
+
+def create_lot(client, admin_headers, name: str) -> int:
+    payload = {
+        "name": name,
+        "location": "Centrum",
+        "address": "Lijnbaan 1",
+        "capacity": 10,
+        "tariff": 2.0,
+        "daytariff": 15.0,
+        "latitude": 51.92,
+        "longitude": 4.48,
+    }
+    response = client.post("/v2/parking-lots", headers=admin_headers, json=payload)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def test_detail_etag_and_304(client, admin_headers, recorder) -> None:
+    lot_id = create_lot(client, admin_headers, "Catalogus Garage")
+
+    client.get(f"/v2/parking-lots/{lot_id}")
+    recorder.start()
+    first = client.get(f"/v2/parking-lots/{lot_id}")
+    recorder.stop()
+    assert first.status_code == 200 and first.json()["name"] == "Catalogus Garage"
+    # served from memory, after checking the catalogue's version
+    assert len(recorder.queries) == 1 and "lot_catalogue_version" in recorder.queries[0][0]
+    etag = first.headers["etag"]
+
+    again = client.get(f"/v2/parking-lots/{lot_id}", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["etag"] == etag
+
+    client.put(f"/v2/parking-lots/{lot_id}", headers=admin_headers, json={"name": "Nieuwe Naam"}).raise_for_status()
+    changed = client.get(f"/v2/parking-lots/{lot_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json()["name"] == "Nieuwe Naam"
+    assert changed.headers["etag"] != etag
+
+    client.delete(f"/v2/parking-lots/{lot_id}", headers=admin_headers).raise_for_status()
+    assert client.get(f"/v2/parking-lots/{lot_id}").status_code == 404
+
+
+def test_list_etag_and_pages(client, admin_headers, user_headers) -> None:
+    create_lot(client, admin_headers, "Lijst Garage")
+    first = client.get("/v2/parking-lots?limit=2", headers=user_headers)
+    assert first.status_code == 200
+    page = first.json()
+    assert len(page["items"]) == 2 and page["limit"] == 2 and page["offset"] == 0 and page["next_cursor"]
+    assert client.get("/v2/parking-lots?limit=2", headers={**user_headers, "If-None-Match": first.headers["etag"]}).status_code == 304
+
+    # same pages with the cursor as with offsets
+    after = client.get(f"/v2/parking-lots?limit=2&after={page['next_cursor']}", headers=user_headers).json()
+    offset = client.get("/v2/parking-lots?limit=2&offset=2", headers=user_headers).json()
+    assert after["items"] == offset["items"]
+
+    # a new lot changes the total and so the ETag
+    create_lot(client, admin_headers, "Nog Een Garage")
+    assert client.get("/v2/parking-lots?limit=2", headers={**user_headers, "If-None-Match": first.headers["etag"]}).status_code == 200
+
+
+def test_writes_by_other_workers_are_seen(client, admin_headers, user_headers, db_path) -> None:
+    lot_id = create_lot(client, admin_headers, "Andere Worker Garage")
+    etag = client.get(f"/v2/parking-lots/{lot_id}").headers["etag"]
+    listed = client.get("/v2/parking-lots?limit=1", headers=user_headers).json()["total"]
+
+    # another worker (or a script) renames this lot and adds one
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE parking_lots SET name = 'Hernoemd' WHERE id = ?", (lot_id,))
+    new_id = conn.execute(
+        "INSERT INTO parking_lots (name, location, address, capacity, reserved, tariff, daytariff, created_at) "
+        "SELECT name || ' 2', location, address, capacity, 0, tariff, daytariff, created_at FROM parking_lots WHERE id = ?",
+        (lot_id,),
+    ).lastrowid
+    conn.commit()
+    conn.close()
+
+    renamed = client.get(f"/v2/parking-lots/{lot_id}", headers={"If-None-Match": etag})
+    assert renamed.status_code == 200 and renamed.json()["name"] == "Hernoemd"
+    assert client.get(f"/v2/parking-lots/{new_id}").status_code == 200
+    assert client.get("/v2/parking-lots?limit=1", headers=user_headers).json()["total"] == listed + 1
+
+
+def test_metrics(client, admin_headers, user_headers) -> None:
+    assert client.get("/v2/metrics", headers=user_headers).status_code == 403
+    metrics = client.get("/v2/metrics", headers=admin_headers).json()
+    lots = metrics["lot_catalogue"]
+    assert lots["complete"] and lots["lots"] > 0 and lots["memory_bytes"] > 0
+    assert 0 <= lots["hit_ratio"] <= 1
@@ -0,0 +1,55 @@
+from app import database
+from app.geo import lot_index
+
+
+def create_lot(client, admin_headers, name: str, lat: float, lon: float) -> int:
+    payload = {
+        "name": name,
+        "location": "Test",
+        "address": f"{name} 1",
+        "capacity": 10,
+        "tariff": 2.0,
+        "daytariff": 15.0,
+        "latitude": lat,
+        "longitude": lon,
+    }
+    response = client.post("/v2/parking-lots", headers=admin_headers, json=payload)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def nearby(client, headers, lat, lon, radius=1000, limit=10) -> list[dict]:
+    response = client.get("/v2/parking-lots/nearby", headers=headers, params={"lat": lat, "lon": lon, "radius": radius, "limit": limit})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_nearby_follows_create_update_delete(client, admin_headers, user_headers) -> None:
+    # ergens op zee, ver van de andere test-lots
+    near = create_lot(client, admin_headers, "Near", 54.5000, 3.0000)
+    far = create_lot(client, admin_headers, "Far", 54.5050, 3.0000)  # ~556 m
+
+    found = nearby(client, user_headers, 54.5, 3.0)
+    assert [lot["id"] for lot in found] == [near, far]
+    assert found[0]["distance_m"] == 0.0 and 550 < found[1]["distance_m"] < 560
+    assert [lot["id"] for lot in nearby(client, user_headers, 54.5, 3.0, radius=300)] == [near]
+    assert [lot["id"] for lot in nearby(client, user_headers, 54.5, 3.0, limit=1)] == [near]
+
+    client.put(f"/v2/parking-lots/{far}", headers=admin_headers, json={"latitude": 54.5001}).raise_for_status()
+    assert [lot["id"] for lot in nearby(client, user_headers, 54.5, 3.0, radius=300)] == [near, far]
+
+    client.delete(f"/v2/parking-lots/{near}", headers=admin_headers).raise_for_status()
+    assert [lot["id"] for lot in nearby(client, user_headers, 54.5, 3.0)] == [far]
+
+
+def test_nearby_reload_and_validation(client, admin_headers, user_headers) -> None:
+    lot_id = create_lot(client, admin_headers, "Reload", -54.5, -3.0)
+    lot_index.remove(lot_id)  # as if another worker created it
+    assert nearby(client, user_headers, -54.5, -3.0) == []
+
+    client.portal.call(lot_index.load, database.ReadSessionLocal)
+    assert [lot["id"] for lot in nearby(client, user_headers, -54.5, -3.0)] == [lot_id]
+
+    assert client.get("/v2/parking-lots/nearby", params={"lat": 52, "lon": 4}).status_code in (401, 403)
+    for params in ({"lat": 91, "lon": 4}, {"lat": 52, "lon": 181}, {"lat": 52, "lon": 4, "radius": 0}, {"lat": 52}):
+        assert client.get("/v2/parking-lots/nearby", headers=user_headers, params=params).status_code == 422
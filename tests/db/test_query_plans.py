@@ -0,0 +1,46 @@
+import re
+import sqlite3
+
+from app.database import register_sqlite_functions
+
+# A router query may never fall back to a full scan of these tables
+GUARDED_TABLES = ("sessions", "payments", "reservation")
+
+
+def guarded_names(statement: str) -> set:
+    # EXPLAIN QUERY PLAN reports aliased tables by their alias
+    names = set(GUARDED_TABLES)
+    for match in re.finditer(r"\b(sessions|payments|reservation)\s+AS\s+(\w+)", statement, re.IGNORECASE):
+        names.add(match.group(2))
+    return names
+
+
+def full_scans(conn: sqlite3.Connection, statement: str, parameters: tuple) -> list:
+    plan = conn.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    names = guarded_names(statement)
+    scans = []
+    for _id, _parent, _unused, detail in plan:
+        match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+        if match and match.group(1) in names:
+            scans.append(detail)
+    return scans
+
+
+def test_router_queries_use_indexes(api_walk, recorder, db_path) -> None:
+    recorder.start()
+    api_walk()
+    recorder.stop()
+
+    queries = dict(recorder.queries)  # one plan per distinct statement
+    assert len(queries) > 20
+
+    conn = sqlite3.connect(db_path)
+    register_sqlite_functions(conn)
+    failures = []
+    for statement, parameters in queries.items():
+        scans = full_scans(conn, statement, parameters)
+        if scans:
+            failures.append(f"{scans} in: {' '.join(statement.split())}")
+    conn.close()
+
+    assert not failures, "full table scans:\n" + "\n".join(failures)
@@ -0,0 +1,98 @@
+import sqlite3
+
+from conftest import create_vehicle, register_and_login
+from test_gates import create_lot
+
+
+def book(client, headers, vehicle_id: int, lot_id: int, start: str, end: str):
+    body = {"vehicles_id": vehicle_id, "parking_lots_id": lot_id, "start_time": start, "end_time": end}
+    return client.post("/v2/reservations", headers=headers, json=body)
+
+
+def test_full_lot_refuses_overlapping_reservation(client, admin_headers, recorder) -> None:
+    headers = register_and_login(client)
+    lot_id = create_lot(client, admin_headers, capacity=1)
+    vehicle_id = create_vehicle(client, headers)
+
+    first = book(client, headers, vehicle_id, lot_id, "2031-03-01T10:00:00Z", "2031-03-01T12:00:00Z")
+    assert first.status_code == 201, first.text
+    recorder.start()
+    full = book(client, headers, vehicle_id, lot_id, "2031-03-01T11:00:00+01:00", "2031-03-01T13:00:00Z")
+    recorder.stop()
+    assert full.status_code == 409, full.text
+    # decided in memory: only the lot's version is read and the INSERT is rolled back
+    selects = [s for s, _ in recorder.queries if s.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == 1 and "reservation_lot_versions" in selects[0]
+    listed = client.get("/v2/reservations", headers=headers).json()["items"]
+    assert [r["id"] for r in listed if r["parking_lots_id"] == lot_id] == [first.json()["id"]]
+
+    # right after the first one: free
+    after = book(client, headers, vehicle_id, lot_id, "2031-03-01T12:00:00Z", "2031-03-01T14:00:00Z")
+    assert after.status_code == 201, after.text
+    assert book(client, headers, vehicle_id, lot_id, "2031-03-01T12:00:00Z", "2031-03-01T11:00:00Z").status_code == 400
+
+
+def test_update_and_delete_move_the_booking(client, admin_headers) -> None:
+    headers = register_and_login(client)
+    lot_id = create_lot(client, admin_headers, capacity=1)
+    vehicle_id = create_vehicle(client, headers)
+    first = book(client, headers, vehicle_id, lot_id, "2031-04-01T10:00:00Z", "2031-04-01T12:00:00Z").json()
+    second = book(client, headers, vehicle_id, lot_id, "2031-04-01T12:00:00Z", "2031-04-01T14:00:00Z").json()
+
+    # longer than the free window
+    longer = client.put(f"/v2/reservations/{first['id']}", headers=headers, json={"end_time": "2031-04-01T13:00:00Z"})
+    assert longer.status_code == 409, longer.text
+    assert client.get(f"/v2/reservations/{first['id']}", headers=headers).json()["end_time"] == "2031-04-01T12:00:00Z"
+
+    # cancelled: the spot is free again
+    cancelled = client.put(f"/v2/reservations/{second['id']}", headers=headers, json={"status": "canceled"})
+    assert cancelled.status_code == 200, cancelled.text
+    assert client.put(f"/v2/reservations/{first['id']}", headers=headers, json={"end_time": "2031-04-01T13:00:00Z"}).status_code == 200
+
+    assert book(client, headers, vehicle_id, lot_id, "2031-04-01T11:00:00Z", "2031-04-01T12:00:00Z").status_code == 409
+    deleted = client.delete(f"/v2/reservations/{first['id']}", headers=admin_headers)
+    assert deleted.status_code == 200, deleted.text
+    assert book(client, headers, vehicle_id, lot_id, "2031-04-01T11:00:00Z", "2031-04-01T12:00:00Z").status_code == 201
+
+    stats = client.get("/v2/metrics", headers=admin_headers).json()["reservations"]
+    assert stats["rejected"] >= 3 and stats["lots"] >= 1
+
+
+def test_move_frees_the_old_lot(client, admin_headers) -> None:
+    headers = register_and_login(client)
+    old_lot, new_lot = create_lot(client, admin_headers, capacity=1), create_lot(client, admin_headers, capacity=1)
+    vehicle_id = create_vehicle(client, headers)
+    moved = book(client, headers, vehicle_id, old_lot, "2031-05-01T10:00:00Z", "2031-05-01T12:00:00Z").json()
+
+    # the new lot isn't loaded yet when the reservation moves there
+    response = client.put(f"/v2/reservations/{moved['id']}", headers=headers, json={"parking_lots_id": new_lot})
+    assert response.status_code == 200, response.text
+    assert book(client, headers, vehicle_id, old_lot, "2031-05-01T10:00:00Z", "2031-05-01T12:00:00Z").status_code == 201
+    assert book(client, headers, vehicle_id, new_lot, "2031-05-01T11:00:00Z", "2031-05-01T12:00:00Z").status_code == 409
+
+    # a refused move leaves both lots as they are
+    refused = client.put(f"/v2/reservations/{moved['id']}", headers=headers, json={"parking_lots_id": old_lot})
+    assert refused.status_code == 409, refused.text
+    assert client.get(f"/v2/reservations/{moved['id']}", headers=headers).json()["parking_lots_id"] == new_lot
+    assert book(client, headers, vehicle_id, new_lot, "2031-05-01T11:00:00Z", "2031-05-01T12:00:00Z").status_code == 409
+    assert book(client, headers, vehicle_id, old_lot, "2031-05-01T12:00:00Z", "2031-05-01T13:00:00Z").status_code == 201
+
+
+def test_bookings_of_other_writers_count(client, admin_headers, db_path) -> None:
+    headers = register_and_login(client)
+    lot_id = create_lot(client, admin_headers, capacity=1)
+    vehicle_id = create_vehicle(client, headers)
+    assert book(client, headers, vehicle_id, lot_id, "2031-06-01T08:00:00Z", "2031-06-01T09:00:00Z").status_code == 201
+
+    # another worker (or a script) books the lot behind this worker's back
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO reservation (vehicles_id, parking_lots_id, start_time, end_time, status, cost) VALUES (?, ?, ?, ?, 'confirmed', 0)",
+        (vehicle_id, lot_id, "2031-06-01T10:00:00Z", "2031-06-01T12:00:00Z"),
+    )
+    conn.commit()
+    conn.close()
+
+    assert book(client, headers, vehicle_id, lot_id, "2031-06-01T11:00:00Z", "2031-06-01T12:00:00Z").status_code == 409
+    stats = client.get("/v2/metrics", headers=admin_headers).json()["reservations"]
+    assert stats["stale"] >= 1
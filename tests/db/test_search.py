@@ -0,0 +1,57 @@
+from app import database
+from app.search import lot_search
+
+
+def create_lot(client, admin_headers, name: str, address: str) -> int:
+    payload = {
+        "name": name,
+        "location": "Zoektest",
+        "address": address,
+        "capacity": 10,
+        "tariff": 2.0,
+        "daytariff": 15.0,
+        "latitude": 52.0,
+        "longitude": 5.0,
+    }
+    response = client.post("/v2/parking-lots", headers=admin_headers, json=payload)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def search(client, headers, q: str) -> list[dict]:
+    response = client.get("/v2/parking-lots/search", headers=headers, params={"q": q})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_search_follows_lot_writes(client, admin_headers, user_headers, recorder) -> None:
+    lot_id = create_lot(client, admin_headers, "Zwaluwstaart Parkeergarage", "Kwikstaartlaan 12, 1234 AB Ulrum")
+
+    recorder.start()
+    found = search(client, user_headers, "Zwaluwstart")
+    recorder.stop()
+    assert [lot["id"] for lot in found] == [lot_id]
+    assert found[0]["address"] == "Kwikstaartlaan 12, 1234 AB Ulrum" and found[0]["score"] > 0
+    # served from the index
+    assert recorder.queries == []
+
+    assert [lot["id"] for lot in search(client, user_headers, "kwikst")] == [lot_id]
+
+    client.put(f"/v2/parking-lots/{lot_id}", headers=admin_headers, json={"name": "Roodborst Garage"}).raise_for_status()
+    assert search(client, user_headers, "zwaluwstaart") == []
+    assert [lot["id"] for lot in search(client, user_headers, "roodborst")] == [lot_id]
+
+    client.delete(f"/v2/parking-lots/{lot_id}", headers=admin_headers).raise_for_status()
+    assert search(client, user_headers, "roodborst") == []
+
+
+def test_search_reload_and_validation(client, admin_headers, user_headers) -> None:
+    lot_id = create_lot(client, admin_headers, "Merelhof Parking", "Lijsterbes 3, 9999 ZZ Usquert")
+    lot_search.remove(lot_id)  # as if another worker created it
+    assert search(client, user_headers, "merelhof") == []
+    client.portal.call(lot_search.load, database.ReadSessionLocal)
+    assert [lot["id"] for lot in search(client, user_headers, "merelhof")] == [lot_id]
+
+    assert client.get("/v2/parking-lots/search", params={"q": "merelhof"}).status_code in (401, 403)
+    assert client.get("/v2/parking-lots/search", headers=user_headers, params={"q": ""}).status_code == 422
+    assert client.get("/v2/parking-lots/search", headers=user_headers, params={"q": "x", "limit": 51}).status_code == 422
@@ -0,0 +1,145 @@
+import os
+import sqlite3
+
+from app import database, settlement
+from app.dependencies import tr_hash
+from conftest import TOOLS_DIR, create_vehicle, register_and_login, run_in_app
+from test_billing_ledger import assert_ledger_consistent
+from test_gates import create_lot
+
+
+def settle(client, chunk: int = 1000) -> tuple[int, int]:
+    # run the job to the end, (payments walked, payments matched)
+    scanned = matched = 0
+    done, hashes = False, None
+    while not done:
+        s, m, done, hashes = run_in_app(client, lambda db: settlement.settle_chunk(db, chunk, hashes))
+        scanned, matched = scanned + s, matched + m
+    return scanned, matched
+
+
+def legacy_payment(db_path: str, user_id: int, thash: str, amount: float = 2.5, completed: bool = True, sessions_id=0) -> int:
+    # imported payment without a session of its own, only the transaction hash
+    conn = sqlite3.connect(db_path)
+    cur = conn.execute(
+        "INSERT INTO payments (amount, sessions_id, initiator_users_id, hash, completed_at) VALUES (?, ?, ?, ?, ?)",
+        (amount, sessions_id, user_id, thash, "2025-05-22 09:09:00" if completed else None),
+    )
+    conn.commit()
+    conn.close()
+    return cur.lastrowid
+
+
+def closed_session(client, headers, lot_id: int) -> tuple[int, str]:
+    vehicle_id = create_vehicle(client, headers)
+    plate = next(v["license_plate"] for v in client.get("/v2/vehicles", headers=headers).json()["items"] if v["vehicle_id"] == vehicle_id)
+    session_id = client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=headers, json={"vehicle_id": vehicle_id}).json()["id"]
+    client.post(f"/v2/parking-lots/{lot_id}/sessions/{session_id}/stop", headers=headers).raise_for_status()
+    return session_id, plate
+
+
+def test_job_matches_hash_only_payments(client, admin_headers, db_path) -> None:
+    settle(client)
+    headers = register_and_login(client)
+    user_id = client.get("/v2/profile", headers=headers).json()["id"]
+    lot_id = create_lot(client, admin_headers)
+    session_id, plate = closed_session(client, headers, lot_id)
+
+    legacy_payment(db_path, user_id, tr_hash(session_id, plate))
+    legacy_payment(db_path, user_id, "d15acc14-02c3-4c9d-b047-c6b16befc302")  # matches no session
+    # a payment made through the API carries the hash of its own session
+    client.post("/v2/payments", headers=headers, json={"sessions_id": session_id, "method": "ideal"}).raise_for_status()
+    assert client.get("/v2/billing", headers=headers).json()["payed"] == 0.0
+
+    scanned, matched = settle(client)
+    assert (scanned, matched) == (3, 1)
+    assert_ledger_consistent(client)
+    # the API payment was for 0.00 (stopped right away), so the hash match pays the session
+    summary = client.get("/v2/billing", headers=headers).json()
+    assert summary["payed"] == 2.5 and summary["sessions"] == 1
+
+    # nothing new: the job continues after the last payment
+    assert settle(client) == (0, 0)
+    progress = run_in_app(client, settlement.read_progress)
+    assert progress[0] >= 3
+
+
+def test_matched_payment_follows_writes(client, admin_headers, db_path, recorder) -> None:
+    settle(client)
+    headers = register_and_login(client)
+    user_id = client.get("/v2/profile", headers=headers).json()["id"]
+    lot_id = create_lot(client, admin_headers)
+    session_id, plate = closed_session(client, headers, lot_id)
+    payment_id = legacy_payment(db_path, user_id, tr_hash(session_id, plate), amount=4.0, completed=False)
+
+    assert settle(client) == (1, 1)
+    assert_ledger_consistent(client)
+    summary = client.get("/v2/billing", headers=headers).json()
+    assert summary["payed"] == 4.0 and summary["payed_completed"] == 0.0
+
+    # completing the payment moves the matched session in the ledger
+    assert client.put(f"/v2/payments/{payment_id}", headers=headers).status_code == 200
+    assert_ledger_consistent(client)
+    assert client.get("/v2/billing", headers=headers).json()["payed_completed"] == 4.0
+
+    # a new plate doesn't move the match
+    vehicle_id = client.get("/v2/vehicles", headers=headers).json()["items"][0]["vehicle_id"]
+    client.put(f"/v2/vehicles/{vehicle_id}", headers=headers, json={"license_plate": "NEW-02-PL"}).raise_for_status()
+    assert_ledger_consistent(client)
+    assert client.get("/v2/billing", headers=headers).json()["payed"] == 4.0
+
+    # billing reads the links, no transaction hash computed per session
+    client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=headers, json={"vehicle_id": vehicle_id}).raise_for_status()
+    recorder.start()
+    client.get("/v2/billing", headers=headers).raise_for_status()
+    recorder.stop()
+    assert not [s for s, _ in recorder.queries if "md5" in s]
+
+
+def test_job_resumes_per_chunk(client, admin_headers, db_path) -> None:
+    settle(client)
+    headers = register_and_login(client)
+    user_id = client.get("/v2/profile", headers=headers).json()["id"]
+    lot_id = create_lot(client, admin_headers)
+    sessions = [closed_session(client, headers, lot_id) for _ in range(3)]
+    for session_id, plate in sessions:
+        legacy_payment(db_path, user_id, tr_hash(session_id, plate), amount=1.0)
+
+    start, _ = run_in_app(client, settlement.read_progress)
+    # one payment per transaction; a stopped run continues after the last committed chunk
+    scanned, matched, done, _ = run_in_app(client, lambda db: settlement.settle_chunk(db, 1))
+    assert (scanned, matched, done) == (1, 1, False)
+    assert run_in_app(client, settlement.read_progress)[0] == start + 1
+    assert_ledger_consistent(client)
+    assert client.get("/v2/billing", headers=headers).json()["payed"] == 1.0
+
+    assert settle(client, chunk=1) == (2, 2)
+    assert_ledger_consistent(client)
+    assert client.get("/v2/billing", headers=headers).json()["payed"] == 3.0
+
+
+def test_payment_of_a_deleted_session_is_matched(client, admin_headers, db_path, tmp_path) -> None:
+    # the migration's backfill and the job take the same payments (sessions_id is NOT NULL
+    # here, a deleted session leaves an id that matches no session)
+    settle(client)
+    headers = register_and_login(client)
+    user_id = client.get("/v2/profile", headers=headers).json()["id"]
+    lot_id = create_lot(client, admin_headers)
+    session_id, plate = closed_session(client, headers, lot_id)
+    payment_id = legacy_payment(db_path, user_id, tr_hash(session_id, plate), sessions_id=999999999)
+
+    # migration 011 on a copy (its backfill bypasses the ledger)
+    copy = sqlite3.connect(str(tmp_path / "migrated.db"))
+    conn = sqlite3.connect(db_path)
+    conn.backup(copy)
+    conn.close()
+    database.register_sqlite_functions(copy)
+    with open(os.path.join(TOOLS_DIR, "migrations", "011_payment_settlements.sql"), "r", encoding="utf-8") as f:
+        copy.executescript(f.read())
+    links = copy.execute("SELECT session_id FROM payment_settlements WHERE payment_id = ?", (payment_id,)).fetchall()
+    copy.close()
+    assert links == [(session_id,)]
+
+    assert settle(client) == (1, 1)
+    assert_ledger_consistent(client)
+    assert client.get("/v2/billing", headers=headers).json()["payed"] == 2.5
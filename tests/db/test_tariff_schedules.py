@@ -0,0 +1,70 @@
+from app.tariffs import schedule_cache
+from conftest import create_vehicle, register_and_login
+
+SCHEDULE = {
+    "timezone": "Europe/Amsterdam",
+    "bands": [
+        {"days": [0, 1, 2, 3, 4], "start": "08:00", "end": "18:00", "rate": 3.5},
+        {"days": [0, 1, 2, 3, 4, 5, 6], "start": "18:00", "end": "08:00", "rate": 1.0, "cap": 6.0},
+    ],
+}
+
+
+def create_lot(client, admin_headers, **extra) -> int:
+    payload = {
+        "name": "Schedule Parking",
+        "location": "Centrum",
+        "address": "Damrak 1",
+        "capacity": 10,
+        "tariff": 2.5,
+        "daytariff": 20.0,
+        "latitude": 52.37,
+        "longitude": 4.89,
+        **extra,
+    }
+    response = client.post("/v2/parking-lots", headers=admin_headers, json=payload)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def test_put_stores_schedule_and_drops_compiled_entry(client, admin_headers) -> None:
+    lot_id = create_lot(client, admin_headers)
+    assert client.get(f"/v2/parking-lots/{lot_id}").json()["tariff_schedule"] is None
+
+    response = client.put(f"/v2/parking-lots/{lot_id}", headers=admin_headers, json={"tariff_schedule": SCHEDULE})
+    assert response.status_code == 200
+    stored = client.get(f"/v2/parking-lots/{lot_id}").json()["tariff_schedule"]
+    assert stored["bands"][1]["cap"] == 6.0
+
+    schedule_cache.get(lot_id, "{}", 2.5, 20.0)
+    # other fields leave the schedule alone, the cache entry is dropped on every PUT
+    assert client.put(f"/v2/parking-lots/{lot_id}", headers=admin_headers, json={"tariff": 3.0}).status_code == 200
+    assert lot_id not in schedule_cache._entries
+    assert client.get(f"/v2/parking-lots/{lot_id}").json()["tariff_schedule"]["timezone"] == "Europe/Amsterdam"
+
+    assert client.put(f"/v2/parking-lots/{lot_id}", headers=admin_headers, json={"tariff_schedule": None}).status_code == 200
+    assert client.get(f"/v2/parking-lots/{lot_id}").json()["tariff_schedule"] is None
+
+
+def test_invalid_schedule_is_rejected(client, admin_headers) -> None:
+    overlapping = {"bands": [
+        {"days": [0], "start": "08:00", "end": "18:00", "rate": 1.0},
+        {"days": [0], "start": "12:00", "end": "13:00", "rate": 2.0},
+    ]}
+    lot_id = create_lot(client, admin_headers)
+    response = client.put(f"/v2/parking-lots/{lot_id}", headers=admin_headers, json={"tariff_schedule": overlapping})
+    assert response.status_code == 422
+
+
+def test_scheduled_lot_prices_sessions(client, admin_headers) -> None:
+    lot_id = create_lot(client, admin_headers, tariff_schedule=SCHEDULE)
+    headers = register_and_login(client)
+    vid = create_vehicle(client, headers)
+    lot = f"/v2/parking-lots/{lot_id}/sessions"
+    sid = client.post(f"{lot}/start", headers=headers, json={"vehicle_id": vid}).json()["id"]
+
+    assert client.get("/v2/billing", headers=headers).status_code == 200
+    assert client.post(f"{lot}/{sid}/stop", headers=headers).status_code == 200
+    # under three minutes: free, priced through the compiled schedule
+    assert client.get("/v2/billing", headers=headers).json()["amount"] == 0.0
+    assert lot_id in schedule_cache._entries
@@ -0,0 +1,93 @@
+from conftest import create_vehicle, register_and_login
+from test_gates import create_lot
+
+
+def counted(recorder, send):
+    # (response, statements the request sent to the database)
+    recorder.start()
+    response = send()
+    recorder.stop()
+    return response, [statement for statement, _ in recorder.queries]
+
+
+def test_updates_are_one_statement(client, admin_headers, recorder) -> None:
+    user = register_and_login(client)
+    lot_id = create_lot(client, admin_headers)
+    vehicle_id = create_vehicle(client, user)
+
+    response, queries = counted(recorder, lambda: client.put(f"/v2/parking-lots/{lot_id}", headers=admin_headers, json={"tariff": 3.0}))
+    assert response.status_code == 200 and response.json()["tariff"] == 3.0
+    assert len(queries) == 1 and queries[0].startswith("UPDATE") and "RETURNING" in queries[0]
+
+    response, queries = counted(recorder, lambda: client.put(f"/v2/vehicles/{vehicle_id}", headers=user, json={"color": "Blue"}))
+    assert response.status_code == 200 and response.json()["color"] == "Blue"
+    assert len(queries) == 1 and "RETURNING" in queries[0]
+
+    reservation = {"vehicles_id": vehicle_id, "parking_lots_id": lot_id, "start_time": "2030-01-01T10:00:00Z", "end_time": "2030-01-01T12:00:00Z"}
+    response, queries = counted(recorder, lambda: client.post("/v2/reservations", headers=user, json=reservation))
+    assert response.status_code == 201
+    # first reservation on the lot: its version, then its bookings are loaded for the capacity check
+    assert len(queries) == 3 and "reservation_lot_versions" in queries[0]
+    assert queries[1].startswith("SELECT") and "FROM reservation " in queries[1]
+    assert queries[2].startswith("INSERT") and "RETURNING" in queries[2]
+    reservation_id = response.json()["id"]
+
+    # the next one only checks the version
+    later = dict(reservation, start_time="2030-01-02T10:00:00Z", end_time="2030-01-02T12:00:00Z")
+    response, queries = counted(recorder, lambda: client.post("/v2/reservations", headers=user, json=later))
+    assert response.status_code == 201
+    assert len(queries) == 2 and "reservation_lot_versions" in queries[0] and queries[1].startswith("INSERT")
+
+    response, queries = counted(recorder, lambda: client.put(f"/v2/reservations/{reservation_id}", headers=user, json={"cost": 5.0}))
+    assert response.status_code == 200 and response.json()["cost"] == 5.0
+    assert len(queries) == 1
+
+
+def test_missing_or_foreign_rows(client, admin_headers) -> None:
+    owner, other = register_and_login(client), register_and_login(client)
+    lot_id = create_lot(client, admin_headers)
+    vehicle_id = create_vehicle(client, owner)
+
+    assert client.put("/v2/parking-lots/999999", headers=admin_headers, json={"tariff": 3.0}).status_code == 404
+    assert client.put(f"/v2/vehicles/{vehicle_id}", headers=other, json={"color": "Red"}).status_code == 404
+    assert client.put("/v2/reservations/999999", headers=owner, json={"cost": 1.0}).status_code == 404
+    reservation = {"vehicles_id": vehicle_id, "parking_lots_id": lot_id, "start_time": "2030-01-01T10:00:00Z"}
+    assert client.post("/v2/reservations", headers=other, json=reservation).status_code == 403
+
+    start = client.post("/v2/parking-lots/999999/sessions/start", headers=owner, json={"vehicle_id": vehicle_id})
+    assert start.status_code == 404 and start.json()["detail"] == "Parking lot not found"
+    start = client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=owner, json={"vehicle_id": 999999})
+    assert start.status_code == 404 and start.json()["detail"] == "Vehicle not found"
+    # nothing changed
+    vehicles = client.get("/v2/vehicles", headers=owner).json()["items"]
+    assert [v["color"] for v in vehicles if v["vehicle_id"] == vehicle_id] != ["Red"]
+
+
+def test_session_and_payment_writes(client, admin_headers, recorder) -> None:
+    user, other = register_and_login(client), register_and_login(client)
+    lot_id = create_lot(client, admin_headers)
+    vehicle_id = create_vehicle(client, user)
+
+    response, queries = counted(recorder, lambda: client.post(f"/v2/parking-lots/{lot_id}/sessions/start", headers=user, json={"vehicle_id": vehicle_id}))
+    assert response.status_code == 201
+    session = response.json()
+    assert session["vehicle_id"] == vehicle_id and session["hourly_rate"] is not None
+    # INSERT ... SELECT ... RETURNING: lot and vehicle read by the INSERT itself
+    assert len(queries) == 1 and "SELECT" in queries[0] and "RETURNING" in queries[0]
+
+    response, queries = counted(recorder, lambda: client.post(f"/v2/parking-lots/{lot_id}/sessions/{session['id']}/stop", headers=user))
+    assert response.status_code == 200
+    # session + lot in one SELECT, the UPDATE and the ledger
+    assert len(queries) <= 6
+    assert "JOIN parking_lots" in queries[0]
+
+    payment_id = client.post("/v2/payments", headers=user, json={"sessions_id": session["id"], "method": "ideal"}).json()["id"]
+    assert client.put(f"/v2/payments/{payment_id}", headers=other).status_code == 403
+    response, queries = counted(recorder, lambda: client.put(f"/v2/payments/{payment_id}", headers=user))
+    assert response.status_code == 200
+    # no SELECT of the payment before the UPDATE, only the ledger totals around it
+    assert len(queries) <= 5
+    assert not [q for q in queries if q.startswith("SELECT") and q.split("FROM")[1].strip().startswith("payments")]
+    again = client.put(f"/v2/payments/{payment_id}", headers=user)
+    assert again.status_code == 400 and again.json()["detail"] == "Payment already completed"
+    assert client.put("/v2/payments/999999", headers=user).status_code == 404
@@ -0,0 +1,116 @@
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.dependencies import calculate_price
+from app.pricing import calculate_prices
+from app.tariffs import compile_schedule
+
+
+class MockParkingLot:
+    def __init__(self, tariff, daytariff):
+        self.tariff = tariff
+        self.daytariff = daytariff
+
+
+def scalar(lots, starts, stops):
+    return [calculate_price(lot, start, stop) for lot, start, stop in zip(lots, starts, stops)]
+
+
+def batch(lots, starts, stops, now=None):
+    prices, hours, days = calculate_prices(
+        starts, stops, [lot.tariff for lot in lots], [lot.daytariff for lot in lots], now=now
+    )
+    return list(zip(prices.tolist(), hours.tolist(), days.tolist()))
+
+
+class TestBatchPricing(unittest.TestCase):
+    def assertSameAsScalar(self, lots, starts, stops) -> None:
+        expected = scalar(lots, starts, stops)
+        actual = batch(lots, starts, stops)
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            self.assertEqual(e, a, f"row {i}: {starts[i]} -> {stops[i]}")
+
+    def test_edge_cases(self) -> None:
+        start = datetime(2024, 3, 1, 23, 0, tzinfo=timezone.utc)
+        durations = [
+            timedelta(0),
+            timedelta(seconds=179, microseconds=999999),  # free window
+            timedelta(seconds=180),
+            timedelta(minutes=59),                        # crosses midnight
+            timedelta(hours=1),
+            timedelta(days=1),
+            timedelta(days=3, hours=5),
+            timedelta(seconds=-30),
+        ]
+        lots = [MockParkingLot(2.5, 20)] * len(durations)
+        self.assertSameAsScalar(lots, [start] * len(durations), [start + d for d in durations])
+
+    def test_day_cap(self) -> None:
+        start = datetime(2024, 3, 1, 6, 0, tzinfo=timezone.utc)
+        stops = [start + timedelta(hours=h) for h in (1, 4, 8, 17)]
+        lots = [MockParkingLot(3, 10)] * len(stops)
+        self.assertSameAsScalar(lots, [start] * len(stops), stops)
+        self.assertEqual(batch(lots, [start] * 4, stops)[-1], (10.0, 17, 0))
+
+    def test_rounding_matches_round(self) -> None:
+        # tariff * hours values whose third decimal sits on a 5
+        start = datetime(2024, 3, 1, 8, 0, tzinfo=timezone.utc)
+        tariffs = [1.005, 2.675, 0.145, 1.115, 0.285, 3.335]
+        lots = [MockParkingLot(t, 999) for t in tariffs for _ in range(1, 8)]
+        stops = [start + timedelta(hours=h) for _ in tariffs for h in range(1, 8)]
+        self.assertSameAsScalar(lots, [start] * len(stops), stops)
+
+    def test_random_sessions(self) -> None:
+        rng = random.Random(7)
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        starts, stops, lots = [], [], []
+        for _ in range(5000):
+            start = base + timedelta(seconds=rng.randrange(365 * 86400), microseconds=rng.randrange(10**6))
+            starts.append(start)
+            stops.append(start + timedelta(seconds=rng.choice([rng.randrange(300), rng.randrange(86400), rng.randrange(5 * 86400)])))
+            lots.append(MockParkingLot(round(rng.uniform(0, 6), 2), round(rng.uniform(0, 40), 2)))
+        self.assertSameAsScalar(lots, starts, stops)
+
+    def test_naive_start_is_utc(self) -> None:
+        start = datetime(2024, 3, 1, 22, 30)
+        stop = datetime(2024, 3, 2, 1, 0, tzinfo=timezone.utc)
+        lot = MockParkingLot(2, 15)
+        self.assertSameAsScalar([lot], [start], [stop])
+
+    def test_datetime64_columns(self) -> None:
+        starts = np.array(["2024-03-01T10:00", "2024-03-01T23:30"], dtype="datetime64[us]")
+        stops = np.array(["2024-03-01T12:30", "2024-03-02T00:30"], dtype="datetime64[us]")
+        prices, hours, days = calculate_prices(starts, stops, [2.0, 2.0], [15.0, 15.0])
+        self.assertEqual(prices.tolist(), [6.0, 15.0])
+        self.assertEqual(hours.tolist(), [3, 1])
+        self.assertEqual(days.tolist(), [0, 1])
+
+    def test_open_session_uses_now(self) -> None:
+        start = datetime(2024, 3, 1, 8, 0, tzinfo=timezone.utc)
+        now = start + timedelta(hours=2, minutes=1)
+        self.assertEqual(batch([MockParkingLot(2, 20)], [start], [None], now=now), [(6.0, 3, 0)])
+
+    def test_rows_with_a_schedule(self) -> None:
+        schedule = compile_schedule({"bands": [{"days": [4], "start": "08:00", "end": "18:00", "rate": 4.0}]}, 2.0, 20.0)
+        start = datetime(2024, 3, 1, 8, 0, tzinfo=timezone.utc)  # vrijdag
+        stops = [start + timedelta(hours=2, minutes=1)] * 2
+        prices, hours, _days = calculate_prices([start, start], stops, [2.0, 2.0], [20.0, 20.0], schedules=[schedule, None])
+        self.assertEqual(prices.tolist(), [12.0, 6.0])
+        self.assertEqual(hours.tolist(), [3, 3])
+
+    def test_negative_values(self) -> None:
+        start = datetime(2024, 3, 1, 8, 0, tzinfo=timezone.utc)
+        with self.assertRaises(ValueError):
+            calculate_prices([start], [start + timedelta(hours=1)], [2.0], [-1.0])
+
+    def test_none_values(self) -> None:
+        start = datetime(2024, 3, 1, 8, 0, tzinfo=timezone.utc)
+        with self.assertRaises(TypeError):
+            calculate_prices([start], [start + timedelta(hours=1)], [None], [None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime
+
+from app.catalogue import LotCatalogue, etag_matches, make_etag
+from app.models import ParkingLot
+
+
+def lot(lot_id: int, name: str = None) -> ParkingLot:
+    return ParkingLot(
+        id=lot_id, name=name or f"Lot {lot_id}", location="Centrum", address=f"Straat {lot_id}",
+        capacity=10, reserved=0, tariff=2.0, daytariff=15.0, created_at=datetime(2024, 1, 1),
+    )
+
+
+class FakeDb:
+    # answers every query with the same rows, scalar() with lot_catalogue_version
+    def __init__(self, rows, version: int = 1):
+        self.rows = rows
+        self.version = version
+        self.queries = 0
+
+    async def execute(self, query):
+        self.queries += 1
+        rows = self.rows
+
+        class Result:
+            def scalars(self):
+                return self
+
+            def all(self):
+                return rows
+
+        return Result()
+
+    async def scalar(self, query):
+        self.queries += 1
+        return self.version
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestEtags(unittest.TestCase):
+    def test_etag_is_strong_and_content_based(self):
+        etag = make_etag(b'{"id":1}')
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        self.assertEqual(etag, make_etag(b'{"id":1}'))
+        self.assertNotEqual(etag, make_etag(b'{"id":2}'))
+
+    def test_if_none_match(self):
+        etag = make_etag(b"x")
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches(f'"other", {etag}', etag))
+        self.assertTrue(etag_matches(f"W/{etag}", etag))
+        self.assertTrue(etag_matches("*", etag))
+        self.assertFalse(etag_matches('"other"', etag))
+        self.assertFalse(etag_matches(None, etag))
+
+
+class TestLotCatalogue(unittest.TestCase):
+    def test_pages_match_keyset_and_offset(self):
+        catalogue = LotCatalogue()
+        db = FakeDb([lot(i) for i in (5, 1, 9, 3, 7)])
+        items, next_key, total = run(catalogue.page(db, 2, 0, None, "exact"))
+        self.assertEqual([i["id"] for i in json.loads(items)], [1, 3])
+        self.assertEqual((next_key, total), (3, 5))
+        items, next_key, _ = run(catalogue.page(db, 2, 0, 3, "exact"))
+        self.assertEqual([i["id"] for i in json.loads(items)], [5, 7])
+        items, next_key, total = run(catalogue.page(db, 2, 4, None, "none"))
+        self.assertEqual([i["id"] for i in json.loads(items)], [9])
+        self.assertEqual((next_key, total), (None, None))
+        # loaded once, after that only the version is read
+        self.assertEqual(catalogue.stats()["loads"], 1)
+        self.assertEqual(db.queries, 5)
+        self.assertEqual(catalogue.stats()["hits"], 2)
+
+    def test_writes_bump_version_and_keep_order(self):
+        catalogue = LotCatalogue()
+        run(catalogue.page(FakeDb([lot(1), lot(3)]), 10, 0, None, "exact"))
+        version = catalogue.version
+        catalogue.put(lot(2))
+        catalogue.put(lot(3, "Renamed"))
+        catalogue.remove(1)
+        self.assertEqual(catalogue.version, version + 3)
+        items, _, total = run(catalogue.page(FakeDb([]), 10, 0, None, "exact"))
+        self.assertEqual([(i["id"], i["name"]) for i in json.loads(items)], [(2, "Lot 2"), (3, "Renamed")])
+        self.assertEqual(total, 2)
+
+    def test_loads_again_when_the_version_moves(self):
+        catalogue = LotCatalogue()
+        db = FakeDb([lot(4)])
+        first = run(catalogue.get(db, 4))
+        self.assertEqual(json.loads(first.detail)["name"], "Lot 4")
+        self.assertIs(run(catalogue.get(db, 4)), first)
+        self.assertEqual(catalogue.stats()["hit_ratio"], 0.5)
+        self.assertGreater(catalogue.stats()["memory_bytes"], len(first.detail))
+
+        # another worker renamed lot 4 and created lot 5
+        db = FakeDb([lot(4, "Renamed"), lot(5)], version=2)
+        self.assertEqual(json.loads(run(catalogue.get(db, 4)).detail)["name"], "Renamed")
+        self.assertIsNotNone(run(catalogue.get(db, 5)))
+        self.assertEqual(catalogue.stats()["loads"], 2)
+
+    def test_load_keeps_changes_made_meanwhile(self):
+        catalogue = LotCatalogue()
+        catalogue.put(lot(1))
+
+        class Db(FakeDb):
+            async def execute(self, query):
+                catalogue.put(lot(2, "New"))  # created after the snapshot
+                catalogue.remove(1)  # deleted after the snapshot
+                return await super().execute(query)
+
+        run(catalogue.load_from(Db([lot(1), lot(3)])))
+        self.assertNotIn(1, catalogue._entries)
+        self.assertEqual(json.loads(catalogue._entries[2].detail)["name"], "New")
+        self.assertEqual(len(catalogue), 2)
+        # the version read belongs to the snapshot, not to those writes: the next request loads again
+        self.assertIsNone(catalogue.stats()["db_version"])
+        run(catalogue.get(FakeDb([lot(2, "New"), lot(3)]), 2))
+        self.assertEqual(catalogue.stats()["loads"], 2)
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime, timezone
+
+from app.events import DROPPED, HEARTBEAT, Broadcaster
+from app.occupancy import OccupancyCounter
+
+AT = datetime(2025, 1, 1, 10, 0, tzinfo=timezone.utc)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def parse(frames: list[str]) -> list[tuple[str, dict]]:
+    events = []
+    for chunk in "".join(frames).split("\n\n"):
+        if chunk.startswith("event: "):
+            event, data = chunk.split("\n")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+class TestBroadcaster(unittest.TestCase):
+    def setUp(self):
+        self.counter = OccupancyCounter()
+        self.broadcaster = Broadcaster(self.counter, queue_size=3)
+        self.counter.set_lot(1, capacity=10, reserved=0)
+        self.counter.set_lot(2, capacity=5, reserved=0)
+
+    def test_fan_out_to_lot_and_all_subscribers(self):
+        async def scenario():
+            one = self.broadcaster.subscribe([1])
+            two = self.broadcaster.subscribe([2])
+            everything = self.broadcaster.subscribe()
+            for sub in (one, two, everything):
+                await sub.next(0)  # snapshot
+            self.broadcaster.session_event(1, "session_started", 7, AT)
+            return [await sub.next(0) for sub in (one, two, everything)]
+
+        one, two, everything = run(scenario())
+        self.assertEqual(parse(one), [("session_started", {"lot_id": 1, "session_id": 7, "at": AT.isoformat()})])
+        self.assertEqual(two, [])
+        self.assertEqual(parse(everything), parse(one))
+
+    def test_occupancy_is_coalesced(self):
+        async def scenario():
+            sub = self.broadcaster.subscribe([1])
+            snapshot = await sub.next(0)
+            for _ in range(50):
+                with self.counter.change(1, +1):
+                    pass
+            with self.counter.change(1, -1):
+                pass
+            return snapshot, await sub.next(0)
+
+        snapshot, frames = run(scenario())
+        self.assertEqual(parse(snapshot), [("occupancy", {"lot_id": 1, "capacity": 10, "reserved": 0, "occupied": 0, "available": 10})])
+        self.assertEqual(parse(frames), [("occupancy", {"lot_id": 1, "capacity": 10, "reserved": 0, "occupied": 49, "available": 0})])
+
+    def test_slow_consumer_is_dropped(self):
+        async def scenario():
+            slow = self.broadcaster.subscribe([1])
+            fast = self.broadcaster.subscribe([1])
+            await slow.next(0)
+            await fast.next(0)
+            received = []
+            for i in range(5):
+                self.broadcaster.session_event(1, "session_started", i, AT)
+                received += await fast.next(0)
+            return slow, received, await slow.next(0)
+
+        slow, received, rest = run(scenario())
+        self.assertEqual(len(parse(received)), 5)
+        self.assertTrue(slow.dropped)
+        self.assertEqual(rest, [DROPPED])
+        self.assertEqual(self.broadcaster.stats(), {"subscribers": 1, "published": 5, "dropped": 1})
+
+    def test_stream_heartbeats_and_unsubscribes(self):
+        async def scenario():
+            sub = self.broadcaster.subscribe([1])
+            stream = self.broadcaster.stream(sub, heartbeat_seconds=0.01)
+            chunks = [await stream.__anext__() for _ in range(2)]
+            subscribers = self.broadcaster.stats()["subscribers"]
+            await stream.aclose()
+            return chunks, subscribers
+
+        chunks, subscribers = run(scenario())
+        self.assertEqual(parse(chunks[:1])[0][0], "occupancy")
+        self.assertEqual(chunks[1], HEARTBEAT)
+        self.assertEqual(subscribers, 1)
+        self.assertEqual(self.broadcaster.stats()["subscribers"], 0)
+
+    def test_no_subscribers_no_work(self):
+        self.broadcaster.session_event(1, "session_started", 1, AT)
+        with self.counter.change(1, +1):
+            pass
+        self.assertEqual(self.broadcaster.stats()["published"], 0)
@@ -0,0 +1,91 @@
+import asyncio
+import random
+import unittest
+
+from app.geo import LotIndex, haversine_m
+
+
+def brute_force(points: dict, lat: float, lon: float, radius_m: float, limit: int) -> list[int]:
+    found = sorted((haversine_m(lat, lon, plat, plon), lot_id) for lot_id, (plat, plon) in points.items())
+    return [lot_id for distance, lot_id in found if distance <= radius_m][:limit]
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeDb:
+    def __init__(self, rows, during=None):
+        self.rows = rows
+        self.during = during
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query):
+        if self.during is not None:
+            self.during()
+        return FakeResult(self.rows)
+
+
+class TestLotIndex(unittest.TestCase):
+    def test_haversine(self):
+        # Rotterdam Centraal - Amsterdam Centraal, ~58.5 km
+        self.assertAlmostEqual(haversine_m(51.9244, 4.4690, 52.3791, 4.9003) / 1000, 58.5, delta=0.5)
+        self.assertEqual(haversine_m(52.0, 4.0, 52.0, 4.0), 0.0)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(1)
+        index = LotIndex()
+        points = {}
+        for lot_id in range(3000):
+            points[lot_id] = (rng.uniform(51.0, 53.0), rng.uniform(3.5, 7.0))
+            index.put(lot_id, *points[lot_id])
+        for _ in range(200):
+            lat, lon = rng.uniform(50.9, 53.1), rng.uniform(3.4, 7.1)
+            radius, limit = rng.choice([200, 2000, 8000, 30000]), rng.choice([1, 10, 100])
+            got = [lot_id for lot_id, _ in index.nearby(lat, lon, radius, limit)]
+            self.assertEqual(got, brute_force(points, lat, lon, radius, limit))
+
+    def test_antimeridian_and_poles(self):
+        index = LotIndex()
+        index.put(1, 0.0, 179.999)
+        index.put(2, 0.0, -179.999)
+        index.put(3, 89.999, 10.0)
+        index.put(4, 89.999, -170.0)
+        self.assertEqual(sorted(lot_id for lot_id, _ in index.nearby(0.0, 180.0, 1000, 10)), [1, 2])
+        self.assertEqual(sorted(lot_id for lot_id, _ in index.nearby(90.0, 0.0, 1000, 10)), [3, 4])
+
+    def test_put_and_remove(self):
+        index = LotIndex()
+        index.put(1, 51.92, 4.48)
+        index.put(1, 52.37, 4.90)  # verplaatst
+        self.assertEqual(index.nearby(51.92, 4.48, 1000, 10), [])
+        self.assertEqual([lot_id for lot_id, _ in index.nearby(52.37, 4.90, 1000, 10)], [1])
+        index.put(1, None, None)
+        self.assertEqual(len(index), 0)
+        index.put(2, 51.92, 4.48)
+        index.remove(2)
+        index.remove(3)
+        self.assertEqual(index.stats()["cells"], 0)
+
+    def test_load_keeps_changes_made_meanwhile(self):
+        index = LotIndex()
+        index.put(1, 51.0, 4.0)
+
+        def meanwhile():
+            index.put(2, 52.0, 5.0)  # created after the snapshot
+            index.remove(1)  # deleted after the snapshot
+
+        asyncio.run(index.load(lambda: FakeDb([(1, 51.0, 4.0), (3, 53.0, 6.0), (4, None, None)], during=meanwhile)))
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.nearby(51.0, 4.0, 1000, 10), [])
+        self.assertEqual([lot_id for lot_id, _ in index.nearby(52.0, 5.0, 1000, 10)], [2])
+        self.assertEqual([lot_id for lot_id, _ in index.nearby(53.0, 6.0, 1000, 10)], [3])
@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+
+from app.ingest import IngestPipeline, outcome
+
+AT = datetime(2025, 1, 1, 10, 0, tzinfo=timezone.utc)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestIngestSubmit(unittest.TestCase):
+    # submit() without the worker: the test takes the reads off the queue and answers them
+
+    def setUp(self):
+        self.pipeline = IngestPipeline(session_factory=None, queue_size=4, max_batch=10, dedupe_seconds=10)
+
+    async def _started(self):
+        self.pipeline.start()
+        self.pipeline._task.cancel()
+        # a worker that never takes anything
+        self.pipeline._task = asyncio.create_task(asyncio.sleep(3600))
+
+    def test_repeated_reads_are_queued_once(self):
+        async def scenario():
+            await self._started()
+            submit = asyncio.create_task(self.pipeline.submit([
+                (1, "entry", "ab-123-c", AT),
+                (1, "entry", "AB 123 C", AT),  # dezelfde auto, andere lezing
+                (2, "entry", "AB-123-C", AT),  # andere lot
+                (1, "entry", " - ", AT),
+            ]))
+            await asyncio.sleep(0)
+            reads = [self.pipeline._queue.get_nowait() for _ in range(self.pipeline._queue.qsize())]
+            for i, read in enumerate(reads):
+                read.future.set_result(outcome("created", 201, 10 + i))
+            results = await submit
+
+            # exit of the car in lot 1 is not a duplicate of its entry
+            exit_submit = asyncio.create_task(self.pipeline.submit([(1, "exit", "AB123C", None)]))
+            await asyncio.sleep(0)
+            exit_read = self.pipeline._queue.get_nowait()
+            exit_read.future.set_result(outcome("stopped", 200, 10))
+            await exit_submit
+            self.pipeline._task.cancel()
+            return reads, results, exit_read
+
+        reads, results, exit_read = run(scenario())
+        self.assertEqual([(r.lot_id, r.plate) for r in reads], [(1, "AB123C"), (2, "AB123C")])
+        self.assertEqual([r["outcome"] for r in results], ["created", "duplicate", "created", "rejected"])
+        self.assertEqual(results[1]["session_id"], 10)
+        self.assertEqual(results[3]["status"], 400)
+        self.assertEqual(exit_read.at.tzinfo, timezone.utc)
+        self.assertEqual(self.pipeline.stats()["duplicates"], 1)
+        self.assertEqual(self.pipeline.stats()["invalid"], 1)
+
+    def test_duplicate_of_a_rejected_read_is_rejected(self):
+        async def scenario():
+            await self._started()
+            first = asyncio.create_task(self.pipeline.submit([(1, "entry", "AB123C", AT)]))
+            second = asyncio.create_task(self.pipeline.submit([(1, "entry", "AB123C", AT)]))
+            await asyncio.sleep(0)
+            self.pipeline._queue.get_nowait().future.set_result(outcome("rejected", 409, detail="Parking lot is full"))
+            self.pipeline._task.cancel()
+            return await first, await second
+
+        first, second = run(scenario())
+        self.assertEqual(first[0]["outcome"], "rejected")
+        self.assertEqual(second[0]["outcome"], "rejected")
+
+    def test_full_queue_rejects_the_request(self):
+        async def scenario():
+            await self._started()
+            waiting = asyncio.create_task(self.pipeline.submit([(1, "entry", f"AA-0{i}", AT) for i in range(3)]))
+            await asyncio.sleep(0)
+            try:
+                with self.assertRaises(HTTPException) as caught:
+                    await self.pipeline.submit([(1, "entry", f"BB-0{i}", AT) for i in range(2)])
+                # wat wel past wordt aangenomen
+                other = asyncio.create_task(self.pipeline.submit([(1, "entry", "CC-01", AT)]))
+                await asyncio.sleep(0)
+                return caught.exception, self.pipeline._queue.qsize()
+            finally:
+                waiting.cancel()
+                other.cancel()
+                self.pipeline._task.cancel()
+
+        exc, queued = run(scenario())
+        self.assertEqual(exc.status_code, 503)
+        self.assertEqual(exc.headers, {"Retry-After": "1"})
+        self.assertEqual(queued, 4)
+        self.assertEqual(self.pipeline.stats()["rejected_requests"], 1)
+
+    def test_not_running(self):
+        with self.assertRaises(HTTPException) as caught:
+            run(self.pipeline.submit([(1, "entry", "AB123C", AT)]))
+        self.assertEqual(caught.exception.status_code, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+
+from app.occupancy import OccupancyCounter
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeDb:
+    # answers the two reconcile queries: lots, then open sessions per lot
+    def __init__(self, lots, open_sessions, during=None):
+        self.results = [lots, list(open_sessions.items())]
+        self.during = during
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query):
+        if self.during is not None:
+            self.during()
+            self.during = None
+        return FakeResult(self.results.pop(0))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestOccupancyCounter(unittest.TestCase):
+    def test_change_applies_after_success(self):
+        counter = OccupancyCounter()
+        counter.set_lot(1, capacity=10, reserved=2)
+        with counter.change(1, +1):
+            self.assertEqual(counter.get(1).occupied, 0)
+        with counter.change(1, +1):
+            pass
+        self.assertEqual(counter.get(1).occupied, 2)
+        self.assertEqual(counter.get(1).available, 6)
+
+    def test_failed_write_leaves_counter(self):
+        counter = OccupancyCounter()
+        counter.set_lot(1, capacity=10, reserved=0)
+        with self.assertRaises(RuntimeError):
+            with counter.change(1, +1):
+                raise RuntimeError("commit failed")
+        self.assertEqual(counter.get(1).occupied, 0)
+        self.assertEqual(counter.stats()["occupied"], 0)
+
+    def test_available_never_negative(self):
+        counter = OccupancyCounter()
+        counter.set_lot(1, capacity=1, reserved=1)
+        with counter.change(1, +1):
+            pass
+        self.assertEqual(counter.get(1).available, 0)
+
+    def test_reconcile_loads_and_corrects(self):
+        counter = OccupancyCounter()
+        run(counter.reconcile(lambda: FakeDb([(1, 10, 0), (2, 5, 1)], {1: 3})))
+        self.assertEqual((counter.get(1).occupied, counter.get(2).occupied), (3, 0))
+
+        # another worker started two sessions on lot 1 and lot 2 was deleted
+        corrected = run(counter.reconcile(lambda: FakeDb([(1, 10, 0)], {1: 5})))
+        self.assertEqual(corrected, 1)
+        self.assertEqual(counter.get(1).occupied, 5)
+        self.assertIsNone(counter.get(2))
+
+    def test_reconcile_skips_lots_changed_meanwhile(self):
+        counter = OccupancyCounter()
+        counter.set_lot(1, capacity=10, reserved=0)
+
+        def start_session():
+            # committed after the count was taken, applied to the counter afterwards
+            with counter.change(1, +1):
+                pass
+
+        corrected = run(counter.reconcile(lambda: FakeDb([(1, 10, 0)], {}, during=start_session)))
+        self.assertEqual(corrected, 0)
+        self.assertEqual(counter.get(1).occupied, 1)
+
+    def test_reconcile_skips_lots_with_write_in_flight(self):
+        counter = OccupancyCounter()
+        counter.set_lot(1, capacity=10, reserved=0)
+        with counter.change(1, +1):
+            # the count already includes the session, the counter not yet
+            run(counter.reconcile(lambda: FakeDb([(1, 10, 0)], {1: 1})))
+        self.assertEqual(counter.get(1).occupied, 1)
+
+    def test_lot_created_elsewhere_not_added_while_deleted_here(self):
+        counter = OccupancyCounter()
+        counter.set_lot(1, capacity=10, reserved=0)
+
+        run(counter.reconcile(lambda: FakeDb([(1, 10, 0)], {}, during=lambda: counter.drop_lot(1))))
+        self.assertIsNone(counter.get(1))
+
+    def test_delta_can_change_inside_the_block(self):
+        counter = OccupancyCounter()
+        counter.set_lot(1, capacity=10, reserved=0)
+        with counter.change(1, +1) as change:
+            change.delta = 0  # the write found an existing session
+        self.assertEqual(counter.get(1).occupied, 0)
@@ -0,0 +1,39 @@
+import unittest
+
+from fastapi import HTTPException
+
+from app.dependencies import decode_cursor, encode_cursor, page_params
+
+
+class TestCursor(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        for key in (0, 1, 50, 2**40):
+            self.assertEqual(decode_cursor(encode_cursor(key)), key)
+
+    def test_cursor_is_url_safe(self) -> None:
+        cursor = encode_cursor(123456789)
+        self.assertNotIn("=", cursor)
+        self.assertNotIn("+", cursor)
+        self.assertNotIn("/", cursor)
+
+    def test_invalid_cursor(self) -> None:
+        for cursor in ("", "not-a-cursor", "e30", encode_cursor(1)[:-2], "eyJhZnRlciI6ICJ4In0"):
+            with self.assertRaises(HTTPException) as ctx:
+                decode_cursor(cursor)
+            self.assertEqual(ctx.exception.status_code, 400)
+
+
+class TestPageParams(unittest.TestCase):
+    def test_after_is_decoded(self) -> None:
+        page = page_params(limit=10, offset=0, after=encode_cursor(42), total="none")
+        self.assertEqual(page.after, 42)
+        self.assertEqual(page.total, "none")
+
+    def test_offset_and_after_are_exclusive(self) -> None:
+        with self.assertRaises(HTTPException) as ctx:
+            page_params(limit=10, offset=20, after=encode_cursor(42), total="exact")
+        self.assertEqual(ctx.exception.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
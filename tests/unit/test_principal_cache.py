@@ -0,0 +1,42 @@
+import unittest
+from app.models import User
+from app.principal_cache import PrincipalCache
+
+def make_user(user_id: int) -> User:
+    return User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com",
+                password_hash="x", name="Test", birth_year=1990, role="USER")
+
+class TestPrincipalCache(unittest.TestCase):
+    def test_put_returns_detached_copy(self) -> None:
+        cache = PrincipalCache(ttl_seconds=60, max_entries=10)
+        user = make_user(1)
+        cache.put("t1", user)
+        cached = cache.get("t1")
+        self.assertIsNot(cached, user)
+        self.assertEqual(cached.username, "user1")
+
+    def test_expired_entry_is_a_miss(self) -> None:
+        cache = PrincipalCache(ttl_seconds=60, max_entries=10)
+        cache.put("t1", make_user(1), now=-100)
+        self.assertIsNone(cache.get("t1"))
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_invalidate_user_drops_all_tokens(self) -> None:
+        cache = PrincipalCache(ttl_seconds=60, max_entries=10)
+        cache.put("t1", make_user(1))
+        cache.put("t2", make_user(1))
+        cache.put("t3", make_user(2))
+        cache.invalidate_user(1)
+        self.assertIsNone(cache.get("t1"))
+        self.assertIsNone(cache.get("t2"))
+        self.assertIsNotNone(cache.get("t3"))
+
+    def test_bounded(self) -> None:
+        cache = PrincipalCache(ttl_seconds=60, max_entries=2)
+        for i in range(3):
+            cache.put(f"t{i}", make_user(i))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("t0"))
+
+if __name__ == "__main__":
+    unittest.main()
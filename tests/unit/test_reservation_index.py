@@ -0,0 +1,190 @@
+import asyncio
+import random
+import unittest
+
+from fastapi import HTTPException
+
+from app.occupancy import OccupancyCounter
+from app.reservation_index import OPEN_END, LotBookings, ReservationIndex, window
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeDb:
+    # reservation_lot_versions and the confirmed (id, start_time, end_time) rows per lot
+    def __init__(self, rows, versions):
+        self.rows = rows
+        self.versions = versions
+        self.loads = 0
+
+    @staticmethod
+    def _lot(query) -> int:
+        return next(v for k, v in query.compile().params.items() if k.startswith("parking_lots_id"))
+
+    async def scalar(self, query):
+        return self.versions.get(self._lot(query))
+
+    async def execute(self, query):
+        self.loads += 1
+        return FakeResult(self.rows.get(self._lot(query), []))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestWindow(unittest.TestCase):
+    def test_formats(self):
+        start, end = window("2030-01-01T10:00:00Z", "2030-01-01 12:00:00")
+        self.assertEqual(end - start, 7200)
+        self.assertEqual(window("2030-01-01T12:00:00+02:00", None), (start, OPEN_END))
+
+    def test_invalid(self):
+        for start_time, end_time in [("morgen", None), ("2030-01-01T12:00:00Z", "2030-01-01T10:00:00Z"), ("2030-01-01", "2030-01-01")]:
+            with self.assertRaises(HTTPException) as raised:
+                window(start_time, end_time)
+            self.assertEqual(raised.exception.status_code, 400)
+
+
+class TestLotBookings(unittest.TestCase):
+    def test_peak(self):
+        lot = LotBookings()
+        lot.add(10, 20)
+        lot.add(15, 30)
+        lot.add(20, 25)
+        self.assertEqual(lot.peak(0, 10), 0)
+        self.assertEqual(lot.peak(10, 15), 1)
+        self.assertEqual(lot.peak(12, 18), 2)
+        # end is exclusive: 20-25 follows 10-20
+        self.assertEqual(lot.peak(20, 21), 2)
+        self.assertEqual(lot.peak(30, 40), 0)
+        lot.add(5, OPEN_END)
+        self.assertEqual(lot.peak(100, 200), 1)
+
+    def test_remove_merges_boundaries(self):
+        lot = LotBookings()
+        lot.add(10, 20)
+        lot.add(20, 30)
+        # one spot from 10 to 30
+        self.assertEqual(lot.times, [10, 30])
+        lot.remove(10, 20)
+        lot.remove(20, 30)
+        self.assertEqual((lot.times, lot.counts), ([], []))
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        lot = LotBookings()
+        bookings = []
+        for _ in range(300):
+            if bookings and rng.random() < 0.3:
+                lot.remove(*bookings.pop(rng.randrange(len(bookings))))
+            else:
+                start = rng.randrange(100)
+                booking = (start, start + rng.randrange(1, 20))
+                bookings.append(booking)
+                lot.add(*booking)
+            start = rng.randrange(110)
+            end = start + rng.randrange(1, 20)
+            expected = max(sum(1 for s, e in bookings if s <= t < e) for t in range(start, end))
+            self.assertEqual(lot.peak(start, end), expected)
+
+
+class TestReservationIndex(unittest.TestCase):
+    def setUp(self):
+        self.counter = OccupancyCounter()
+        self.counter.set_lot(1, capacity=2, reserved=0)
+        self.counter.set_lot(2, capacity=1, reserved=0)
+        self.index = ReservationIndex(self.counter)
+        self.db = FakeDb({1: [(1, "2030-01-01T10:00:00Z", "2030-01-01T12:00:00Z"), (2, "onleesbaar", None)]}, {1: 4})
+        self.start, self.end = window("2030-01-01T11:00:00Z", "2030-01-01T13:00:00Z")
+
+    def write(self, lot_id, booking=None):
+        # one write: sync, the statement (its trigger bumps the version), then set();
+        # without a booking only the sync
+        async def unit(changes):
+            await changes.sync(self.db, lot_id)
+            if booking is not None:
+                self.db.versions[lot_id] += 1
+                changes.set(*booking)
+
+        versions = dict(self.db.versions)
+        try:
+            with self.index.changes() as changes:
+                run(unit(changes))
+        except Exception:
+            # rolled back
+            self.db.versions = versions
+            raise
+
+    def test_loads_when_stale(self):
+        self.write(1, (10, 1, self.start, self.end))
+        self.write(1)
+        self.assertEqual(self.db.loads, 1)
+        self.assertEqual(self.index._lots[1].version, 5)
+        # unreadable times are not counted
+        self.assertEqual(self.index.stats()["reservations"], 2)
+
+        # another worker booked the lot
+        self.db.versions[1] += 1
+        self.db.rows[1].append((11, "2030-01-01T11:30:00Z", None))
+        with self.assertRaises(HTTPException) as raised:
+            self.write(1, (12, 1, self.start, self.end))
+        self.assertEqual(raised.exception.status_code, 409)
+        self.assertEqual((self.db.loads, self.index.stats()["stale"]), (2, 1))
+        # the rejected write left the copy current
+        self.assertEqual(self.index._lots[1].version, 6)
+        self.write(1)
+        self.assertEqual(self.db.loads, 2)
+
+    def test_rejects_over_capacity(self):
+        self.write(1, (10, 1, self.start, self.end))
+        with self.assertRaises(HTTPException) as raised:
+            self.write(1, (11, 1, self.start, self.end))
+        self.assertEqual(raised.exception.status_code, 409)
+        # moving an existing booking doesn't count against itself
+        self.write(1, (10, 1, self.start + 60, self.end + 60))
+        self.assertEqual(self.index.stats()["rejected"], 1)
+        self.assertEqual(self.db.loads, 1)
+
+    def test_move_frees_the_old_lot(self):
+        self.db.versions[2] = 0
+        self.write(2, (20, 2, self.start, self.end))
+        # 20 moved to lot 1 (not loaded yet): its load takes 20 out of lot 2
+        self.db.rows[1].append((20, "2030-01-01T11:00:00Z", "2030-01-01T13:00:00Z"))
+        self.write(1)
+        self.assertEqual(self.index.booking(20)[0], 1)
+        self.assertEqual(self.index._lots[2].peak(self.start, self.end), 0)
+
+    def test_unknown_lot(self):
+        with self.assertRaises(HTTPException) as raised:
+            self.index.check(99, self.start, self.end)
+        self.assertEqual(raised.exception.status_code, 404)
+
+    def test_failed_write_is_undone(self):
+        self.write(1)
+        with self.assertRaises(RuntimeError):
+            with self.index.changes() as changes:
+                run(changes.sync(self.db, 1))
+                changes.remove(1, 1)
+                changes.set(10, 1, self.start, self.end)
+                raise RuntimeError("commit failed")
+        # the changed lot is dropped, the next write loads it again
+        self.assertEqual(self.index.stats()["lots"], 0)
+        self.write(1, (10, 1, self.start, self.end))
+        self.assertEqual(self.db.loads, 2)
+
+    def test_drop_lot(self):
+        self.write(1)
+        self.index.drop_lot(1)
+        self.assertEqual(self.index.stats()["reservations"], 0)
+        self.assertEqual(self.index.stats()["lots"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
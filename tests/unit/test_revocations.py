@@ -0,0 +1,27 @@
+import unittest
+from app.revocations import RevocationList
+
+class TestRevocationList(unittest.TestCase):
+    def test_revoke_single_token(self) -> None:
+        revoked = RevocationList()
+        revoked.revoke_token("jti-1", 1, expires_at=100)
+        self.assertTrue(revoked.is_revoked("jti-1", 1, issued_at=10))
+        self.assertFalse(revoked.is_revoked("jti-2", 1, issued_at=10))
+
+    def test_revoke_user_only_hits_older_tokens(self) -> None:
+        revoked = RevocationList()
+        revoked.revoke_user(1, before=50, expires_at=150)
+        self.assertTrue(revoked.is_revoked("a", 1, issued_at=49.9))
+        self.assertFalse(revoked.is_revoked("b", 1, issued_at=50))
+        self.assertFalse(revoked.is_revoked("c", 2, issued_at=10))
+
+    def test_prune_drops_expired_entries(self) -> None:
+        revoked = RevocationList()
+        revoked.revoke_token("jti-1", 1, expires_at=100)
+        revoked.revoke_user(2, before=50, expires_at=150)
+        revoked.prune(now=120)
+        self.assertEqual(len(revoked), 1)
+        self.assertFalse(revoked.is_revoked("jti-1", 1, issued_at=10))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+
+from app.search import LotSearchIndex, edit_distance, normalize
+
+LOTS = {
+    1: ("Bedrijventerrein Almere Parkeergarage", "Industrial Zone", "Schanssingel 337, 2421 BS Almere"),
+    2: ("Vlaardingen Evenementenhal Parkeerterrein", "Event Center", "Westlindepark 756, 8920 AB Vlaardingen"),
+    3: ("Almere Centrum Garage", "City Center", "Stationsplein 1, 1315 NT Almere"),
+    4: ("Campus Epe Park & Ride", "Campus", "Schanshof 12, 8161 AA Epe"),
+    5: ("Café 's-Hertogenbosch P1", "Centrum", "Markt 1, 5211 JV 's-Hertogenbosch"),
+}
+
+
+def ids(results) -> list[int]:
+    return [lot_id for lot_id, _ in results]
+
+
+class TestLotSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = LotSearchIndex()
+        for lot_id, fields in LOTS.items():
+            self.index.put(lot_id, *fields)
+
+    def test_normalize(self):
+        self.assertEqual(normalize("Café 's-Hertogenbosch"), ["cafe", "s", "hertogenbosch"])
+        self.assertEqual(normalize(None), [])
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("schansingel", "schanssingel", 2), 1)
+        self.assertEqual(edit_distance("almere", "amsterdam", 2), 3)
+
+    def test_exact_and_ranking(self):
+        # name matches rank above address matches
+        self.assertEqual(ids(self.index.search("Almere", 10)), [3, 1])
+        self.assertEqual(ids(self.index.search("schanssingel", 10)), [1])
+
+    def test_prefix_while_typing(self):
+        # the shorter completion first
+        self.assertEqual(ids(self.index.search("Schans", 10)), [4, 1])
+        # a finished word is no prefix
+        self.assertEqual(ids(self.index.search("Schans ", 10)), [])
+        self.assertEqual(ids(self.index.search("almere schans", 10)), [1])
+
+    def test_typos(self):
+        self.assertEqual(ids(self.index.search("Schansingel", 10)), [1])
+        self.assertEqual(ids(self.index.search("Vlaardigen", 10)), [2])
+        self.assertEqual(ids(self.index.search("Schamssin", 10)), [1])
+        self.assertEqual(ids(self.index.search("hertogenbosh", 10)), [5])
+        # no typos in short words
+        self.assertEqual(ids(self.index.search("epa ", 10)), [])
+
+    def test_every_word_has_to_match(self):
+        self.assertEqual(ids(self.index.search("almere vlaardingen", 10)), [])
+        self.assertEqual(ids(self.index.search("", 10)), [])
+        self.assertEqual(ids(self.index.search("!!", 10)), [])
+
+    def test_update_and_remove(self):
+        self.index.put(4, "Epe Noord", "Campus", "Dorpsstraat 1, Epe")
+        self.assertEqual(ids(self.index.search("schanshof", 10)), [])
+        self.assertEqual(ids(self.index.search("dorpsstraat", 10)), [4])
+        self.index.remove(1)
+        self.assertEqual(ids(self.index.search("schanssingel", 10)), [])
+        self.assertEqual(self.index.stats()["lots"], 4)
+
+    def test_load_keeps_changes_made_meanwhile(self):
+        class Result:
+            def all(self):
+                return [(1, *LOTS[1]), (2, *LOTS[2])]
+
+        index = self.index
+
+        class Db:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def execute(self, query):
+                index.put(6, "Nieuw Almere", None, None)  # created after the snapshot
+                index.remove(2)  # deleted after the snapshot
+                return Result()
+
+        asyncio.run(index.load(Db))
+        self.assertEqual(sorted(ids(index.search("almere", 10))), [1, 6])
+        self.assertEqual(len(index), 2)
@@ -0,0 +1,196 @@
+import json
+import math
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from app.dependencies import calculate_price
+from app.tariffs import DAY, ScheduleCache, compile_schedule, parse_clock
+
+SCHEDULE = {
+    "bands": [
+        {"days": [0, 1, 2, 3, 4], "start": "08:00", "end": "18:00", "rate": 3.5},
+        {"days": [0, 1, 2, 3, 4, 5, 6], "start": "18:00", "end": "08:00", "rate": 1.0, "cap": 6.0},
+        {"days": [5], "start": "08:00", "end": "14:00", "rate": 2.0, "cap": 9.0},
+    ],
+}
+
+
+class MockParkingLot:
+    def __init__(self, tariff, daytariff):
+        self.tariff = tariff
+        self.daytariff = daytariff
+
+
+def brute_force(schedule: dict, tariff: float, daytariff: float, start: datetime, stop: datetime) -> float:
+    # minute by minute: cost per occurrence of a band (or per day outside the bands), then the caps;
+    # every elapsed minute is looked up on the wall clock of the schedule's timezone
+    tz = ZoneInfo(schedule.get("timezone") or "UTC")
+    occurrences = {}
+    elapsed = start
+    while elapsed < stop:
+        t = elapsed.astimezone(tz).replace(tzinfo=None)
+        minute = t.weekday() * DAY + t.hour * 3600 + t.minute * 60
+        key, rate, cap = ("day", t.date()), tariff, daytariff
+        for i, band in enumerate(schedule["bands"]):
+            begin, end = parse_clock(band["start"]), parse_clock(band["end"])
+            for day in band["days"]:
+                length = end - begin if end > begin else end + DAY - begin
+                offset = (minute - (day * DAY + begin)) % (7 * DAY)
+                if offset < length:
+                    occurrence = (t - timedelta(seconds=offset)).date()
+                    key, rate, cap = (i, occurrence), band["rate"], band.get("cap", math.inf)
+        total, _, _ = occurrences.get(key, (0.0, rate, cap))
+        occurrences[key] = (total + rate / 60.0, rate, cap)
+        elapsed += timedelta(minutes=1)
+    return sum(min(total, cap) for total, _, cap in occurrences.values())
+
+
+class TestTariffSchedules(unittest.TestCase):
+    def test_without_bands_matches_calculate_price_within_a_day(self) -> None:
+        lot = MockParkingLot(2.5, 20.0)
+        compiled = compile_schedule({}, lot.tariff, lot.daytariff)
+        rng = random.Random(12)
+        base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for _ in range(2000):
+            start = base + timedelta(seconds=rng.randrange(300 * DAY))
+            stop = start + timedelta(seconds=rng.randrange(DAY))
+            if stop.date() != start.date():
+                continue
+            self.assertEqual(compiled.price(start, stop), calculate_price(lot, start, stop))
+
+    def test_matches_minute_by_minute(self) -> None:
+        compiled = compile_schedule({**SCHEDULE, "unit_minutes": 1}, 2.5, 20.0)
+        rng = random.Random(7)
+        base = datetime(2025, 3, 3, tzinfo=timezone.utc)  # maandag
+        for _ in range(150):
+            start = base + timedelta(minutes=rng.randrange(14 * 24 * 60))
+            stop = start + timedelta(minutes=rng.randrange(3, 4 * 24 * 60))
+            expected = brute_force(SCHEDULE, 2.5, 20.0, start, stop)
+            self.assertAlmostEqual(compiled.price(start, stop)[0], expected, delta=0.0051, msg=(start, stop))
+
+    def test_default_time_is_capped_per_day(self) -> None:
+        # default time on both sides of the band shares one daytariff
+        schedule = {"bands": [{"days": [0, 1, 2, 3, 4], "start": "08:00", "end": "18:00", "rate": 3.5}]}
+        compiled = compile_schedule(schedule, 2.5, 20.0)
+        tuesday = datetime(2025, 3, 4, tzinfo=timezone.utc)
+        self.assertEqual(compiled.price(tuesday, tuesday + timedelta(hours=23, minutes=59))[0], 20.0 + 35.0)
+        # 06:00-08:00 and 18:00-20:00: 10.0 under the cap
+        self.assertEqual(compiled.price(tuesday + timedelta(hours=6), tuesday + timedelta(hours=20))[0], 10.0 + 35.0)
+        # tuesday evening into wednesday morning: two days, two caps
+        price = compiled.price(tuesday + timedelta(hours=10), tuesday + timedelta(hours=34))[0]
+        self.assertEqual(price, 8 * 3.5 + 15.0 + 20.0 + 2 * 3.5)
+
+        rng = random.Random(11)
+        minutes = {**schedule, "unit_minutes": 1}
+        compiled = compile_schedule(minutes, 2.5, 20.0)
+        for _ in range(150):
+            start = tuesday + timedelta(minutes=rng.randrange(14 * 24 * 60))
+            stop = start + timedelta(minutes=rng.randrange(3, 4 * 24 * 60))
+            expected = brute_force(minutes, 2.5, 20.0, start, stop)
+            self.assertAlmostEqual(compiled.price(start, stop)[0], expected, delta=0.0051, msg=(start, stop))
+
+    def test_overnight_cap_and_started_units(self) -> None:
+        compiled = compile_schedule(SCHEDULE, 2.5, 20.0)
+        monday = datetime(2025, 3, 3, tzinfo=timezone.utc)
+        # 17:00-18:00 peak, whole night capped at 6, 08:00-09:30 peak billed as 2 started hours
+        price, hours, days = compiled.price(monday + timedelta(hours=17), monday + timedelta(hours=33, minutes=30))
+        self.assertEqual(price, 3.5 + 6.0 + 2 * 3.5)
+        self.assertEqual((hours, days), (17, 1))
+        # under three minutes is free
+        self.assertEqual(compiled.price(monday, monday + timedelta(seconds=179))[0], 0.0)
+
+    def test_band_over_the_end_of_the_week(self) -> None:
+        schedule = {"bands": [{"days": [6], "start": "22:00", "end": "06:00", "rate": 2.0, "cap": 5.0}]}
+        compiled = compile_schedule(schedule, 1.0, 100.0)
+        sunday = datetime(2025, 3, 9, 21, tzinfo=timezone.utc)
+        self.assertEqual(compiled.price(sunday, sunday + timedelta(hours=10))[0], 1.0 + 5.0 + 1.0)
+
+    def test_long_sessions_use_whole_weeks(self) -> None:
+        compiled = compile_schedule(SCHEDULE, 2.5, 20.0)
+        start = datetime(2025, 3, 3, 10, tzinfo=timezone.utc)
+        one = compiled.price(start, start + timedelta(days=7))[0]
+        ten = compiled.price(start, start + timedelta(days=70))[0]
+        self.assertAlmostEqual(ten, 10 * one, places=2)
+        self.assertAlmostEqual(one, compiled.week_cost, places=2)
+
+    def test_timezone_shifts_the_bands(self) -> None:
+        schedule = {"timezone": "Europe/Amsterdam", "bands": [{"days": [0], "start": "08:00", "end": "09:00", "rate": 10.0}]}
+        compiled = compile_schedule(schedule, 1.0, 100.0)
+        # 07:00 UTC is 08:00 in Amsterdam (winter time)
+        start = datetime(2025, 1, 6, 7, tzinfo=timezone.utc)
+        self.assertEqual(compiled.price(start, start + timedelta(hours=1))[0], 10.0)
+
+    def test_offset_changes_count_elapsed_time(self) -> None:
+        compiled = compile_schedule({"timezone": "Europe/Amsterdam"}, 2.5, 20.0)
+        # autumn: 02:30 CEST to 02:10 CET is 40 minutes, one started hour
+        autumn = datetime(2025, 10, 26, 0, 30, tzinfo=timezone.utc)
+        self.assertEqual(compiled.price(autumn, autumn + timedelta(minutes=40)), (2.5, 1, 0))
+        # spring: 01:50 CET to 03:10 CEST is 20 minutes
+        spring = datetime(2025, 3, 30, 0, 50, tzinfo=timezone.utc)
+        self.assertEqual(compiled.price(spring, spring + timedelta(minutes=20)), (2.5, 1, 0))
+        # the 25-hour day shares one daytariff
+        midnight = datetime(2025, 10, 25, 22, tzinfo=timezone.utc)
+        self.assertEqual(compiled.price(midnight, midnight + timedelta(hours=25))[0], 20.0)
+
+    def test_offset_changes_match_minute_by_minute(self) -> None:
+        # both changes are on a sunday between 02:00 and 03:00, the 02:30-03:30 band overlaps them
+        schedule = {
+            "timezone": "Europe/Amsterdam",
+            "unit_minutes": 1,
+            "bands": [
+                {"days": [0, 1, 2, 3, 4], "start": "08:00", "end": "18:00", "rate": 3.5},
+                {"days": [6], "start": "02:30", "end": "03:30", "rate": 4.0, "cap": 5.0},
+            ],
+        }
+        compiled = compile_schedule(schedule, 2.5, 40.0)
+        rng = random.Random(3)
+        for change in (datetime(2025, 3, 30, 1, tzinfo=timezone.utc), datetime(2025, 10, 26, 1, tzinfo=timezone.utc)):
+            for _ in range(30):
+                start = change - timedelta(minutes=rng.randrange(2 * 24 * 60))
+                stop = max(start + timedelta(minutes=3), change + timedelta(minutes=rng.randrange(-60, 2 * 24 * 60)))
+                expected = brute_force(schedule, 2.5, 40.0, start, stop)
+                self.assertAlmostEqual(compiled.price(start, stop)[0], expected, delta=0.0051, msg=(start, stop))
+
+    def test_invalid_schedules(self) -> None:
+        with self.assertRaises(ValueError):
+            compile_schedule({"bands": [
+                {"days": [0], "start": "08:00", "end": "18:00", "rate": 1.0},
+                {"days": [0], "start": "17:00", "end": "19:00", "rate": 1.0},
+            ]}, 1.0, 10.0)
+        with self.assertRaises(ValueError):
+            # overnight band runs into the next morning's band
+            compile_schedule({"bands": [
+                {"days": [0], "start": "20:00", "end": "09:00", "rate": 1.0},
+                {"days": [1], "start": "08:00", "end": "18:00", "rate": 1.0},
+            ]}, 1.0, 10.0)
+        with self.assertRaises(ValueError):
+            compile_schedule({"timezone": "Mars/Olympus"}, 1.0, 10.0)
+        with self.assertRaises(ValueError):
+            compile_schedule({"bands": [{"days": [0], "start": "25:00", "end": "26:00", "rate": 1.0}]}, 1.0, 10.0)
+
+
+class TestScheduleCache(unittest.TestCase):
+    def test_compiles_once_until_changed(self) -> None:
+        cache = ScheduleCache()
+        raw = json.dumps(SCHEDULE)
+        first = cache.get(1, raw, 2.5, 20.0)
+        self.assertIs(cache.get(1, raw, 2.5, 20.0), first)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # other tariff (e.g. changed by another worker) -> recompiled
+        self.assertIsNot(cache.get(1, raw, 3.0, 20.0), first)
+        self.assertIsNone(cache.get(2, None, 2.5, 20.0))
+
+    def test_invalidate(self) -> None:
+        cache = ScheduleCache()
+        raw = json.dumps(SCHEDULE)
+        first = cache.get(1, raw, 2.5, 20.0)
+        cache.invalidate(1)
+        self.assertIsNot(cache.get(1, raw, 2.5, 20.0), first)
+        self.assertEqual(cache.stats()["entries"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from app.token_store import TokenStore
+
+class TestTokenStore(unittest.TestCase):
+    def test_add_and_get(self) -> None:
+        store = TokenStore(ttl_seconds=60, max_tokens=10)
+        store.add("a", 1, now=0)
+        self.assertEqual(store.get("a"), (1, 60))
+        self.assertIsNone(store.get("b"))
+
+    def test_remove_user(self) -> None:
+        store = TokenStore(ttl_seconds=60, max_tokens=10)
+        store.add("a", 1, now=0)
+        store.add("b", 1, now=1)
+        store.add("c", 2, now=2)
+        store.remove_user(1)
+        self.assertIsNone(store.get("a"))
+        self.assertIsNone(store.get("b"))
+        self.assertIsNotNone(store.get("c"))
+        self.assertEqual(store.stats()["revoked"], 2)
+
+    def test_sweep_stops_at_first_valid_token(self) -> None:
+        store = TokenStore(ttl_seconds=60, max_tokens=10)
+        for i in range(5):
+            store.add(f"t{i}", i, now=i)
+        self.assertEqual(store.sweep(now=62), 3)
+        self.assertEqual(len(store), 2)
+        self.assertIsNotNone(store.get("t3"))
+
+    def test_cap_evicts_oldest(self) -> None:
+        store = TokenStore(ttl_seconds=60, max_tokens=2)
+        store.add("a", 1, now=0)
+        store.add("b", 2, now=1)
+        store.add("c", 3, now=2)
+        self.assertIsNone(store.get("a"))
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.stats()["evicted"], 1)
+        self.assertEqual(store.stats()["users"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import sys
+from bisect import bisect_right, insort
+from hashlib import blake2b
+from typing import Optional
+
+from sqlalchemy import select
+
+from . import schemas
+from .models import LotCatalogueVersion, ParkingLot
+
+logger = logging.getLogger(__name__)
+
+
+def make_etag(body: bytes) -> str:
+    # strong ETag from the response bytes, equal on every worker for equal content
+    return '"' + blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+class CatalogueEntry:
+    __slots__ = ("detail", "detail_etag", "item")
+
+    def __init__(self, lot: ParkingLot):
+        # both responses encoded once, when the lot is (re)loaded
+        self.detail = schemas.ParkingLotDetails.model_validate(lot).model_dump_json().encode()
+        self.detail_etag = make_etag(self.detail)
+        self.item = schemas.ParkingLot.model_validate(lot).model_dump_json().encode()
+
+
+class LotCatalogue:
+    # Parking lots in memory for GET /v2/parking-lots and /v2/parking-lots/{id},
+    # kept as encoded JSON. Lot writes call put()/remove() after their commit,
+    # each bumps `version`. Before answering, the catalogue compares
+    # lot_catalogue_version (bumped by triggers on parking_lots, one PK
+    # lookup) with the version it was loaded at and loads the whole table
+    # again when a lot was written since, on this worker, another one or by a
+    # script. An entry or ETag is never older than the database.
+
+    def __init__(self):
+        self._entries: dict[int, CatalogueEntry] = {}
+        self._ids: list[int] = []  # sorted, for pages
+        self.complete = False
+        self.version = 0
+        # lot_catalogue_version.version the entries were loaded at
+        self.db_version: Optional[int] = None
+        self._loading = asyncio.Lock()
+        # ids put/removed while load() is reading, those keep their current state
+        self._changed: Optional[set[int]] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _set(self, lot_id: int, entry: Optional[CatalogueEntry]):
+        if lot_id in self._entries:
+            if entry is None:
+                del self._entries[lot_id]
+                self._ids.pop(bisect_right(self._ids, lot_id) - 1)
+            else:
+                self._entries[lot_id] = entry
+        elif entry is not None:
+            self._entries[lot_id] = entry
+            insort(self._ids, lot_id)
+        self.version += 1
+        if self._changed is not None:
+            self._changed.add(lot_id)
+
+    def put(self, lot: ParkingLot):
+        self._set(lot.id, CatalogueEntry(lot))
+
+    def remove(self, lot_id: int):
+        self._set(lot_id, None)
+
+    async def _current(self, db):
+        # load the table again when the database moved on since the last load
+        version = await db.scalar(select(LotCatalogueVersion.version).where(LotCatalogueVersion.id == 1))
+        if self.complete and version == self.db_version:
+            self.hits += 1
+            return
+        self.misses += 1
+        async with self._loading:
+            # a request that waited here may find it loaded already
+            if not (self.complete and version == self.db_version):
+                await self.load_from(db)
+
+    async def get(self, db, lot_id: int) -> Optional[CatalogueEntry]:
+        await self._current(db)
+        return self._entries.get(lot_id)
+
+    async def page(
+        self, db, limit: int, offset: int, after: Optional[int], total: str
+    ) -> tuple[bytes, Optional[int], Optional[int]]:
+        # (the encoded items of the page as a JSON list, key of the last item if there is a next page, total),
+        # the same pages as paginate()
+        await self._current(db)
+        if after is not None:
+            start = bisect_right(self._ids, after)
+        else:
+            start = offset
+        ids = self._ids[start:start + limit + 1]
+        next_key = ids[limit - 1] if len(ids) > limit else None
+        items = b"[" + b",".join(self._entries[lot_id].item for lot_id in ids[:limit]) + b"]"
+        return items, next_key, (None if total == "none" else len(self._ids))
+
+    async def load_from(self, db):
+        self._changed = set()
+        try:
+            # one read transaction: the version belongs to these rows
+            db_version = await db.scalar(select(LotCatalogueVersion.version).where(LotCatalogueVersion.id == 1))
+            lots = (await db.execute(select(ParkingLot))).scalars().all()
+            changed = self._changed
+        finally:
+            self._changed = None
+
+        entries = {lot.id: CatalogueEntry(lot) for lot in lots if lot.id not in changed}
+        for lot_id in changed:
+            if lot_id in self._entries:
+                entries[lot_id] = self._entries[lot_id]
+        self._entries = entries
+        self._ids = sorted(entries)
+        # with local writes in between the next request loads again
+        self.db_version = None if changed else db_version
+        self.complete = True
+        self.version += 1
+        self.loads += 1
+
+    async def load(self, session_factory):
+        async with session_factory() as db:
+            await self.load_from(db)
+
+    async def run_refresher(self, session_factory, interval_seconds: float):
+        # Background task, started from the app lifespan.
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.load(session_factory)
+            except Exception:
+                logger.exception("Lot catalogue refresh failed")
+
+    def memory_bytes(self) -> int:
+        # encoded responses plus the containers holding them
+        total = sys.getsizeof(self._entries) + sys.getsizeof(self._ids)
+        for entry in self._entries.values():
+            total += sys.getsizeof(entry) + sys.getsizeof(entry.detail)
+            total += sys.getsizeof(entry.detail_etag) + sys.getsizeof(entry.item)
+        return total
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "lots": len(self._entries),
+            "complete": self.complete,
+            "version": self.version,
+            "db_version": self.db_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else None,
+            "memory_bytes": self.memory_bytes(),
+            "loads": self.loads,
+        }
+
+
+catalogue = LotCatalogue()
@@ -1,21 +1,105 @@
+import hashlib
 import os
 from typing import AsyncGenerator
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy import text, event
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./data/mobypark.db")
 
-engine = create_async_engine(DATABASE_URL, future=True, echo=False)
+# "production": WAL + tuned pragmas, a read-only reader pool and a single writer connection
+# "default": library defaults, one engine for everything
+DB_PROFILE = os.getenv("DB_PROFILE", "production").lower()
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+
+SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",   # safe with WAL, fsync only at checkpoints
+    "mmap_size": 268435456,    # 256 MB
+    "cache_size": -65536,      # 64 MB (negative = KiB)
+    "busy_timeout": 5000,      # ms
+    "foreign_keys": "ON",
+}
+
+
+def _apply_pragmas(dbapi_connection, pragmas: dict):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _md5(value):
+    return None if value is None else hashlib.md5(str(value).encode("utf-8")).hexdigest()
+
+
+def register_sqlite_functions(dbapi_connection):
+    # SQLite has no md5(), Postgres does: payment reconciliation (app/settlement.py) and migrations use it in SQL
+    dbapi_connection.create_function("md5", 1, _md5, deterministic=True)
+
+
+def _read_only_url(url: str) -> str:
+    # sqlite+aiosqlite:///./data/x.db -> sqlite+aiosqlite:///file:./data/x.db?mode=ro&uri=true
+    parsed = make_url(url)
+    return parsed.set(database=f"file:{parsed.database}", query={"mode": "ro", "uri": "true"}).render_as_string(
+        hide_password=False
+    )
+
+
+def create_engines(url: str, profile: str = DB_PROFILE) -> tuple[AsyncEngine, AsyncEngine]:
+    # Returns (write_engine, read_engine). Outside the sqlite production profile both are the same engine.
+    database = make_url(url).database
+    if profile != "production" or not url.startswith("sqlite") or database in (None, "", ":memory:"):
+        engine = create_async_engine(url, future=True, echo=False)
+        if url.startswith("sqlite"):
+            event.listen(
+                engine.sync_engine, "connect", lambda dbapi_connection, _: register_sqlite_functions(dbapi_connection)
+            )
+        return engine, engine
+
+    # One writer connection: writes queue in the pool instead of failing with "database is locked"
+    write_engine = create_async_engine(url, future=True, echo=False, pool_size=1, max_overflow=0)
+    read_engine = create_async_engine(
+        _read_only_url(url), future=True, echo=False, pool_size=DB_READ_POOL_SIZE, max_overflow=0
+    )
+
+    @event.listens_for(write_engine.sync_engine, "connect")
+    def _on_write_connect(dbapi_connection, connection_record):
+        # we emit BEGIN ourselves (see below), this also makes SAVEPOINT work as expected
+        dbapi_connection.isolation_level = None
+        _apply_pragmas(dbapi_connection, {"journal_mode": "WAL", **SQLITE_PRAGMAS})
+        register_sqlite_functions(dbapi_connection)
+
+    @event.listens_for(write_engine.sync_engine, "begin")
+    def _on_write_begin(conn):
+        # take the write lock up front, a deferred transaction that upgrades later can fail with SQLITE_BUSY
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    @event.listens_for(read_engine.sync_engine, "connect")
+    def _on_read_connect(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, SQLITE_PRAGMAS)
+        register_sqlite_functions(dbapi_connection)
+
+    return write_engine, read_engine
+
+
+engine, read_engine = create_engines(DATABASE_URL)
 AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
 
-# Dependency to get DB session
+# Dependency to get DB session (writer, for mutations)
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
 
+
+# Dependency to get a read-only DB session (for GET routes)
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with ReadSessionLocal() as session:
+        yield session
+
 # Test database connection
 async def ping() -> bool:
     async with engine.connect() as conn:
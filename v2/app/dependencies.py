@@ -6,49 +6,137 @@ from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 
-from .database import get_db
-from .models import User, ParkingLot, Payment
-from .schemas import VehicleBase
+from .database import get_db, ReadSessionLocal
+from .models import User, ParkingLot, Payment, PaymentSettlement
+from .schemas import VehicleBase, Page
 from .security import check_token
+from .principal_cache import principal_cache
+from .tariffs import schedule_cache
 
-from typing import Optional
+from typing import Optional, Literal
 from datetime import datetime, timezone
 
 import re
 import math
+import json
+import base64
 from hashlib import md5
 import uuid
 
 DEFAULT_LIMIT = 50
 MAX_LIMIT = 200
+# total=estimate telt hoogstens zoveel rijen
+TOTAL_ESTIMATE_CAP = 10000
 
 bearer_scheme = HTTPBearer(auto_error=True)
 
 async def get_current_user(
     # Geauthenticeerde gebruiker ophalen
+    # De enige auth dependency: het token wordt hier precies één keer per request gevalideerd
     creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     db: AsyncSession = Depends(get_db),
 ):
     user_id = check_token(creds.credentials)
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+
+    cached = principal_cache.get(creds.credentials)
+    if cached is not None:
+        # attach a per-request copy to this session, no SELECT needed
+        return await db.merge(cached, load=False)
+
+    # load through the reader pool, the request session may be bound to the single writer
+    async with ReadSessionLocal() as read_db:
+        result = await read_db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    principal_cache.put(creds.credentials, user)
+    return await db.merge(user, load=False)
 
 class PageParams(BaseModel):
     limit: int
     offset: int
+    after: Optional[int] = None
+    total: str = "exact"
+
+
+def encode_cursor(key: int) -> str:
+    # opaque for clients, it only carries the last key of the page
+    return base64.urlsafe_b64encode(json.dumps({"after": key}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))["after"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(key, int) or isinstance(key, bool):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
 
 def page_params(
     # Pagination parameters
+    # offset: klassieke paginering, after: cursor uit next_cursor (keyset, elke pagina even snel)
+    # total: exact = COUNT(*), estimate = begrensde telling, none = geen telling
     limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
     offset: int = Query(0, ge=0),
+    after: Optional[str] = Query(None),
+    total: Literal["exact", "estimate", "none"] = Query("exact"),
 ) -> PageParams:
-    return PageParams(limit=limit, offset=offset)
+    if after is not None and offset:
+        raise HTTPException(status_code=400, detail="Use either offset or after, not both")
+    return PageParams(
+        limit=limit,
+        offset=offset,
+        after=decode_cursor(after) if after is not None else None,
+        total=total,
+    )
+
+
+async def count_total(db: AsyncSession, query, key_column, mode: str) -> Optional[int]:
+    if mode == "none":
+        return None
+    if mode == "exact":
+        return (await db.execute(select(func.count()).select_from(query.order_by(None).subquery()))).scalar_one()
+
+    # estimate: count at most TOTAL_ESTIMATE_CAP keys, past the cap extrapolate
+    # from the key density of the rows counted so far
+    head = query.with_only_columns(key_column).order_by(key_column).limit(TOTAL_ESTIMATE_CAP).subquery()
+    counted, first_key, last_key = (
+        await db.execute(select(func.count(), func.min(head.c[0]), func.max(head.c[0])))
+    ).one()
+    if counted < TOTAL_ESTIMATE_CAP or last_key == first_key:
+        return counted
+    max_key = (await db.execute(query.with_only_columns(func.max(key_column)).order_by(None))).scalar_one()
+    return int(counted * (max_key - first_key + 1) / (last_key - first_key + 1))
+
+
+async def paginate(db: AsyncSession, query, key_column, page: PageParams) -> Page:
+    # query: select(Model).where(...) zonder order_by/offset/limit
+    # rows are ordered by key_column (indexed, unique), the cursor is the last key of the page
+    total = await count_total(db, query, key_column, page.total)
+
+    if page.after is not None:
+        query = query.where(key_column > page.after)
+    elif page.offset:
+        query = query.offset(page.offset)
+
+    result = await db.execute(query.order_by(key_column).limit(page.limit + 1))
+    items = result.scalars().all()
+
+    next_cursor = None
+    if len(items) > page.limit:
+        items = items[:page.limit]
+        next_cursor = encode_cursor(getattr(items[-1], key_column.key))
+
+    return Page(items=items, total=total, limit=page.limit, offset=page.offset, next_cursor=next_cursor)
 
 def calculate_price(parking_lot: ParkingLot, start: datetime, stop: Optional[datetime] = None):
     # bereken prijs op basis van tarief en tijdsduur
+    if getattr(parking_lot, "tariff_schedule_json", None):
+        # lot met tariefschema (app/tariffs.py)
+        return schedule_cache.for_lot(parking_lot).price(start, stop)
+
     if stop is None:
         stop = datetime.now(timezone.utc)
 
@@ -93,7 +181,8 @@ def tr_hash(session_id: int, license_plate: str) -> str:
     base = f"{session_id}{license_plate}"
     return md5(base.encode("utf-8")).hexdigest()
 
-async def sum_paid_eur(db: AsyncSession, session_id: int, thash: str) -> float:
+
+async def sum_paid_eur(db: AsyncSession, session_id: int) -> float:
     res = await db.execute(
         select(func.coalesce(func.sum(Payment.amount), 0))
         .where(Payment.sessions_id == session_id)
@@ -103,9 +192,11 @@ async def sum_paid_eur(db: AsyncSession, session_id: int, thash: str) -> float:
     if amount:
         return round(float(amount), 2)
 
+    # betalingen die via de transactie-hash bij deze sessie horen (app/settlement.py)
     res = await db.execute(
         select(func.coalesce(func.sum(Payment.amount), 0))
-        .where(Payment.hash == thash)
+        .join(PaymentSettlement, PaymentSettlement.payment_id == Payment.id)
+        .where(PaymentSettlement.session_id == session_id)
     )
     amount = res.scalar_one() or 0.0
     return round(float(amount), 2)
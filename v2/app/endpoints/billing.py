@@ -1,88 +1,116 @@
 from __future__ import annotations
 
 import logging
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy import select, func
+from fastapi import APIRouter, Depends
+from fastapi.security import HTTPBearer
+from sqlalchemy import select, func, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
-from app import models, schemas
-from app.dependencies import get_current_user, check_token, calculate_price, tr_hash, sum_paid_eur
+from app.database import get_read_db
+from app import models, schemas, ledger
+from app.dependencies import get_current_user
+from app.pricing import calculate_prices
+from app.tariffs import schedule_cache
 from app.security import require_admin
 
+from datetime import datetime, timezone
 from app.logging_setup import log_event
 
 router = APIRouter(prefix="/v2", tags=["billing"])
 bearer_scheme = HTTPBearer(auto_error=True)
 
-@router.get("/billing", response_model=schemas.BillingSummary)
-async def billing_summary_me(
-    db: AsyncSession = Depends(get_db),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    current_user: models.User = Depends(get_current_user),
-):
-    check_token(token.credentials)
-    # Get all sessions for the current user where the vehicle belongs to the user and status is completed
-    q = (
-        select(models.Session, models.ParkingLot, models.Vehicle)
-        .join(models.Vehicle, models.Session.vehicle_id == models.Vehicle.vehicle_id)
-        .join(models.ParkingLot, models.Session.parking_lots_id == models.ParkingLot.id)
-        .where(models.Vehicle.user_id == current_user.id and models.Session.status == "completed")
-    )
-    res = await db.execute(q)
-    rows = res.all()
 
-    total_amount = 0.0
-    total_paid = 0.0
-    sessions_count = 0
+async def _billing_summary(db: AsyncSession, user_id: int) -> schemas.BillingSummary:
+    # Afgesloten sessies komen uit het ledger (één rij), alleen open sessies worden live geprijsd
+    sessions_count, total_amount, total_paid, total_completed = await ledger.read_ledger(db, user_id)
 
-    for s, lot, veh in rows:
-        amount_eur, _hours, _days = calculate_price(lot, s.start_date, s.end_date)
-        thash = tr_hash(s.id, veh.license_plate)
-        paid_eur = await sum_paid_eur(db, s.id, thash)
-
-        total_amount += amount_eur
-        total_paid += paid_eur
-        sessions_count += 1
+    res = await db.execute(
+        ledger.per_session(models.Vehicle.user_id == user_id, models.Session.end_date.is_(None))
+    )
+    open_rows = res.all()
+    if open_rows:
+        prices, _hours, _days = calculate_prices(
+            [row.start_date for row in open_rows],
+            [None] * len(open_rows),
+            [row.tariff for row in open_rows],
+            [row.daytariff for row in open_rows],
+            schedules=[
+                schedule_cache.get(row.lot_id, row.tariff_schedule_json, row.tariff, row.daytariff)
+                for row in open_rows
+            ],
+        )
+        total_amount += sum(prices.tolist())
+        total_paid += sum(float(row.paid or 0) for row in open_rows)
+        total_completed += sum(float(row.paid_completed or 0) for row in open_rows)
+        sessions_count += len(open_rows)
 
     total_amount = round(total_amount, 2)
     total_paid = round(total_paid, 2)
     amount_still_to_pay  = round(total_amount - total_paid, 2)
     average = round(total_amount / sessions_count, 2) if sessions_count else 0.0
 
-    log_event(logging.INFO, "/billing", 200, "Billing summary retrieved")
-
     return schemas.BillingSummary(
         amount=total_amount,
         payed=total_paid,
+        payed_completed=round(total_completed, 2),
         amount_still_to_pay=amount_still_to_pay,
         sessions=sessions_count,
         average=average,
     )
 
 
+@router.get("/billing", response_model=schemas.BillingSummary)
+async def billing_summary_me(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    summary = await _billing_summary(db, current_user.id)
+
+    log_event(logging.INFO, "/billing", 200, "Billing summary retrieved")
+    return summary
+
+
 @router.get("/billing/monthly")
 async def billing_monthly_me(
-    db: AsyncSession = Depends(get_db),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    check_token(token.credentials)
+    # Afgelopen maanden uit de rollup, alleen de lopende maand en open sessies live
+    month_start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    current_month = month_start.strftime("%Y-%m")
+
+    res = await db.execute(
+        select(models.BillingMonthly.month, models.BillingMonthly.sessions, models.BillingMonthly.total_cost)
+        .where(
+            models.BillingMonthly.user_id == current_user.id,
+            models.BillingMonthly.month < current_month,
+            models.BillingMonthly.sessions > 0,
+        )
+    )
+    months = {month: [sessions, total_cost] for month, sessions, total_cost in res.all()}
 
-    q = (
+    live = (
         select(
-            func.strftime("%Y-%m", models.Session.start_date).label("month"),
+            ledger.SESSION_MONTH.label("month"),
             func.count(models.Session.id).label("sessions"),
             func.sum(models.Session.calculated_amount).label("total_cost"),
         )
         .join(models.Vehicle, models.Session.vehicle_id == models.Vehicle.vehicle_id)
         .where(models.Vehicle.user_id == current_user.id)
         .group_by("month")
-        .order_by("month")
     )
-
-    res = await db.execute(q)
+    # closed sessions of this month (range on idx_sessions_vehicle_start) + every open session
+    # (idx_sessions_open_vehicle), the rollup only holds closed sessions
+    res = await db.execute(
+        union_all(
+            live.where(models.Session.start_date >= month_start, models.Session.end_date.is_not(None)),
+            live.where(models.Session.end_date.is_(None)),
+        )
+    )
+    for month, sessions, total_cost in res.all():
+        entry = months.setdefault(month, [0, 0.0])
+        entry[0] += sessions
+        entry[1] += total_cost or 0
 
     return [
         {
@@ -90,54 +118,19 @@ async def billing_monthly_me(
             "sessions": sessions,
             "total_cost": round(total_cost or 0, 2),
         }
-        for month, sessions, total_cost in res.all()
+        for month, (sessions, total_cost) in sorted(months.items())
     ]
 
 
-
 @router.get("/billing/{uid}", response_model=schemas.BillingSummary)
 async def billing_summary_user(
     uid: int,
-    db: AsyncSession = Depends(get_db),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    check_token(token.credentials)
     require_admin(current_user)
 
-    q = (
-        select(models.Session, models.ParkingLot, models.Vehicle)
-        .join(models.Vehicle, models.Session.vehicle_id == models.Vehicle.vehicle_id)
-        .join(models.ParkingLot, models.Session.parking_lots_id == models.ParkingLot.id)
-        .where(models.Vehicle.user_id == uid)
-    )
-    res = await db.execute(q)
-    rows = res.all()
-
-    total_amount = 0.0
-    total_paid = 0.0
-    sessions_count = 0
-
-    for s, lot, veh in rows:
-        amount_eur, _hours, _days = calculate_price(lot, s.start_date, s.end_date)
-        thash = tr_hash(s.id, veh.license_plate)
-        paid_eur = await sum_paid_eur(db, s.id, thash)
-
-        total_amount += amount_eur
-        total_paid += paid_eur
-        sessions_count += 1
-
-    total_amount = round(total_amount, 2)
-    total_paid = round(total_paid, 2)
-    amount_still_to_pay  = round(total_amount - total_paid, 2)
-    average = round(total_amount / sessions_count, 2) if sessions_count else 0.0
+    summary = await _billing_summary(db, uid)
 
     log_event(logging.INFO, "/billing/{uid}", 200, "Billing summary retrieved (admin)")
-
-    return schemas.BillingSummary(
-        amount=total_amount,
-        payed=total_paid,
-        amount_still_to_pay=amount_still_to_pay,
-        sessions=sessions_count,
-        average=average,
-    )
+    return summary
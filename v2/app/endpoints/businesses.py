@@ -4,7 +4,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, or_
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app import models, schemas
 from app.dependencies import get_current_user
 from app.security import (
@@ -104,7 +104,11 @@ async def register_business(payload: schemas.BusinessCreate, db: AsyncSession =
 
 # parking lots van een business
 @router.get("/businesses/{business_id}/parking-lots", response_model=list[schemas.ParkingLotBase])
-async def get_parking_lot(business_id: int, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def get_parking_lot(
+    business_id: int,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user),
+):
     result = await db.execute(select(models.ParkingLot).where(models.ParkingLot.business_id == business_id))
     
     #list all of the business parking_lots
@@ -116,7 +120,7 @@ async def get_parking_lot(business_id: int, db: AsyncSession = Depends(get_db),
     return lot
 
 @router.get("/businesses/{business_id}", response_model=schemas.BusinessRead)
-async def get_business(business_id: int, db: AsyncSession = Depends(get_db)):
+async def get_business(business_id: int, db: AsyncSession = Depends(get_read_db)):
     result = await db.execute(select(models.Business).where(models.Business.id == business_id))
     business = result.scalar_one_or_none()
     if not business:
@@ -124,7 +128,7 @@ async def get_business(business_id: int, db: AsyncSession = Depends(get_db)):
     return business
 
 @router.get("/businesses", response_model=list[schemas.BusinessRead])
-async def get_all_businesses(db: AsyncSession = Depends(get_db)):
+async def get_all_businesses(db: AsyncSession = Depends(get_read_db)):
     result = await db.execute(select(models.Business))
     businesses = result.scalars().all()
     return businesses
\ No newline at end of file
@@ -0,0 +1,34 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException
+
+from app import models, schemas
+from app.dependencies import get_current_user
+from app.ingest import ingest_pipeline, INGEST_MAX_EVENTS
+from app.security import require_admin
+
+from app.logging_setup import log_event
+
+router = APIRouter(prefix="/v2/gate", tags=["gates"])
+
+
+# bulk camera reads van de slagbomen van alle lots (alleen admin), zie app/ingest.py
+@router.post("/events", response_model=schemas.CameraEventResults)
+async def ingest_events(
+    batch: schemas.CameraEventBatch,
+    current_user: models.User = Depends(get_current_user),
+):
+    require_admin(current_user)
+    if len(batch.events) > INGEST_MAX_EVENTS:
+        log_event(logging.WARNING, "/gate/events", 400, "Too many camera events")
+        raise HTTPException(status_code=400, detail=f"At most {INGEST_MAX_EVENTS} events per request")
+
+    try:
+        results = await ingest_pipeline.submit(
+            [(event.lot_id, event.kind, event.license_plate, event.at) for event in batch.events]
+        )
+    except HTTPException as exc:
+        log_event(logging.WARNING, "/gate/events", exc.status_code, exc.detail)
+        raise
+
+    log_event(logging.INFO, "/gate/events", 200, f"{len(results)} camera events ingested")
+    return {"results": [{"index": i, **result} for i, result in enumerate(results)]}
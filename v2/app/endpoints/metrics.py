@@ -0,0 +1,47 @@
+import logging
+from fastapi import APIRouter, Depends
+
+from app import models
+from app.catalogue import catalogue
+from app.dependencies import get_current_user
+from app.events import broadcaster
+from app.geo import lot_index
+from app.idempotency import idempotency_store
+from app.ingest import ingest_pipeline
+from app.lot_stats import stats_materializer
+from app.occupancy import occupancy
+from app.principal_cache import principal_cache
+from app.reservation_index import reservation_index
+from app.search import lot_search
+from app.security import require_admin, token_store
+from app.settlement import payment_reconciler
+from app.tariffs import schedule_cache
+from app.write_queue import group_writer
+
+from app.logging_setup import log_event
+
+router = APIRouter(prefix="/v2", tags=["metrics"])
+
+
+# tellers van de in-memory caches en indexen van deze worker (alleen admin)
+@router.get("/metrics")
+async def get_metrics(current_user: models.User = Depends(get_current_user)):
+    require_admin(current_user)
+
+    log_event(logging.INFO, "/metrics", 200, "Metrics retrieved")
+    return {
+        "lot_catalogue": catalogue.stats(),
+        "lot_index": lot_index.stats(),
+        "lot_search": lot_search.stats(),
+        "occupancy": occupancy.stats(),
+        "reservations": reservation_index.stats(),
+        "events": broadcaster.stats(),
+        "ingest": ingest_pipeline.stats(),
+        "settlement": payment_reconciler.stats(),
+        "lot_stats": stats_materializer.stats(),
+        "schedule_cache": schedule_cache.stats(),
+        "principal_cache": principal_cache.stats(),
+        "idempotency": idempotency_store.stats(),
+        "token_store": token_store.stats(),
+        "group_writer": group_writer.stats(),
+    }
@@ -13,6 +13,7 @@ from app.security import (
     remove_token, remove_all_tokens_for_user
 )
 
+from app.principal_cache import principal_cache
 from app.logging_setup import log_event
 
 router = APIRouter(prefix="/v2", tags=["auth"])  
@@ -110,8 +111,10 @@ async def update_user(
 
     db.add(current_user)
     await db.commit()
+    principal_cache.invalidate_user(current_user.id)
     if revoke:
-        remove_token(creds.credentials)
+        # revoke every session of the user, not only the current token
+        remove_all_tokens_for_user(current_user.id)
         log_event(logging.INFO, "/profile", 200, "Password updated, token revoked")
         return schemas.Message(message="Password updated. Please log in again.")
 
@@ -1,14 +1,26 @@
+import json
 import logging
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timedelta, timezone
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
-from app.database import get_db
-from app import models, schemas
+from app.database import ReadSessionLocal, get_db, get_read_db
+from app import models, schemas, ledger, lot_stats
 from app.security import check_token ,require_admin
-from app.dependencies import get_current_user, page_params, PageParams
+from app.dependencies import get_current_user, page_params, PageParams, encode_cursor
+from app.catalogue import catalogue, etag_matches, make_etag
+from app.tariffs import schedule_cache
+from app.occupancy import occupancy
+from app.reservation_index import reservation_index
+from app.events import broadcaster
+from app.geo import lot_index
+from app.search import lot_search
+from app.write_queue import run_write
+from app.writes import update_returning
 
 from app.logging_setup import log_event
 
@@ -48,49 +60,281 @@ async def create_parking_lot(
         latitude=lot.latitude,
         longitude=lot.longitude,
         business_id=business_id,
+        tariff_schedule_json=lot.tariff_schedule.model_dump_json() if lot.tariff_schedule else None,
     )
 
     db.add(new_lot)
     await db.commit()
     await db.refresh(new_lot)
+    catalogue.put(new_lot)
+    occupancy.set_lot(new_lot.id, new_lot.capacity, new_lot.reserved)
+    lot_index.put(new_lot.id, new_lot.latitude, new_lot.longitude)
+    lot_search.put(new_lot.id, new_lot.name, new_lot.location, new_lot.address)
 
     log_event(logging.INFO, "/parking-lots", 201, "Parking lot created")
     return new_lot
 
 
+def _json_with_etag(request: Request, body: bytes, etag: str) -> Response:
+    # 304 zonder body als de client deze versie al heeft
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
 @router.get("/parking-lots", response_model=schemas.Page[schemas.ParkingLot])
-async def list_parking_lots(p: PageParams = Depends(page_params), db: AsyncSession = Depends(get_db), creds: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+async def list_parking_lots(
+    request: Request,
+    p: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_read_db),
+    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+):
     check_token(creds.credentials)
 
-    # total count
-    total = (await db.execute(select(func.count()).select_from(models.ParkingLot))).scalar_one()
+    # uit de catalogus (app/catalogue.py), dezelfde pagina's als paginate()
+    items, next_key, total = await catalogue.page(db, p.limit, p.offset, p.after, p.total)
+    next_cursor = encode_cursor(next_key) if next_key is not None else None
+    rest = {"total": total, "limit": p.limit, "offset": p.offset, "next_cursor": next_cursor}
+    body = b'{"items":' + items + b"," + json.dumps(rest, separators=(",", ":")).encode()[1:]
+    log_event(logging.INFO, "/parking-lots", 200, "Parking lots listed")
+    return _json_with_etag(request, body, make_etag(body))
 
-    # page of rows
-    result = await db.execute(
-        select(models.ParkingLot)
-        .order_by(models.ParkingLot.id)
-        .offset(p.offset)
-        .limit(p.limit)
-    )
-    rows = result.scalars().all()
 
-    items = rows
-    log_event(logging.INFO, "/parking-lots", 200, "Parking lots listed")
-    return schemas.Page(items=items, total=total, limit=p.limit, offset=p.offset)
+# zoeken op naam, locatie en adres (app/search.py), vóór /parking-lots/{lot_id}
+@router.get("/parking-lots/search", response_model=List[schemas.ParkingLotSearchResult])
+async def search_parking_lots(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=10, ge=1, le=50),
+    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+):
+    check_token(creds.credentials)
+
+    results = []
+    for lot_id, score in lot_search.search(q, limit):
+        fields = lot_search.get(lot_id)
+        results.append(schemas.ParkingLotSearchResult(id=lot_id, score=score, **fields))
+
+    log_event(logging.INFO, "/parking-lots/search", 200, "Parking lots searched")
+    return results
+
+
+# dichtstbijzijnde lots uit de in-memory index (app/geo.py), vóór /parking-lots/{lot_id}
+@router.get("/parking-lots/nearby", response_model=List[schemas.NearbyParkingLot])
+async def nearby_parking_lots(
+    lat: float = Query(ge=-90, le=90),
+    lon: float = Query(ge=-180, le=180),
+    radius: float = Query(default=1000, gt=0, le=50_000, description="metres"),
+    limit: int = Query(default=10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+):
+    check_token(creds.credentials)
+
+    found = lot_index.nearby(lat, lon, radius, limit)
+    lots = {}
+    if found:
+        result = await db.execute(select(models.ParkingLot).where(models.ParkingLot.id.in_([lot_id for lot_id, _ in found])))
+        lots = {lot.id: lot for lot in result.scalars()}
+
+    log_event(logging.INFO, "/parking-lots/nearby", 200, "Nearby parking lots listed")
+    # a lot deleted by another worker can still be in the index until the next refresh
+    return [
+        schemas.NearbyParkingLot(
+            id=lot_id, name=lots[lot_id].name, address=lots[lot_id].address,
+            latitude=lots[lot_id].latitude, longitude=lots[lot_id].longitude, distance_m=round(distance, 1),
+        )
+        for lot_id, distance in found
+        if lot_id in lots
+    ]
+
+
+MAX_AVAILABILITY_IDS = 500
+
+
+async def _availability(db: AsyncSession, lot_ids: List[int]) -> dict[int, schemas.LotAvailability]:
+    # from the in-memory counters; lots this worker doesn't know yet come from the database
+    found = {}
+    missing = []
+    for lot_id in lot_ids:
+        lot = occupancy.get(lot_id)
+        if lot is None:
+            missing.append(lot_id)
+            continue
+        found[lot_id] = schemas.LotAvailability(
+            lot_id=lot_id, capacity=lot.capacity, reserved=lot.reserved, occupied=lot.occupied, available=lot.available
+        )
+    if missing:
+        # idx_sessions_open_lot
+        open_sessions = dict((await db.execute(
+            select(models.Session.parking_lots_id, func.count())
+            .where(models.Session.parking_lots_id.in_(missing), models.Session.end_date.is_(None))
+            .group_by(models.Session.parking_lots_id)
+        )).all())
+        lots = await db.execute(
+            select(models.ParkingLot.id, models.ParkingLot.capacity, models.ParkingLot.reserved)
+            .where(models.ParkingLot.id.in_(missing))
+        )
+        for lot_id, capacity, reserved in lots:
+            occupied = open_sessions.get(lot_id, 0)
+            found[lot_id] = schemas.LotAvailability(
+                lot_id=lot_id, capacity=capacity, reserved=reserved, occupied=occupied,
+                available=max(capacity - reserved - occupied, 0),
+            )
+    return found
+
+
+# vóór /parking-lots/{lot_id}, anders matcht "availability" als lot_id
+@router.get("/parking-lots/availability", response_model=List[schemas.LotAvailability])
+async def list_availability(
+    ids: Optional[List[int]] = Query(default=None),
+    db: AsyncSession = Depends(get_read_db),
+    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+):
+    check_token(creds.credentials)
+
+    if ids is None:
+        # alle lots die deze worker kent
+        lot_ids = sorted(occupancy.all())
+    else:
+        lot_ids = list(dict.fromkeys(ids))
+        if len(lot_ids) > MAX_AVAILABILITY_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_AVAILABILITY_IDS} ids per request")
+
+    found = await _availability(db, lot_ids)
+    log_event(logging.INFO, "/parking-lots/availability", 200, "Availability listed")
+    return [found[lot_id] for lot_id in lot_ids if lot_id in found]
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+# live bezetting en sessie-events (SSE) in plaats van pollen
+@router.get("/parking-lots/events")
+async def stream_events(
+    ids: Optional[List[int]] = Query(default=None),
+    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+):
+    check_token(creds.credentials)
+
+    if ids is not None and len(set(ids)) > MAX_AVAILABILITY_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_AVAILABILITY_IDS} ids per request")
+
+    sub = broadcaster.subscribe(ids)
+    log_event(logging.INFO, "/parking-lots/events", 200, "Event stream opened")
+    return StreamingResponse(broadcaster.stream(sub), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/parking-lots/{lot_id}/events")
+async def stream_lot_events(
+    lot_id: int,
+    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+):
+    check_token(creds.credentials)
+
+    if occupancy.get(lot_id) is None:
+        # geen Depends(get_read_db): die sessie zou open blijven zolang de stream loopt
+        async with ReadSessionLocal() as db:
+            lot = await db.scalar(select(models.ParkingLot.id).where(models.ParkingLot.id == lot_id))
+        if lot is None:
+            log_event(logging.WARNING, "/parking-lots/{lot_id}/events", 404, "Parking lot not found")
+            raise HTTPException(status_code=404, detail="Parking lot not found")
+
+    sub = broadcaster.subscribe([lot_id])
+    log_event(logging.INFO, "/parking-lots/{lot_id}/events", 200, "Event stream opened")
+    return StreamingResponse(broadcaster.stream(sub), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/parking-lots/{lot_id}/availability", response_model=schemas.LotAvailability)
+async def get_availability(
+    lot_id: int,
+    db: AsyncSession = Depends(get_read_db),
+    creds: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+):
+    check_token(creds.credentials)
+
+    found = await _availability(db, [lot_id])
+    if lot_id not in found:
+        log_event(logging.WARNING, "/parking-lots/{lot_id}/availability", 404, "Parking lot not found")
+        raise HTTPException(status_code=404, detail="Parking lot not found")
+
+    log_event(logging.INFO, "/parking-lots/{lot_id}/availability", 200, "Availability retrieved")
+    return found[lot_id]
+
 
 @router.get("/parking-lots/{lot_id}", response_model=schemas.ParkingLotDetails)
 async def get_parking_lot(
     lot_id: int,
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
 ):
-    result = await db.execute(select(models.ParkingLot).where(models.ParkingLot.id == lot_id))
-    lot = result.scalar_one_or_none()
-    if not lot:
+    entry = await catalogue.get(db, lot_id)
+    if entry is None:
         log_event(logging.WARNING, "/parking-lots/{lot_id}", 404, "Parking lot not found")
         raise HTTPException(status_code=404, detail="Parking lot not found")
 
     log_event(logging.INFO, "/parking-lots/{lot_id}", 200, "Parking lot retrieved")
-    return lot
+    return _json_with_etag(request, entry.detail, entry.detail_etag)
+
+
+def _utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+@router.get("/parking-lots/{lot_id}/stats", response_model=schemas.LotStats)
+async def get_parking_lot_stats(
+    lot_id: int,
+    bucket: Literal["hour", "day", "week"] = "day",
+    start: Optional[datetime] = Query(default=None, alias="from"),
+    end: Optional[datetime] = Query(default=None, alias="to"),
+    db: AsyncSession = Depends(get_read_db),
+    writer: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    require_admin(current_user)
+
+    lot = await db.scalar(select(models.ParkingLot.id).where(models.ParkingLot.id == lot_id))
+    if lot is None:
+        log_event(logging.WARNING, "/parking-lots/{lot_id}/stats", 404, "Parking lot not found")
+        raise HTTPException(status_code=404, detail="Parking lot not found")
+
+    # standaard de laatste 30 dagen, niet verder dan nu
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    end = min(_utc_naive(end), now) if end is not None else now
+    start = _utc_naive(start) if start is not None else end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    if (end - start) / lot_stats.BUCKETS[bucket] > lot_stats.MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"At most {lot_stats.MAX_BUCKETS} buckets per request")
+
+    # afgesloten uren die nog niet in lot_stats_hourly staan wegschrijven, hooguit
+    # STATS_REQUEST_CHUNKS blokken; de rest doet de achtergrondtaak en wordt nu live gelezen
+    until = lot_stats.floor_bucket(now, "hour")
+    done = await lot_stats.materialized_until(db, lot_id)
+    if done is not None and done < until:
+        async def write(w: AsyncSession):
+            return await lot_stats.materialize(w, lot_id, until)
+
+        for _ in range(lot_stats.STATS_REQUEST_CHUNKS):
+            if await run_write(writer, write):
+                break
+        # nieuwe leestransactie, anders ziet de reader de nieuwe rijen niet
+        await db.rollback()
+        done = await lot_stats.materialized_until(db, lot_id)
+        until = min(until, done)
+
+    buckets = await lot_stats.read_buckets(db, lot_id, bucket, start, end, until)
+
+    log_event(logging.INFO, "/parking-lots/{lot_id}/stats", 200, "Parking lot stats retrieved")
+    return schemas.LotStats(
+        lot_id=lot_id,
+        bucket=bucket,
+        start=start.replace(tzinfo=timezone.utc),
+        end=end.replace(tzinfo=timezone.utc),
+        buckets=buckets,
+    )
+
 
 @router.put("/parking-lots/{lot_id}", response_model=schemas.UpdateParkingLot)
 async def update_parking_lot(
@@ -102,34 +346,25 @@ async def update_parking_lot(
 ):
     require_admin(current_user)
 
-    result = await db.execute(select(models.ParkingLot).where(models.ParkingLot.id == lot_id))
-    lot = result.scalar_one_or_none()
-    if not lot:
-        log_event(logging.WARNING, "/parking-lots/{lot_id}", 404, "Parking lot not found")
-        raise HTTPException(status_code=404, detail="Parking lot not found")
+    values = lot_update.model_dump(exclude={"tariff_schedule"}, exclude_none=True)
+    if "tariff_schedule" in lot_update.model_fields_set:
+        schedule = lot_update.tariff_schedule
+        values["tariff_schedule_json"] = schedule.model_dump_json() if schedule else None
 
-    if lot_update.name is not None:
-        lot.name = lot_update.name
-    if lot_update.location is not None:
-        lot.location = lot_update.location
-    if lot_update.address is not None:
-        lot.address = lot_update.address
-    if lot_update.capacity is not None:
-        lot.capacity = lot_update.capacity
-    if lot_update.reserved is not None:
-        lot.reserved = lot_update.reserved
-    if lot_update.tariff is not None:
-        lot.tariff = lot_update.tariff
-    if lot_update.daytariff is not None:
-        lot.daytariff = lot_update.daytariff
-    if lot_update.latitude is not None:
-        lot.latitude = lot_update.latitude
-    if lot_update.longitude is not None:
-        lot.longitude = lot_update.longitude
-
-    db.add(lot)
-    await db.commit()
-    await db.refresh(lot)
+    async def write(db: AsyncSession):
+        lot = await update_returning(db, models.ParkingLot, values, models.ParkingLot.id == lot_id)
+        if lot is None:
+            log_event(logging.WARNING, "/parking-lots/{lot_id}", 404, "Parking lot not found")
+            raise HTTPException(status_code=404, detail="Parking lot not found")
+        return lot
+
+    lot = await run_write(db, write)
+    # tarieven of schema gewijzigd: opnieuw compileren bij de volgende prijsberekening
+    schedule_cache.invalidate(lot_id)
+    catalogue.put(lot)
+    occupancy.set_lot(lot.id, lot.capacity, lot.reserved)
+    lot_index.put(lot.id, lot.latitude, lot.longitude)
+    lot_search.put(lot.id, lot.name, lot.location, lot.address)
 
     log_event(logging.INFO, "/parking-lots/{lot_id}", 200, "Parking lot updated")
     return lot
@@ -149,7 +384,15 @@ async def delete_parking_lot(
         log_event(logging.WARNING, "/parking-lots/{lot_id}", 404, "Parking lot not found")
         raise HTTPException(status_code=404, detail="Parking lot not found")
 
-    await db.delete(lot)
+    # foreign_keys=ON: its sessions go along and drop out of their owners' billing
+    async with ledger.tracking(db, models.Session.parking_lots_id == lot_id):
+        await db.delete(lot)
     await db.commit()
+    schedule_cache.invalidate(lot_id)
+    catalogue.remove(lot_id)
+    occupancy.drop_lot(lot_id)
+    reservation_index.drop_lot(lot_id)
+    lot_index.remove(lot_id)
+    lot_search.remove(lot_id)
     log_event(logging.INFO, "/parking-lots/{lot_id}", 200, "Parking lot deleted")
     return schemas.Message(message="Parking lot deleted successfully.")
\ No newline at end of file
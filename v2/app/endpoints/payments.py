@@ -1,14 +1,17 @@
 import logging
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from fastapi.security import HTTPBearer
 
-from app.database import get_db
-from app import models, schemas
-from app.security import check_token ,require_admin
-from app.dependencies import get_current_user, page_params, PageParams, generate_payment_hash
+from app.database import get_db, get_read_db
+from app import models, schemas, ledger
+from app.security import require_admin
+from app.dependencies import get_current_user, page_params, PageParams, paginate, generate_payment_hash
+from app.write_queue import run_write
+from app.idempotency import idempotent, fingerprint
+from app.writes import update_returning
 
 from datetime import datetime, timezone
 from app.logging_setup import log_event
@@ -22,77 +25,98 @@ async def create_payment(
     payment: schemas.PaymentCreate,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    idempotency_key: Optional[str] = Header(default=None),
 ):
-    check_token(token.credentials)
-
-    result = await db.execute(
-        select(models.Session).where(models.Session.id == payment.sessions_id)
-    )
-    session = result.scalars().first()
-    if not session:
-        log_event(logging.WARNING, "/payments", 404, "Payment creation failed: session not found")
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    vehicle = None
-    if session.vehicle_id:
+    async def write(db: AsyncSession):
         result = await db.execute(
-            select(models.Vehicle).where(models.Vehicle.vehicle_id == session.vehicle_id)
+            select(models.Session).where(models.Session.id == payment.sessions_id)
+        )
+        session = result.scalars().first()
+        if not session:
+            log_event(logging.WARNING, "/payments", 404, "Payment creation failed: session not found")
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        vehicle = None
+        if session.vehicle_id:
+            result = await db.execute(
+                select(models.Vehicle).where(models.Vehicle.vehicle_id == session.vehicle_id)
+            )
+            vehicle = result.scalars().first()
+            if not vehicle:
+                log_event(logging.WARNING, "/payments", 404, "Payment creation failed: vehicle not found")
+                raise HTTPException(status_code=404, detail="Vehicle not found")
+
+        new_payment = models.Payment(
+            amount=session.calculated_amount,
+            sessions_id=payment.sessions_id,
+            initiator_users_id=current_user.id,
+            created_at=datetime.now(timezone.utc),
+            hash=generate_payment_hash(str(session.id), vehicle) if vehicle else None,
+            method=payment.method,
+            issuer=payment.issuer,
+            bank=payment.bank,
         )
-        vehicle = result.scalars().first()
-        if not vehicle:
-            log_event(logging.WARNING, "/payments", 404, "Payment creation failed: vehicle not found")
-            raise HTTPException(status_code=404, detail="Vehicle not found")
-
-    new_payment = models.Payment(
-        amount=session.calculated_amount,
-        sessions_id=payment.sessions_id,
-        initiator_users_id=current_user.id,
-        created_at=datetime.now(timezone.utc),
-        hash=generate_payment_hash(str(session.id), vehicle) if vehicle else None,
-        method=payment.method,
-        issuer=payment.issuer,
-        bank=payment.bank,
-    )
 
-    db.add(new_payment)
-    await db.commit()
-    await db.refresh(new_payment)
+        async with ledger.tracking(db, models.Session.id == session.id):
+            db.add(new_payment)
+        return new_payment
 
-    log_event(logging.INFO, "/payments", 201, "Payment created")
-    return {"message": f"Payment created with ID {new_payment.id}", "id": new_payment.id}
+    async def create(claim):
+        new_payment = await run_write(db, claim(write))
 
+        log_event(logging.INFO, "/payments", 201, "Payment created")
+        return new_payment
 
-# update completed_at payment to now by payment_id
-@router.put("/payments/{pid}", response_model=schemas.Message)
-async def complete_payment(
-    pid: int,
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-):
-    check_token(token.credentials)
+    def respond(new_payment):
+        return {"message": f"Payment created with ID {new_payment.id}", "id": new_payment.id}
 
-    result = await db.execute(
-        select(models.Payment).where(models.Payment.id == pid)
-    )
-    payment = result.scalars().first()
+    # een herhaling met dezelfde Idempotency-Key krijgt het eerste antwoord, zonder tweede betaling
+    request = fingerprint("POST /v2/payments", payment.model_dump_json())
+    return await idempotent(idempotency_key, current_user.id, request, create, schemas.MessageWithId, 201, respond)
+
+
+async def payment_not_completed(db: AsyncSession, pid: int, user_id: int):
+    # the UPDATE matched no row: find out why
+    payment = await db.get(models.Payment, pid)
     if not payment:
         log_event(logging.WARNING, "/payments/{pid}", 404, "Payment completion failed: payment not found")
         raise HTTPException(status_code=404, detail="Payment not found")
 
-    if payment.initiator_users_id != current_user.id:
+    if payment.initiator_users_id != user_id:
         log_event(logging.WARNING, "/payments/{pid}", 403, "Payment completion forbidden")
         raise HTTPException(status_code=403, detail="Not authorized to complete this payment")
 
-    if payment.completed_at is not None:
-        log_event(logging.WARNING, "/payments/{pid}", 400, "Payment already completed")
-        raise HTTPException(status_code=400, detail="Payment already completed")
+    log_event(logging.WARNING, "/payments/{pid}", 400, "Payment already completed")
+    raise HTTPException(status_code=400, detail="Payment already completed")
+
+
+# update completed_at payment to now by payment_id
+@router.put("/payments/{pid}", response_model=schemas.Message)
+async def complete_payment(
+    pid: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    # the session of the payment and the sessions it was matched to by hash, for the ledger
+    payment_sessions = select(models.Payment.sessions_id).where(models.Payment.id == pid).union_all(
+        select(models.PaymentSettlement.session_id).where(models.PaymentSettlement.payment_id == pid)
+    )
 
-    payment.completed_at = datetime.now(timezone.utc)
-    db.add(payment)
-    await db.commit()
-    await db.refresh(payment)
+    async def write(db: AsyncSession):
+        async with ledger.tracking(db, models.Session.id.in_(payment_sessions)):
+            payment = await update_returning(
+                db,
+                models.Payment,
+                {"completed_at": datetime.now(timezone.utc)},
+                models.Payment.id == pid,
+                models.Payment.initiator_users_id == current_user.id,
+                models.Payment.completed_at.is_(None),
+            )
+            if payment is None:
+                await payment_not_completed(db, pid, current_user.id)
+        return payment
+
+    payment = await run_write(db, write)
 
     log_event(logging.INFO, "/payments/{pid}", 200, "Payment completed")
     return {"message": f"Payment with ID {payment.id} completed"}
@@ -101,38 +125,25 @@ async def complete_payment(
 # list payments of current user
 @router.get("/payments", response_model=schemas.Page[schemas.Payment])
 async def list_payments(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     params: PageParams = Depends(page_params),
 ):
-    check_token(token.credentials)
 
-    total = (await db.execute(
-        select(func.count()).select_from(models.Payment).where(models.Payment.initiator_users_id == current_user.id)
-    )).scalar_one()
-
-    result = await db.execute(
-        select(models.Payment)
-        .where(models.Payment.initiator_users_id == current_user.id)
-        .offset(params.offset)
-        .limit(params.limit)
-    )
-    payments = result.scalars().all()
+    query = select(models.Payment).where(models.Payment.initiator_users_id == current_user.id)
+    payments = await paginate(db, query, models.Payment.id, params)
 
     log_event(logging.INFO, "/payments", 200, "Payments listed")
-    return schemas.Page(items=payments, total=total, limit=params.limit, offset=params.offset)
+    return payments
 
 
 # get payment by user id (admin)
 @router.get("/payments/{uid}", response_model=schemas.Payment)
 async def get_payment_by_user_id(
     uid: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
     require_admin(current_user)
 
     result = await db.execute(
@@ -2,13 +2,16 @@ import logging
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, literal, Float, String
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app import models, schemas
 from app.security import check_token ,require_admin
-from app.dependencies import get_current_user, page_params, PageParams
+from app.dependencies import get_current_user, page_params, PageParams, paginate
+from app.write_queue import run_write
+from app.writes import insert_returning, update_returning
+from app.reservation_index import reservation_index, window
 
 from app.logging_setup import log_event
 
@@ -20,36 +23,38 @@ async def create_reservation(
     reservation: schemas.ReservationCreate,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
-
-    result = await db.execute(
-        select(models.Vehicle).where(
-            models.Vehicle.vehicle_id == reservation.vehicles_id,
-            models.Vehicle.user_id == current_user.id,
-        )
-    )
-    vehicle = result.scalar_one_or_none()
-    if not vehicle:
-        log_event(logging.WARNING, "/reservations", 403, "Reservation creation forbidden: vehicle not owned or not found")
-        raise HTTPException(
-            status_code=403,
-            detail="Vehicle does not exist or does not belong to the user",
-        )
-
-    new_reservation = models.Reservation(
-        vehicles_id=reservation.vehicles_id,
-        parking_lots_id=reservation.parking_lots_id,
-        start_time=reservation.start_time,
-        end_time=reservation.end_time,
-        status="confirmed",
-        cost=reservation.cost,
+    start, end = window(reservation.start_time, reservation.end_time)
+    # the row comes from the user's own vehicle: no row = not found or not owned
+    source = select(
+        models.Vehicle.vehicle_id,
+        literal(reservation.parking_lots_id),
+        literal(reservation.start_time),
+        literal(reservation.end_time, String),
+        literal("confirmed"),
+        literal(reservation.cost if reservation.cost is not None else 0.0, Float),
+    ).where(
+        models.Vehicle.vehicle_id == reservation.vehicles_id,
+        models.Vehicle.user_id == current_user.id,
     )
 
-    db.add(new_reservation)
-    await db.commit()
-    await db.refresh(new_reservation)
+    async def write(db: AsyncSession):
+        await changes.sync(db, reservation.parking_lots_id)
+        new_reservation = await insert_returning(
+            db, models.Reservation, ["vehicles_id", "parking_lots_id", "start_time", "end_time", "status", "cost"], source
+        )
+        if new_reservation is None:
+            log_event(logging.WARNING, "/reservations", 403, "Reservation creation forbidden: vehicle not owned or not found")
+            raise HTTPException(
+                status_code=403,
+                detail="Vehicle does not exist or does not belong to the user",
+            )
+        # 409 when the lot is full for the window, rolls the INSERT back
+        changes.set(new_reservation.id, new_reservation.parking_lots_id, start, end)
+        return new_reservation
+
+    with reservation_index.changes() as changes:
+        new_reservation = await run_write(db, write)
 
     log_event(logging.INFO, "/reservations", 201, "Reservation created")
     return new_reservation
@@ -57,30 +62,21 @@ async def create_reservation(
 #resetvations of current user
 @router.get("/reservations", response_model=schemas.Page[schemas.Reservation])
 async def get_reservations(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     page: PageParams = Depends(page_params),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     current_user: models.User = Depends(get_current_user)
 ):
-    check_token(token.credentials)
-    total = (await db.execute(
-        select(func.count())
-        .select_from(models.Reservation)
-        .join(models.Vehicle)
-        .where(models.Vehicle.user_id == current_user.id)
-    )).scalar_one()
-    query = select(models.Reservation).join(models.Vehicle).where(models.Vehicle.user_id == current_user.id).offset(page.offset).limit(page.limit)
-    result = await db.execute(query)
-    reservations = result.scalars().all()
+    query = select(models.Reservation).join(models.Vehicle).where(models.Vehicle.user_id == current_user.id)
+    reservations = await paginate(db, query, models.Reservation.id, page)
 
     log_event(logging.INFO, "/reservations", 200, "Reservations listed")
-    return schemas.Page(items=reservations, total=total, limit=page.limit, offset=page.offset)
+    return reservations
 
 
 @router.get("/reservations/{reservation_id}", response_model=schemas.Reservation)
 async def get_reservation(
     reservation_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
     check_token(token.credentials)
@@ -103,33 +99,38 @@ async def update_reservation(
     reservation_update: schemas.ReservationUpdate,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
-
-    result = await db.execute(
-        select(models.Reservation).where(models.Reservation.id == reservation_id)
+    values = reservation_update.model_dump(
+        include={"vehicles_id", "parking_lots_id", "end_time", "status", "cost"}, exclude_none=True
     )
-    reservation = result.scalar_one_or_none()
-
-    if not reservation:
-        log_event(logging.WARNING, "/reservations/{reservation_id}", 404, "Reservation not found")
-        raise HTTPException(status_code=404, detail="Reservation not found")
-
-    if reservation_update.vehicles_id is not None:
-        reservation.vehicles_id = reservation_update.vehicles_id
-    if reservation_update.parking_lots_id is not None:
-        reservation.parking_lots_id = reservation_update.parking_lots_id
-    if reservation_update.end_time is not None:
-        reservation.end_time = reservation_update.end_time
-    if reservation_update.status is not None:
-        reservation.status = reservation_update.status
-    if reservation_update.cost is not None:
-        reservation.cost = reservation_update.cost
-
-    db.add(reservation)
-    await db.commit()
-    await db.refresh(reservation)
+    # lot, window or status changed: the booking moves along
+    rebook = bool(values.keys() & {"parking_lots_id", "end_time", "status"})
+
+    async def write(db: AsyncSession):
+        if rebook:
+            # the lots it moves between, before the UPDATE
+            previous = reservation_index.booking(reservation_id)
+            if "parking_lots_id" in values:
+                await changes.sync(db, values["parking_lots_id"])
+            if previous is not None and previous[0] not in changes.synced:
+                await changes.sync(db, previous[0], load=False)
+        reservation = await update_returning(db, models.Reservation, values, models.Reservation.id == reservation_id)
+        if reservation is None:
+            log_event(logging.WARNING, "/reservations/{reservation_id}", 404, "Reservation not found")
+            raise HTTPException(status_code=404, detail="Reservation not found")
+        if rebook:
+            if reservation.parking_lots_id not in changes.synced:
+                # its lot wasn't known before the UPDATE
+                await changes.sync(db, reservation.parking_lots_id, written=True)
+            if reservation.status == "confirmed":
+                start, end = window(reservation.start_time, reservation.end_time)
+                changes.set(reservation.id, reservation.parking_lots_id, start, end)
+            else:
+                changes.remove(reservation.id, reservation.parking_lots_id)
+        return reservation
+
+    with reservation_index.changes() as changes:
+        reservation = await run_write(db, write)
 
     log_event(logging.INFO, "/reservations/{reservation_id}", 200, "Reservation updated")
     return reservation
@@ -140,22 +141,26 @@ async def delete_reservation(
     reservation_id: int,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
     require_admin(current_user)
 
-    result = await db.execute(
-        select(models.Reservation).where(models.Reservation.id == reservation_id)
-    )
-    reservation = result.scalar_one_or_none()
+    async def write(db: AsyncSession):
+        result = await db.execute(
+            select(models.Reservation).where(models.Reservation.id == reservation_id)
+        )
+        reservation = result.scalar_one_or_none()
 
-    if not reservation:
-        log_event(logging.WARNING, "/reservations/{reservation_id}", 404, "Reservation not found")
-        raise HTTPException(status_code=404, detail="Reservation not found")
+        if not reservation:
+            log_event(logging.WARNING, "/reservations/{reservation_id}", 404, "Reservation not found")
+            raise HTTPException(status_code=404, detail="Reservation not found")
+
+        await changes.sync(db, reservation.parking_lots_id, load=False)
+        await db.delete(reservation)
+        await db.flush()
+        changes.remove(reservation_id, reservation.parking_lots_id)
 
-    await db.delete(reservation)
-    await db.commit()
+    with reservation_index.changes() as changes:
+        await run_write(db, write)
 
     log_event(logging.INFO, "/reservations/{reservation_id}", 200, "Reservation deleted")
     return {"message": "Reservation deleted successfully"}
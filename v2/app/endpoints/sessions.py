@@ -1,14 +1,19 @@
 import logging
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-
-from app.database import get_db
-from app import models, schemas
-from app.security import check_token ,require_admin
-from app.dependencies import get_current_user, page_params, PageParams, calculate_price
+from sqlalchemy import select, literal, true, DateTime
+from fastapi.security import HTTPBearer
+
+from app.database import get_db, get_read_db
+from app import models, schemas, gates, ledger, lot_stats
+from app.occupancy import occupancy
+from app.events import broadcaster
+from app.security import require_admin
+from app.dependencies import get_current_user, page_params, PageParams, paginate
+from app.write_queue import run_write
+from app.idempotency import idempotent, fingerprint
+from app.writes import insert_returning
 
 from datetime import datetime, timezone
 from app.logging_setup import log_event
@@ -23,37 +28,45 @@ async def create_session(
     lid: int,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    idempotency_key: Optional[str] = Header(default=None),
 ):
-    check_token(token.credentials)
-
-    parking_lot = (await db.execute(
-        select(models.ParkingLot).where(models.ParkingLot.id == lid)
-    )).scalars().first()
-
-    if not parking_lot:
-        raise HTTPException(status_code=404, detail="Parking lot not found")
-
-    vehicle = (await db.execute(
-        select(models.Vehicle).where(models.Vehicle.vehicle_id == session.vehicle_id)
-    )).scalars().first()
-
-    if not vehicle:
-        raise HTTPException(status_code=404, detail="Vehicle not found")
-
-    new_session = models.Session(
-        parking_lots_id=parking_lot.id,
-        vehicle_id=vehicle.vehicle_id,
-        license_plate=vehicle.license_plate,
-        start_date=datetime.now(timezone.utc),
-        hourly_rate=parking_lot.tariff,
+    # the new row straight from the lot and the vehicle: INSERT ... SELECT ... RETURNING,
+    # no row when one of them doesn't exist
+    source = (
+        select(
+            models.ParkingLot.id,
+            models.Vehicle.vehicle_id,
+            models.Vehicle.license_plate,
+            literal(datetime.now(timezone.utc), DateTime),
+            models.ParkingLot.tariff,
+        )
+        .select_from(models.Vehicle)
+        .join(models.ParkingLot, true())
+        .where(models.ParkingLot.id == lid, models.Vehicle.vehicle_id == session.vehicle_id)
     )
 
-    db.add(new_session)
-    await db.commit()
-    await db.refresh(new_session)
+    async def write(db: AsyncSession):
+        # 409 als het voertuig al een open sessie heeft, zonder extra SELECT
+        with gates.one_open_session():
+            new_session = await insert_returning(
+                db, models.Session, ["parking_lots_id", "vehicle_id", "license_plate", "start_date", "hourly_rate"], source
+            )
+        if new_session is None:
+            if await db.get(models.ParkingLot, lid) is None:
+                raise HTTPException(status_code=404, detail="Parking lot not found")
+            raise HTTPException(status_code=404, detail="Vehicle not found")
+        return new_session
+
+    async def start(claim):
+        # teller pas ophogen als de sessie gecommit is
+        with occupancy.change(lid, +1):
+            new_session = await run_write(db, claim(write))
+        broadcaster.session_event(lid, "session_started", new_session.id, new_session.start_date)
+        return new_session
 
-    return new_session
+    # een herhaling met dezelfde Idempotency-Key krijgt de eerste sessie terug (app/idempotency.py)
+    request = fingerprint("POST /v2/parking-lots/{lid}/sessions/start", str(lid), session.model_dump_json())
+    return await idempotent(idempotency_key, current_user.id, request, start, schemas.Session, 201)
 
 
 # stop a session
@@ -63,102 +76,109 @@ async def stop_session(
     lid: int,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
+    async def write(db: AsyncSession):
+        # session and lot in one query; the price is computed here, so this stays read-then-UPDATE
+        row = (await db.execute(
+            select(models.Session, models.ParkingLot)
+            .outerjoin(models.ParkingLot, models.ParkingLot.id == models.Session.parking_lots_id)
+            .where(
+                models.Session.id == session_id,
+                models.Session.parking_lots_id == lid,
+                models.Session.end_date.is_(None),
+            )
+        )).first()
+        if not row:
+            log_event(logging.WARNING, "/sessions/{session_id}/stop", 404, "Active session not found")
+            raise HTTPException(status_code=404, detail="No active session found")
 
-    result = await db.execute(
-        select(models.Session).where(
-            models.Session.id == session_id,
-            models.Session.parking_lots_id == lid,
-            models.Session.end_date.is_(None),
-        )
-    )
-    session = result.scalars().first()
-    if not session:
-        log_event(logging.WARNING, "/sessions/{session_id}/stop", 404, "Active session not found")
-        raise HTTPException(status_code=404, detail="No active session found")
+        session, parking_lot = row
+        if not parking_lot:
+            log_event(logging.WARNING, "/sessions/{session_id}/stop", 404, "Parking lot not found")
+            raise HTTPException(status_code=404, detail="Parking lot not found")
 
-    lot_res = await db.execute(
-        select(models.ParkingLot).where(models.ParkingLot.id == lid)
-    )
-    parking_lot = lot_res.scalars().first()
-    if not parking_lot:
-        log_event(logging.WARNING, "/sessions/{session_id}/stop", 404, "Parking lot not found")
-        raise HTTPException(status_code=404, detail="Parking lot not found")
+        await gates.close_session(db, session, parking_lot)
+        return session.end_date
+
+    with occupancy.change(lid, -1):
+        end_date = await run_write(db, write)
+    broadcaster.session_event(lid, "session_stopped", session_id, end_date)
+
+    log_event(logging.INFO, "/sessions/{session_id}/stop", 200, "Session stopped")
+    return {"message": "Session stopped"}
+
+
+# slagboomcamera: kenteken in, sessie uit (app/gates.py)
+@router.post("/gate/entry", response_model=schemas.Session)
+async def gate_entry(
+    event: schemas.GateEvent,
+    lid: int,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    require_admin(current_user)
 
-    session.end_date = datetime.now(timezone.utc)
-    session.status = "COMPLETED"
-    start = session.start_date
-    if start.tzinfo is None:
-        start = start.replace(tzinfo=timezone.utc)
+    async def write(db: AsyncSession):
+        return await gates.enter(db, lid, event.license_plate)
 
-    session.duration_minutes = int((session.end_date - start).total_seconds() // 60)
+    with occupancy.change(lid, +1) as change:
+        session, created = await run_write(db, write)
+        if not created:
+            # tweede lezing van een auto die al binnen staat
+            change.delta = 0
 
-    price_eur, hours, days = calculate_price(parking_lot, start, session.end_date)
-    session.calculated_amount = float(price_eur)
+    if created:
+        response.status_code = 201
+        broadcaster.session_event(lid, "session_started", session.id, session.start_date)
+    log_event(logging.INFO, "/gate/entry", response.status_code or 200, "Gate entry")
+    return session
 
-    await db.commit()
-    await db.refresh(session)
 
-    log_event(logging.INFO, "/sessions/{session_id}/stop", 200, "Session stopped")
-    return {"message": "Session stopped"}
+@router.post("/gate/exit", response_model=schemas.Session)
+async def gate_exit(
+    event: schemas.GateEvent,
+    lid: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    require_admin(current_user)
+
+    async def write(db: AsyncSession):
+        return await gates.leave(db, lid, event.license_plate)
+
+    with occupancy.change(lid, -1):
+        session = await run_write(db, write)
+    broadcaster.session_event(lid, "session_stopped", session.id, session.end_date)
+
+    log_event(logging.INFO, "/gate/exit", 200, "Gate exit")
+    return session
 
 
 @router.get("/sessions", response_model=schemas.Page[schemas.Session])
 async def get_sessions(
     lid: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
     page: PageParams = Depends(page_params),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
 
     if current_user.role == "ADMIN":
-        total = (
-            await db.execute(
-                select(func.count())
-                .select_from(models.Session)
-                .where(models.Session.parking_lots_id == lid)
-            )).scalar_one()
-        
-        query = (
-            select(models.Session)
-            .where(models.Session.parking_lots_id == lid)
-            .offset(page.offset)
-            .limit(page.limit)
-        )
+        query = select(models.Session).where(models.Session.parking_lots_id == lid)
     else:
         vehicle_result = await db.execute(
             select(models.Vehicle.vehicle_id).where(models.Vehicle.user_id == current_user.id)
         )
         vehicle_ids = [v[0] for v in vehicle_result.all()]
-        total = (
-            await db.execute(
-                select(func.count())
-                .select_from(models.Session)
-                .where(
-                    models.Session.parking_lots_id == lid,
-                    models.Session.vehicle_id.in_(vehicle_ids),
-                )
-            )).scalar_one()
-        
-        query = (
-            select(models.Session)
-            .where(
-                models.Session.parking_lots_id == lid,
-                models.Session.vehicle_id.in_(vehicle_ids),
-            )
-            .offset(page.offset)
-            .limit(page.limit)
+        query = select(models.Session).where(
+            models.Session.parking_lots_id == lid,
+            models.Session.vehicle_id.in_(vehicle_ids),
         )
 
-    result = await db.execute(query)
-    sessions = result.scalars().all()
+    sessions = await paginate(db, query, models.Session.id, page)
 
     log_event(logging.INFO, "/sessions", 200, "Sessions listed")
-    return schemas.Page(items=sessions, total=total, limit=page.limit, offset=page.offset)
+    return sessions
 
 
 # get specific session
@@ -166,11 +186,9 @@ async def get_sessions(
 async def get_session(
     session_id: int,
     lid: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
 
     if current_user.role == "ADMIN":
         query = select(models.Session).where(
@@ -207,9 +225,7 @@ async def delete_session(
     lid: int,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
     require_admin(current_user)
 
     result = await db.execute(
@@ -224,8 +240,13 @@ async def delete_session(
         log_event(logging.WARNING, "/sessions/{session_id}", 404, "Session not found")
         raise HTTPException(status_code=404, detail="Session not found")
 
-    await db.delete(session)
-    await db.commit()
+    # an open session still counts as a car inside
+    with occupancy.change(lid, -1 if session.end_date is None else 0):
+        async with ledger.tracking(db, models.Session.id == session.id):
+            await db.delete(session)
+        # de uren van deze sessie in de lot-statistieken opnieuw laten berekenen
+        await lot_stats.rewind(db, lid, session.start_date)
+        await db.commit()
 
     log_event(logging.INFO, "/sessions/{session_id}", 200, "Session deleted")
     return {"message": "Session deleted"}
@@ -2,13 +2,15 @@ import logging
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from fastapi.security import HTTPBearer
 
-from app.database import get_db
-from app import models, schemas
-from app.security import check_token ,require_admin
-from app.dependencies import get_current_user, page_params, PageParams, licenceplate_clean
+from app.database import get_db, get_read_db
+from app import models, schemas, ledger
+from app.security import require_admin
+from app.dependencies import get_current_user, page_params, PageParams, paginate, licenceplate_clean
+from app.write_queue import run_write
+from app.writes import update_returning
 
 from app.logging_setup import log_event
 
@@ -20,9 +22,7 @@ async def create_vehicle(
     vehicle: schemas.VehicleCreate,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
 
     # Check if license plate already exists
     result = await db.execute(
@@ -52,49 +52,31 @@ async def create_vehicle(
 
 @router.get("/vehicles", response_model=schemas.Page[schemas.Vehicle])
 async def get_vehicles(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
     page: PageParams = Depends(page_params),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
 
-    query = (
-        select(models.Vehicle)
-        .where(models.Vehicle.user_id == current_user.id)
-        .offset(page.offset)
-        .limit(page.limit)
-    )
-    result = await db.execute(query)
-    vehicles = result.scalars().all()
+    query = select(models.Vehicle).where(models.Vehicle.user_id == current_user.id)
+    vehicles = await paginate(db, query, models.Vehicle.vehicle_id, page)
 
     log_event(logging.INFO, "/vehicles", 200, "Vehicles listed")
-    return schemas.Page(items=vehicles, total=len(vehicles), limit=page.limit, offset=page.offset)
+    return vehicles
 
 @router.get("/vehicles/{user_id}", response_model=schemas.Page[schemas.Vehicle])
 async def get_vehicles_for_user(
     user_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
     page: PageParams = Depends(page_params),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
     require_admin(current_user)
 
-    total = (await db.execute(select(func.count()).select_from(models.Vehicle).where(models.Vehicle.user_id == user_id))).scalar_one()
-
-    query = (
-        select(models.Vehicle)
-        .where(models.Vehicle.user_id == user_id)
-        .offset(page.offset)
-        .limit(page.limit)
-    )
-    result = await db.execute(query)
-    vehicles = result.scalars().all()
+    query = select(models.Vehicle).where(models.Vehicle.user_id == user_id)
+    vehicles = await paginate(db, query, models.Vehicle.vehicle_id, page)
 
     log_event(logging.INFO, "/vehicles/{user_id}", 200, "Vehicles listed (admin)")
-    return schemas.Page(items=vehicles, total=total, limit=page.limit, offset=page.offset)
+    return vehicles
 
 @router.put("/vehicles/{vehicle_id}", response_model=schemas.Vehicle)
 async def update_vehicle(
@@ -102,36 +84,20 @@ async def update_vehicle(
     vehicle_update: schemas.VehicleUpdate,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
+    values = vehicle_update.model_dump(include={"license_plate", "vehicle_name", "brand", "model", "color"}, exclude_none=True)
+    owned = (models.Vehicle.vehicle_id == vehicle_id, models.Vehicle.user_id == current_user.id)
 
-    result = await db.execute(
-        select(models.Vehicle).where(
-            models.Vehicle.vehicle_id == vehicle_id,
-            models.Vehicle.user_id == current_user.id,
-        )
-    )
-    vehicle = result.scalar_one_or_none()
-
-    if not vehicle:
-        log_event(logging.WARNING, "/vehicles/{vehicle_id}", 404, "Vehicle not found")
-        raise HTTPException(status_code=404, detail="Vehicle not found")
+    async def write(db: AsyncSession):
+        # hash-matched payments are linked in payment_settlements, a new plate doesn't move them
+        vehicle = await update_returning(db, models.Vehicle, values, *owned)
+        if vehicle is None:
+            # niet gevonden of van iemand anders
+            log_event(logging.WARNING, "/vehicles/{vehicle_id}", 404, "Vehicle not found")
+            raise HTTPException(status_code=404, detail="Vehicle not found")
+        return vehicle
 
-    if vehicle_update.license_plate is not None:
-        vehicle.license_plate = vehicle_update.license_plate
-    if vehicle_update.vehicle_name is not None:
-        vehicle.vehicle_name = vehicle_update.vehicle_name
-    if vehicle_update.brand is not None:
-        vehicle.brand = vehicle_update.brand
-    if vehicle_update.model is not None:
-        vehicle.model = vehicle_update.model
-    if vehicle_update.color is not None:
-        vehicle.color = vehicle_update.color
-
-    db.add(vehicle)
-    await db.commit()
-    await db.refresh(vehicle)
+    vehicle = await run_write(db, write)
 
     log_event(logging.INFO, "/vehicles/{vehicle_id}", 200, "Vehicle updated")
     return vehicle
@@ -142,9 +108,7 @@ async def delete_vehicle(
     vehicle_id: int,
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ):
-    check_token(token.credentials)
 
     result = await db.execute(
         select(models.Vehicle).where(
@@ -158,7 +122,9 @@ async def delete_vehicle(
         log_event(logging.WARNING, "/vehicles/{vehicle_id}", 404, "Vehicle not found")
         raise HTTPException(status_code=404, detail="Vehicle not found")
 
-    await db.delete(vehicle)
+    # its sessions drop out of the owner's billing
+    async with ledger.tracking(db, models.Session.vehicle_id == vehicle.vehicle_id):
+        await db.delete(vehicle)
     await db.commit()
 
     log_event(logging.INFO, "/vehicles/{vehicle_id}", 200, "Vehicle deleted")
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+from collections import deque
+from itertools import chain
+from typing import Iterable, Optional
+
+from .occupancy import LotOccupancy, OccupancyCounter, occupancy
+
+# Live events per parking lot for GET /v2/parking-lots/{lot_id}/events (SSE).
+#
+# Every subscriber (one open stream) has its own bounded buffer. publish
+# encodes an event once and hands the same frame to every subscriber of
+# the lot: no database query and no serialisation per subscriber.
+# Occupancy is coalesced: a subscriber only keeps the latest state per lot,
+# so a burst of starts/stops becomes one update. Session events are kept in
+# order; a subscriber that has SSE_QUEUE_SIZE of them waiting is too slow
+# and gets dropped (it can reconnect and starts again from a snapshot).
+
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+HEARTBEAT = ": keepalive\n\n"
+DROPPED = "event: dropped\ndata: {}\n\n"
+
+
+def frame(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def occupancy_frame(lot_id: int, lot: LotOccupancy) -> str:
+    return frame("occupancy", {
+        "lot_id": lot_id,
+        "capacity": lot.capacity,
+        "reserved": lot.reserved,
+        "occupied": lot.occupied,
+        "available": lot.available,
+    })
+
+
+class Subscriber:
+    __slots__ = ("lots", "occupancy", "frames", "dropped", "wakeup")
+
+    def __init__(self, lots: Optional[frozenset]):
+        self.lots = lots  # None = every lot
+        self.occupancy: dict[int, str] = {}  # latest occupancy frame per lot
+        self.frames: deque[str] = deque()  # session events, in order
+        self.dropped = False
+        self.wakeup = asyncio.Event()
+
+    async def next(self, timeout: float) -> list[str]:
+        # frames waiting for this subscriber, [] after `timeout` seconds without any
+        if not (self.frames or self.occupancy or self.dropped):
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self.wakeup.clear()
+        out = list(self.frames)
+        self.frames.clear()
+        out.extend(self.occupancy.values())
+        self.occupancy.clear()
+        if self.dropped:
+            out.append(DROPPED)
+        return out
+
+
+class Broadcaster:
+    def __init__(self, counter: OccupancyCounter, queue_size: int = SSE_QUEUE_SIZE):
+        self.counter = counter
+        self.queue_size = queue_size
+        counter.listeners.append(self.occupancy_changed)
+        self._by_lot: dict[int, set[Subscriber]] = {}
+        self._everything: set[Subscriber] = set()
+
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, lot_ids: Optional[Iterable[int]] = None) -> Subscriber:
+        # starts with the current occupancy of its lots, from the counters
+        sub = Subscriber(frozenset(lot_ids) if lot_ids is not None else None)
+        if sub.lots is None:
+            self._everything.add(sub)
+            snapshot = self.counter.all().items()
+        else:
+            for lot_id in sub.lots:
+                self._by_lot.setdefault(lot_id, set()).add(sub)
+            snapshot = [(lot_id, self.counter.get(lot_id)) for lot_id in sub.lots]
+        for lot_id, lot in snapshot:
+            if lot is not None:
+                sub.occupancy[lot_id] = occupancy_frame(lot_id, lot)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        if sub.lots is None:
+            self._everything.discard(sub)
+            return
+        for lot_id in sub.lots:
+            subs = self._by_lot.get(lot_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._by_lot[lot_id]
+
+    def _subscribers(self, lot_id: int):
+        return chain(self._by_lot.get(lot_id, ()), self._everything)
+
+    def occupancy_changed(self, lot_id: int, lot: LotOccupancy):
+        # listener of the OccupancyCounter
+        if lot_id not in self._by_lot and not self._everything:
+            return
+        data = occupancy_frame(lot_id, lot)
+        for sub in self._subscribers(lot_id):
+            sub.occupancy[lot_id] = data
+            sub.wakeup.set()
+        self.published += 1
+
+    def session_event(self, lot_id: int, event: str, session_id: int, at):
+        if lot_id not in self._by_lot and not self._everything:
+            return
+        data = frame(event, {"lot_id": lot_id, "session_id": session_id, "at": at.isoformat()})
+        slow = []
+        for sub in self._subscribers(lot_id):
+            if len(sub.frames) >= self.queue_size:
+                slow.append(sub)
+                continue
+            sub.frames.append(data)
+            sub.wakeup.set()
+        for sub in slow:
+            self.drop(sub)
+        self.published += 1
+
+    def drop(self, sub: Subscriber):
+        # slow consumer: stop buffering for it, its stream ends after a "dropped" event
+        self.unsubscribe(sub)
+        sub.frames.clear()
+        sub.dropped = True
+        sub.wakeup.set()
+        self.dropped += 1
+
+    async def stream(self, sub: Subscriber, heartbeat_seconds: float = SSE_HEARTBEAT_SECONDS):
+        # body of the StreamingResponse
+        try:
+            while True:
+                frames = await sub.next(heartbeat_seconds)
+                if not frames:
+                    yield HEARTBEAT
+                    continue
+                yield "".join(frames)
+                if sub.dropped:
+                    return
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._everything) + len({s for subs in self._by_lot.values() for s in subs}),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+broadcaster = Broadcaster(occupancy)
@@ -0,0 +1,166 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import ledger, models
+from .dependencies import calculate_price, licenceplate_clean
+from .occupancy import occupancy
+
+# Gate decisions for barrier cameras: a raw plate read in, a session out.
+# The plate is normalised with licenceplate_clean() and matched against
+# sessions.plate_norm / vehicles.plate_norm (migration 009), so the open
+# session of a car in a lot is one lookup on idx_sessions_open_plate.
+# enter() and leave() are write units (run_write), the caller updates the
+# occupancy counter around them. app/ingest.py applies many reads of a lot
+# at once with the *_sessions/find_vehicles lookups and the same rules.
+
+
+ACTIVE_SESSION_CONFLICT = "Vehicle already has an active session"
+
+
+def normalize_plate(license_plate: str) -> str:
+    plate = licenceplate_clean(license_plate)
+    if not plate:
+        raise HTTPException(status_code=400, detail="Invalid license plate")
+    return plate
+
+
+def check_space(lot_id: int, pending: int = 0):
+    # pending: cars let in earlier in this transaction, not in the occupancy counter yet (app/ingest.py)
+    lot = occupancy.get(lot_id)
+    if lot is not None and lot.available - pending <= 0:
+        raise HTTPException(status_code=409, detail="Parking lot is full")
+
+
+async def find_open_session(db: AsyncSession, lot_id: int, plate_norm: str) -> Optional[models.Session]:
+    # idx_sessions_open_plate
+    return await db.scalar(
+        select(models.Session)
+        .where(
+            models.Session.plate_norm == plate_norm,
+            models.Session.parking_lots_id == lot_id,
+            models.Session.end_date.is_(None),
+        )
+        .limit(1)
+    )
+
+
+def finish_session(session: models.Session, parking_lot: models.ParkingLot, now: Optional[datetime] = None):
+    # end and price an open session, without the ledger (see close_session)
+    start = session.start_date
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    # a camera clock behind the one of the entry read can't give a negative duration
+    end = max(now or datetime.now(timezone.utc), start)
+    price_eur, hours, days = calculate_price(parking_lot, start, end)
+
+    session.end_date = end
+    session.status = "COMPLETED"
+    session.duration_minutes = int((end - start).total_seconds() // 60)
+    session.calculated_amount = float(price_eur)
+
+
+async def find_open_sessions(db: AsyncSession, lot_id: int, plates) -> dict[str, models.Session]:
+    # find_open_session() for many plates in one query
+    result = await db.scalars(
+        select(models.Session).where(
+            models.Session.plate_norm.in_(plates),
+            models.Session.parking_lots_id == lot_id,
+            models.Session.end_date.is_(None),
+        )
+    )
+    return {session.plate_norm: session for session in result}
+
+
+async def find_vehicles(db: AsyncSession, plates) -> dict[str, models.Vehicle]:
+    # idx_vehicles_plate_norm
+    result = await db.scalars(select(models.Vehicle).where(models.Vehicle.plate_norm.in_(plates)))
+    found = {}
+    for vehicle in result:
+        found.setdefault(vehicle.plate_norm, vehicle)
+    return found
+
+
+async def find_parked_vehicles(db: AsyncSession, vehicle_ids) -> set[int]:
+    # vehicles with an open session in any lot (idx_sessions_open_vehicle)
+    result = await db.scalars(
+        select(models.Session.vehicle_id).where(models.Session.vehicle_id.in_(vehicle_ids), models.Session.end_date.is_(None))
+    )
+    return set(result)
+
+
+@contextmanager
+def one_open_session():
+    # around the INSERT of a new open session. The unique idx_sessions_open_vehicle (migration 010)
+    # refuses a second open session of a vehicle, also when two requests start it at the same time: 409
+    try:
+        yield
+    except IntegrityError as exc:
+        if "sessions.vehicle_id" not in str(exc.orig):
+            raise
+        raise HTTPException(status_code=409, detail=ACTIVE_SESSION_CONFLICT) from None
+
+
+async def add_session(db: AsyncSession, session: models.Session):
+    db.add(session)
+    with one_open_session():
+        await db.flush()
+
+
+async def close_session(
+    db: AsyncSession, session: models.Session, parking_lot: models.ParkingLot, now: Optional[datetime] = None
+):
+    # stop an open session and price it; it enters the billing ledger once it is closed
+    async with ledger.tracking_session(db, session.id, was_open=session.end_date is None):
+        finish_session(session, parking_lot, now)
+
+
+def new_session(
+    parking_lot: models.ParkingLot, plate: str, vehicle: Optional[models.Vehicle], now: Optional[datetime] = None
+) -> models.Session:
+    # cars without an account park without vehicle_id
+    return models.Session(
+        parking_lots_id=parking_lot.id,
+        vehicle_id=vehicle.vehicle_id if vehicle else None,
+        license_plate=vehicle.license_plate if vehicle else plate,
+        plate_norm=plate,
+        start_date=now or datetime.now(timezone.utc),
+        hourly_rate=parking_lot.tariff,
+    )
+
+
+async def enter(
+    db: AsyncSession, lot_id: int, license_plate: str, now: Optional[datetime] = None
+) -> tuple[models.Session, bool]:
+    # (session, created): a second read of a car that is already inside returns its open session
+    plate = normalize_plate(license_plate)
+    existing = await find_open_session(db, lot_id, plate)
+    if existing is not None:
+        return existing, False
+
+    parking_lot = await db.get(models.ParkingLot, lot_id)
+    if parking_lot is None:
+        raise HTTPException(status_code=404, detail="Parking lot not found")
+    check_space(lot_id)
+
+    # idx_vehicles_plate_norm
+    vehicle = await db.scalar(select(models.Vehicle).where(models.Vehicle.plate_norm == plate).limit(1))
+    session = new_session(parking_lot, plate, vehicle, now)
+    # de flush haalt id en created_at al op (RETURNING), geen refresh nodig
+    await add_session(db, session)
+    return session, True
+
+
+async def leave(db: AsyncSession, lot_id: int, license_plate: str, now: Optional[datetime] = None) -> models.Session:
+    plate = normalize_plate(license_plate)
+    session = await find_open_session(db, lot_id, plate)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No open session for this license plate")
+    parking_lot = await db.get(models.ParkingLot, lot_id)
+    await close_session(db, session, parking_lot, now)
+    return session
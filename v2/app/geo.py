@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import math
+import os
+from typing import Optional
+
+from sqlalchemy import select
+
+from .models import ParkingLot
+
+logger = logging.getLogger(__name__)
+
+LOT_INDEX_REFRESH_SECONDS = float(os.getenv("LOT_INDEX_REFRESH_SECONDS", "300"))
+
+EARTH_RADIUS_M = 6_371_000.0
+# cell size in degrees, ~5.5 km north-south
+CELL_DEGREES = 0.05
+LON_CELLS = round(360 / CELL_DEGREES)
+# a search touching more cells than this scans every lot instead
+MAX_SEARCH_CELLS = 4096
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_of(lat: float, lon: float) -> tuple[int, int]:
+    return math.floor(lat / CELL_DEGREES), math.floor(lon / CELL_DEGREES) % LON_CELLS
+
+
+class LotIndex:
+    # Coordinates of every parking lot in a grid of CELL_DEGREES cells, for
+    # GET /v2/parking-lots/nearby. A search reads the cells overlapping the
+    # bounding box of the circle and keeps the lots within the radius
+    # (haversine). Lot create/update/delete call put()/remove() after their
+    # commit; load() builds the index at startup and refreshes it
+    # periodically for lots written by other workers.
+
+    def __init__(self):
+        self._cells: dict[tuple[int, int], dict[int, tuple[float, float]]] = {}
+        self._points: dict[int, tuple[float, float]] = {}
+        # ids put/removed while load() is reading, those keep their current state
+        self._changed: Optional[set[int]] = None
+
+        self.loads = 0
+        self.searches = 0
+        self.full_scans = 0
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _remove(self, lot_id: int):
+        point = self._points.pop(lot_id, None)
+        if point is None:
+            return
+        cell = cell_of(*point)
+        bucket = self._cells[cell]
+        del bucket[lot_id]
+        if not bucket:
+            del self._cells[cell]
+
+    def put(self, lot_id: int, lat: Optional[float], lon: Optional[float]):
+        # a lot without coordinates is not searchable
+        self._remove(lot_id)
+        if self._changed is not None:
+            self._changed.add(lot_id)
+        if lat is None or lon is None:
+            return
+        self._points[lot_id] = (lat, lon)
+        self._cells.setdefault(cell_of(lat, lon), {})[lot_id] = (lat, lon)
+
+    def remove(self, lot_id: int):
+        self._remove(lot_id)
+        if self._changed is not None:
+            self._changed.add(lot_id)
+
+    def _candidates(self, lat: float, lon: float, radius_m: float):
+        # points in the cells around (lat, lon) that can be within radius_m
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        lat_lo, lat_hi = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        # longitude span at the latitude furthest from the equator; the whole circle near a pole
+        cos_lat = math.cos(math.radians(max(abs(lat_lo), abs(lat_hi))))
+        dlon = 180.0 if cos_lat < 1e-9 else min(math.degrees(radius_m / EARTH_RADIUS_M) / cos_lat, 180.0)
+
+        rows = range(math.floor(lat_lo / CELL_DEGREES), math.floor(lat_hi / CELL_DEGREES) + 1)
+        first = math.floor((lon - dlon) / CELL_DEGREES)
+        last = math.floor((lon + dlon) / CELL_DEGREES)
+        columns = range(LON_CELLS) if last - first + 1 >= LON_CELLS else range(first, last + 1)
+
+        if len(rows) * len(columns) > min(MAX_SEARCH_CELLS, len(self._cells)):
+            # groot gebied of weinig lots: alles langslopen is goedkoper
+            self.full_scans += 1
+            yield from self._points.items()
+            return
+        for i in rows:
+            for j in columns:
+                bucket = self._cells.get((i, j % LON_CELLS))
+                if bucket:
+                    yield from bucket.items()
+
+    def nearby(self, lat: float, lon: float, radius_m: float, limit: int) -> list[tuple[int, float]]:
+        # [(lot_id, distance in metres)], nearest first
+        self.searches += 1
+        found = []
+        for lot_id, (plat, plon) in self._candidates(lat, lon, radius_m):
+            distance = haversine_m(lat, lon, plat, plon)
+            if distance <= radius_m:
+                found.append((distance, lot_id))
+        found.sort()
+        return [(lot_id, distance) for distance, lot_id in found[:limit]]
+
+    async def load(self, session_factory):
+        self._changed = set()
+        try:
+            async with session_factory() as db:
+                rows = (await db.execute(
+                    select(ParkingLot.id, ParkingLot.latitude, ParkingLot.longitude)
+                )).all()
+            changed = self._changed
+            current = {lot_id: self._points.get(lot_id) for lot_id in changed}
+        finally:
+            self._changed = None
+
+        self._cells, self._points = {}, {}
+        for lot_id, lat, lon in rows:
+            if lot_id not in changed:
+                self.put(lot_id, lat, lon)
+        for lot_id, point in current.items():
+            if point is not None:
+                self.put(lot_id, *point)
+        self.loads += 1
+
+    async def run_refresher(self, session_factory, interval_seconds: float):
+        # Background task, started from the app lifespan.
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.load(session_factory)
+            except Exception:
+                logger.exception("Lot index refresh failed")
+
+    def stats(self) -> dict:
+        return {
+            "lots": len(self._points),
+            "cells": len(self._cells),
+            "loads": self.loads,
+            "searches": self.searches,
+            "full_scans": self.full_scans,
+        }
+
+
+lot_index = LotIndex()
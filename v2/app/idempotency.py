@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import os
+import time
+from hashlib import blake2b
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal, ReadSessionLocal
+from .models import IdempotencyKey
+from .write_queue import WriteUnit, run_write
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_SWEEP_SECONDS = float(os.getenv("IDEMPOTENCY_SWEEP_SECONDS", "3600"))
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(*parts: str) -> bytes:
+    # the request a key was first used for: route, path parameters and body
+    digest = blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.digest()
+
+
+class KeyTaken(Exception):
+    # another request (on any worker) committed the key first
+    pass
+
+
+class IdempotencyStore:
+    # Responses of retried POST /v2/payments and /sessions/start by
+    # Idempotency-Key header, in idempotency_keys (shared by the workers).
+    #
+    # Keys are scoped per user. The first request with a key claims its row
+    # in the transaction of its own write and stores the encoded response
+    # (status + JSON bytes) there before the COMMIT; a repeat within
+    # ttl_seconds returns those bytes without running the write. Two
+    # requests that both miss the row are serialized by SQLite's write lock:
+    # the second one's claim fails, its write is rolled back and it replays
+    # the first one's response. On one worker a repeat that arrives while
+    # the first is still running waits for it. A key used again for a
+    # different request is refused with 422. Errors are not stored: a 4xx is
+    # handed to the requests waiting at that moment, the key stays free.
+
+    def __init__(self, read_factory, write_factory, ttl_seconds: float):
+        self.read_factory = read_factory
+        self.write_factory = write_factory
+        self.ttl = ttl_seconds
+        # requests in flight on this worker, removed when they are done
+        self._pending: dict[tuple[int, str], asyncio.Future] = {}
+
+        self.stored = 0
+        self.replayed = 0
+        self.waited = 0
+        self.taken = 0
+        self.mismatches = 0
+        self.expired = 0
+
+    async def _lookup(self, key: tuple[int, str]) -> Optional[IdempotencyKey]:
+        async with self.read_factory() as db:
+            return await db.scalar(
+                select(IdempotencyKey).where(
+                    IdempotencyKey.user_id == key[0],
+                    IdempotencyKey.key == key[1],
+                    IdempotencyKey.created_at > time.time() - self.ttl,
+                )
+            )
+
+    def claim(self, key: tuple[int, str], request: bytes, encode: Callable[[object], tuple[int, bytes]]):
+        # wraps a write unit: the key's row first (an expired one is taken over), the
+        # response of the unit's result last, all in the unit's transaction
+        def wrap(unit: WriteUnit) -> WriteUnit:
+            async def keyed(db: AsyncSession):
+                now = time.time()
+                stmt = insert(IdempotencyKey).values(user_id=key[0], key=key[1], fingerprint=request, created_at=now)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[IdempotencyKey.user_id, IdempotencyKey.key],
+                    set_={"fingerprint": request, "status_code": 0, "body": b"", "created_at": now},
+                    where=IdempotencyKey.created_at <= now - self.ttl,
+                ).returning(IdempotencyKey.user_id)
+                if await db.scalar(stmt) is None:
+                    raise KeyTaken()
+
+                result = await unit(db)
+                await db.flush()
+                status_code, body = encode(result)
+                await db.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.user_id == key[0], IdempotencyKey.key == key[1])
+                    .values(status_code=status_code, body=body)
+                )
+                return result
+            return keyed
+        return wrap
+
+    async def run(self, key: tuple[int, str], request: bytes, encode, call) -> tuple[int, bytes, Optional[object]]:
+        # (status code, body, result); result is None for a replay.
+        # call(claim) runs the request, claim(unit) is its write unit with the key
+        while True:
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.waited += 1
+                # shield: a cancelled repeat must not cancel the wait of the others
+                error = await asyncio.shield(pending)
+                if error is not None:
+                    raise error
+                # done (or failed otherwise): look again
+                continue
+
+            # in flight from here on, the lookup included
+            # resolved with the 4xx of this request for the repeats waiting on it, else None
+            future = self._pending[key] = asyncio.get_running_loop().create_future()
+            error = None
+            try:
+                row = await self._lookup(key)
+                if row is None:
+                    result = await call(self.claim(key, request, encode))
+            except KeyTaken:
+                self.taken += 1
+                continue
+            except HTTPException as exc:
+                error = exc
+                raise
+            finally:
+                del self._pending[key]
+                future.set_result(error)
+
+            if row is not None:
+                if row.fingerprint != request:
+                    self.mismatches += 1
+                    raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+                self.replayed += 1
+                return row.status_code, row.body, None
+
+            self.stored += 1
+            status_code, body = encode(result)
+            return status_code, body, result
+
+    async def sweep(self) -> int:
+        # delete the expired keys
+        async def write(db: AsyncSession):
+            result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at <= time.time() - self.ttl))
+            return result.rowcount
+
+        async with self.write_factory() as db:
+            swept = await run_write(db, write)
+        self.expired += swept
+        return swept
+
+    async def run_sweeper(self, interval_seconds: float):
+        # Background task, started from the app lifespan.
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Idempotency key sweep failed")
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "stored": self.stored,
+            "replayed": self.replayed,
+            "waited": self.waited,
+            "taken": self.taken,
+            "mismatches": self.mismatches,
+            "expired": self.expired,
+        }
+
+
+idempotency_store = IdempotencyStore(ReadSessionLocal, AsyncSessionLocal, IDEMPOTENCY_TTL_SECONDS)
+
+
+def no_key(unit: WriteUnit) -> WriteUnit:
+    return unit
+
+
+async def idempotent(
+    idempotency_key: Optional[str],
+    user_id: int,
+    request: bytes,
+    call: Callable[[Callable[[WriteUnit], WriteUnit]], Awaitable],
+    response_model,
+    status_code: int,
+    respond: Callable[[object], object] = lambda result: result,
+):
+    # Run an endpoint once per Idempotency-Key; without the header call() runs as usual.
+    # call(claim) passes its write unit through claim(): run_write(db, claim(write)).
+    # respond(result of the write unit) is the response.
+    #   return await idempotent(idempotency_key, current_user.id, fingerprint(...), create, schemas.X, 201)
+    if idempotency_key is None:
+        return respond(await call(no_key))
+    if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+
+    def encode(result) -> tuple[int, bytes]:
+        return status_code, response_model.model_validate(respond(result)).model_dump_json().encode()
+
+    status, body, result = await idempotency_store.run((user_id, idempotency_key), request, encode, call)
+    headers = {"Idempotent-Replayed": "true"} if result is None else None
+    return Response(content=body, status_code=status, media_type="application/json", headers=headers)
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+
+from . import gates, ledger, lot_stats, models
+from .database import AsyncSessionLocal
+from .events import broadcaster
+from .occupancy import occupancy
+
+logger = logging.getLogger(__name__)
+
+# Bulk ingestion of barrier camera reads for POST /v2/gate/events.
+#
+# Requests put their reads on one bounded queue; a single worker task takes
+# up to INGEST_MAX_BATCH of them at a time, groups them per lot (in the
+# order of the camera timestamps) and applies every lot group in one
+# transaction: one query for the open sessions of all plates, one for the
+# vehicles, then the gate rules per read in memory and one flush. A read
+# that the rules refuse gets its own outcome; an error in the transaction
+# fails the reads of that lot only. Reads from before the current hour
+# rewind the lot's stats rollup in the same transaction. The occupancy
+# counter and the SSE events follow after the commit.
+#
+# A camera reads the same plate several times while the car passes: a read
+# of the same (lot, plate, entry/exit) as the previous read within
+# INGEST_DEDUPE_SECONDS is not queued again, it gets the outcome of that
+# read. A full queue rejects the whole request with 503 + Retry-After
+# instead of letting it wait.
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "500"))
+INGEST_DEDUPE_SECONDS = float(os.getenv("INGEST_DEDUPE_SECONDS", "10"))
+# reads per request
+INGEST_MAX_EVENTS = int(os.getenv("INGEST_MAX_EVENTS", "1000"))
+# window of events_per_second in stats()
+THROUGHPUT_WINDOW_SECONDS = 60.0
+
+
+class Read:
+    __slots__ = ("lot_id", "kind", "plate", "at", "future")
+
+    def __init__(self, lot_id: int, kind: str, plate: str, at: datetime, future: asyncio.Future):
+        self.lot_id = lot_id
+        self.kind = kind  # "entry" / "exit"
+        self.plate = plate  # genormaliseerd
+        self.at = at
+        self.future = future
+
+
+def outcome(result: str, status: int, session_id: Optional[int] = None, detail: Optional[str] = None) -> dict:
+    return {"outcome": result, "status": status, "session_id": session_id, "detail": detail}
+
+
+class IngestPipeline:
+    def __init__(self, session_factory, queue_size: int, max_batch: int, dedupe_seconds: float):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.dedupe_seconds = dedupe_seconds
+        self.queue_size = queue_size
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        # (lot_id, plate) -> latest queued read of that car, for deduplication
+        self._recent: dict[tuple[int, str], Read] = {}
+        self._recent_order: deque[tuple[float, tuple[int, str], Read]] = deque()
+        self._applied: deque[tuple[float, int]] = deque()  # (monotonic, reads) per transaction
+
+        self.received = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.applied = 0
+        self.rejected = 0
+        self.failed = 0
+        self.batches = 0
+        self.transactions = 0
+        self.rejected_requests = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> asyncio.Task:
+        # queue and reads belong to the event loop of the app
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._recent.clear()
+        self._recent_order.clear()
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def _forget_expired(self, now: float):
+        while self._recent_order and self._recent_order[0][0] <= now - self.dedupe_seconds:
+            _, key, read = self._recent_order.popleft()
+            if self._recent.get(key) is read:
+                del self._recent[key]
+
+    async def submit(self, events) -> list[dict]:
+        # events: [(lot_id, kind, raw plate, camera time or None)], returns an outcome per event
+        if not self.running:
+            raise HTTPException(status_code=503, detail="Ingestion is not running")
+        if self._queue.maxsize - self._queue.qsize() < len(events):
+            self.rejected_requests += 1
+            raise HTTPException(status_code=503, detail="Ingestion queue is full", headers={"Retry-After": "1"})
+
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        self._forget_expired(now)
+        self.received += len(events)
+
+        # per event: (future, duplicate) or a finished outcome
+        waits = [self._enqueue(loop, now, *event) for event in events]
+
+        results = []
+        for wait in waits:
+            if isinstance(wait, dict):
+                results.append(wait)
+                continue
+            future, duplicate = wait
+            # shield: a cancelled request must not cancel a read that other requests wait for
+            result = await asyncio.shield(future)
+            # a duplicate of a read that was rejected gets that rejection
+            results.append({**result, "outcome": "duplicate"} if duplicate and result["status"] < 400 else result)
+        return results
+
+    def _enqueue(self, loop, now: float, lot_id: int, kind: str, license_plate: str, at: Optional[datetime]):
+        try:
+            plate = gates.normalize_plate(license_plate)
+        except HTTPException as exc:
+            self.invalid += 1
+            return outcome("rejected", exc.status_code, detail=exc.detail)
+
+        key = (lot_id, plate)
+        previous = self._recent.get(key)
+        if previous is not None and previous.kind == kind:
+            self.duplicates += 1
+            return previous.future, True
+
+        if at is None:
+            at = datetime.now(timezone.utc)
+        elif at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+        read = Read(lot_id, kind, plate, at, loop.create_future())
+        self._recent[key] = read
+        self._recent_order.append((now, key, read))
+        self._queue.put_nowait(read)
+        return read.future, False
+
+    async def run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            by_lot: dict[int, list[Read]] = {}
+            for read in batch:
+                by_lot.setdefault(read.lot_id, []).append(read)
+            for lot_id, reads in by_lot.items():
+                # stable: reads with the same timestamp keep their arrival order
+                reads.sort(key=lambda read: read.at)
+                try:
+                    await self._apply(lot_id, reads)
+                except Exception:
+                    logger.exception("Ingesting %s camera reads for lot %s failed", len(reads), lot_id)
+                    self._finish(reads, outcome("failed", 503, detail="Transaction failed"))
+            self.batches += 1
+
+    async def _apply(self, lot_id: int, reads: list[Read]):
+        # the rules of gates.enter()/leave(), with the lookups of all reads done up front
+        started: list = []  # sessions created, for the SSE events
+        stopped: list = []
+        with occupancy.change(lot_id, 0) as change:
+            async with self.session_factory() as db:
+                plates = {read.plate for read in reads}
+                inside = await gates.find_open_sessions(db, lot_id, plates)
+                parking_lot = await db.get(models.ParkingLot, lot_id)
+                entering = {read.plate for read in reads if read.kind == "entry"} - inside.keys()
+                vehicles = await gates.find_vehicles(db, entering) if entering and parking_lot else {}
+                # one open session per vehicle: refused here instead of failing the flush of the whole batch
+                parked = await gates.find_parked_vehicles(db, [v.vehicle_id for v in vehicles.values()]) if vehicles else set()
+
+                results = self._decide(db, lot_id, parking_lot, reads, inside, vehicles, parked, started, stopped)
+
+                await db.flush()
+                # a session started and stopped in this batch was never in the ledger either
+                await ledger.sessions_closed(db, [session.id for session in stopped])
+                # reads of a camera that was offline are backdated: hours that were closed
+                # (and maybe materialized) change, recompute them
+                applied = [read.at for read, result in zip(reads, results) if result[0] in ("created", "stopped")]
+                closed = lot_stats.floor_bucket(datetime.now(timezone.utc), "hour").replace(tzinfo=timezone.utc)
+                if applied and min(applied) < closed:
+                    await lot_stats.rewind(db, lot_id, min(applied))
+                await db.commit()
+            change.delta = len(started) - len(stopped)
+
+        for session in started:
+            broadcaster.session_event(lot_id, "session_started", session.id, session.start_date)
+        for session in stopped:
+            broadcaster.session_event(lot_id, "session_stopped", session.id, session.end_date)
+
+        self.transactions += 1
+        self._applied.append((time.monotonic(), len(reads)))
+        for read, (result, status, session, detail) in zip(reads, results):
+            if result == "rejected":
+                self.rejected += 1
+                # a new read of this car is tried again instead of getting this outcome
+                if self._recent.get((read.lot_id, read.plate)) is read:
+                    del self._recent[(read.lot_id, read.plate)]
+            else:
+                self.applied += 1
+            if not read.future.done():
+                # ids of new sessions are known after the flush
+                read.future.set_result(outcome(result, status, session.id if session else None, detail))
+
+    def _decide(self, db, lot_id, parking_lot, reads, inside, vehicles, parked, started, stopped) -> list[tuple]:
+        # (outcome, status, session, detail) per read, new sessions are added to db;
+        # inside and parked follow the reads, started/stopped collect the sessions for the SSE events
+        results: list[tuple] = []
+        for read in reads:
+            session = inside.get(read.plate)
+            try:
+                if read.kind == "entry":
+                    if session is not None:
+                        # auto stond al binnen
+                        results.append(("already_inside", 200, session, None))
+                        continue
+                    if parking_lot is None:
+                        raise HTTPException(status_code=404, detail="Parking lot not found")
+                    vehicle = vehicles.get(read.plate)
+                    if vehicle is not None and vehicle.vehicle_id in parked:
+                        raise HTTPException(status_code=409, detail=gates.ACTIVE_SESSION_CONFLICT)
+                    gates.check_space(lot_id, pending=len(started) - len(stopped))
+                    session = inside[read.plate] = gates.new_session(parking_lot, read.plate, vehicle, read.at)
+                    db.add(session)
+                    if vehicle is not None:
+                        parked.add(vehicle.vehicle_id)
+                    started.append(session)
+                    results.append(("created", 201, session, None))
+                else:
+                    if session is None:
+                        raise HTTPException(status_code=404, detail="No open session for this license plate")
+                    gates.finish_session(session, parking_lot, read.at)
+                    del inside[read.plate]
+                    parked.discard(session.vehicle_id)
+                    stopped.append(session)
+                    results.append(("stopped", 200, session, None))
+            except HTTPException as exc:
+                results.append(("rejected", exc.status_code, None, exc.detail))
+        return results
+
+    def _finish(self, reads: list[Read], result: dict):
+        for read in reads:
+            self.failed += 1
+            if self._recent.get((read.lot_id, read.plate)) is read:
+                del self._recent[(read.lot_id, read.plate)]
+            if not read.future.done():
+                read.future.set_result(result)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        while self._applied and self._applied[0][0] <= now - THROUGHPUT_WINDOW_SECONDS:
+            self._applied.popleft()
+        window = sum(count for _, count in self._applied)
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "applied": self.applied,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "batches": self.batches,
+            "transactions": self.transactions,
+            "reads_per_transaction": (
+                round((self.applied + self.rejected) / self.transactions, 2) if self.transactions else None
+            ),
+            "events_per_second": round(window / THROUGHPUT_WINDOW_SECONDS, 2),
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "rejected_requests": self.rejected_requests,
+        }
+
+
+ingest_pipeline = IngestPipeline(AsyncSessionLocal, INGEST_QUEUE_SIZE, INGEST_MAX_BATCH, INGEST_DEDUPE_SECONDS)
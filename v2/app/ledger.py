@@ -0,0 +1,276 @@
+from contextlib import asynccontextmanager
+from functools import cache
+from datetime import datetime, timezone
+
+from sqlalchemy import select, func, case, delete, bindparam
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from . import models
+
+# Per-user billing ledger: totals of every *closed* session of the user's vehicles.
+# Writes that change those totals apply the difference in their own transaction:
+#
+#   async with ledger.tracking(db, models.Session.id == session_id):
+#       ... change the session, its payments or its vehicle ...
+#
+# The same writes maintain billing_monthly, session count and cost of the closed
+# sessions per (user, start month), read by /v2/billing/monthly.
+#
+# Open sessions are priced live by the billing endpoints, they enter the ledger
+# when they are stopped. rebuild_*()/diff_*() recompute everything
+# from scratch for the consistency check (tools/billing_ledger.py).
+
+LEDGER_FIELDS = ("sessions", "amount", "paid", "paid_completed")
+# ledger amounts are kept in cents, float sums may differ below that
+TOLERANCE = 0.005
+
+# month of a session, same format as billing_monthly.month
+SESSION_MONTH = func.strftime("%Y-%m", models.Session.start_date)
+
+
+def per_session(*where):
+    # One row per session with its owner, price and paid amounts. Paid is the sum
+    # of the payments on sessions_id, sessions without one fall back to the payments
+    # matched to them by transaction hash (payment_settlements, app/settlement.py).
+    by_hash = aliased(models.Payment)
+    settled = (
+        select(func.coalesce(func.sum(by_hash.amount), 0))
+        .select_from(models.PaymentSettlement)
+        .join(by_hash, by_hash.id == models.PaymentSettlement.payment_id)
+        .where(models.PaymentSettlement.session_id == models.Session.id)
+    )
+
+    paid_by_id = func.coalesce(func.sum(models.Payment.amount), 0)
+    completed_by_id = func.coalesce(
+        func.sum(case((models.Payment.completed_at.is_not(None), models.Payment.amount), else_=0)), 0
+    )
+    paid_by_hash = settled.scalar_subquery()
+    completed_by_hash = settled.where(by_hash.completed_at.is_not(None)).scalar_subquery()
+
+    return (
+        select(
+            models.Vehicle.user_id.label("user_id"),
+            models.Session.start_date.label("start_date"),
+            models.Session.end_date.label("end_date"),
+            func.coalesce(models.Session.calculated_amount, 0).label("amount"),
+            models.ParkingLot.tariff.label("tariff"),
+            models.ParkingLot.daytariff.label("daytariff"),
+            models.ParkingLot.id.label("lot_id"),
+            models.ParkingLot.tariff_schedule_json.label("tariff_schedule_json"),
+            func.round(case((paid_by_id == 0, paid_by_hash), else_=paid_by_id), 2).label("paid"),
+            func.round(case((paid_by_id == 0, completed_by_hash), else_=completed_by_id), 2).label("paid_completed"),
+        )
+        .join(models.Vehicle, models.Session.vehicle_id == models.Vehicle.vehicle_id)
+        .join(models.ParkingLot, models.Session.parking_lots_id == models.ParkingLot.id)
+        .outerjoin(models.Payment, models.Payment.sessions_id == models.Session.id)
+        .where(*where)
+        .group_by(models.Session.id, models.Vehicle.vehicle_id, models.ParkingLot.id)
+    )
+
+
+def _totals_query(*where):
+    rows = per_session(models.Session.end_date.is_not(None), *where).subquery()
+    return (
+        select(
+            rows.c.user_id,
+            func.count().label("sessions"),
+            func.round(func.sum(rows.c.amount), 2).label("amount"),
+            func.round(func.sum(rows.c.paid), 2).label("paid"),
+            func.round(func.sum(rows.c.paid_completed), 2).label("paid_completed"),
+        )
+        .group_by(rows.c.user_id)
+    )
+
+
+async def session_totals(db: AsyncSession, *where) -> dict[int, tuple]:
+    # {user_id: (sessions, amount, paid, paid_completed)} over the closed sessions matching `where`
+    result = await db.execute(_totals_query(*where))
+    return {row.user_id: tuple(getattr(row, f) or 0 for f in LEDGER_FIELDS) for row in result}
+
+
+def _month_totals_query(*where):
+    return (
+        select(
+            models.Vehicle.user_id,
+            SESSION_MONTH.label("month"),
+            func.count(models.Session.id).label("sessions"),
+            func.round(func.sum(func.coalesce(models.Session.calculated_amount, 0)), 2).label("total_cost"),
+        )
+        .join(models.Vehicle, models.Session.vehicle_id == models.Vehicle.vehicle_id)
+        .where(models.Session.end_date.is_not(None), *where)
+        .group_by(models.Vehicle.user_id, SESSION_MONTH)
+    )
+
+
+async def month_totals(db: AsyncSession, *where) -> dict[tuple[int, str], tuple]:
+    # {(user_id, month): (sessions, total_cost)} over the closed sessions matching `where`
+    result = await db.execute(_month_totals_query(*where))
+    return {(row.user_id, row.month): (row.sessions, row.total_cost or 0.0) for row in result}
+
+
+@asynccontextmanager
+async def tracking(db: AsyncSession, *where):
+    # totals of the sessions matching `where` before and after the block, the difference goes to the ledger
+    before = await session_totals(db, *where)
+    months_before = await month_totals(db, *where)
+    yield
+    await db.flush()
+    await apply_change(db, before, await session_totals(db, *where))
+    await apply_month_change(db, months_before, await month_totals(db, *where))
+
+
+@cache
+def _one_session_queries():
+    # per_session() takes milliseconds to build, the queries for a single session are built once
+    where = models.Session.id == bindparam("session_id")
+    return _totals_query(where), _month_totals_query(where)
+
+
+@asynccontextmanager
+async def tracking_session(db: AsyncSession, session_id: int, was_open: bool = False):
+    # tracking(db, Session.id == session_id) for the hot paths (stopping a session, gates);
+    # a session that was still open has nothing in the ledger yet
+    totals_query, months_query = _one_session_queries()
+    params = {"session_id": session_id}
+
+    async def totals():
+        result = await db.execute(totals_query, params)
+        return {row.user_id: tuple(getattr(row, f) or 0 for f in LEDGER_FIELDS) for row in result}
+
+    async def months():
+        result = await db.execute(months_query, params)
+        return {(row.user_id, row.month): (row.sessions, row.total_cost or 0.0) for row in result}
+
+    before = {} if was_open else await totals()
+    months_before = {} if was_open else await months()
+    yield
+    await db.flush()
+    await apply_change(db, before, await totals())
+    await apply_month_change(db, months_before, await months())
+
+
+async def sessions_closed(db: AsyncSession, session_ids):
+    # sessions that were open before this transaction and are closed (and flushed) now enter the ledger
+    if not session_ids:
+        return
+    where = models.Session.id.in_(session_ids)
+    await apply_change(db, {}, await session_totals(db, where))
+    await apply_month_change(db, {}, await month_totals(db, where))
+
+
+async def apply_change(db: AsyncSession, before: dict[int, tuple], after: dict[int, tuple]):
+    for user_id in before.keys() | after.keys():
+        old = before.get(user_id, (0, 0.0, 0.0, 0.0))
+        new = after.get(user_id, (0, 0.0, 0.0, 0.0))
+        delta = [n - o for n, o in zip(new, old)]
+        if any(delta):
+            await _add(db, user_id, *delta)
+
+
+async def _add(db: AsyncSession, user_id: int, sessions: int, amount: float, paid: float, paid_completed: float):
+    ledger = models.BillingLedger.__table__
+    now = datetime.now(timezone.utc)
+    stmt = insert(ledger).values(
+        user_id=user_id,
+        sessions=sessions,
+        amount=round(amount, 2),
+        paid=round(paid, 2),
+        paid_completed=round(paid_completed, 2),
+        updated_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ledger.c.user_id],
+        set_={
+            "sessions": ledger.c.sessions + stmt.excluded.sessions,
+            "amount": func.round(ledger.c.amount + stmt.excluded.amount, 2),
+            "paid": func.round(ledger.c.paid + stmt.excluded.paid, 2),
+            "paid_completed": func.round(ledger.c.paid_completed + stmt.excluded.paid_completed, 2),
+            "updated_at": now,
+        },
+    )
+    await db.execute(stmt)
+
+
+async def apply_month_change(db: AsyncSession, before: dict, after: dict):
+    rollup = models.BillingMonthly.__table__
+    for user_id, month in before.keys() | after.keys():
+        old = before.get((user_id, month), (0, 0.0))
+        new = after.get((user_id, month), (0, 0.0))
+        sessions, total_cost = new[0] - old[0], new[1] - old[1]
+        if not (sessions or total_cost):
+            continue
+        stmt = insert(rollup).values(
+            user_id=user_id, month=month, sessions=sessions, total_cost=round(total_cost, 2)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[rollup.c.user_id, rollup.c.month],
+            set_={
+                "sessions": rollup.c.sessions + stmt.excluded.sessions,
+                "total_cost": func.round(rollup.c.total_cost + stmt.excluded.total_cost, 2),
+            },
+        )
+        await db.execute(stmt)
+
+
+async def read_ledger(db: AsyncSession, user_id: int) -> tuple:
+    row = (await db.execute(
+        select(*(getattr(models.BillingLedger, f) for f in LEDGER_FIELDS))
+        .where(models.BillingLedger.user_id == user_id)
+    )).first()
+    return tuple(row) if row else (0, 0.0, 0.0, 0.0)
+
+
+async def diff_ledger(db: AsyncSession) -> list[tuple[int, tuple, tuple]]:
+    # [(user_id, ledger, rebuilt)] for every user whose ledger row is off
+    rebuilt = await session_totals(db)
+    live = {
+        row.user_id: tuple(getattr(row, f) for f in LEDGER_FIELDS)
+        for row in (await db.execute(select(models.BillingLedger))).scalars()
+    }
+    return _diff(live, rebuilt, (0, 0.0, 0.0, 0.0))
+
+
+async def diff_months(db: AsyncSession) -> list[tuple[tuple[int, str], tuple, tuple]]:
+    # [((user_id, month), rollup, rebuilt)] for every rollup row that is off
+    rebuilt = await month_totals(db)
+    live = {
+        (row.user_id, row.month): (row.sessions, row.total_cost)
+        for row in (await db.execute(select(models.BillingMonthly))).scalars()
+    }
+    return _diff(live, rebuilt, (0, 0.0))
+
+
+def _diff(live: dict, rebuilt: dict, empty: tuple) -> list:
+    diffs = []
+    for key in sorted(rebuilt.keys() | live.keys()):
+        have, want = live.get(key, empty), rebuilt.get(key, empty)
+        if have[0] != want[0] or any(abs(h - w) > TOLERANCE for h, w in zip(have[1:], want[1:])):
+            diffs.append((key, have, want))
+    return diffs
+
+
+async def rebuild_ledger(db: AsyncSession) -> int:
+    # Replace the whole ledger with freshly computed totals, caller commits
+    rebuilt = await session_totals(db)
+    await db.execute(delete(models.BillingLedger))
+    for user_id, totals in rebuilt.items():
+        await _add(db, user_id, *totals)
+    return len(rebuilt)
+
+
+async def rebuild_months(db: AsyncSession, user_ids: list[int] | None = None) -> int:
+    # Backfill billing_monthly from the sessions, for all users or only `user_ids`, caller commits
+    where = [models.Vehicle.user_id.in_(user_ids)] if user_ids is not None else []
+    stmt = delete(models.BillingMonthly)
+    if user_ids is not None:
+        stmt = stmt.where(models.BillingMonthly.user_id.in_(user_ids))
+    await db.execute(stmt)
+    rows = (await db.execute(_month_totals_query(*where))).all()
+    if rows:
+        await db.execute(insert(models.BillingMonthly.__table__), [
+            {"user_id": r.user_id, "month": r.month, "sessions": r.sessions, "total_cost": r.total_cost or 0.0}
+            for r in rows
+        ])
+    return len(rows)
@@ -0,0 +1,364 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .database import AsyncSessionLocal
+from .write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+# Revenue and utilisation per lot in hour/day/week buckets (UTC), for
+# GET /v2/parking-lots/{lot_id}/stats.
+#
+# A session counts in the hour it *ended* in (sessions, revenue, duration);
+# peak is the highest number of cars inside at any moment of the hour.
+# An hour that ended before now can no longer change (start and stop write
+# now), so closed hours are computed once and kept in lot_stats_hourly:
+# lot_stats_state.materialized_until says how far a lot is done. A background
+# task materializes every lot every STATS_MATERIALIZE_SECONDS; a stats request
+# writes at most STATS_REQUEST_CHUNKS chunks itself, groups the hourly rows
+# into the requested buckets and computes the hours after the rollup (at
+# least the open hour) live. Deleting a session rewinds its lot to the hour
+# the session started.
+
+BUCKETS = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}
+MAX_BUCKETS = 10_000
+# hours materialized per write transaction, keeps the writer free for other requests
+MATERIALIZE_CHUNK = timedelta(days=7)
+# chunks one stats request may write, the rest of a backlog is read live and left to the background task
+STATS_REQUEST_CHUNKS = int(os.getenv("STATS_REQUEST_CHUNKS", "4"))
+STATS_MATERIALIZE_SECONDS = float(os.getenv("STATS_MATERIALIZE_SECONDS", "300"))
+
+# same format as lot_stats_hourly.hour and the bucket expressions below
+KEY_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# sessions hold both "2024-01-01T10:00:00Z" (imported) and "2024-01-01 10:00:00.000000"
+# (written by the API). Those don't compare as strings within a day, so the
+# index range uses whole days and datetime() does the exact filter.
+START = func.datetime(models.Session.start_date)
+END = func.datetime(models.Session.end_date)
+
+
+def bucket_expr(column, bucket: str):
+    if bucket == "hour":
+        return func.strftime("%Y-%m-%d %H:00:00", column)
+    if bucket == "day":
+        return func.strftime("%Y-%m-%d 00:00:00", column)
+    # monday of the week
+    return func.strftime("%Y-%m-%d 00:00:00", column, "weekday 0", "-6 days")
+
+
+def floor_bucket(value: datetime, bucket: str) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if bucket == "hour":
+        return value
+    value = value.replace(hour=0)
+    if bucket == "day":
+        return value
+    return value - timedelta(days=value.weekday())
+
+
+def bucket_range(start: datetime, end: datetime, bucket: str) -> list[datetime]:
+    # bucket starts covering [start, end), naive UTC
+    step = BUCKETS[bucket]
+    current = floor_bucket(start, bucket)
+    starts = []
+    while current < end:
+        starts.append(current)
+        current += step
+    return starts
+
+
+def _between(column, exact, lo: datetime, hi: datetime):
+    # index range on whole days, exact bounds on the normalised value
+    return (
+        column >= lo.strftime("%Y-%m-%d"),
+        column < (hi + timedelta(days=1)).strftime("%Y-%m-%d"),
+        exact >= lo.strftime(KEY_FORMAT),
+        exact < hi.strftime(KEY_FORMAT),
+    )
+
+
+async def query_hours(db: AsyncSession, lot_id: int, lo: datetime, hi: datetime, level: int) -> list[dict]:
+    # Hourly stats straight from sessions for the hours in [lo, hi) with arrivals or
+    # departures. `level` is the number of cars inside at lo.
+    lot = models.Session.parking_lots_id == lot_id
+
+    # sessions ended in the range, via idx_sessions_lot_end
+    ended = await db.execute(
+        select(
+            bucket_expr(END, "hour").label("hour"),
+            func.count().label("sessions"),
+            func.sum(func.coalesce(models.Session.calculated_amount, 0)).label("revenue"),
+            func.sum(models.Session.duration_minutes).label("duration_sum"),
+            func.count(models.Session.duration_minutes).label("duration_count"),
+        )
+        .where(lot, *_between(models.Session.end_date, END, lo, hi))
+        .group_by("hour")
+    )
+    ended = {row.hour: row for row in ended}
+
+    # +1 per arrival (idx_sessions_lot_start), -1 per departure; the running sum is the
+    # number of cars inside relative to lo, departures first on the same second
+    events = union_all(
+        select(START.label("t"), literal(1).label("d")).where(lot, *_between(models.Session.start_date, START, lo, hi)),
+        select(END.label("t"), literal(-1).label("d")).where(lot, *_between(models.Session.end_date, END, lo, hi)),
+    ).subquery()
+    running = select(
+        events.c.t,
+        events.c.d,
+        func.sum(events.c.d).over(order_by=(events.c.t, events.c.d), rows=(None, 0)).label("level"),
+    ).subquery()
+    moves = await db.execute(
+        select(
+            bucket_expr(running.c.t, "hour").label("hour"),
+            func.max(running.c.level).label("peak"),
+            func.sum(running.c.d).label("net"),
+        )
+        .group_by("hour")
+        .order_by("hour")
+    )
+
+    hours = []
+    start_level = level
+    for row in moves:
+        closed = ended.get(row.hour)
+        end_level = start_level + row.net
+        hours.append({
+            "hour": row.hour,
+            "sessions": closed.sessions if closed else 0,
+            "revenue": round(closed.revenue, 2) if closed else 0.0,
+            "duration_sum": (closed.duration_sum or 0) if closed else 0,
+            "duration_count": closed.duration_count if closed else 0,
+            "peak": max(start_level, level + row.peak),
+            "net": row.net,
+            "occupancy": end_level,
+        })
+        start_level = end_level
+    return hours
+
+
+async def _occupancy_before(db: AsyncSession, lot_id: int, hour: datetime) -> int:
+    # cars inside at `hour`, from the last materialized hour before it
+    occupancy = await db.scalar(
+        select(models.LotStatsHourly.occupancy)
+        .where(models.LotStatsHourly.parking_lots_id == lot_id, models.LotStatsHourly.hour < hour.strftime(KEY_FORMAT))
+        .order_by(models.LotStatsHourly.hour.desc())
+        .limit(1)
+    )
+    return occupancy or 0
+
+
+async def materialized_until(db: AsyncSession, lot_id: int) -> Optional[datetime]:
+    # first hour that is not in lot_stats_hourly yet; a new lot starts on the day of its first session
+    until = await db.scalar(
+        select(models.LotStatsState.materialized_until).where(models.LotStatsState.parking_lots_id == lot_id)
+    )
+    if until is None:
+        until = await db.scalar(
+            select(func.substr(func.min(models.Session.start_date), 1, 10)).where(
+                models.Session.parking_lots_id == lot_id
+            )
+        )
+        if until is None:
+            return None
+    return datetime.fromisoformat(until)
+
+
+async def materialize(db: AsyncSession, lot_id: int, until: datetime) -> bool:
+    # Write unit: materialize the next chunk of closed hours before `until`.
+    # Returns True when the lot is done up to `until`.
+    start = await materialized_until(db, lot_id)
+    if start is None or start >= until:
+        return True
+
+    end = min(until, start + MATERIALIZE_CHUNK)
+    rows = await query_hours(db, lot_id, start, end, await _occupancy_before(db, lot_id, start))
+    if rows:
+        table = models.LotStatsHourly.__table__
+        stmt = insert(table)
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.c.parking_lots_id, table.c.hour],
+                set_={
+                    c: stmt.excluded[c]
+                    for c in ("sessions", "revenue", "duration_sum", "duration_count", "peak", "net", "occupancy")
+                },
+            ),
+            [{"parking_lots_id": lot_id, **row} for row in rows],
+        )
+    await _set_until(db, lot_id, end)
+    return end >= until
+
+
+async def _set_until(db: AsyncSession, lot_id: int, until: datetime):
+    table = models.LotStatsState.__table__
+    stmt = insert(table).values(parking_lots_id=lot_id, materialized_until=until.strftime(KEY_FORMAT))
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.parking_lots_id], set_={"materialized_until": stmt.excluded.materialized_until}
+        )
+    )
+
+
+async def rewind(db: AsyncSession, lot_id: int, since: datetime):
+    # sessions from `since` on changed: drop those hours, the next stats request recomputes them.
+    # Caller commits, in the same transaction as the change.
+    hour = floor_bucket(since, "hour")
+    await db.execute(
+        delete(models.LotStatsHourly).where(
+            models.LotStatsHourly.parking_lots_id == lot_id,
+            models.LotStatsHourly.hour >= hour.strftime(KEY_FORMAT),
+        )
+    )
+    current = await db.scalar(
+        select(models.LotStatsState.materialized_until).where(models.LotStatsState.parking_lots_id == lot_id)
+    )
+    if current is None or current <= hour.strftime(KEY_FORMAT):
+        return
+    earlier = await db.scalar(
+        select(models.LotStatsHourly.hour)
+        .where(models.LotStatsHourly.parking_lots_id == lot_id, models.LotStatsHourly.hour < hour.strftime(KEY_FORMAT))
+        .limit(1)
+    )
+    if earlier is None:
+        # nothing left before it, start again from the first session
+        await db.execute(delete(models.LotStatsState).where(models.LotStatsState.parking_lots_id == lot_id))
+    else:
+        await _set_until(db, lot_id, hour)
+
+
+async def read_buckets(
+    db: AsyncSession, lot_id: int, bucket: str, start: datetime, end: datetime, until: datetime
+) -> list[dict]:
+    # Buckets covering [start, end) from lot_stats_hourly (materialized up to `until`),
+    # the hours from `until` on are computed live.
+    starts = bucket_range(start, end, bucket)
+    if not starts:
+        return []
+    lo, hi = starts[0], starts[-1] + BUCKETS[bucket]
+
+    hourly = models.LotStatsHourly
+    values = (hourly.sessions, hourly.revenue, hourly.duration_sum, hourly.duration_count, hourly.peak, hourly.net)
+    if bucket == "hour":
+        # hour buckets are the rows themselves
+        query = select(hourly.hour, *values)
+    else:
+        key = bucket_expr(hourly.hour, bucket)
+        query = select(key, *(func.max(c) if c is hourly.peak else func.sum(c) for c in values)).group_by(key)
+    rows = await db.execute(
+        query.where(
+            hourly.parking_lots_id == lot_id,
+            hourly.hour >= lo.strftime(KEY_FORMAT),
+            hourly.hour < min(hi, until).strftime(KEY_FORMAT),
+        )
+    )
+    # {bucket: [sessions, revenue, duration_sum, duration_count, peak, net]}
+    found = {row[0]: list(row[1:]) for row in rows}
+
+    level = await _occupancy_before(db, lot_id, lo)
+    if hi > until:
+        live_from = max(lo, until)
+        live_level = await _occupancy_before(db, lot_id, live_from)
+        for row in await query_hours(db, lot_id, live_from, hi, live_level):
+            live_key = floor_bucket(datetime.fromisoformat(row["hour"]), bucket).isoformat(" ")
+            entry = found.setdefault(live_key, [0, 0.0, 0, 0, row["peak"], 0])
+            entry[0] += row["sessions"]
+            entry[1] += row["revenue"]
+            entry[2] += row["duration_sum"]
+            entry[3] += row["duration_count"]
+            entry[4] = max(entry[4], row["peak"])
+            entry[5] += row["net"]
+
+    # every bucket in order, empty ones included; the peak of a bucket without
+    # arrivals or departures is the occupancy carried over from before
+    buckets = []
+    for bucket_start in starts:
+        # isoformat(" ") == KEY_FORMAT for whole hours, and a lot faster
+        entry = found.get(bucket_start.isoformat(" "))
+        if entry is None:
+            buckets.append({
+                "start": bucket_start.replace(tzinfo=timezone.utc),
+                "sessions": 0,
+                "revenue": 0.0,
+                "avg_duration_minutes": None,
+                "peak_occupancy": level,
+            })
+            continue
+        sessions, revenue, duration_sum, duration_count, peak, net = entry
+        buckets.append({
+            "start": bucket_start.replace(tzinfo=timezone.utc),
+            "sessions": sessions,
+            "revenue": round(revenue or 0.0, 2),
+            "avg_duration_minutes": round(duration_sum / duration_count, 1) if duration_count else None,
+            "peak_occupancy": max(level, peak),
+        })
+        level += net
+    return buckets
+
+
+class StatsMaterializer:
+    # Keeps lot_stats_hourly up to the last closed hour for every lot, so a
+    # stats request rarely has anything left to write. One chunk per write
+    # unit: other writes get the writer in between.
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+        self.runs = 0
+        self.chunks = 0
+
+    async def run_once(self) -> int:
+        # returns the number of chunks written
+        until = floor_bucket(datetime.now(timezone.utc), "hour")
+        async with self.session_factory() as db:
+            lot_ids = (await db.execute(
+                select(models.ParkingLot.id)
+                .outerjoin(models.LotStatsState, models.LotStatsState.parking_lots_id == models.ParkingLot.id)
+                .where(
+                    (models.LotStatsState.materialized_until.is_(None))
+                    | (models.LotStatsState.materialized_until < until.strftime(KEY_FORMAT))
+                )
+                .order_by(models.ParkingLot.id)
+            )).scalars().all()
+
+        chunks = 0
+        for lot_id in lot_ids:
+            async def write(db: AsyncSession, lot_id=lot_id):
+                return await materialize(db, lot_id, until)
+
+            done = False
+            while not done:
+                async with self.session_factory() as db:
+                    done = await run_write(db, write)
+                chunks += 1
+        self.chunks += chunks
+        self.runs += 1
+        return chunks
+
+    async def run_materializer(self, interval_seconds: float):
+        # Background task, started from the app lifespan.
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Lot stats materialization failed")
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "chunks": self.chunks,
+        }
+
+
+stats_materializer = StatsMaterializer(AsyncSessionLocal)
@@ -1,11 +1,56 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from app.logging_setup import setup_logging 
-from app.endpoints import oauth, vehicles, parking_lots, reservations, sessions, payments, billing, businesses
+from app.database import AsyncSessionLocal, ReadSessionLocal, engine, read_engine
+from app.write_queue import group_writer, GROUP_COMMIT_WINDOW_MS
+from app.occupancy import occupancy, OCCUPANCY_RECONCILE_SECONDS
+from app.geo import lot_index, LOT_INDEX_REFRESH_SECONDS
+from app.search import lot_search
+from app.catalogue import catalogue
+from app.ingest import ingest_pipeline
+from app.settlement import payment_reconciler, SETTLEMENT_INTERVAL_SECONDS
+from app.lot_stats import stats_materializer, STATS_MATERIALIZE_SECONDS
+from app.idempotency import idempotency_store, IDEMPOTENCY_SWEEP_SECONDS
+from app.security import token_store, revocations, TOKEN_MODE, TOKEN_SWEEP_SECONDS, REVOCATION_SYNC_SECONDS
+from app.endpoints import oauth, vehicles, parking_lots, reservations, sessions, payments, billing, businesses, metrics, gates
 
 setup_logging(logging.INFO)
-app = FastAPI(title="MobyPark API v2")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # bezetting, coördinaten, zoekindex en catalogus van de lots uit de database laden, daarna periodiek bijwerken
+    await occupancy.reconcile(ReadSessionLocal)
+    await lot_index.load(ReadSessionLocal)
+    await lot_search.load(ReadSessionLocal)
+    await catalogue.load(ReadSessionLocal)
+    # background tasks die zolang de API draait meelopen
+    tasks = [
+        asyncio.create_task(token_store.run_sweeper(TOKEN_SWEEP_SECONDS)),
+        asyncio.create_task(occupancy.run_reconciler(ReadSessionLocal, OCCUPANCY_RECONCILE_SECONDS)),
+        asyncio.create_task(lot_index.run_refresher(ReadSessionLocal, LOT_INDEX_REFRESH_SECONDS)),
+        asyncio.create_task(lot_search.run_refresher(ReadSessionLocal, LOT_INDEX_REFRESH_SECONDS)),
+        asyncio.create_task(catalogue.run_refresher(ReadSessionLocal, LOT_INDEX_REFRESH_SECONDS)),
+        asyncio.create_task(payment_reconciler.run_reconciler(SETTLEMENT_INTERVAL_SECONDS)),
+        asyncio.create_task(stats_materializer.run_materializer(STATS_MATERIALIZE_SECONDS)),
+        asyncio.create_task(idempotency_store.run_sweeper(IDEMPOTENCY_SWEEP_SECONDS)),
+        ingest_pipeline.start(),
+    ]
+    if GROUP_COMMIT_WINDOW_MS > 0:
+        tasks.append(group_writer.start())
+    if TOKEN_MODE == "jwt":
+        await revocations.sync(AsyncSessionLocal)
+        tasks.append(asyncio.create_task(revocations.run_sync(AsyncSessionLocal, REVOCATION_SYNC_SECONDS)))
+    yield
+    for task in tasks:
+        task.cancel()
+    await engine.dispose()
+    await read_engine.dispose()
+
+app = FastAPI(title="MobyPark API v2", lifespan=lifespan)
 app.include_router(oauth.router)
 app.include_router(vehicles.router)
 app.include_router(parking_lots.router)
@@ -14,8 +59,10 @@ app.include_router(sessions.router)
 app.include_router(payments.router)
 app.include_router(billing.router)
 app.include_router(businesses.router)
+app.include_router(metrics.router)
+app.include_router(gates.router)
 
 @app.get("/")
 async def root():
     logging.info("Root endpoint accessed")
-    return {"message": "Welcome to MobyPark API v2"}
\ No newline at end of file
+    return {"message": "Welcome to MobyPark API v2"}
@@ -1,6 +1,7 @@
 # app/models.py
 from __future__ import annotations
 
+import json
 from typing import List, Optional
 from datetime import datetime 
 
@@ -13,7 +14,10 @@ from sqlalchemy import (
     CheckConstraint,
     UniqueConstraint,
     Float,
+    Index,
+    LargeBinary,
     func,
+    text,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.database import Base
@@ -64,6 +68,8 @@ class Vehicle(Base):
     )
 
     license_plate: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    # licenceplate_clean(license_plate), bijgehouden door triggers (migratie 009)
+    plate_norm: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     vehicle_name: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     brand: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     model: Mapped[Optional[str]] = mapped_column(String, nullable=True)
@@ -85,6 +91,10 @@ class Vehicle(Base):
         passive_deletes=True,
     )
 
+    __table_args__ = (
+        Index("idx_vehicles_plate_norm", "plate_norm"),
+    )
+
 class ParkingLot(Base):
     __tablename__ = "parking_lots"
 
@@ -98,6 +108,8 @@ class ParkingLot(Base):
     reserved: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     tariff: Mapped[float] = mapped_column(Float, nullable=False)
     daytariff: Mapped[float] = mapped_column(Float, nullable=False)
+    # JSON, zie app/tariffs.py; NULL = vlak tarief (tariff/daytariff)
+    tariff_schedule_json: Mapped[Optional[str]] = mapped_column("tariff_schedule", Text, nullable=True)
     is_active: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
     business_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
@@ -122,6 +134,10 @@ class ParkingLot(Base):
         passive_deletes=True,
     )
 
+    @property
+    def tariff_schedule(self) -> Optional[dict]:
+        return json.loads(self.tariff_schedule_json) if self.tariff_schedule_json else None
+
 class Session(Base):
     __tablename__ = "sessions"
 
@@ -139,6 +155,8 @@ class Session(Base):
     )
 
     license_plate: Mapped[str] = mapped_column(String, nullable=False)
+    # licenceplate_clean(license_plate), bijgehouden door triggers (migratie 009)
+    plate_norm: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     start_date: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     end_date: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     duration_minutes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
@@ -156,6 +174,14 @@ class Session(Base):
             "status in ('ACTIVE','COMPLETED','CANCELLED')",
             name="ck_sessions_status",
         ),
+        Index("idx_sessions_lot", "parking_lots_id"),
+        Index("idx_sessions_lot_start", "parking_lots_id", "start_date"),
+        Index("idx_sessions_lot_end", "parking_lots_id", "end_date"),
+        Index("idx_sessions_vehicle_start", "vehicle_id", "start_date"),
+        # one open session per vehicle (migration 010)
+        Index("idx_sessions_open_vehicle", "vehicle_id", unique=True, sqlite_where=text("end_date IS NULL")),
+        Index("idx_sessions_open_lot", "parking_lots_id", sqlite_where=text("end_date IS NULL")),
+        Index("idx_sessions_open_plate", "plate_norm", "parking_lots_id", sqlite_where=text("end_date IS NULL")),
     )
 
     parking_lot: Mapped["ParkingLot"] = relationship(back_populates="sessions")
@@ -176,7 +202,6 @@ class Reservation(Base):
     vehicles_id: Mapped[int] = mapped_column(
         ForeignKey("vehicles.vehicle_id", ondelete="CASCADE", onupdate="CASCADE"),
         nullable=False,
-        index=True,
     )
     parking_lots_id: Mapped[int] = mapped_column(
         ForeignKey("parking_lots.id", ondelete="CASCADE", onupdate="CASCADE"),
@@ -195,11 +220,40 @@ class Reservation(Base):
             "status in ('confirmed','completed','canceled')",
             name="ck_reservation_status",
         ),
+        Index("idx_reservation_vehicle_start", "vehicles_id", "start_time"),
     )
 
     parking_lot: Mapped["ParkingLot"] = relationship(back_populates="reservations")
     vehicle: Mapped["Vehicle"] = relationship(back_populates="reservations")
 
+
+class ReservationLotVersion(Base):
+    # bumped by triggers on reservation (migration 012), see app/reservation_index.py
+    __tablename__ = "reservation_lot_versions"
+
+    parking_lots_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class LotCatalogueVersion(Base):
+    # bumped by triggers on parking_lots (migration 014), see app/catalogue.py
+    __tablename__ = "lot_catalogue_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class IdempotencyKey(Base):
+    # stored responses per Idempotency-Key (migration 013), see app/idempotency.py
+    __tablename__ = "idempotency_keys"
+
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    fingerprint: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    status_code: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    body: Mapped[bytes] = mapped_column(LargeBinary, nullable=False, default=b"")
+    created_at: Mapped[float] = mapped_column(Float, nullable=False)  # unix time
+
 class Payment(Base):
     __tablename__ = "payments"
 
@@ -208,7 +262,6 @@ class Payment(Base):
     sessions_id: Mapped[int] = mapped_column(
         ForeignKey("sessions.id", ondelete="CASCADE", onupdate="CASCADE"),
         nullable=False,
-        index=True,
     )
 
     initiator_users_id: Mapped[int] = mapped_column(
@@ -224,6 +277,11 @@ class Payment(Base):
     issuer: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     bank: Mapped[Optional[str]] = mapped_column(String, nullable=True)
 
+    __table_args__ = (
+        Index("idx_payments_session_amount", "sessions_id", "amount"),
+        Index("idx_payments_hash_amount", "hash", "amount", sqlite_where=text("hash IS NOT NULL")),
+    )
+
     initiator: Mapped["User"] = relationship(
         back_populates="payments_initiated", foreign_keys=[initiator_users_id]
     )
@@ -237,4 +295,95 @@ class Business(Base):
     
     id: Mapped[int] = mapped_column("business_id", primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String, nullable=False)
-    address: Mapped[str] = mapped_column(String, nullable=False)
\ No newline at end of file
+    address: Mapped[str] = mapped_column(String, nullable=False)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    # NULL jti: revokes every token of the user issued before revoked_at
+    jti: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    revoked_at: Mapped[float] = mapped_column(Float, nullable=False)
+    expires_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)
+
+
+class BillingLedger(Base):
+    # Totals of the closed sessions per user, maintained by app/ledger.py
+    __tablename__ = "billing_ledger"
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    sessions: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    amount: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    paid: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    paid_completed: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+
+
+class BillingMonthly(Base):
+    # Session count and cost of the closed sessions per user and start month, maintained by app/ledger.py
+    __tablename__ = "billing_monthly"
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    month: Mapped[str] = mapped_column(String, primary_key=True)  # YYYY-MM
+    sessions: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total_cost: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+
+
+class LotStatsHourly(Base):
+    # Closed hours of a lot for /v2/parking-lots/{lot_id}/stats, maintained by app/lot_stats.py
+    __tablename__ = "lot_stats_hourly"
+
+    parking_lots_id: Mapped[int] = mapped_column(
+        ForeignKey("parking_lots.id", ondelete="CASCADE"), primary_key=True
+    )
+    hour: Mapped[str] = mapped_column(String, primary_key=True)  # YYYY-MM-DD HH:00:00 (UTC)
+    sessions: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    revenue: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    duration_sum: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    duration_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    peak: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    net: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    occupancy: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class LotStatsState(Base):
+    __tablename__ = "lot_stats_state"
+
+    parking_lots_id: Mapped[int] = mapped_column(
+        ForeignKey("parking_lots.id", ondelete="CASCADE"), primary_key=True
+    )
+    # first hour that is not in lot_stats_hourly yet
+    materialized_until: Mapped[str] = mapped_column(String, nullable=False)
+
+
+class PaymentSettlement(Base):
+    # Payment matched to a session by transaction hash, maintained by app/settlement.py
+    __tablename__ = "payment_settlements"
+
+    session_id: Mapped[int] = mapped_column(
+        ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True
+    )
+    payment_id: Mapped[int] = mapped_column(
+        ForeignKey("payments.id", ondelete="CASCADE"), primary_key=True
+    )
+
+    __table_args__ = (
+        Index("idx_payment_settlements_payment", "payment_id"),
+        {"sqlite_with_rowid": False},
+    )
+
+
+class SettlementProgress(Base):
+    __tablename__ = "settlement_progress"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    # payments up to this id have been matched
+    last_payment_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    matched: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
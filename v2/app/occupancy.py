@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from .models import ParkingLot, Session
+
+logger = logging.getLogger(__name__)
+
+OCCUPANCY_RECONCILE_SECONDS = float(os.getenv("OCCUPANCY_RECONCILE_SECONDS", "60"))
+
+
+class LotOccupancy:
+    __slots__ = ("capacity", "reserved", "occupied", "version")
+
+    def __init__(self, capacity: int, reserved: int, occupied: int):
+        self.capacity = capacity
+        self.reserved = reserved
+        self.occupied = occupied
+        # bumped by every change made through this process, see reconcile()
+        self.version = 0
+
+    @property
+    def available(self) -> int:
+        return max(self.capacity - self.reserved - self.occupied, 0)
+
+
+class PendingChange:
+    __slots__ = ("delta",)
+
+    def __init__(self, delta: int):
+        self.delta = delta
+
+
+class OccupancyCounter:
+    # Cars inside per parking lot (open sessions), kept in memory so
+    # availability is a dict lookup instead of a COUNT over sessions.
+    #
+    # Writes wrap their commit in change(): the counter moves only once the
+    # commit succeeded. reconcile() reloads the counts from the database at
+    # startup and periodically, that also picks up sessions started or
+    # stopped by other workers. A lot with a change in flight during the
+    # reconcile query keeps its counter and is corrected on the next round.
+
+    def __init__(self):
+        self._lots: dict[int, LotOccupancy] = {}
+        self._pending: dict[int, int] = {}
+        # called as listener(lot_id, lot) after every change, see app/events.py
+        self.listeners = []
+
+        self.reconciles = 0
+        self.corrections = 0
+
+    def _notify(self, lot_id: int, lot: LotOccupancy):
+        for listener in self.listeners:
+            listener(lot_id, lot)
+
+    def get(self, lot_id: int) -> Optional[LotOccupancy]:
+        return self._lots.get(lot_id)
+
+    def all(self) -> dict[int, LotOccupancy]:
+        return self._lots
+
+    @contextmanager
+    def change(self, lot_id: int, delta: int):
+        # with occupancy.change(lot_id, +1): await run_write(db, write)
+        # the caller can still set change.delta (e.g. to 0 when the write changed nothing)
+        self._pending[lot_id] = self._pending.get(lot_id, 0) + 1
+        change = PendingChange(delta)
+        try:
+            yield change
+            lot = self._lots.get(lot_id)
+            if lot is not None:
+                lot.occupied = max(lot.occupied + change.delta, 0)
+                lot.version += 1
+                self._notify(lot_id, lot)
+        finally:
+            self._pending[lot_id] -= 1
+            if not self._pending[lot_id]:
+                del self._pending[lot_id]
+
+    def set_lot(self, lot_id: int, capacity: int, reserved: int):
+        # lot created or updated (after the commit)
+        lot = self._lots.get(lot_id)
+        if lot is None:
+            lot = self._lots[lot_id] = LotOccupancy(capacity, reserved, 0)
+        else:
+            lot.capacity, lot.reserved = capacity, reserved
+            lot.version += 1
+        self._notify(lot_id, lot)
+
+    def drop_lot(self, lot_id: int):
+        self._lots.pop(lot_id, None)
+
+    async def reconcile(self, session_factory) -> int:
+        # Reload capacity and open sessions of every lot, returns the number of lots that were off
+        versions = {lot_id: lot.version for lot_id, lot in self._lots.items()}
+        busy = set(self._pending)
+        async with session_factory() as db:
+            lots = (await db.execute(select(ParkingLot.id, ParkingLot.capacity, ParkingLot.reserved))).all()
+            # idx_sessions_open_lot
+            open_sessions = dict((await db.execute(
+                select(Session.parking_lots_id, func.count())
+                .where(Session.end_date.is_(None))
+                .group_by(Session.parking_lots_id)
+            )).all())
+
+        corrected = 0
+        for lot_id, capacity, reserved in lots:
+            occupied = open_sessions.get(lot_id, 0)
+            if lot_id in busy or lot_id in self._pending:
+                continue
+            current = self._lots.get(lot_id)
+            if current is None:
+                if lot_id not in versions:
+                    self._lots[lot_id] = LotOccupancy(capacity, reserved, occupied)
+                continue
+            if versions.get(lot_id) != current.version:
+                continue
+            if (current.capacity, current.reserved, current.occupied) != (capacity, reserved, occupied):
+                corrected += 1
+                current.capacity, current.reserved, current.occupied = capacity, reserved, occupied
+                self._notify(lot_id, current)
+
+        known = {lot_id for lot_id, _, _ in lots}
+        for lot_id in [lot_id for lot_id in self._lots if lot_id not in known and lot_id in versions]:
+            del self._lots[lot_id]
+
+        self.reconciles += 1
+        self.corrections += corrected
+        return corrected
+
+    async def run_reconciler(self, session_factory, interval_seconds: float):
+        # Background task, started from the app lifespan.
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                corrected = await self.reconcile(session_factory)
+                if corrected:
+                    logger.info("Occupancy reconcile corrected %s lot(s)", corrected)
+            except Exception:
+                logger.exception("Occupancy reconcile failed")
+
+    def stats(self) -> dict:
+        return {
+            "lots": len(self._lots),
+            "occupied": sum(lot.occupied for lot in self._lots.values()),
+            "reconciles": self.reconciles,
+            "corrections": self.corrections,
+        }
+
+
+occupancy = OccupancyCounter()
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+# Batch variant of calculate_price (app/dependencies.py) for columnar data:
+# billing, reports and recompute jobs price whole result sets in one call.
+# The result is identical to calling calculate_price per row, keep the two in sync.
+# Lots with a tariff schedule (app/tariffs.py) are priced per row by their compiled schedule.
+
+FREE_SECONDS = 180
+US_PER_SECOND = 1_000_000
+US_PER_DAY = 86_400 * US_PER_SECOND
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+Timestamps = Union[np.ndarray, Sequence[Optional[datetime]]]
+NAT = np.iinfo(np.int64).min
+
+
+def _datetime_to_us(value: datetime, naive_is_local: bool) -> int:
+    # same normalisation as calculate_price: naive starts are UTC, naive stops go
+    # through astimezone() and are therefore read as local time
+    if value.tzinfo is None and not naive_is_local:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    delta = value - EPOCH
+    return (delta.days * 86_400 + delta.seconds) * US_PER_SECOND + delta.microseconds
+
+
+def to_utc_micros(values: Timestamps, naive_is_local: bool = False) -> np.ndarray:
+    # int64 microseconds since the epoch (UTC), missing values become NAT.
+    # datetime64 arrays are taken as UTC as is.
+    if isinstance(values, np.ndarray) and np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[us]").astype(np.int64)
+    return np.fromiter(
+        (NAT if v is None else _datetime_to_us(v, naive_is_local) for v in values),
+        dtype=np.int64,
+        count=len(values),
+    )
+
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    # np.round scales by 100 and rounds half-even, round() rounds the exact binary
+    # value. They only disagree when value*100 sits on .5, redo those with round().
+    rounded = np.round(values, 2)
+    scaled = values * 100.0
+    suspect = np.flatnonzero(np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6)
+    for i in suspect:
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
+
+
+def calculate_prices(
+    starts: Timestamps,
+    stops: Timestamps,
+    tariffs,
+    daytariffs,
+    now: Optional[datetime] = None,
+    schedules: Optional[Sequence] = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Returns (price, hours, days) arrays, element i equals calculate_price(lot_i, start_i, stop_i).
+    # A missing stop (None / NaT) means "still parked" and is priced until now.
+    # schedules: optional CompiledSchedule (or None) per row, see ScheduleCache.get().
+    start_us = to_utc_micros(starts)
+    stop_us = to_utc_micros(stops, naive_is_local=True)
+    tariff = np.asarray(tariffs, dtype=np.float64)
+    daytariff = np.asarray(daytariffs, dtype=np.float64)
+
+    if not (len(start_us) == len(stop_us) == len(tariff) == len(daytariff)):
+        raise ValueError("All columns must have the same length")
+    if np.isnan(tariff).any() or np.isnan(daytariff).any():
+        # calculate_price fails on a None tariff as well
+        raise TypeError("Tariff and daytariff are required")
+    if (tariff < 0).any() or (daytariff < 0).any():
+        raise ValueError("Negative value is not possible")
+
+    open_sessions = stop_us == NAT
+    if open_sessions.any():
+        stop_us = stop_us.copy()
+        stop_us[open_sessions] = _datetime_to_us(now or datetime.now(timezone.utc), naive_is_local=True)
+
+    diff_us = stop_us - start_us
+    seconds = diff_us / US_PER_SECOND
+    hours = np.ceil(seconds / 3600.0).astype(np.int64)
+
+    free = seconds < FREE_SECONDS
+    multi_day = ~free & (stop_us // US_PER_DAY > start_us // US_PER_DAY)
+    # timedelta.days is floor(diff / 1 day)
+    days = np.where(multi_day, diff_us // US_PER_DAY + 1, 0)
+
+    price = np.where(multi_day, daytariff * days, np.minimum(tariff * hours, daytariff))
+    price[free] = 0.0
+    price = _round2(price)
+
+    for i, schedule in enumerate(schedules or ()):
+        if schedule is not None:
+            price[i] = schedule.price(
+                EPOCH + timedelta(microseconds=int(start_us[i])), EPOCH + timedelta(microseconds=int(stop_us[i]))
+            )[0]
+
+    return price, hours, days
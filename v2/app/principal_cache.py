@@ -0,0 +1,92 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", "10000"))
+
+
+def detached_copy(obj):
+    # Copy the column values of a loaded ORM object into a new, detached
+    # instance that is not bound to any session. Session.merge(copy, load=False)
+    # turns it back into a per-request instance without a SELECT.
+    mapper = inspect(obj).mapper
+    copy = mapper.class_(**{attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+class PrincipalCache:
+    # Bounded LRU of authenticated users keyed by bearer token, entries live
+    # for at most ttl_seconds. A user -> tokens index allows dropping every
+    # cached principal of a user when the profile or role changes.
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._by_user: dict[int, set[str]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str):
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, user = entry
+        if time.monotonic() >= expires_at:
+            self._discard(token)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def put(self, token: str, user, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self._discard(token)
+        while len(self._entries) >= self.max_entries:
+            self._discard(next(iter(self._entries)))
+
+        self._entries[token] = (now + self.ttl, detached_copy(user))
+        self._by_user.setdefault(user.id, set()).add(token)
+
+    def invalidate_token(self, token: str):
+        self._discard(token)
+
+    def invalidate_user(self, user_id: int):
+        for token in self._by_user.pop(user_id, ()):
+            self._entries.pop(token, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _discard(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[1].id
+        tokens = self._by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[user_id]
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_MAX)
@@ -0,0 +1,298 @@
+import logging
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from .models import Reservation, ReservationLotVersion
+from .occupancy import OccupancyCounter, occupancy
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_FULL = "Parking lot is fully booked for this time window"
+# a reservation without end_time holds its spot from the start on
+OPEN_END = float("inf")
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    # reservation times are TEXT ("2025-12-03T11:00:00Z", "2020-05-17 00:00:00"), naive = UTC
+    if value is None:
+        return None
+    try:
+        moment = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid reservation time {value!r}") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def window(start_time: str, end_time: Optional[str]) -> tuple[float, float]:
+    start = parse_time(start_time)
+    end = parse_time(end_time)
+    if end is None:
+        end = OPEN_END
+    if end <= start:
+        raise HTTPException(status_code=400, detail="Reservation end_time must be after start_time")
+    return start, end
+
+
+class LotBookings:
+    # Confirmed reservations of one lot as a step function (sweep line):
+    # times[i] is a boundary, counts[i] the number of reservations holding a
+    # spot from times[i] until times[i + 1] (0 before the first boundary).
+    # The peak of a window is a bisect plus a walk over the boundaries inside it.
+
+    __slots__ = ("times", "counts", "version")
+
+    def __init__(self):
+        self.times: list[float] = []
+        self.counts: list[int] = []
+        # reservation_lot_versions.version this copy is at
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _boundary(self, at: float) -> int:
+        # index of the boundary at `at`, inserted when missing
+        i = bisect_left(self.times, at)
+        if i == len(self.times) or self.times[i] != at:
+            self.times.insert(i, at)
+            self.counts.insert(i, self.counts[i - 1] if i else 0)
+        return i
+
+    def _merge(self, i: int):
+        # drop boundary i when it doesn't change the count
+        if 0 <= i < len(self.times) and self.counts[i] == (self.counts[i - 1] if i else 0):
+            del self.times[i]
+            del self.counts[i]
+
+    def add(self, start: float, end: float, delta: int = 1):
+        i = self._boundary(start)
+        j = self._boundary(end) if end != OPEN_END else len(self.times)
+        for k in range(i, j):
+            self.counts[k] += delta
+        if end != OPEN_END:
+            self._merge(j)
+        self._merge(i)
+
+    def remove(self, start: float, end: float):
+        self.add(start, end, -1)
+
+    def peak(self, start: float, end: float) -> int:
+        # most reservations holding a spot at any moment of [start, end)
+        i = bisect_right(self.times, start) - 1
+        peak = self.counts[i] if i >= 0 else 0
+        i += 1
+        while i < len(self.times) and self.times[i] < end:
+            if self.counts[i] > peak:
+                peak = self.counts[i]
+            i += 1
+        return peak
+
+
+class Touched:
+    __slots__ = ("lot", "version", "changed", "bumped")
+
+    def __init__(self, lot: LotBookings):
+        self.lot = lot
+        self.version = lot.version
+        self.changed = False  # bookings changed by this write
+        self.bumped = False  # version moved along with the write's statement
+
+
+class BookingChanges:
+    # The lots one write synced and changed. The write's statement bumps the
+    # version of its lot(s) once; set()/remove() move the copy in memory along.
+    # When the write fails a lot whose bookings changed is dropped (the next
+    # write loads it again), the others get their version back.
+
+    __slots__ = ("index", "touched", "synced")
+
+    def __init__(self, index: "ReservationIndex"):
+        self.index = index
+        self.touched: dict[int, Touched] = {}
+        self.synced: set[int] = set()
+
+    def _touch(self, lot_id: int) -> Optional[Touched]:
+        lot = self.index._lots.get(lot_id)
+        if lot is None:
+            return None
+        entry = self.touched.get(lot_id)
+        if entry is None or entry.lot is not lot:
+            entry = self.touched[lot_id] = Touched(lot)
+        return entry
+
+    def _bump(self, lot_id: int, changed: bool = True):
+        entry = self._touch(lot_id)
+        if entry is None:
+            return
+        entry.changed = entry.changed or changed
+        if not entry.bumped:
+            entry.bumped = True
+            entry.lot.version += 1
+
+    async def sync(self, db, lot_id: int, load: bool = True, written: bool = False):
+        # Bring a lot up to date inside the write transaction (which holds the write lock):
+        # it is loaded again when another writer changed it since, or when it isn't loaded.
+        # Normally before the write's statement; written=True when the statement already
+        # ran (its change is then part of what is loaded). With load=False a lot that
+        # isn't loaded stays that way and a stale one is dropped. `synced` holds the
+        # lots that are loaded and current.
+        index = self.index
+        version = await db.scalar(
+            select(ReservationLotVersion.version).where(ReservationLotVersion.parking_lots_id == lot_id)
+        ) or 0
+        lot = index._lots.get(lot_id)
+        if lot is not None and lot.version + written == version:
+            self.synced.add(lot_id)
+            self._touch(lot_id)
+            if written:
+                self._bump(lot_id, changed=False)
+            return
+        if lot is not None:
+            index.stale += 1
+            index.drop_lot(lot_id)
+        if load:
+            self.synced.add(lot_id)
+            await index._load(db, lot_id, version)
+            entry = self._touch(lot_id)
+            entry.changed = entry.bumped = written
+
+    def set(self, reservation_id: int, lot_id: int, start: float, end: float):
+        # book (or move) a confirmed reservation after its statement, 409 when the lot is full for the window
+        index = self.index
+        previous = index._booked.get(reservation_id)
+        index._place(reservation_id, None)
+        try:
+            index.check(lot_id, start, end)
+        except HTTPException:
+            index._place(reservation_id, previous)
+            raise
+        index._place(reservation_id, (lot_id, start, end))
+        self._bump(lot_id)
+        if previous is not None:
+            self._bump(previous[0])
+
+    def remove(self, reservation_id: int, lot_id: int):
+        # reservation deleted, cancelled or completed, after its statement
+        previous = self.index._booked.get(reservation_id)
+        if previous is not None:
+            self.index._place(reservation_id, None)
+            self._bump(previous[0])
+        self._bump(lot_id)
+
+    def undo(self):
+        for lot_id, entry in self.touched.items():
+            if self.index._lots.get(lot_id) is not entry.lot:
+                continue
+            if entry.changed:
+                self.index.drop_lot(lot_id)
+            else:
+                entry.lot.version = entry.version
+
+
+class ReservationIndex:
+    # Confirmed reservations per lot in memory, for the capacity check of
+    # POST/PUT /v2/reservations: a new or changed reservation may not bring
+    # the number of reservations holding a spot at the same moment above the
+    # lot's capacity (from the occupancy counter).
+    #
+    # Everything happens inside the write unit, while the transaction holds
+    # SQLite's write lock: sync() compares the lot's version in
+    # reservation_lot_versions (bumped by triggers, one PK lookup) with the
+    # copy in memory and loads the lot again (one query on
+    # fk_reservation_parking_lots1_idx) when another worker or a script
+    # changed it. Otherwise the decision is a bisect in memory. Writes record
+    # their changes in changes(), which wraps the commit like
+    # occupancy.change(): a write that fails is undone.
+
+    def __init__(self, counter: OccupancyCounter):
+        self.counter = counter
+        self._lots: dict[int, LotBookings] = {}
+        self._booked: dict[int, tuple[int, float, float]] = {}  # reservation id -> (lot, start, end)
+
+        self.loads = 0
+        self.stale = 0
+        self.checks = 0
+        self.rejected = 0
+
+    def _place(self, reservation_id: int, booking: Optional[tuple[int, float, float]]):
+        # replace the booking of a reservation (None: no booking)
+        old = self._booked.pop(reservation_id, None)
+        if old is not None:
+            lot = self._lots.get(old[0])
+            if lot is not None:
+                lot.remove(old[1], old[2])
+        if booking is not None:
+            lot = self._lots.get(booking[0])
+            if lot is not None:
+                lot.add(booking[1], booking[2])
+                self._booked[reservation_id] = booking
+
+    async def _load(self, db, lot_id: int, version: int):
+        # the confirmed reservations of a lot as the write transaction sees them
+        rows = (await db.execute(
+            select(Reservation.id, Reservation.start_time, Reservation.end_time)
+            .where(Reservation.parking_lots_id == lot_id, Reservation.status == "confirmed")
+        )).all()
+        lot = self._lots[lot_id] = LotBookings()
+        lot.version = version
+        for reservation_id, start_time, end_time in rows:
+            try:
+                start, end = window(start_time, end_time)
+            except HTTPException:
+                logger.warning("Reservation %s has unreadable times, not counted", reservation_id)
+                continue
+            # a reservation still booked in another lot moved here: _place takes it out there
+            self._place(reservation_id, (lot_id, start, end))
+        self.loads += 1
+
+    def check(self, lot_id: int, start: float, end: float):
+        # 404 for an unknown lot, 409 when the window has no free spot left
+        self.checks += 1
+        state = self.counter.get(lot_id)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Parking lot not found")
+        lot = self._lots.get(lot_id)
+        if lot is not None and lot.peak(start, end) >= state.capacity:
+            self.rejected += 1
+            raise HTTPException(status_code=409, detail=RESERVATION_FULL)
+
+    def booking(self, reservation_id: int) -> Optional[tuple[int, float, float]]:
+        return self._booked.get(reservation_id)
+
+    @contextmanager
+    def changes(self):
+        # with reservation_index.changes() as changes: await run_write(db, write)
+        # (write calls changes.sync before its INSERT/UPDATE/DELETE and changes.set/remove after it)
+        changes = BookingChanges(self)
+        try:
+            yield changes
+        except BaseException:
+            changes.undo()
+            raise
+
+    def drop_lot(self, lot_id: int):
+        lot = self._lots.pop(lot_id, None)
+        if lot is not None:
+            for reservation_id in [rid for rid, booking in self._booked.items() if booking[0] == lot_id]:
+                del self._booked[reservation_id]
+
+    def stats(self) -> dict:
+        return {
+            "lots": len(self._lots),
+            "reservations": len(self._booked),
+            "boundaries": sum(len(lot) for lot in self._lots.values()),
+            "loads": self.loads,
+            "stale": self.stale,
+            "checks": self.checks,
+            "rejected": self.rejected,
+        }
+
+
+reservation_index = ReservationIndex(occupancy)
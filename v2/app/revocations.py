@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import select, delete
+
+from .models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationList:
+    # Revoked signed tokens, kept in memory so check_token never touches the DB.
+    #
+    # Revocations made by this worker are queued and written to the
+    # revoked_tokens table by sync(), which also pulls in the revocations of
+    # the other workers. A revocation is therefore visible everywhere within
+    # one sync interval. Entries are dropped once the tokens they cover have
+    # expired, which keeps the list small.
+
+    def __init__(self):
+        self._tokens: dict[str, float] = {}                 # jti -> expires_at
+        self._users: dict[int, tuple[float, float]] = {}    # user_id -> (revoked_before, expires_at)
+        self._pending: list[tuple[Optional[str], int, float, float]] = []
+        self._last_id = 0
+
+    def __len__(self) -> int:
+        return len(self._tokens) + len(self._users)
+
+    def revoke_token(self, jti: str, user_id: int, expires_at: float):
+        self._tokens[jti] = expires_at
+        self._pending.append((jti, user_id, time.time(), expires_at))
+
+    def revoke_user(self, user_id: int, before: float, expires_at: float):
+        self._apply_user(user_id, before, expires_at)
+        self._pending.append((None, user_id, before, expires_at))
+
+    def is_revoked(self, jti: str, user_id: int, issued_at: float) -> bool:
+        if jti in self._tokens:
+            return True
+        record = self._users.get(user_id)
+        return record is not None and issued_at < record[0]
+
+    def prune(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        self._users = {uid: rec for uid, rec in self._users.items() if rec[1] > now}
+
+    async def sync(self, session_factory):
+        now = time.time()
+        pending, self._pending = self._pending, []
+
+        async with session_factory() as db:
+            try:
+                for jti, user_id, revoked_at, expires_at in pending:
+                    db.add(RevokedToken(jti=jti, user_id=user_id, revoked_at=revoked_at, expires_at=expires_at))
+                await db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+                await db.commit()
+            except Exception:
+                # keep the revocations for the next attempt
+                self._pending = pending + self._pending
+                raise
+
+            result = await db.execute(
+                select(RevokedToken)
+                .where(RevokedToken.id > self._last_id, RevokedToken.expires_at > now)
+                .order_by(RevokedToken.id)
+            )
+            for row in result.scalars():
+                if row.jti is not None:
+                    self._tokens[row.jti] = row.expires_at
+                else:
+                    self._apply_user(row.user_id, row.revoked_at, row.expires_at)
+                self._last_id = row.id
+
+        self.prune(now)
+
+    async def run_sync(self, session_factory, interval_seconds: float):
+        # Background task, started from the app lifespan.
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.sync(session_factory)
+            except Exception:
+                logger.exception("Token revocation sync failed")
+
+    def _apply_user(self, user_id: int, before: float, expires_at: float):
+        current = self._users.get(user_id)
+        if current is None or before > current[0]:
+            self._users[user_id] = (before, max(expires_at, current[1] if current else 0.0))
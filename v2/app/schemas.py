@@ -1,15 +1,18 @@
 from __future__ import annotations
-from pydantic import BaseModel, Field, ConfigDict, conint
+from pydantic import BaseModel, Field, ConfigDict, conint, model_validator
 from typing import Optional, Literal, Generic, TypeVar, List
 from datetime import datetime
 
+from app.tariffs import compile_schedule
+
 T = TypeVar('T')
 
 class Page(BaseModel, Generic[T]):
     items: List[T]
-    total: int
+    total: Optional[int] = None  # None bij total=none
     limit: int
     offset: int
+    next_cursor: Optional[str] = None  # doorgeven als ?after= voor de volgende pagina
 
 class Message(BaseModel):
     message: str
@@ -71,6 +74,29 @@ class User(BaseModel):
 class VehicleBase(BaseModel):
     pass
 
+
+class TariffBand(BaseModel):
+    days: List[conint(ge=0, le=6)] = Field(min_length=1)  # 0 = maandag
+    start: str = Field(pattern=r"^\d{2}:\d{2}$")
+    end: str = Field(pattern=r"^\d{2}:\d{2}$")  # end <= start loopt door na middernacht
+    rate: float = Field(ge=0)  # per uur
+    cap: Optional[float] = Field(default=None, ge=0)  # max per keer dat de band loopt
+
+
+class TariffSchedule(BaseModel):
+    timezone: str = "UTC"
+    unit_minutes: int = Field(default=60, ge=1, le=1440)
+    default_rate: Optional[float] = Field(default=None, ge=0)  # None: tariff van de lot
+    default_cap: Optional[float] = Field(default=None, ge=0)  # None: daytariff, per kalenderdag
+    bands: List[TariffBand] = []
+
+    @model_validator(mode="after")
+    def check_compiles(self):
+        # overlappende banden, onbekende tijdzone of tijd -> 422
+        compile_schedule(self.model_dump(), 0.0, 0.0)
+        return self
+
+
 class ParkingLotBase(BaseModel):
     name: str
     location: str
@@ -85,6 +111,7 @@ class ParkingLotBase(BaseModel):
 
 class CreateParkingLot(ParkingLotBase):
     business_id: Optional[int] = None
+    tariff_schedule: Optional[TariffSchedule] = None
 
 class UpdateParkingLot(BaseModel):
     name: Optional[str] = None
@@ -96,6 +123,7 @@ class UpdateParkingLot(BaseModel):
     daytariff: Optional[float] = None
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    tariff_schedule: Optional[TariffSchedule] = None  # expliciet null = terug naar vlak tarief
 
 
 class ParkingLot(BaseModel):
@@ -118,8 +146,52 @@ class ParkingLotDetails(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     business_id: Optional[int] = None
+    tariff_schedule: Optional[TariffSchedule] = None
+    model_config = ConfigDict(from_attributes=True)
+
+
+class LotStatsBucket(BaseModel):
+    start: datetime  # begin van het uur/dag/week (UTC)
+    sessions: int  # sessies die in deze bucket zijn afgesloten
+    revenue: float
+    avg_duration_minutes: Optional[float] = None
+    peak_occupancy: int  # max. aantal auto's tegelijk binnen
+
+
+class LotStats(BaseModel):
+    lot_id: int
+    bucket: Literal["hour", "day", "week"]
+    start: datetime
+    end: datetime
+    buckets: List[LotStatsBucket]
+
+
+class ParkingLotSearchResult(BaseModel):
+    id: int
+    name: str
+    location: Optional[str] = None
+    address: Optional[str] = None
+    score: float  # hoger = betere match
+
+
+class NearbyParkingLot(BaseModel):
+    id: int
+    name: str
+    address: Optional[str] = None
+    latitude: float
+    longitude: float
+    distance_m: float  # hemelsbreed, in meters
+
     model_config = ConfigDict(from_attributes=True)
 
+
+class LotAvailability(BaseModel):
+    lot_id: int
+    capacity: int
+    reserved: int
+    occupied: int  # open sessies
+    available: int
+
 class VehicleBase(BaseModel):
     license_plate: str
     vehicle_name: Optional[str] = None
@@ -204,6 +276,35 @@ class SessionCreate(BaseModel):
     # license_plate: str
     vehicle_id: int
 
+
+class GateEvent(BaseModel):
+    # kenteken zoals de camera het leest, bv. "ab-123-c"
+    license_plate: str = Field(min_length=1, max_length=20)
+
+
+class CameraEvent(BaseModel):
+    lot_id: int
+    kind: Literal["entry", "exit"]
+    license_plate: str = Field(min_length=1, max_length=20)
+    at: Optional[datetime] = None  # tijd van de camera, zonder tijdzone = UTC; leeg = nu
+
+
+class CameraEventBatch(BaseModel):
+    events: List[CameraEvent] = Field(min_length=1)
+
+
+class CameraEventResult(BaseModel):
+    index: int
+    # created / already_inside / stopped / duplicate / rejected / failed
+    outcome: str
+    status: int
+    session_id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class CameraEventResults(BaseModel):
+    results: List[CameraEventResult]
+
 class SessionUpdate(BaseModel):
     end_date: Optional[datetime] = None
     duration_minutes: Optional[int] = Field(default=None, ge=0)
@@ -259,6 +360,7 @@ class Payment(BaseModel):
 class BillingSummary(BaseModel):
     amount: float
     payed: float
+    payed_completed: float = 0.0  # deel van payed waarvan de betaling is afgerond
     amount_still_to_pay: float
     sessions: int
     average: float
@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import logging
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Optional
+
+from sqlalchemy import select
+
+from .models import ParkingLot
+
+logger = logging.getLogger(__name__)
+
+# a match in the name counts more than one in the location or address
+FIELD_WEIGHTS = {"name": 3.0, "location": 2.0, "address": 1.0}
+MAX_QUERY_WORDS = 8
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: Optional[str]) -> list[str]:
+    # lowercase words without accents: "Café 's-Hertogenbosch" -> ["cafe", "s", "hertogenbosch"]
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    return [w for w in _NON_WORD.split(text) if w]
+
+
+def trigrams(word: str) -> set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(word: str) -> int:
+    if len(word) < 4:
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    # Levenshtein distance, or limit + 1 as soon as it is certainly above limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def word_score(query: str, word: str, prefix: bool) -> float:
+    # 1.0 exact, <1 for a prefix (last query word only) or a word with a typo, 0 no match
+    if query == word:
+        return 1.0
+    if prefix and word.startswith(query):
+        return 0.8 + 0.2 * len(query) / len(word)
+    limit = max_typos(query)
+    if not limit:
+        return 0.0
+    distance = edit_distance(query, word, limit)
+    if distance <= limit:
+        return 0.7 - 0.1 * distance
+    if prefix and len(word) > len(query):
+        # typo in a word that is still being typed
+        distance = edit_distance(query, word[:len(query)], limit)
+        if distance <= limit:
+            return 0.6 - 0.1 * distance
+    return 0.0
+
+
+class LotSearchIndex:
+    # In-memory search over parking lot name, location and address for
+    # GET /v2/parking-lots/search. The text is split into words; a query word
+    # matches a word exactly, as a prefix (the last query word, while typing)
+    # or with up to 1-2 typos. Candidate words for typos come from a trigram
+    # index over the vocabulary, prefixes from the sorted vocabulary. Every
+    # query word has to match; lots are ranked by the weighted sum of their
+    # best match per query word. Kept in sync like app/geo.py: put()/remove()
+    # after lot writes, load() at startup and periodically.
+
+    def __init__(self):
+        self._lots: dict[int, dict[str, str]] = {}  # lot_id -> the indexed fields
+        self._postings: dict[str, dict[int, float]] = {}  # word -> {lot_id: field weight}
+        self._trigrams: dict[str, set[str]] = {}  # trigram -> words
+        self._sorted_words: Optional[list[str]] = None  # voor prefixen, opnieuw gesorteerd na een wijziging
+        # ids put/removed while load() is reading, those keep their current state
+        self._changed: Optional[set[int]] = None
+
+        self.loads = 0
+        self.searches = 0
+
+    def __len__(self) -> int:
+        return len(self._lots)
+
+    def _words(self, fields: dict[str, str]) -> dict[str, float]:
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for word in normalize(fields.get(field)):
+                weights[word] = max(weights.get(word, 0.0), weight)
+        return weights
+
+    def _remove(self, lot_id: int):
+        fields = self._lots.pop(lot_id, None)
+        if fields is None:
+            return
+        for word in self._words(fields):
+            postings = self._postings[word]
+            del postings[lot_id]
+            if not postings:
+                del self._postings[word]
+                for gram in trigrams(word):
+                    words = self._trigrams[gram]
+                    words.discard(word)
+                    if not words:
+                        del self._trigrams[gram]
+                self._sorted_words = None
+
+    def put(self, lot_id: int, name: Optional[str], location: Optional[str], address: Optional[str]):
+        self._remove(lot_id)
+        if self._changed is not None:
+            self._changed.add(lot_id)
+        fields = {"name": name or "", "location": location or "", "address": address or ""}
+        self._lots[lot_id] = fields
+        for word, weight in self._words(fields).items():
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = {}
+                for gram in trigrams(word):
+                    self._trigrams.setdefault(gram, set()).add(word)
+                self._sorted_words = None
+            postings[lot_id] = weight
+
+    def remove(self, lot_id: int):
+        self._remove(lot_id)
+        if self._changed is not None:
+            self._changed.add(lot_id)
+
+    def get(self, lot_id: int) -> Optional[dict[str, str]]:
+        return self._lots.get(lot_id)
+
+    def _candidates(self, query: str, prefix: bool) -> set[str]:
+        # vocabulary words that can match `query`
+        found = {query} if query in self._postings else set()
+        if prefix:
+            if self._sorted_words is None:
+                self._sorted_words = sorted(self._postings)
+            words = self._sorted_words
+            i = bisect_left(words, query)
+            while i < len(words) and words[i].startswith(query):
+                found.add(words[i])
+                i += 1
+        limit = max_typos(query)
+        if limit:
+            # a word within `limit` edits shares at least this many trigrams (3 per edit lost);
+            # a longer word that is still being typed doesn't have the closing "x " one
+            grams = trigrams(query)
+            needed = len(grams) - 3 * limit - (1 if prefix else 0)
+            counts: dict[str, int] = {}
+            for gram in grams:
+                for word in self._trigrams.get(gram, ()):
+                    counts[word] = counts.get(word, 0) + 1
+            found.update(word for word, count in counts.items() if count >= max(needed, 1))
+        return found
+
+    def search(self, q: str, limit: int) -> list[tuple[int, float]]:
+        # [(lot_id, score)], best first
+        self.searches += 1
+        words = list(dict.fromkeys(normalize(q)))[:MAX_QUERY_WORDS]
+        if not words:
+            return []
+        # an incomplete last word ("Schans") is a prefix, unless the query ends with a space
+        last_is_prefix = not q[-1:].isspace()
+
+        scores: Optional[dict[int, float]] = None
+        for i, query in enumerate(words):
+            prefix = last_is_prefix and i == len(words) - 1
+            best: dict[int, float] = {}
+            for word in self._candidates(query, prefix):
+                score = word_score(query, word, prefix)
+                if not score:
+                    continue
+                for lot_id, weight in self._postings[word].items():
+                    if score * weight > best.get(lot_id, 0.0):
+                        best[lot_id] = score * weight
+            # every query word has to match
+            if scores is None:
+                scores = best
+            else:
+                scores = {lot_id: scores[lot_id] + s for lot_id, s in best.items() if lot_id in scores}
+            if not scores:
+                return []
+
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], self._lots[item[0]]["name"], item[0]))
+        return [(lot_id, round(score, 3)) for lot_id, score in ranked]
+
+    async def load(self, session_factory):
+        self._changed = set()
+        try:
+            async with session_factory() as db:
+                rows = (await db.execute(
+                    select(ParkingLot.id, ParkingLot.name, ParkingLot.location, ParkingLot.address)
+                )).all()
+            changed = self._changed
+            current = {lot_id: self._lots.get(lot_id) for lot_id in changed}
+        finally:
+            self._changed = None
+
+        self._lots, self._postings, self._trigrams, self._sorted_words = {}, {}, {}, None
+        for lot_id, name, location, address in rows:
+            if lot_id not in changed:
+                self.put(lot_id, name, location, address)
+        for lot_id, fields in current.items():
+            if fields is not None:
+                self.put(lot_id, fields["name"], fields["location"], fields["address"])
+        self.loads += 1
+
+    async def run_refresher(self, session_factory, interval_seconds: float):
+        # Background task, started from the app lifespan.
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.load(session_factory)
+            except Exception:
+                logger.exception("Lot search index refresh failed")
+
+    def stats(self) -> dict:
+        return {
+            "lots": len(self._lots),
+            "words": len(self._postings),
+            "trigrams": len(self._trigrams),
+            "loads": self.loads,
+            "searches": self.searches,
+        }
+
+
+lot_search = LotSearchIndex()
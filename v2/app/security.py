@@ -1,7 +1,14 @@
 import hashlib
+import os
+import time
 import uuid
-from datetime import datetime, timedelta
+from datetime import timedelta
 from fastapi import HTTPException, status
+from jose import jwt, JWTError, ExpiredSignatureError
+
+from .token_store import TokenStore
+from .revocations import RevocationList
+from .principal_cache import principal_cache
 
 def hash_password(password: str):
     # Simple SHA-256 hashing for demonstration purposes.
@@ -12,37 +19,103 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return hash_password(plain_password) == hashed_password
 
 TOKEN_TTL = timedelta(minutes=15)
-active_tokens: dict[str, tuple[int, datetime]] = {}
+TOKEN_STORE_MAX = int(os.getenv("TOKEN_STORE_MAX", "1000000"))
+TOKEN_SWEEP_SECONDS = float(os.getenv("TOKEN_SWEEP_SECONDS", "30"))
+
+# "opaque": random tokens in the in-process token store (single worker only)
+# "jwt": signed tokens that every worker can verify on its own
+TOKEN_MODE = os.getenv("TOKEN_MODE", "opaque").lower()
+SECRET_KEY = os.getenv("SECRET_KEY")
+JWT_ALGORITHM = "HS256"
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+
+if TOKEN_MODE not in ("opaque", "jwt"):
+    raise RuntimeError(f"Unknown TOKEN_MODE {TOKEN_MODE!r}, use 'opaque' or 'jwt'")
+if TOKEN_MODE == "jwt" and not SECRET_KEY:
+    raise RuntimeError("TOKEN_MODE=jwt requires SECRET_KEY to be set")
+
+token_store = TokenStore(TOKEN_TTL.total_seconds(), TOKEN_STORE_MAX)
+revocations = RevocationList()
 
 def create_token(user_id: int):
-    #Generate a token and store it with user_id + issue time.
+    if TOKEN_MODE == "jwt":
+        return _create_signed_token(user_id)
+
+    #Generate a token and store it with user_id + expiry time.
     token = uuid.uuid4().hex
-    active_tokens[token] = (user_id, datetime.now())
+    token_store.add(token, user_id)
     return token
 
 def remove_token(token: str):
-    active_tokens.pop(token, None)
+    principal_cache.invalidate_token(token)
+    if TOKEN_MODE == "jwt":
+        claims = _decode_signed_token(token, verify_exp=False)
+        if claims:
+            revocations.revoke_token(claims["jti"], int(claims["sub"]), claims["exp"])
+        return
+
+    token_store.remove(token)
 
 def remove_all_tokens_for_user(user_id: int):
-    to_delete = [t for t, (uid, _) in active_tokens.items() if uid == user_id]
-    for t in to_delete:
-        active_tokens.pop(t, None)
+    principal_cache.invalidate_user(user_id)
+    if TOKEN_MODE == "jwt":
+        now = time.time()
+        revocations.revoke_user(user_id, now, now + TOKEN_TTL.total_seconds())
+        return
+
+    token_store.remove_user(user_id)
 
 def check_token(token: str):
+    if TOKEN_MODE == "jwt":
+        return _check_signed_token(token)
+
     #Raises HTTPException if invalid/expired.
-    record = active_tokens.get(token)
+    record = token_store.get(token)
     if not record:
         raise HTTPException(status_code=401, detail="Invalid or missing token")
     
     #Validate token, check expiry.
-    user_id, issued_at = record
-    if datetime.now() - issued_at > TOKEN_TTL:
-        remove_token(token)
+    user_id, expires_at = record
+    if time.monotonic() >= expires_at:
+        token_store.expire(token)
         raise HTTPException(status_code=401, detail="Token expired")
     
     #Returns user_id if valid.
     return user_id
 
+
+def _create_signed_token(user_id: int):
+    now = time.time()
+    claims = {
+        "sub": str(user_id),
+        "iat": now,
+        "exp": int(now + TOKEN_TTL.total_seconds()),
+        "jti": uuid.uuid4().hex,
+    }
+    return jwt.encode(claims, SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+def _decode_signed_token(token: str, verify_exp: bool = True):
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM], options={"verify_exp": verify_exp})
+    except JWTError:
+        return None
+
+
+def _check_signed_token(token: str):
+    # Verified locally: signature + expiry, then the in-memory revocation list.
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    except ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or missing token")
+
+    user_id = int(claims["sub"])
+    if revocations.is_revoked(claims["jti"], user_id, claims["iat"]):
+        raise HTTPException(status_code=401, detail="Invalid or missing token")
+    return user_id
+
 def require_admin(user: str):
     # Raises HTTPException if user is not admin.
     if not user or getattr(user, "role", None) != "ADMIN":
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+from sqlalchemy import select, func, cast, String
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from . import ledger, models
+from .database import AsyncSessionLocal
+from .dependencies import tr_hash
+
+logger = logging.getLogger(__name__)
+
+# Payment-to-session reconciliation for the billing queries.
+#
+# A payment counts for its sessions_id. Legacy payments (imports) can
+# instead carry the transaction hash md5(id || license_plate) of another
+# session; a session without payments of its own is paid by those. Billing
+# used to find them with md5() over every session it priced, now this job
+# links them once in payment_settlements and ledger.per_session() sums the
+# links through the primary key.
+#
+# The job walks the payments table in id order, SETTLEMENT_CHUNK payments
+# per transaction, and keeps its position in settlement_progress: a stopped
+# run continues after the last committed chunk. Payments the API creates
+# carry the hash of their own session and are skipped without a lookup;
+# only when a chunk holds other hashes are the session hashes computed,
+# once per run. Links are written inside ledger.tracking() so the billing
+# ledger moves along. Migration 011 backfilled the existing payments.
+
+SETTLEMENT_CHUNK = int(os.getenv("SETTLEMENT_CHUNK", "1000"))
+SETTLEMENT_INTERVAL_SECONDS = float(os.getenv("SETTLEMENT_INTERVAL_SECONDS", "300"))
+PROGRESS_NAME = "payments"
+
+
+async def session_hashes(db: AsyncSession) -> dict[str, list[int]]:
+    # {transaction hash: [session ids]}; "1" + "2AB" and "12" + "AB" give the same hash
+    hashes: dict[str, list[int]] = {}
+    result = await db.stream(
+        select(models.Session.id, models.Vehicle.license_plate)
+        .join(models.Vehicle, models.Session.vehicle_id == models.Vehicle.vehicle_id)
+    )
+    async for session_id, license_plate in result:
+        hashes.setdefault(tr_hash(session_id, license_plate), []).append(session_id)
+    return hashes
+
+
+async def read_progress(db: AsyncSession) -> tuple[int, int]:
+    # (last payment id walked, payments matched so far)
+    row = (await db.execute(
+        select(models.SettlementProgress.last_payment_id, models.SettlementProgress.matched)
+        .where(models.SettlementProgress.name == PROGRESS_NAME)
+    )).first()
+    return (row.last_payment_id, row.matched) if row else (0, 0)
+
+
+async def settle_chunk(db: AsyncSession, chunk: int = SETTLEMENT_CHUNK, hashes=None) -> tuple[int, int, bool, dict]:
+    # Match the next `chunk` payments, caller commits.
+    # Returns (payments walked, payments matched, done, the session hashes if they were needed)
+    last_payment_id, matched_total = await read_progress(db)
+    own = aliased(models.Session)
+    rows = (await db.execute(
+        select(
+            models.Payment.id,
+            models.Payment.sessions_id,
+            models.Payment.hash,
+            # hash of the payment's own session, NULL when that session is gone
+            func.md5(cast(own.id, String) + models.Vehicle.license_plate).label("own_hash"),
+        )
+        .outerjoin(own, own.id == models.Payment.sessions_id)
+        .outerjoin(models.Vehicle, models.Vehicle.vehicle_id == own.vehicle_id)
+        .where(models.Payment.id > last_payment_id)
+        .order_by(models.Payment.id)
+        .limit(chunk)
+    )).all()
+    if not rows:
+        return 0, 0, True, hashes
+
+    candidates = [row for row in rows if row.hash and row.hash != row.own_hash]
+    links = []
+    if candidates:
+        if hashes is None:
+            hashes = await session_hashes(db)
+        links = [
+            {"session_id": session_id, "payment_id": row.id}
+            for row in candidates
+            for session_id in hashes.get(row.hash, ())
+            if session_id != row.sessions_id
+        ]
+    matched = len({link["payment_id"] for link in links})
+
+    session_ids = {link["session_id"] for link in links}
+    tracking = ledger.tracking(db, models.Session.id.in_(session_ids)) if links else nullcontext()
+    async with tracking:
+        if links:
+            await db.execute(insert(models.PaymentSettlement).values(links).on_conflict_do_nothing())
+        progress = models.SettlementProgress.__table__
+        now = datetime.now(timezone.utc)
+        stmt = insert(progress).values(
+            name=PROGRESS_NAME, last_payment_id=rows[-1].id, matched=matched_total + matched, updated_at=now
+        )
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[progress.c.name],
+            set_={"last_payment_id": stmt.excluded.last_payment_id, "matched": stmt.excluded.matched, "updated_at": now},
+        ))
+    return len(rows), matched, len(rows) < chunk, hashes
+
+
+async def reset(db: AsyncSession):
+    # walk every payment again on the next run (links already made stay), caller commits
+    await db.execute(
+        models.SettlementProgress.__table__.delete().where(models.SettlementProgress.name == PROGRESS_NAME)
+    )
+
+
+class PaymentReconciler:
+    def __init__(self, session_factory, chunk: int):
+        self.session_factory = session_factory
+        self.chunk = chunk
+
+        self.runs = 0
+        self.scanned = 0
+        self.matched = 0
+
+    async def run_once(self) -> int:
+        # walk the payments added since the last run, one transaction per chunk; returns the payments matched
+        matched = 0
+        hashes = None
+        done = False
+        while not done:
+            async with self.session_factory() as db:
+                scanned, chunk_matched, done, hashes = await settle_chunk(db, self.chunk, hashes)
+                await db.commit()
+            self.scanned += scanned
+            matched += chunk_matched
+        self.matched += matched
+        self.runs += 1
+        return matched
+
+    async def run_reconciler(self, interval_seconds: float):
+        # Background task, started from the app lifespan.
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                matched = await self.run_once()
+                if matched:
+                    logger.info("Payment reconciliation matched %s payment(s)", matched)
+            except Exception:
+                logger.exception("Payment reconciliation failed")
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "scanned": self.scanned,
+            "matched": self.matched,
+        }
+
+
+payment_reconciler = PaymentReconciler(AsyncSessionLocal, SETTLEMENT_CHUNK)
@@ -0,0 +1,321 @@
+import bisect
+import json
+import math
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Tariff schedules: per-lot hourly rates by weekday and time of day, with caps.
+#
+#   {"timezone": "Europe/Amsterdam", "unit_minutes": 60,
+#    "default_rate": 2.5, "default_cap": 20.0,
+#    "bands": [{"days": [0, 1, 2, 3, 4], "start": "08:00", "end": "18:00", "rate": 3.5},
+#              {"days": [0, 1, 2, 3, 4, 5, 6], "start": "18:00", "end": "08:00", "rate": 1.0, "cap": 6.0},
+#              {"days": [5, 6], "start": "08:00", "end": "18:00", "rate": 2.0, "cap": 12.0}]}
+#
+# days: 0 = monday. A band with end <= start runs past midnight (overnight).
+# cap is the maximum charged for one occurrence of the band (one evening+night).
+# Time outside the bands is charged at default_rate (the lot's tariff) and
+# capped per calendar day at default_cap (the lot's daytariff).
+#
+# A schedule compiles into a list of periods covering one week: the bands,
+# each with a rate and a cap, and the default time between them. Bands keep
+# the cumulative capped cost of all full bands, default time the cumulative
+# seconds, with the capped cost of each weekday's default time on top. The
+# price of a session is then its partial band and partial days plus
+# prefix-sum differences: O(log n) via bisect, regardless of the session length.
+#
+# The bands are wall clock in the schedule's timezone, the duration is elapsed
+# time: a session is split at the timezone's offset changes into pieces of
+# wall clock, so the hour repeated in autumn counts twice (under the caps of
+# the band and the day it falls in) and the hour skipped in spring not at all.
+# The duration is billed per started unit_minutes, the rest of the last unit at
+# the rate of the period the session ends in. Sessions under FREE_SECONDS are
+# free, like calculate_price.
+
+DAY = 86_400
+WEEK = 7 * DAY
+FREE_SECONDS = 180
+# 1970-01-05 was a monday, wall clock seconds are counted from there
+MONDAY = datetime(1970, 1, 5)
+MONDAY_EPOCH = 4 * DAY
+
+
+def _offset(tz: ZoneInfo, t: float) -> float:
+    return datetime.fromtimestamp(t, tz).utcoffset().total_seconds()
+
+
+@lru_cache(maxsize=256)
+def _transitions(tz: ZoneInfo, year: int) -> tuple[float, ...]:
+    # the UTC instants in `year` at which the offset of tz changes (a day apart at least)
+    t = datetime(year, 1, 1, tzinfo=timezone.utc).timestamp()
+    end = datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp()
+    found = []
+    offset = _offset(tz, t)
+    while t < end:
+        step = min(t + DAY, end)
+        if _offset(tz, step) != offset:
+            lo, hi = t, step
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if _offset(tz, mid) == offset:
+                    lo = mid
+                else:
+                    hi = mid
+            found.append(hi)
+            offset = _offset(tz, hi)
+        t = step
+    return tuple(found)
+
+
+def parse_clock(value: str) -> int:
+    # "HH:MM" -> seconds after midnight, "24:00" is allowed as an end
+    try:
+        hours, minutes = (int(part) for part in value.split(":"))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    if not (0 <= minutes < 60 and 0 <= hours <= 24) or (hours == 24 and minutes):
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    return hours * 3600 + minutes * 60
+
+
+class CompiledSchedule:
+    def __init__(self, origin: int, periods: list[tuple[int, int, float, Optional[float]]], tz: ZoneInfo, unit_seconds: int,
+                 default_rate: float, default_cap: float):
+        # periods: (start, end, rate per second, cap), contiguous from origin to origin + WEEK;
+        # cap None is default time, capped per calendar day together with the rest of that day
+        self.origin = origin
+        self.tz = tz
+        self.unit = unit_seconds
+        self.default_rate = default_rate
+        self.default_cap = default_cap
+        self.starts = [start - origin for start, _, _, _ in periods]
+        self.ends = [end - origin for _, end, _, _ in periods]
+        self.rates = [rate for _, _, rate, _ in periods]
+        self.caps = [cap for _, _, _, cap in periods]
+        self.default = [cap is None for cap in self.caps]
+
+        # capped cost of the full bands before period k, default seconds before period k
+        self.prefix = [0.0]
+        self.default_prefix = [0]
+        for start, end, rate, cap in periods:
+            self.prefix.append(self.prefix[-1] + (0.0 if cap is None else min(rate * (end - start), cap)))
+            self.default_prefix.append(self.default_prefix[-1] + (end - start if cap is None else 0))
+        self.band_week_cost = self.prefix[-1]
+        self.week_default = self.default_prefix[-1]
+
+        # capped default cost of each whole weekday (0 = monday), twice for a wrap-around difference
+        day_costs = [
+            self._capped_default(self._default_seconds((d + 1) * DAY) - self._default_seconds(d * DAY)) for d in range(7)
+        ]
+        self.day_prefix = [0.0]
+        for day_cost in day_costs + day_costs:
+            self.day_prefix.append(self.day_prefix[-1] + day_cost)
+        self.week_cost = self.band_week_cost + self.day_prefix[7]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _locate(self, t: float) -> tuple[int, int, float]:
+        week, offset = divmod(t - self.origin, WEEK)
+        return int(week), bisect.bisect_right(self.starts, offset) - 1, offset
+
+    def _default_seconds(self, t: float) -> float:
+        # default time from the origin up to wall clock second t
+        week, k, offset = self._locate(t)
+        inside = offset - self.starts[k] if self.default[k] else 0
+        return week * self.week_default + self.default_prefix[k] + inside
+
+    def _capped_default(self, seconds: float) -> float:
+        return min(self.default_rate * seconds, self.default_cap)
+
+    def _whole_days(self, first: int, last: int) -> float:
+        # capped default cost of the days [first, last), day 0 = MONDAY
+        weeks, rest = divmod(last - first, 7)
+        weekday = first % 7
+        return weeks * self.day_prefix[7] + self.day_prefix[weekday + rest] - self.day_prefix[weekday]
+
+    def cost(self, a: float, b: float, extra: float = 0.0) -> float:
+        # unrounded cost of wall clock seconds [a, b), `extra` seconds (the rest of
+        # the last started unit) are charged at the rate and under the cap of the period b falls in
+        if b <= a:
+            return 0.0
+        wa, ka, oa = self._locate(a)
+        wb, kb, ob = self._locate(b)
+
+        # bands: each occurrence under its own cap
+        if (wa, ka) == (wb, kb):
+            bands = 0.0 if self.default[ka] else min(self.rates[ka] * (ob - oa + extra), self.caps[ka])
+        else:
+            first = 0.0 if self.default[ka] else min(self.rates[ka] * (self.ends[ka] - oa), self.caps[ka])
+            last = 0.0 if self.default[kb] else min(self.rates[kb] * (ob - self.starts[kb] + extra), self.caps[kb])
+            middle = (wb - wa) * self.band_week_cost + self.prefix[kb] - self.prefix[ka + 1]
+            bands = first + middle + last
+
+        # default time: the pieces of one calendar day share default_cap
+        extra_default = extra if self.default[kb] else 0.0
+        da, db = int(a // DAY), int(b // DAY)
+        if da == db:
+            return bands + self._capped_default(self._default_seconds(b) - self._default_seconds(a) + extra_default)
+        first_day = self._capped_default(self._default_seconds((da + 1) * DAY) - self._default_seconds(a))
+        last_day = self._capped_default(self._default_seconds(b) - self._default_seconds(db * DAY) + extra_default)
+        return bands + first_day + self._whole_days(da + 1, db) + last_day
+
+    def wall_seconds(self, value: datetime) -> float:
+        local = value.astimezone(self.tz).replace(tzinfo=None)
+        return (local - MONDAY).total_seconds()
+
+    def pieces(self, start: datetime, stop: datetime) -> list[tuple[float, float]]:
+        # [start, stop) as wall clock pieces [a, b) of one UTC offset each
+        a, b = start.timestamp(), stop.timestamp()
+        cuts = [t for year in range(start.year, stop.year + 1) for t in _transitions(self.tz, year) if a < t < b]
+        pieces = []
+        for piece_start, piece_end in zip([a] + cuts, cuts + [b]):
+            wall = piece_start + _offset(self.tz, piece_start) - MONDAY_EPOCH
+            pieces.append((wall, wall + piece_end - piece_start))
+        return pieces
+
+    def elapsed_cost(self, pieces: list[tuple[float, float]], extra: float = 0.0) -> float:
+        # cost() of each piece, `extra` on the last one; a band occurrence or a day that
+        # more than one piece runs through (around an offset change) is capped once over all of them
+        total = sum(self.cost(a, b, extra if i == len(pieces) - 1 else 0.0) for i, (a, b) in enumerate(pieces))
+        if len(pieces) == 1:
+            return total
+
+        last = pieces[-1][1]
+        _, k_last, _ = self._locate(last)
+        occurrences, days = set(), set()
+        for (_, b), (a, _) in zip(pieces, pieces[1:]):
+            lo, hi = min(a, b) - 1, max(a, b) + 1
+            week, k, _ = self._locate(lo)
+            while self.origin + week * WEEK + self.starts[k] <= hi:
+                if not self.default[k]:
+                    occurrences.add((week, k))
+                week, k = (week, k + 1) if k + 1 < len(self.starts) else (week + 1, 0)
+            days.update(range(int(lo // DAY), int(hi // DAY) + 1))
+
+        for week, k in occurrences:
+            begin = self.origin + week * WEEK + self.starts[k]
+            end = begin + self.ends[k] - self.starts[k]
+            seconds = [max(0.0, min(b, end) - max(a, begin)) for a, b in pieces]
+            if begin <= last < end:
+                seconds[-1] += extra
+            rate, cap = self.rates[k], self.caps[k]
+            total += min(rate * sum(seconds), cap) - sum(min(rate * s, cap) for s in seconds)
+
+        for day in days:
+            seconds = [
+                max(0.0, self._default_seconds(min(b, (day + 1) * DAY)) - self._default_seconds(max(a, day * DAY)))
+                for a, b in pieces
+            ]
+            if self.default[k_last] and int(last // DAY) == day:
+                seconds[-1] += extra
+            total += self._capped_default(sum(seconds)) - sum(self._capped_default(s) for s in seconds if s)
+        return total
+
+    def price(self, start: datetime, stop: Optional[datetime] = None) -> tuple[float, int, int]:
+        # same contract and time handling as calculate_price: (price, hours, days)
+        if stop is None:
+            stop = datetime.now(timezone.utc)
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        start = start.astimezone(timezone.utc)
+        stop = stop.astimezone(timezone.utc)
+
+        diff = stop - start
+        seconds = diff.total_seconds()
+        hours = int(math.ceil(seconds / 3600.0))
+        if seconds < FREE_SECONDS:
+            return 0.0, hours, 0
+
+        days = diff.days + 1 if stop.date() > start.date() else 0
+        extra = math.ceil(seconds / self.unit) * self.unit - seconds
+        return round(self.elapsed_cost(self.pieces(start, stop), extra), 2), hours, days
+
+
+def _day_pieces(start: int, end: int):
+    # split [start, end) at midnight
+    while start < end:
+        cut = min(end, (start // DAY + 1) * DAY)
+        yield start, cut
+        start = cut
+
+
+def compile_schedule(schedule: dict, tariff: float, daytariff: float) -> CompiledSchedule:
+    # raises ValueError on overlapping bands or an unknown timezone
+    try:
+        tz = ZoneInfo(schedule.get("timezone") or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone {schedule.get('timezone')!r}")
+
+    unit_seconds = int(schedule.get("unit_minutes") or 60) * 60
+    default_rate = schedule.get("default_rate")
+    default_rate = float(tariff if default_rate is None else default_rate) / 3600.0
+    default_cap = schedule.get("default_cap")
+    default_cap = float(daytariff if default_cap is None else default_cap)
+
+    bands = []
+    for band in schedule.get("bands") or ():
+        begin, end = parse_clock(band["start"]), parse_clock(band["end"])
+        length = end - begin if end > begin else end + DAY - begin
+        cap = band.get("cap")
+        for day in sorted(set(band["days"])):
+            start = day * DAY + begin
+            bands.append((start, start + length, float(band["rate"]) / 3600.0, math.inf if cap is None else float(cap)))
+    bands.sort()
+
+    # on the weekly circle a band must end before the next one starts
+    for i, (_, end, _, _) in enumerate(bands):
+        next_start = bands[i + 1][0] if i + 1 < len(bands) else bands[0][0] + WEEK
+        if end > next_start:
+            raise ValueError("Tariff bands overlap")
+
+    # start the week at a band so that no band wraps around the end of the cycle
+    origin = bands[0][0] if bands else 0
+    periods = []
+    cursor = origin
+    for start, end, rate, cap in bands + [(origin + WEEK, None, None, None)]:
+        for piece_start, piece_end in _day_pieces(cursor, start):
+            periods.append((piece_start, piece_end, default_rate, None))
+        if end is not None:
+            periods.append((start, end, rate, cap))
+            cursor = end
+    return CompiledSchedule(origin, periods, tz, unit_seconds, default_rate, default_cap)
+
+
+class ScheduleCache:
+    # Compiled schedules per lot. An entry is keyed on the stored schedule and
+    # the lot's tariffs, so a change made by another worker is picked up too;
+    # PUT /v2/parking-lots/{id} drops the entry explicitly.
+
+    def __init__(self):
+        self._entries: dict[int, tuple[tuple, CompiledSchedule]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, lot_id: int, raw: Optional[str], tariff: float, daytariff: float) -> Optional[CompiledSchedule]:
+        if not raw:
+            return None
+        key = (raw, tariff, daytariff)
+        entry = self._entries.get(lot_id)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        compiled = compile_schedule(json.loads(raw), tariff, daytariff)
+        self._entries[lot_id] = (key, compiled)
+        return compiled
+
+    def for_lot(self, lot) -> Optional[CompiledSchedule]:
+        return self.get(lot.id, getattr(lot, "tariff_schedule_json", None), lot.tariff, lot.daytariff)
+
+    def invalidate(self, lot_id: int):
+        self._entries.pop(lot_id, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+schedule_cache = ScheduleCache()
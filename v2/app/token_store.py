@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenStore:
+    # In-memory store for opaque bearer tokens.
+    #
+    # Every token gets the same TTL, so issue order is expiry order: the
+    # OrderedDict is both the lookup table and the expiry queue (a single-slot
+    # timing wheel). Sweeping and cap eviction only ever pop from the front,
+    # and a per-user index makes "log out everywhere" independent of the
+    # number of live tokens. All operations are O(1).
+
+    def __init__(self, ttl_seconds: float, max_tokens: int):
+        self.ttl = ttl_seconds
+        self.max_tokens = max_tokens
+        self._tokens: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._by_user: dict[int, set[str]] = {}
+
+        self.issued = 0
+        self.revoked = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def add(self, token: str, user_id: int, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+
+        # hard cap: drop the tokens closest to expiry first
+        while len(self._tokens) >= self.max_tokens:
+            oldest = next(iter(self._tokens))
+            self._discard(oldest)
+            self.evicted += 1
+
+        self._tokens[token] = (user_id, now + self.ttl)
+        self._by_user.setdefault(user_id, set()).add(token)
+        self.issued += 1
+
+    def get(self, token: str) -> Optional[tuple[int, float]]:
+        # Returns (user_id, expires_at) or None, expiry is checked by the caller.
+        return self._tokens.get(token)
+
+    def remove(self, token: str):
+        if self._discard(token):
+            self.revoked += 1
+
+    def expire(self, token: str):
+        if self._discard(token):
+            self.expired += 1
+
+    def remove_user(self, user_id: int):
+        tokens = self._by_user.pop(user_id, None)
+        if not tokens:
+            return
+        for token in tokens:
+            self._tokens.pop(token, None)
+        self.revoked += len(tokens)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        # Drop every expired token, stops at the first one that is still valid.
+        now = time.monotonic() if now is None else now
+        swept = 0
+        while self._tokens:
+            token, (_, expires_at) = next(iter(self._tokens.items()))
+            if expires_at > now:
+                break
+            self._discard(token)
+            swept += 1
+        self.expired += swept
+        return swept
+
+    async def run_sweeper(self, interval_seconds: float):
+        # Background task, started from the app lifespan.
+        while True:
+            await asyncio.sleep(interval_seconds)
+            swept = self.sweep()
+            if swept:
+                logger.info("Token sweep removed %s expired tokens", swept)
+
+    def stats(self) -> dict:
+        return {
+            "live": len(self._tokens),
+            "users": len(self._by_user),
+            "max_tokens": self.max_tokens,
+            "issued": self.issued,
+            "revoked": self.revoked,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+    def _discard(self, token: str) -> bool:
+        record = self._tokens.pop(token, None)
+        if record is None:
+            return False
+        user_id = record[0]
+        tokens = self._by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[user_id]
+        return True
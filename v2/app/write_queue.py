@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# 0 disables group commit: every request commits its own transaction
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "0"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "64"))
+
+T = TypeVar("T")
+# A write unit does its reads and writes on the session it is given and
+# returns its result. It must not commit, rollback or close the session.
+WriteUnit = Callable[[AsyncSession], Awaitable[T]]
+
+
+class GroupCommitWriter:
+    # Single writer task that runs the write units of concurrent requests in
+    # one transaction and commits them together.
+    #
+    # The first unit opens a batch, every unit that arrives within the window
+    # (or until max_batch) joins it. Each unit runs in its own SAVEPOINT, so a
+    # failing unit is rolled back on its own and its caller gets the error,
+    # the others still commit. If the final COMMIT fails every caller in the
+    # batch gets that error.
+
+    def __init__(self, session_factory, window_seconds: float, max_batch: int):
+        self.session_factory = session_factory
+        self.window = window_seconds
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.units = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def submit(self, unit: WriteUnit[T]) -> T:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((unit, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._commit_batch(batch)
+            except Exception as exc:
+                logger.exception("Group commit of %s write units failed", len(batch))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    async def _commit_batch(self, batch):
+        outcomes = []
+        async with self.session_factory() as db:
+            for unit, future in batch:
+                try:
+                    async with db.begin_nested():
+                        result = await unit(db)
+                    outcomes.append((future, result, None))
+                except Exception as exc:
+                    outcomes.append((future, None, exc))
+            try:
+                await db.commit()
+            except Exception:
+                # a failed COMMIT (deferred constraint, disk full) leaves the transaction
+                # open on the writer connection, the next batch couldn't BEGIN
+                await db.rollback()
+                raise
+
+        self.batches += 1
+        self.units += len(batch)
+        for future, result, exc in outcomes:
+            if future.done():
+                # the request was cancelled while waiting
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "units": self.units,
+            "queued": self._queue.qsize(),
+        }
+
+
+group_writer = GroupCommitWriter(AsyncSessionLocal, GROUP_COMMIT_WINDOW_MS / 1000.0, GROUP_COMMIT_MAX_BATCH)
+
+
+async def run_write(db: AsyncSession, unit: WriteUnit[T]) -> T:
+    # Run a write unit and commit it. With group commit enabled the unit runs
+    # on the writer task's session, otherwise on the request session `db`.
+    if group_writer.running:
+        return await group_writer.submit(unit)
+
+    try:
+        result = await unit(db)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return result
@@ -0,0 +1,33 @@
+from typing import Optional, TypeVar
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Single-statement writes for the mutating endpoints. The statement carries
+# the conditions of the request in its WHERE (exists, owned by the user,
+# still open) and hands back the written row with RETURNING: one round trip
+# instead of SELECT, UPDATE and refresh(). No row back means a condition did
+# not hold; only then does the endpoint look up which one (404 / 403 / 400),
+# off the happy path.
+#
+#   vehicle = await update_returning(db, models.Vehicle, {"color": "Red"},
+#                                    models.Vehicle.vehicle_id == vid, models.Vehicle.user_id == uid)
+#   if vehicle is None: ...404
+
+M = TypeVar("M")
+
+
+async def update_returning(db: AsyncSession, model: type[M], values: dict, *where) -> Optional[M]:
+    # UPDATE model SET values WHERE where RETURNING *, the updated object or None when no row matched
+    if not values:
+        # niets te wijzigen: de rij zoals hij is
+        return await db.scalar(select(model).where(*where))
+    stmt = update(model).where(*where).values(values).returning(model)
+    return await db.scalar(stmt, execution_options={"synchronize_session": False})
+
+
+async def insert_returning(db: AsyncSession, model: type[M], columns: list[str], source) -> Optional[M]:
+    # INSERT INTO model (columns) SELECT ... RETURNING *: the new object, or None when the
+    # SELECT (which carries the conditions, e.g. "the vehicle exists") gave no row
+    stmt = insert(model).from_select(columns, source).returning(model)
+    return await db.scalar(stmt)
@@ -0,0 +1,64 @@
+"""Benchmark for the live event broadcaster (app/events.py).
+
+Opens N subscribers on one parking lot, each drained by its own task like an
+SSE stream, then publishes session starts/stops with their occupancy
+updates and reports the publish cost per event and the time until every
+subscriber has received everything.
+
+Run from the v2 directory:  python tools/benchmarks/bench_events.py [SUBSCRIBERS]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, ".")
+
+from app.events import Broadcaster  # noqa: E402
+from app.occupancy import OccupancyCounter  # noqa: E402
+
+EVENTS = 1000
+
+
+async def consume(sub, expected: int) -> int:
+    received = 0
+    while received < expected:
+        frames = await sub.next(5)
+        received += sum(1 for f in frames if f.startswith("event: session"))
+    return received
+
+
+async def main():
+    subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    counter = OccupancyCounter()
+    broadcaster = Broadcaster(counter, queue_size=EVENTS)
+    counter.set_lot(1, capacity=500, reserved=0)
+
+    subs = [broadcaster.subscribe([1]) for _ in range(subscribers)]
+    tasks = [asyncio.create_task(consume(sub, EVENTS)) for sub in subs]
+    await asyncio.sleep(0)
+
+    now = datetime.now(timezone.utc)
+    begin = time.perf_counter()
+    publish = 0.0
+    for i in range(EVENTS):
+        t = time.perf_counter()
+        with counter.change(1, +1 if i % 2 == 0 else -1):
+            pass
+        broadcaster.session_event(1, "session_started" if i % 2 == 0 else "session_stopped", i, now)
+        publish += time.perf_counter() - t
+        if i % 50 == 0:
+            # consumers get the loop in between, as between requests
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    total = time.perf_counter() - begin
+
+    print(f"{subscribers} subscribers, {EVENTS} session events (+ occupancy)")
+    per_event = publish / EVENTS
+    print(f"publish per event:  {per_event * 1000:8.3f} ms  ({per_event / subscribers * 1e6:.2f} us per subscriber)")
+    print(f"all delivered in:   {total:8.2f} s")
+    print(broadcaster.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""Gate decision latency (app/gates.py).
+
+Builds a scratch database from tools/init.sql + tools/migrations with 20
+lots, 10k vehicles and 200k closed sessions, then drives entries and exits
+with camera-style plate reads ("ab 123 c") through gates.enter/leave, one
+write transaction each as the endpoints do, and reports p50/p99 per
+decision including the commit.
+
+Run from the v2 directory:  python tools/benchmarks/bench_gates.py [DECISIONS]
+"""
+import asyncio
+import glob
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, ".")
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker  # noqa: E402
+
+from app import gates  # noqa: E402
+from app.database import create_engines, register_sqlite_functions  # noqa: E402
+
+LOTS = 20
+VEHICLES = 10_000
+SESSIONS = 200_000
+
+
+def build(path: str):
+    conn = sqlite3.connect(path)
+    register_sqlite_functions(conn)
+    with open("tools/init.sql", "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    for migration in sorted(glob.glob("tools/migrations/*.sql")):
+        with open(migration, "r", encoding="utf-8") as f:
+            conn.executescript(f.read())
+    conn.execute(
+        "INSERT INTO users (username, email, password_hash, name, birth_year) VALUES ('bench', 'b@x', 'x', 'b', 1990)"
+    )
+    conn.executemany(
+        "INSERT INTO parking_lots (id, name, location, address, capacity, reserved, tariff, daytariff) "
+        "VALUES (?, 'x', 'x', 'x', 5000, 0, 2.5, 20)",
+        [(i,) for i in range(1, LOTS + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO vehicles (vehicle_id, user_id, license_plate) VALUES (?, 1, ?)",
+        [(i, plate(i)) for i in range(1, VEHICLES + 1)],
+    )
+    rng = random.Random(1)
+    conn.executemany(
+        "INSERT INTO sessions (parking_lots_id, vehicle_id, license_plate, start_date, end_date, status) "
+        "VALUES (?, ?, ?, '2025-01-01 10:00:00', '2025-01-01 12:00:00', 'COMPLETED')",
+        [(rng.randint(1, LOTS), v, plate(v)) for v in (rng.randint(1, VEHICLES) for _ in range(SESSIONS))],
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def plate(i: int) -> str:
+    return f"{chr(65 + i % 26)}{chr(65 + i // 26 % 26)}-{i % 1000:03d}-{chr(65 + i // 1000 % 26)}"
+
+
+def percentile(times: list[float], p: float) -> float:
+    times = sorted(times)
+    return times[min(len(times) - 1, int(len(times) * p))]
+
+
+async def main():
+    decisions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build(path)
+        write_engine, read_engine = create_engines(f"sqlite+aiosqlite:///{path}", "production")
+        writer = async_sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False)
+
+        rng = random.Random(2)
+        inside: dict[int, int] = {}  # vehicle -> lot
+        times = {"entry": [], "exit": []}
+        for _ in range(decisions):
+            if inside and (len(inside) > 500 or rng.random() < 0.5):
+                vehicle = rng.choice(list(inside))
+                kind, lot = "exit", inside.pop(vehicle)
+            else:
+                vehicle = rng.choice([v for v in rng.sample(range(1, VEHICLES + 1), 5) if v not in inside])
+                kind, lot = "entry", rng.randint(1, LOTS)
+                inside[vehicle] = lot
+            read = plate(vehicle).lower().replace("-", " ")
+
+            begin = time.perf_counter()
+            async with writer() as db:
+                if kind == "entry":
+                    await gates.enter(db, lot, read)
+                else:
+                    await gates.leave(db, lot, read)
+                await db.commit()
+            times[kind].append((time.perf_counter() - begin) * 1000)
+
+        print(f"{LOTS} lots, {VEHICLES:,} vehicles, {SESSIONS:,} sessions")
+        for kind, values in times.items():
+            p50, p99 = percentile(values, 0.5), percentile(values, 0.99)
+            print(f"{kind:<5} {len(values):>5}x   p50 {p50:6.2f} ms   p99 {p99:6.2f} ms")
+        await write_engine.dispose()
+        await read_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""Camera read ingestion throughput (app/ingest.py).
+
+Same scratch database as bench_gates.py. Replays a rush hour of entry and
+exit reads over 20 lots (every car read 1-3 times), once as one gate
+transaction per read and once through the ingestion pipeline with requests
+of REQUEST_SIZE reads submitted concurrently, and reports reads per second.
+
+Run from the v2 directory:  python tools/benchmarks/bench_ingest.py [READS]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, ".")
+
+from fastapi import HTTPException  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker  # noqa: E402
+
+from app import gates  # noqa: E402
+from app.database import create_engines  # noqa: E402
+from app.ingest import IngestPipeline  # noqa: E402
+from bench_gates import LOTS, VEHICLES, build, plate  # noqa: E402
+
+REQUEST_SIZE = 200
+CONCURRENT_REQUESTS = 4
+
+
+def rush_hour(reads: int, seed: int) -> list[tuple[int, str, str, None]]:
+    # [(lot_id, kind, camera read, at)]; a car leaves the lot it entered
+    rng = random.Random(seed)
+    inside: dict[int, int] = {}
+    events = []
+    while len(events) < reads:
+        if inside and rng.random() < 0.4:
+            vehicle = rng.choice(list(inside))
+            kind, lot = "exit", inside.pop(vehicle)
+        else:
+            vehicle = rng.randint(1, VEHICLES)
+            if vehicle in inside:
+                continue
+            kind, lot = "entry", rng.randint(1, LOTS)
+            inside[vehicle] = lot
+        for _ in range(rng.randint(1, 3)):
+            events.append((lot, kind, plate(vehicle).lower().replace("-", " "), None))
+    return events[:reads]
+
+
+async def one_by_one(writer, events) -> float:
+    begin = time.perf_counter()
+    for lot_id, kind, read, _ in events:
+        async with writer() as db:
+            try:
+                if kind == "entry":
+                    await gates.enter(db, lot_id, read)
+                else:
+                    await gates.leave(db, lot_id, read)
+                await db.commit()
+            except HTTPException:
+                await db.rollback()
+    return time.perf_counter() - begin
+
+
+async def pipelined(writer, events) -> tuple[float, dict]:
+    pipeline = IngestPipeline(writer, queue_size=10_000, max_batch=500, dedupe_seconds=10)
+    pipeline.start()
+    requests = [events[i:i + REQUEST_SIZE] for i in range(0, len(events), REQUEST_SIZE)]
+    begin = time.perf_counter()
+    for i in range(0, len(requests), CONCURRENT_REQUESTS):
+        await asyncio.gather(*(pipeline.submit(r) for r in requests[i:i + CONCURRENT_REQUESTS]))
+    elapsed = time.perf_counter() - begin
+    pipeline._task.cancel()
+    return elapsed, pipeline.stats()
+
+
+async def main():
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for name in ("one transaction per read", "ingestion pipeline"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            build(path)
+            write_engine, read_engine = create_engines(f"sqlite+aiosqlite:///{path}", "production")
+            writer = async_sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False)
+            events = rush_hour(reads, seed=3)
+            if name == "ingestion pipeline":
+                elapsed, stats = await pipelined(writer, events)
+                extra = f"   {stats['transactions']} transactions, {stats['duplicates']} duplicates"
+            else:
+                elapsed, extra = await one_by_one(writer, events), ""
+            print(f"{name:<26} {reads / elapsed:8.0f} reads/s{extra}")
+            await write_engine.dispose()
+            await read_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""Benchmark for the per-lot stats endpoint (app/lot_stats.py).
+
+Builds a scratch database from tools/init.sql + tools/migrations with one
+300-bay lot and a year of sessions, materializes the closed hours once
+(what the first stats request or tools/lot_stats.py does) and then times
+a year of stats in hour, day and week buckets, as the endpoint reads them.
+
+Run from the v2 directory:  python tools/benchmarks/bench_lot_stats.py [BAYS]
+"""
+import asyncio
+import glob
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, ".")
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker  # noqa: E402
+
+from app import lot_stats  # noqa: E402
+from app.database import create_engines, register_sqlite_functions  # noqa: E402
+
+YEAR_START = datetime(2024, 1, 1)
+NOW = datetime(2025, 1, 1, 12, 30)
+
+
+def build(path: str, bays: int) -> int:
+    conn = sqlite3.connect(path)
+    register_sqlite_functions(conn)
+    with open("tools/init.sql", "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    for migration in sorted(glob.glob("tools/migrations/*.sql")):
+        with open(migration, "r", encoding="utf-8") as f:
+            conn.executescript(f.read())
+
+    conn.execute(
+        "INSERT INTO parking_lots (id, name, location, address, capacity, reserved, tariff, daytariff) "
+        "VALUES (1, 'Bench', 'Bench', 'Bench 1', ?, 0, 2.5, 20)", (bays,)
+    )
+    # every bay: stays of 20 min - 10 h with gaps of up to 3 h, half the imported format, half the API format
+    rng = random.Random(42)
+    rows = []
+    for bay in range(bays):
+        t = YEAR_START + timedelta(minutes=rng.randrange(180))
+        while t < NOW:
+            stay = timedelta(minutes=rng.randrange(20, 600))
+            end = t + stay
+            fmt = "%Y-%m-%dT%H:%M:%SZ" if bay % 2 else "%Y-%m-%d %H:%M:%S.000000"
+            closed = end < NOW
+            rows.append((
+                1, bay, f"BAY-{bay}", t.strftime(fmt), end.strftime(fmt) if closed else None,
+                stay.seconds // 60 if closed else None, round(stay.seconds / 3600 * 2.5, 2) if closed else None,
+                "COMPLETED" if closed else "ACTIVE",
+            ))
+            t = end + timedelta(minutes=rng.randrange(5, 180))
+    conn.executemany(
+        "INSERT INTO sessions (parking_lots_id, vehicle_id, license_plate, start_date, end_date, duration_minutes, "
+        "calculated_amount, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return len(rows)
+
+
+async def timed(db: AsyncSession, bucket: str) -> tuple[float, int]:
+    begin = time.perf_counter()
+    buckets = await lot_stats.read_buckets(db, 1, bucket, YEAR_START, NOW, lot_stats.floor_bucket(NOW, "hour"))
+    return (time.perf_counter() - begin) * 1000, len(buckets)
+
+
+async def main():
+    bays = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        sessions = build(path, bays)
+        print(f"{bays} bays, {sessions:,} sessions in one year")
+
+        write_engine, read_engine = create_engines(f"sqlite+aiosqlite:///{path}", "production")
+        writer = async_sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False)
+        reader = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+        begin = time.perf_counter()
+        async with writer() as db:
+            while not await lot_stats.materialize(db, 1, lot_stats.floor_bucket(NOW, "hour")):
+                await db.commit()
+            await db.commit()
+        print(f"materialize once: {time.perf_counter() - begin:8.2f} s")
+
+        async with reader() as db:
+            for bucket in ("hour", "day", "week"):
+                times = [await timed(db, bucket) for _ in range(5)]
+                best = min(ms for ms, _ in times)
+                print(f"{bucket:<5} {times[0][1]:>6} buckets  {best:8.1f} ms")
+        await write_engine.dispose()
+        await read_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
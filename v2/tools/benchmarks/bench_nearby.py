@@ -0,0 +1,56 @@
+"""Benchmark for GET /v2/parking-lots/nearby (app/geo.py).
+
+Puts N synthetic lots (default 100k) spread over the Netherlands in the
+grid index and times nearby searches against a brute-force haversine scan
+over every lot, checking that both return the same lots.
+
+Run from the v2 directory:  python tools/benchmarks/bench_nearby.py [LOTS]
+"""
+import random
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from app.geo import LotIndex, haversine_m  # noqa: E402
+
+SEARCHES = 200
+
+
+def brute_force(points: list, lat: float, lon: float, radius_m: float, limit: int) -> list[int]:
+    found = []
+    for lot_id, plat, plon in points:
+        distance = haversine_m(lat, lon, plat, plon)
+        if distance <= radius_m:
+            found.append((distance, lot_id))
+    found.sort()
+    return [lot_id for _, lot_id in found[:limit]]
+
+
+def timed(fn, queries) -> tuple[float, list]:
+    begin = time.perf_counter()
+    results = [fn(*q) for q in queries]
+    return (time.perf_counter() - begin) / len(queries) * 1000, results
+
+
+def main():
+    lots = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(42)
+    points = [(lot_id, rng.uniform(50.75, 53.55), rng.uniform(3.35, 7.25)) for lot_id in range(lots)]
+
+    index = LotIndex()
+    begin = time.perf_counter()
+    for lot_id, lat, lon in points:
+        index.put(lot_id, lat, lon)
+    print(f"{lots:,} lots, index built in {time.perf_counter() - begin:.2f} s ({index.stats()['cells']} cells)")
+
+    for radius in (500, 2000, 10_000, 50_000):
+        queries = [(rng.uniform(50.75, 53.55), rng.uniform(3.35, 7.25), radius, 10) for _ in range(SEARCHES)]
+        grid_ms, grid = timed(lambda lat, lon, r, n: [i for i, _ in index.nearby(lat, lon, r, n)], queries)
+        scan_ms, scan = timed(lambda lat, lon, r, n: brute_force(points, lat, lon, r, n), queries[:20])
+        assert grid[:20] == scan, "grid and brute force disagree"
+        print(f"radius {radius:>6} m   grid {grid_ms:8.3f} ms   brute force {scan_ms:8.1f} ms   x{scan_ms / grid_ms:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
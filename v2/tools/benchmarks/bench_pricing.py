@@ -0,0 +1,75 @@
+"""Benchmark for batch pricing (app/pricing.py) against calculate_price.
+
+Prices N random sessions (default 1M) with calculate_prices on datetime64
+columns, then with calculate_price in a Python loop, and checks that every
+price, hour and day count is identical.
+
+Run from the v2 directory:  python tools/benchmarks/bench_pricing.py [N]
+"""
+import sys
+import time
+from datetime import timezone
+
+import numpy as np
+
+sys.path.insert(0, ".")
+
+from app.dependencies import calculate_price  # noqa: E402
+from app.pricing import calculate_prices  # noqa: E402
+
+LOTS = 1_000
+
+
+class Lot:
+    def __init__(self, tariff, daytariff):
+        self.tariff = tariff
+        self.daytariff = daytariff
+
+
+def make_sessions(n: int, rng: np.random.Generator):
+    base = np.datetime64("2024-01-01T00:00:00", "us")
+    starts = base + rng.integers(0, 365 * 86_400_000_000, n).astype("timedelta64[us]")
+    # 10% free (< 3 min), 70% short stays, 20% up to five days
+    kind = rng.random(n)
+    durations = np.where(
+        kind < 0.1,
+        rng.integers(0, 180_000_000, n),
+        np.where(kind < 0.8, rng.integers(0, 6 * 3_600_000_000, n), rng.integers(0, 5 * 86_400_000_000, n)),
+    )
+    stops = starts + durations.astype("timedelta64[us]")
+    lot_tariffs = np.round(rng.uniform(0.5, 6.0, LOTS), 2)
+    lot_daytariffs = np.round(rng.uniform(5.0, 40.0, LOTS), 2)
+    lot_ids = rng.integers(0, LOTS, n)
+    return starts, stops, lot_tariffs[lot_ids], lot_daytariffs[lot_ids]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    starts, stops, tariffs, daytariffs = make_sessions(n, np.random.default_rng(42))
+
+    begin = time.perf_counter()
+    prices, hours, days = calculate_prices(starts, stops, tariffs, daytariffs)
+    batch_s = time.perf_counter() - begin
+    print(f"{'calculate_prices':<18} {n:>10,} sessions  {batch_s:8.3f} s  {n / batch_s:>12,.0f} sessions/s")
+
+    # datetime64[us].tolist() gives naive UTC datetimes, make them aware for calculate_price
+    start_list = [s.replace(tzinfo=timezone.utc) for s in starts.tolist()]
+    stop_list = [s.replace(tzinfo=timezone.utc) for s in stops.tolist()]
+    lots = [Lot(t, d) for t, d in zip(tariffs.tolist(), daytariffs.tolist())]
+
+    begin = time.perf_counter()
+    scalar = [calculate_price(lot, s, e) for lot, s, e in zip(lots, start_list, stop_list)]
+    scalar_s = time.perf_counter() - begin
+    print(f"{'calculate_price':<18} {n:>10,} sessions  {scalar_s:8.3f} s  {n / scalar_s:>12,.0f} sessions/s")
+    print(f"speedup: {scalar_s / batch_s:.1f}x")
+
+    mismatches = sum(
+        1 for i, (p, h, d) in enumerate(scalar)
+        if p != prices[i] or h != hours[i] or d != days[i]
+    )
+    print(f"mismatches: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark for GET /v2/parking-lots/search (app/search.py).
+
+Indexes the imported catalogue (tools/import_jsons/data/parking-lots.json)
+and times searches built from its own names and addresses: whole words,
+prefixes while typing, and words with one or two typos. Reports p50/p99
+per query kind.
+
+Run from the v2 directory:  python tools/benchmarks/bench_search.py [QUERIES]
+"""
+import json
+import random
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from app.search import LotSearchIndex, normalize  # noqa: E402
+
+CATALOGUE = "tools/import_jsons/data/parking-lots.json"
+
+
+def typo(rng: random.Random, word: str) -> str:
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(["drop", "swap", "replace"])
+    if kind == "drop":
+        return word[:i] + word[i + 1:]
+    if kind == "swap":
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + word[i + 1:]
+
+
+def percentile(times: list[float], p: float) -> float:
+    times = sorted(times)
+    return times[min(len(times) - 1, int(len(times) * p))]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(CATALOGUE, "r", encoding="utf-8") as f:
+        lots = json.load(f)
+
+    index = LotSearchIndex()
+    begin = time.perf_counter()
+    for lot_id, lot in lots.items():
+        index.put(int(lot_id), lot["name"], lot["location"], lot["address"])
+    print(f"{len(index)} lots indexed in {(time.perf_counter() - begin) * 1000:.0f} ms, {index.stats()}")
+
+    rng = random.Random(42)
+    words = sorted({
+        w for lot in lots.values() for w in normalize(f"{lot['name']} {lot['address']}") if len(w) >= 5 and w.isalpha()
+    })
+    kinds = {
+        "word": lambda: rng.choice(words) + " ",
+        "prefix": lambda: (lambda w: w[:rng.randrange(2, len(w))])(rng.choice(words)),
+        "two words": lambda: f"{rng.choice(words)} {rng.choice(words)[:4]}",
+        "typo": lambda: typo(rng, rng.choice(words)) + " ",
+    }
+    for kind, make in kinds.items():
+        times, hits = [], 0
+        for _ in range(count):
+            q = make()
+            begin = time.perf_counter()
+            hits += bool(index.search(q, 10))
+            times.append((time.perf_counter() - begin) * 1000)
+        print(
+            f"{kind:<10} p50 {percentile(times, 0.5):6.2f} ms   p99 {percentile(times, 0.99):6.2f} ms   "
+            f"with results {hits / count:6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
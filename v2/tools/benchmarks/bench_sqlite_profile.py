@@ -0,0 +1,114 @@
+"""Mixed read/write throughput of the SQLite engine profiles.
+
+Builds a scratch database from tools/init.sql, then runs concurrent reader
+tasks (a page of sessions by primary key) and writer tasks (start + stop a session,
+one commit each) for a few seconds against the "default" and the
+"production" profile of app.database.create_engines.
+
+Run from the v2 directory:  python tools/benchmarks/bench_sqlite_profile.py [seconds]
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, ".")
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+
+from app.database import create_engines  # noqa: E402
+
+READERS = int(os.getenv("READERS", "16"))
+WRITERS = int(os.getenv("WRITERS", "8"))
+LOTS = 20
+SESSIONS = 50_000
+
+
+def seed(path: str):
+    conn = sqlite3.connect(path)
+    with open("./tools/init.sql", "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    conn.execute(
+        "INSERT INTO users (username, email, password_hash, name, birth_year) VALUES ('bench', 'b@x', 'x', 'b', 1990)"
+    )
+    conn.executemany(
+        "INSERT INTO parking_lots (name, location, address, capacity, tariff, daytariff) VALUES (?, 'x', 'x', 500, 2.5, 20)",
+        [(f"lot {i}",) for i in range(LOTS)],
+    )
+    conn.executemany(
+        "INSERT INTO vehicles (user_id, license_plate) VALUES (1, ?)", [(f"BENCH-{i}",) for i in range(1000)]
+    )
+    conn.executemany(
+        "INSERT INTO sessions (parking_lots_id, vehicle_id, license_plate, start_date, end_date, status) "
+        "VALUES (?, ?, 'x', '2025-01-01 10:00:00', '2025-01-01 12:00:00', 'COMPLETED')",
+        [(random.randint(1, LOTS), random.randint(1, 1000)) for _ in range(SESSIONS)],
+    )
+    conn.commit()
+    conn.close()
+
+
+async def run_profile(path: str, profile: str, seconds: float) -> dict:
+    write_engine, read_engine = create_engines(f"sqlite+aiosqlite:///{path}", profile)
+    writer = async_sessionmaker(write_engine, expire_on_commit=False)
+    reader = async_sessionmaker(read_engine, expire_on_commit=False)
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.perf_counter() + seconds
+
+    async def read_loop():
+        while time.perf_counter() < deadline:
+            async with reader() as db:
+                await db.execute(
+                    text("SELECT * FROM sessions WHERE id >= :first ORDER BY id LIMIT 50"),
+                    {"first": random.randint(1, SESSIONS)},
+                )
+            counts["reads"] += 1
+
+    async def write_loop():
+        while time.perf_counter() < deadline:
+            try:
+                async with writer() as db:
+                    now = datetime.now(timezone.utc).isoformat()
+                    res = await db.execute(
+                        text(
+                            "INSERT INTO sessions (parking_lots_id, vehicle_id, license_plate, start_date, status) "
+                            "VALUES (:lid, :vid, 'x', :now, 'ACTIVE')"
+                        ),
+                        {"lid": random.randint(1, LOTS), "vid": random.randint(1, 1000), "now": now},
+                    )
+                    await db.commit()
+                    await db.execute(
+                        text("UPDATE sessions SET end_date = :now, status = 'COMPLETED' WHERE id = :sid"),
+                        {"now": now, "sid": res.lastrowid},
+                    )
+                    await db.commit()
+                counts["writes"] += 1
+            except OperationalError:
+                counts["errors"] += 1
+
+    await asyncio.gather(*[read_loop() for _ in range(READERS)], *[write_loop() for _ in range(WRITERS)])
+    await write_engine.dispose()
+    await read_engine.dispose()
+    return {k: round(v / seconds) if k != "errors" else v for k, v in counts.items()}
+
+
+async def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    for profile in ("default", "production"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            seed(path)
+            result = await run_profile(path, profile, seconds)
+            print(
+                f"{profile:<11} reads/s={result['reads']:>6}  writes/s={result['writes']:>6}  "
+                f"locked errors={result['errors']}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
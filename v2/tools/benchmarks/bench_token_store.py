@@ -0,0 +1,71 @@
+"""Micro-benchmark for the bearer token store.
+
+Fills the store with N live tokens (default 1M, one per user) and measures
+login (revoke all + issue), check and logout. The old dict-scan login is
+measured on the same population for comparison.
+
+Run from the v2 directory:  python tools/benchmarks/bench_token_store.py [N]
+"""
+import sys
+import time
+import uuid
+
+sys.path.insert(0, ".")
+
+from app.token_store import TokenStore  # noqa: E402
+
+OPS = 100_000
+LEGACY_OPS = 20
+
+
+def per_op_us(start: float, ops: int) -> float:
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    store = TokenStore(ttl_seconds=900, max_tokens=n + OPS)
+    legacy: dict[str, tuple[int, float]] = {}
+
+    tokens = []
+    for uid in range(n):
+        token = uuid.uuid4().hex
+        store.add(token, uid)
+        legacy[token] = (uid, 0.0)
+        tokens.append(token)
+    print(f"live tokens: {len(store):,}")
+
+    start = time.perf_counter()
+    for i in range(OPS):
+        store.get(tokens[(i * 7919) % n])
+    print(f"{'check':<18}{per_op_us(start, OPS):8.2f} us/op")
+
+    new_tokens = []
+    start = time.perf_counter()
+    for i in range(OPS):
+        uid = (i * 7919) % n
+        store.remove_user(uid)
+        token = uuid.uuid4().hex
+        store.add(token, uid)
+        new_tokens.append(token)
+    print(f"{'login':<18}{per_op_us(start, OPS):8.2f} us/op")
+
+    start = time.perf_counter()
+    for token in new_tokens:
+        store.remove(token)
+    print(f"{'logout':<18}{per_op_us(start, OPS):8.2f} us/op")
+
+    start = time.perf_counter()
+    for i in range(LEGACY_OPS):
+        uid = (i * 7919) % n
+        to_delete = [t for t, (u, _) in legacy.items() if u == uid]
+        for t in to_delete:
+            legacy.pop(t, None)
+        legacy[uuid.uuid4().hex] = (uid, 0.0)
+    print(f"{'login (dict scan)':<18}{per_op_us(start, LEGACY_OPS):8.2f} us/op")
+
+    print(store.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Consistency check and backfill for the billing rollups (app/ledger.py).
+
+Recomputes the per-user ledger (billing_ledger) and the monthly rollup
+(billing_monthly) from sessions and payments and diffs them against the
+live tables.
+
+Run from the v2 directory:
+    python tools/billing_ledger.py check            # report differences, exit code 1 if any
+    python tools/billing_ledger.py rebuild          # replace both tables with the recomputed totals
+    python tools/billing_ledger.py backfill-months [--chunk N]
+                                                    # rebuild billing_monthly N users per transaction
+"""
+import argparse
+import asyncio
+import sys
+
+sys.path.insert(0, ".")
+
+from sqlalchemy import select  # noqa: E402
+
+from app import ledger, models  # noqa: E402
+from app.database import AsyncSessionLocal, engine, read_engine  # noqa: E402
+
+
+async def check() -> int:
+    async with AsyncSessionLocal() as db:
+        diffs = await ledger.diff_ledger(db)
+        month_diffs = await ledger.diff_months(db)
+    for user_id, have, want in diffs:
+        print(f"user {user_id}: ledger {dict(zip(ledger.LEDGER_FIELDS, have))} "
+              f"!= rebuilt {dict(zip(ledger.LEDGER_FIELDS, want))}")
+    for (user_id, month), have, want in month_diffs:
+        print(f"user {user_id} {month}: rollup (sessions, cost) {have} != rebuilt {want}")
+    print(f"{len(diffs)} ledger row(s) and {len(month_diffs)} monthly row(s) differ")
+    return 1 if diffs or month_diffs else 0
+
+
+async def rebuild() -> int:
+    async with AsyncSessionLocal() as db:
+        users = await ledger.rebuild_ledger(db)
+        months = await ledger.rebuild_months(db)
+        await db.commit()
+    print(f"ledger rebuilt for {users} user(s), {months} monthly row(s)")
+    return 0
+
+
+async def backfill_months(chunk: int) -> int:
+    # short transactions, the API keeps writing in between
+    async with AsyncSessionLocal() as db:
+        user_ids = (await db.execute(select(models.User.id).order_by(models.User.id))).scalars().all()
+    months = 0
+    for i in range(0, len(user_ids), chunk):
+        async with AsyncSessionLocal() as db:
+            months += await ledger.rebuild_months(db, user_ids[i:i + chunk])
+            await db.commit()
+        print(f"{min(i + chunk, len(user_ids))}/{len(user_ids)} users, {months} monthly row(s)")
+    return 0
+
+
+async def main(args) -> int:
+    try:
+        if args.command == "check":
+            return await check()
+        if args.command == "rebuild":
+            return await rebuild()
+        return await backfill_months(args.chunk)
+    finally:
+        await engine.dispose()
+        await read_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["check", "rebuild", "backfill-months"], nargs="?", default="check")
+    parser.add_argument("--chunk", type=int, default=500, help="users per transaction for backfill-months")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,10 +1,44 @@
 import sqlite3
 import os
 import sys
+import glob
+import hashlib
 
 DB_PATH = "./data/mobypark.db"
+MIGRATIONS_DIR = "./tools/migrations"
 db_exists = os.path.exists(DB_PATH)
 
+
+def apply_migrations(db_path: str):
+    # Apply every tools/migrations/*.sql file that has not been applied yet, in name order
+    conn = sqlite3.connect(db_path)
+    # same md5() as the app registers on its connections (app/database.py)
+    conn.create_function(
+        "md5", 1, lambda v: None if v is None else hashlib.md5(str(v).encode("utf-8")).hexdigest(), deterministic=True
+    )
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name TEXT PRIMARY KEY, applied_at TEXT NOT NULL DEFAULT (datetime('now')))"
+        )
+        applied = {row[0] for row in conn.execute("SELECT name FROM schema_migrations")}
+
+        for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql"))):
+            name = os.path.basename(path)
+            if name in applied:
+                continue
+
+            with open(path, "r", encoding="utf-8") as f:
+                sql = f.read()
+
+            print(f"[migrate] {name}")
+            conn.executescript(sql)
+            conn.execute("INSERT INTO schema_migrations (name) VALUES (?)", (name,))
+            conn.commit()
+    finally:
+        conn.close()
+
+
 if not db_exists:
     print(f"Database not found at {DB_PATH}. Creating new database...")
 
@@ -34,4 +68,7 @@ if not db_exists:
         print(f"Warning: Failed to run data imports: {e}")
         print("Database schema created, but data imports failed.")
 else:
-    print(f"Database already exists at {DB_PATH}. Skipping initialization.")
\ No newline at end of file
+    print(f"Database already exists at {DB_PATH}. Skipping initialization.")
+
+# Schema migrations run for new and existing databases, after the data imports
+apply_migrations(DB_PATH)
@@ -0,0 +1,67 @@
+"""Fill or reset the per-lot stats rollup (app/lot_stats.py).
+
+The API materializes every lot in the background (STATS_MATERIALIZE_SECONDS)
+and a /v2/parking-lots/{lot_id}/stats request reads what is not done yet
+live; run this after an import or a restore to fill the rollup right away.
+
+Run from the v2 directory:
+    python tools/lot_stats.py materialize [--lot ID]   # all lots, or one
+    python tools/lot_stats.py reset [--lot ID]         # drop the rollup, recomputed on the next request
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, ".")
+
+from sqlalchemy import select  # noqa: E402
+
+from app import lot_stats, models  # noqa: E402
+from app.database import AsyncSessionLocal, engine, read_engine  # noqa: E402
+
+
+async def lot_ids(lot: int | None) -> list[int]:
+    if lot is not None:
+        return [lot]
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(models.ParkingLot.id).order_by(models.ParkingLot.id))).scalars().all()
+
+
+async def materialize(lot: int | None) -> int:
+    until = lot_stats.floor_bucket(datetime.now(timezone.utc), "hour")
+    for lot_id in await lot_ids(lot):
+        # one chunk per transaction, the API keeps writing in between
+        done = False
+        while not done:
+            async with AsyncSessionLocal() as db:
+                done = await lot_stats.materialize(db, lot_id, until)
+                await db.commit()
+        print(f"lot {lot_id}: materialized until {until:%Y-%m-%d %H:00}")
+    return 0
+
+
+async def reset(lot: int | None) -> int:
+    for lot_id in await lot_ids(lot):
+        async with AsyncSessionLocal() as db:
+            await lot_stats.rewind(db, lot_id, datetime(1970, 1, 1))
+            await db.commit()
+        print(f"lot {lot_id}: reset")
+    return 0
+
+
+async def main(args) -> int:
+    try:
+        if args.command == "materialize":
+            return await materialize(args.lot)
+        return await reset(args.lot)
+    finally:
+        await engine.dispose()
+        await read_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["materialize", "reset"])
+    parser.add_argument("--lot", type=int, default=None, help="only this parking lot")
+    sys.exit(asyncio.run(main(parser.parse_args())))
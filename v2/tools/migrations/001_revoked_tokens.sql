@@ -0,0 +1,12 @@
+-- Revocation list for signed (TOKEN_MODE=jwt) access tokens.
+-- A row with a jti revokes a single token, a row without jti revokes every
+-- token of user_id issued before revoked_at. Rows are useless once expires_at
+-- has passed and are pruned by the API.
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    jti TEXT,
+    user_id INTEGER NOT NULL,
+    revoked_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON revoked_tokens (expires_at);
@@ -0,0 +1,21 @@
+-- Index set for the hot queries of the API.
+-- tests/db/test_query_plans.py fails when a router query scans sessions,
+-- payments or reservation, keep the two in sync.
+
+-- sessions: active/stop lookups and listings per lot
+CREATE INDEX IF NOT EXISTS idx_sessions_lot_end ON sessions (parking_lots_id, end_date);
+-- sessions: billing and monthly overviews per vehicle, in time order
+CREATE INDEX IF NOT EXISTS idx_sessions_vehicle_start ON sessions (vehicle_id, start_date);
+
+-- payments: SUM(amount) per session straight from the index (covering)
+CREATE INDEX IF NOT EXISTS idx_payments_session_amount ON payments (sessions_id, amount);
+DROP INDEX IF EXISTS fk_payments_sessions1_idx;
+-- payments: transaction hash fallback, covering for SUM(amount)
+CREATE INDEX IF NOT EXISTS idx_payments_hash_amount ON payments (hash, amount) WHERE hash IS NOT NULL;
+
+-- reservation: reservations per vehicle in time order
+CREATE INDEX IF NOT EXISTS idx_reservation_vehicle_start ON reservation (vehicles_id, start_time);
+DROP INDEX IF EXISTS fk_reservation_vehicles1_idx;
+
+-- vehicles: every per-user listing and join starts here
+CREATE INDEX IF NOT EXISTS idx_vehicles_user ON vehicles (user_id);
@@ -0,0 +1,5 @@
+-- Keyset pagination orders every list by primary key, see paginate() in app/dependencies.py.
+-- An index on (col) also holds the rowid, so "col = ? AND id > ? ORDER BY id" is one index range.
+
+-- sessions per lot in id order (idx_sessions_lot_end is ordered by end_date)
+CREATE INDEX IF NOT EXISTS idx_sessions_lot ON sessions (parking_lots_id);
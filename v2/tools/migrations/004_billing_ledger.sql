@@ -0,0 +1,39 @@
+-- Per-user billing ledger, see app/ledger.py.
+-- Holds the totals of every closed session of the user's vehicles, open sessions are priced live.
+CREATE TABLE IF NOT EXISTS billing_ledger (
+    user_id INTEGER PRIMARY KEY,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    amount REAL NOT NULL DEFAULT 0,
+    paid REAL NOT NULL DEFAULT 0,
+    paid_completed REAL NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+);
+
+-- open sessions per vehicle (live part of the billing summary)
+CREATE INDEX IF NOT EXISTS idx_sessions_open_vehicle ON sessions (vehicle_id) WHERE end_date IS NULL;
+
+-- backfill, same rules as ledger.per_session(): payments on sessions_id, else the transaction hash
+-- (md5() is registered by init_db.py). Check afterwards with: python tools/billing_ledger.py check
+INSERT OR REPLACE INTO billing_ledger (user_id, sessions, amount, paid, paid_completed)
+SELECT user_id, COUNT(*), ROUND(SUM(amount), 2), ROUND(SUM(paid), 2), ROUND(SUM(paid_completed), 2)
+FROM (
+    SELECT
+        v.user_id AS user_id,
+        COALESCE(s.calculated_amount, 0) AS amount,
+        ROUND(CASE WHEN COALESCE(SUM(p.amount), 0) = 0
+            THEN (SELECT COALESCE(SUM(h.amount), 0) FROM payments h
+                  WHERE h.hash = md5(CAST(s.id AS TEXT) || v.license_plate))
+            ELSE COALESCE(SUM(p.amount), 0) END, 2) AS paid,
+        ROUND(CASE WHEN COALESCE(SUM(p.amount), 0) = 0
+            THEN (SELECT COALESCE(SUM(h.amount), 0) FROM payments h
+                  WHERE h.hash = md5(CAST(s.id AS TEXT) || v.license_plate) AND h.completed_at IS NOT NULL)
+            ELSE COALESCE(SUM(CASE WHEN p.completed_at IS NOT NULL THEN p.amount ELSE 0 END), 0) END, 2) AS paid_completed
+    FROM sessions s
+    JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+    JOIN parking_lots l ON s.parking_lots_id = l.id
+    LEFT JOIN payments p ON p.sessions_id = s.id
+    WHERE s.end_date IS NOT NULL
+    GROUP BY s.id
+)
+GROUP BY user_id;
@@ -0,0 +1,18 @@
+-- Monthly billing rollup, see app/ledger.py.
+-- Closed sessions per (user, start month), /v2/billing/monthly only computes the current month live.
+CREATE TABLE IF NOT EXISTS billing_monthly (
+    user_id INTEGER NOT NULL,
+    month TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    total_cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, month),
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+);
+
+-- backfill, same as ledger.rebuild_months(): python tools/billing_ledger.py backfill-months
+INSERT OR REPLACE INTO billing_monthly (user_id, month, sessions, total_cost)
+SELECT v.user_id, strftime('%Y-%m', s.start_date), COUNT(s.id), ROUND(SUM(COALESCE(s.calculated_amount, 0)), 2)
+FROM sessions s
+JOIN vehicles v ON s.vehicle_id = v.vehicle_id
+WHERE s.end_date IS NOT NULL
+GROUP BY v.user_id, strftime('%Y-%m', s.start_date);
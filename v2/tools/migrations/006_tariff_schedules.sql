@@ -0,0 +1,2 @@
+-- Optional tariff schedule per lot (JSON, see app/tariffs.py). NULL keeps the flat tariff/daytariff pricing.
+ALTER TABLE parking_lots ADD COLUMN tariff_schedule TEXT;
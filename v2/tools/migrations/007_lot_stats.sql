@@ -0,0 +1,25 @@
+-- Per-lot stats, see app/lot_stats.py.
+-- Closed hours per lot, filled by the first /v2/parking-lots/{lot_id}/stats request
+-- (or ahead of time: python tools/lot_stats.py materialize).
+CREATE TABLE IF NOT EXISTS lot_stats_hourly (
+    parking_lots_id INTEGER NOT NULL,
+    hour TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    duration_sum INTEGER NOT NULL DEFAULT 0,
+    duration_count INTEGER NOT NULL DEFAULT 0,
+    peak INTEGER NOT NULL DEFAULT 0,
+    net INTEGER NOT NULL DEFAULT 0,
+    occupancy INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (parking_lots_id, hour),
+    FOREIGN KEY (parking_lots_id) REFERENCES parking_lots (id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS lot_stats_state (
+    parking_lots_id INTEGER PRIMARY KEY,
+    materialized_until TEXT NOT NULL,
+    FOREIGN KEY (parking_lots_id) REFERENCES parking_lots (id) ON DELETE CASCADE
+);
+
+-- arrivals per lot in time order
+CREATE INDEX IF NOT EXISTS idx_sessions_lot_start ON sessions (parking_lots_id, start_date);
@@ -0,0 +1,3 @@
+-- Open sessions per lot, for the occupancy reconcile (app/occupancy.py) and
+-- /v2/parking-lots/{lot_id}/availability of lots a worker doesn't know yet.
+CREATE INDEX IF NOT EXISTS idx_sessions_open_lot ON sessions (parking_lots_id) WHERE end_date IS NULL;
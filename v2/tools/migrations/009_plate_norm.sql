@@ -0,0 +1,38 @@
+-- Normalised licence plates for the gate endpoints, see app/gates.py.
+-- plate_norm = licenceplate_clean(license_plate): without spaces and dashes, upper case.
+-- The triggers keep it up to date for every writer (API, tools/import_jsons, scripts).
+ALTER TABLE vehicles ADD COLUMN plate_norm TEXT;
+ALTER TABLE sessions ADD COLUMN plate_norm TEXT;
+
+UPDATE vehicles SET plate_norm = upper(replace(replace(replace(replace(replace(license_plate,
+    ' ', ''), '-', ''), char(9), ''), char(10), ''), char(13), ''));
+UPDATE sessions SET plate_norm = upper(replace(replace(replace(replace(replace(license_plate,
+    ' ', ''), '-', ''), char(9), ''), char(10), ''), char(13), ''));
+
+CREATE TRIGGER IF NOT EXISTS trg_vehicles_plate_norm_insert AFTER INSERT ON vehicles
+WHEN NEW.plate_norm IS NULL
+BEGIN
+    UPDATE vehicles SET plate_norm = upper(replace(replace(replace(replace(replace(NEW.license_plate,
+        ' ', ''), '-', ''), char(9), ''), char(10), ''), char(13), ''))
+    WHERE vehicle_id = NEW.vehicle_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_vehicles_plate_norm_update AFTER UPDATE OF license_plate ON vehicles
+BEGIN
+    UPDATE vehicles SET plate_norm = upper(replace(replace(replace(replace(replace(NEW.license_plate,
+        ' ', ''), '-', ''), char(9), ''), char(10), ''), char(13), ''))
+    WHERE vehicle_id = NEW.vehicle_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sessions_plate_norm_insert AFTER INSERT ON sessions
+WHEN NEW.plate_norm IS NULL
+BEGIN
+    UPDATE sessions SET plate_norm = upper(replace(replace(replace(replace(replace(NEW.license_plate,
+        ' ', ''), '-', ''), char(9), ''), char(10), ''), char(13), ''))
+    WHERE id = NEW.id;
+END;
+
+-- plate -> vehicle
+CREATE INDEX IF NOT EXISTS idx_vehicles_plate_norm ON vehicles (plate_norm);
+-- plate -> open session in a lot, one lookup per gate decision
+CREATE INDEX IF NOT EXISTS idx_sessions_open_plate ON sessions (plate_norm, parking_lots_id) WHERE end_date IS NULL;
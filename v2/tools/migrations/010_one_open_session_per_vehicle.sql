@@ -0,0 +1,19 @@
+-- At most one open session per vehicle (create_session, gates, app/ingest.py).
+-- The unique index also settles two concurrent starts of the same vehicle:
+-- the second INSERT fails and is answered with 409.
+--
+-- Vehicles that already have more than one open session keep the newest,
+-- the older ones are cancelled without duration or costs. Those now count as
+-- closed sessions in the billing ledger, check afterwards with:
+--     python tools/billing_ledger.py check   (rebuild if it reports differences)
+UPDATE sessions
+SET end_date = start_date, duration_minutes = 0, calculated_amount = 0, status = 'CANCELLED'
+WHERE end_date IS NULL
+  AND vehicle_id IS NOT NULL
+  AND id < (
+      SELECT MAX(newer.id) FROM sessions newer
+      WHERE newer.vehicle_id = sessions.vehicle_id AND newer.end_date IS NULL
+  );
+
+DROP INDEX IF EXISTS idx_sessions_open_vehicle;
+CREATE UNIQUE INDEX idx_sessions_open_vehicle ON sessions (vehicle_id) WHERE end_date IS NULL;
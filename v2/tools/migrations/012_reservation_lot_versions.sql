@@ -0,0 +1,36 @@
+-- Change counter per lot for the reservation capacity index, see app/reservation_index.py.
+-- Every insert, delete and booking change of a reservation bumps the version of its lot
+-- (both lots when it moves). A worker whose copy of a lot is behind the version reloads it
+-- inside the write transaction, so bookings made by other workers and scripts count too.
+-- No foreign key: deleting a lot cascades to its reservations, their triggers still bump it.
+CREATE TABLE IF NOT EXISTS reservation_lot_versions (
+    parking_lots_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_reservation_version_insert AFTER INSERT ON reservation
+BEGIN
+    INSERT INTO reservation_lot_versions (parking_lots_id, version) VALUES (NEW.parking_lots_id, 1)
+    ON CONFLICT (parking_lots_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reservation_version_update
+AFTER UPDATE OF parking_lots_id, start_time, end_time, status ON reservation
+BEGIN
+    INSERT INTO reservation_lot_versions (parking_lots_id, version) VALUES (NEW.parking_lots_id, 1)
+    ON CONFLICT (parking_lots_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reservation_version_move
+AFTER UPDATE OF parking_lots_id ON reservation
+WHEN OLD.parking_lots_id <> NEW.parking_lots_id
+BEGIN
+    INSERT INTO reservation_lot_versions (parking_lots_id, version) VALUES (OLD.parking_lots_id, 1)
+    ON CONFLICT (parking_lots_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reservation_version_delete AFTER DELETE ON reservation
+BEGIN
+    INSERT INTO reservation_lot_versions (parking_lots_id, version) VALUES (OLD.parking_lots_id, 1)
+    ON CONFLICT (parking_lots_id) DO UPDATE SET version = version + 1;
+END;
@@ -0,0 +1,16 @@
+-- Responses of POST /v2/payments and /sessions/start per Idempotency-Key, see app/idempotency.py.
+-- The row is claimed in the transaction of the write itself, so a retry that lands on another
+-- worker finds it (or waits for the write lock and then finds it) instead of writing again.
+-- status_code 0 never reaches a reader: it is filled in before the transaction commits.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint BLOB NOT NULL,
+    status_code INTEGER NOT NULL DEFAULT 0,
+    body BLOB NOT NULL DEFAULT x'',
+    created_at REAL NOT NULL,  -- unix time
+    PRIMARY KEY (user_id, key)
+) WITHOUT ROWID;
+
+-- expired keys, for the sweeper
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at);
@@ -0,0 +1,24 @@
+-- Change counter of parking_lots for the lot catalogue, see app/catalogue.py. Every insert,
+-- update and delete of a lot bumps it, a worker whose catalogue is behind loads it again
+-- before answering, so lots written by other workers and scripts are never served stale.
+CREATE TABLE IF NOT EXISTS lot_catalogue_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO lot_catalogue_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_lot_catalogue_insert AFTER INSERT ON parking_lots
+BEGIN
+    UPDATE lot_catalogue_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_lot_catalogue_update AFTER UPDATE ON parking_lots
+BEGIN
+    UPDATE lot_catalogue_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_lot_catalogue_delete AFTER DELETE ON parking_lots
+BEGIN
+    UPDATE lot_catalogue_version SET version = version + 1 WHERE id = 1;
+END;
@@ -0,0 +1,75 @@
+"""Match payments to sessions by transaction hash (app/settlement.py).
+
+The API runs this job every SETTLEMENT_INTERVAL_SECONDS; run it by hand
+after importing payments so billing sees them right away. A run continues
+where the previous one stopped.
+
+Run from the v2 directory:
+    python tools/settle_payments.py run [--chunk N]   # walk the payments not matched yet
+    python tools/settle_payments.py status            # how far the job is
+    python tools/settle_payments.py reset             # walk every payment again on the next run
+"""
+import argparse
+import asyncio
+import sys
+
+sys.path.insert(0, ".")
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app import models, settlement  # noqa: E402
+from app.database import AsyncSessionLocal, engine, read_engine  # noqa: E402
+
+
+async def run(chunk: int) -> int:
+    scanned = matched = 0
+    hashes = None
+    done = False
+    while not done:
+        # one chunk per transaction, the API keeps writing in between
+        async with AsyncSessionLocal() as db:
+            chunk_scanned, chunk_matched, done, hashes = await settlement.settle_chunk(db, chunk, hashes)
+            await db.commit()
+        scanned += chunk_scanned
+        matched += chunk_matched
+        if chunk_scanned:
+            print(f"{scanned} payment(s) walked, {matched} matched")
+    print(f"done: {scanned} payment(s) walked, {matched} matched to a session by hash")
+    return 0
+
+
+async def status() -> int:
+    async with AsyncSessionLocal() as db:
+        last_payment_id, matched = await settlement.read_progress(db)
+        remaining = await db.scalar(select(func.count()).where(models.Payment.id > last_payment_id))
+        links = await db.scalar(select(func.count()).select_from(models.PaymentSettlement))
+    print(f"walked up to payment {last_payment_id}, {remaining} payment(s) to go")
+    print(f"{matched} payment(s) matched, {links} payment/session link(s)")
+    return 0
+
+
+async def reset() -> int:
+    async with AsyncSessionLocal() as db:
+        await settlement.reset(db)
+        await db.commit()
+    print("reset: the next run walks every payment")
+    return 0
+
+
+async def main(args) -> int:
+    try:
+        if args.command == "run":
+            return await run(args.chunk)
+        if args.command == "status":
+            return await status()
+        return await reset()
+    finally:
+        await engine.dispose()
+        await read_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["run", "status", "reset"])
+    parser.add_argument("--chunk", type=int, default=settlement.SETTLEMENT_CHUNK, help="payments per transaction")
+    sys.exit(asyncio.run(main(parser.parse_args())))